@@ -0,0 +1,351 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import zipfile
+import datetime
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import NamedTuple, Optional
+
+import task_parser
+
+MANIFEST_FILE = "manifest.db"
+BUNDLES_DIR = "bundles"
+# 压缩包内附带的清单 (压缩包脱离 manifest.db 单独拷贝时仍可查看其中的任务)
+BUNDLE_MANIFEST = "manifest.json"
+SHARD_FORMAT = "%Y-%m"
+SHARD_RE = re.compile(r'^\d{4}-\d{2}$')
+DEFAULT_BUNDLE_AFTER_DAYS = 31
+DEFAULT_ROLL_INTERVAL_SECONDS = 3600
+DEFAULT_COMPRESS_LEVEL = 9
+# 同时保持打开的压缩包数量 (读取时复用中央目录，避免每次重新解析)
+OPEN_BUNDLE_CACHE = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    name TEXT PRIMARY KEY,
+    task_id TEXT,
+    shard TEXT NOT NULL,
+    bundled INTEGER NOT NULL DEFAULT 0,
+    archived_at REAL NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_task_id ON entries (task_id);
+CREATE INDEX IF NOT EXISTS entries_shard ON entries (shard, bundled);
+CREATE INDEX IF NOT EXISTS entries_archived_at ON entries (archived_at);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('count', 0);
+"""
+
+
+class ArchiveEntry(NamedTuple):
+    name: str
+    task_id: Optional[str]
+    shard: str
+    bundled: bool
+    archived_at: float
+    mtime: float        # 归档时任务文件的修改时间
+    size: int
+
+
+class ArchiveStore:
+    """
+    分片 + 压缩的归档存储:
+    - 新归档的任务按归档月份放入 ARCHIVE/<YYYY-MM>/ (热分片)，单个目录只保存一个月的归档
+    - 月份结束超过 bundle_after_days 天的热分片整体打包为 ARCHIVE/bundles/<YYYY-MM>.zip (内含清单)，
+      原文件删除；读取时直接从压缩包中取出，无需解包
+    - ARCHIVE/manifest.db 记录每个归档任务的位置，按 ID 查找与计数都不需要扫描目录
+    DEAD_LETTER / MILESTONES / .summaries 等子目录不受影响；直接放入 ARCHIVE/ 顶层的任务文件由 adopt_loose() 收编。
+    """
+    def __init__(self, archive_dir, bundle_after_days=DEFAULT_BUNDLE_AFTER_DAYS,
+                 roll_interval=DEFAULT_ROLL_INTERVAL_SECONDS, compress_level=DEFAULT_COMPRESS_LEVEL):
+        self.archive_dir = Path(archive_dir)
+        self.bundles_dir = self.archive_dir / BUNDLES_DIR
+        self.bundle_after_days = bundle_after_days
+        self.roll_interval = roll_interval
+        self.compress_level = compress_level
+        self._lock = threading.RLock()
+        self._conn = None
+        self._ids = None            # 已归档任务 ID 的内存缓存
+        self._data_version = None   # 其他进程修改清单时失效
+        self._bundles = OrderedDict()   # 压缩包路径 -> (mtime_ns, ZipFile)
+        self._last_roll = 0.0
+
+    @classmethod
+    def from_config(cls, archive_dir, cfg):
+        cfg = cfg or {}
+        return cls(
+            archive_dir,
+            bundle_after_days=cfg.get("bundle_after_days", DEFAULT_BUNDLE_AFTER_DAYS),
+            roll_interval=cfg.get("roll_interval_seconds", DEFAULT_ROLL_INTERVAL_SECONDS),
+            compress_level=cfg.get("compress_level", DEFAULT_COMPRESS_LEVEL),
+        )
+
+    # ---------- 清单 ----------
+    def _connect(self):
+        manifest = self.archive_dir / MANIFEST_FILE
+        if self._conn is not None and not manifest.exists():
+            # ARCHIVE 被整体移走 (如 cleanup_workspace 备份)，旧连接仍指向移走后的文件
+            self.close()
+            self._ids = None
+        if self._conn is None:
+            self.archive_dir.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(manifest), check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        with self._lock:
+            for _, bundle in self._bundles.values():
+                bundle.close()
+            self._bundles.clear()
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _register(self, conn, name, shard, archived_at, st):
+        existed = conn.execute("SELECT 1 FROM entries WHERE name = ?", (name,)).fetchone()
+        conn.execute(
+            "INSERT OR REPLACE INTO entries (name, task_id, shard, bundled, archived_at, mtime, size) VALUES (?, ?, ?, 0, ?, ?, ?)",
+            (name, task_parser.extract_task_id(name), shard, archived_at, st.st_mtime, st.st_size)
+        )
+        if not existed:
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'count'")
+        return not existed
+
+    def _remember_id(self, name):
+        task_id = task_parser.extract_task_id(name)
+        if self._ids is not None and task_id:
+            self._ids.add(task_id)
+
+    @staticmethod
+    def _entry(row):
+        name, task_id, shard, bundled, archived_at, mtime, size = row
+        return ArchiveEntry(name, task_id, shard, bool(bundled), archived_at, mtime, size)
+
+    # ---------- 写入 ----------
+    def add(self, src_path, archived_at=None):
+        """把任务文件移入当前月份的热分片并登记，返回新路径"""
+        src_path = Path(src_path)
+        archived_at = archived_at or time.time()
+        shard = datetime.datetime.fromtimestamp(archived_at).strftime(SHARD_FORMAT)
+        dest_dir = self.archive_dir / shard
+        dest_dir.mkdir(parents=True, exist_ok=True)
+        dest_path = dest_dir / src_path.name
+        with self._lock:
+            # 先登记再移动: 后台归档期间任务不会同时从 MESSAGES 与归档清单中消失
+            conn = self._connect()
+            with conn:
+                added = self._register(conn, src_path.name, shard, archived_at, src_path.stat())
+            try:
+                os.replace(src_path, dest_path)
+            except OSError:
+                if not added:
+                    raise
+                with conn:
+                    conn.execute("DELETE FROM entries WHERE name = ?", (src_path.name,))
+                    conn.execute("UPDATE meta SET value = value - 1 WHERE key = 'count'")
+                self._ids = None
+                raise
+            self._remember_id(src_path.name)
+        return dest_path
+
+    def adopt_loose(self):
+        """收编直接放在 ARCHIVE/ 顶层的任务文件 (旧版本的扁平归档或手工放入)，返回 [(旧路径, 新路径)]"""
+        moves = []
+        try:
+            with os.scandir(self.archive_dir) as it:
+                loose = [Path(e.path) for e in it if e.is_file() and e.name.endswith(".md")]
+        except OSError:
+            return moves
+        for path in loose:
+            try:
+                # 按文件的修改时间归入对应月份，旧文件会在下次滚动时直接打包
+                moves.append((path, self.add(path, archived_at=path.stat().st_mtime)))
+            except OSError:
+                continue
+        return moves
+
+    # ---------- 查询 ----------
+    def count(self):
+        """已归档任务数 (清单中的计数器，O(1))"""
+        with self._lock:
+            return self._connect().execute("SELECT value FROM meta WHERE key = 'count'").fetchone()[0]
+
+    def task_ids(self):
+        """已归档任务 ID 集合 (内存缓存，清单被其他进程修改后重新加载)"""
+        with self._lock:
+            conn = self._connect()
+            version = conn.execute("PRAGMA data_version").fetchone()[0]
+            if self._ids is None or version != self._data_version:
+                self._ids = {row[0] for row in conn.execute("SELECT task_id FROM entries WHERE task_id IS NOT NULL")}
+                self._data_version = version
+            return self._ids
+
+    def find(self, task_id):
+        """按任务 ID 查找归档记录 (同一 ID 有多个文件时取最近归档的)"""
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT name, task_id, shard, bundled, archived_at, mtime, size FROM entries "
+                "WHERE task_id = ? ORDER BY archived_at DESC LIMIT 1", (task_id,)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def recent(self, limit=100):
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT name, task_id, shard, bundled, archived_at, mtime, size FROM entries ORDER BY archived_at DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    def bundled_entries(self):
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT name, task_id, shard, bundled, archived_at, mtime, size FROM entries WHERE bundled = 1"
+            ).fetchall()
+        return [self._entry(row) for row in rows]
+
+    @staticmethod
+    def is_managed_dir(name):
+        """ARCHIVE/ 下由本存储管理的子目录 (热分片与压缩包目录)"""
+        return name == BUNDLES_DIR or bool(SHARD_RE.match(name))
+
+    def bundle_path(self, shard):
+        return self.bundles_dir / f"{shard}.zip"
+
+    def path_of(self, entry):
+        """归档文件的路径；已打包的任务返回 压缩包路径/文件名 形式的虚拟路径"""
+        if entry.bundled:
+            return self.bundle_path(entry.shard) / entry.name
+        return self.archive_dir / entry.shard / entry.name
+
+    def _open_bundle(self, path):
+        mtime = path.stat().st_mtime_ns
+        cached = self._bundles.get(path)
+        if cached and cached[0] == mtime:
+            self._bundles.move_to_end(path)
+            return cached[1]
+        if cached:
+            cached[1].close()
+        bundle = zipfile.ZipFile(path)
+        self._bundles[path] = (mtime, bundle)
+        while len(self._bundles) > OPEN_BUNDLE_CACHE:
+            self._bundles.popitem(last=False)[1][1].close()
+        return bundle
+
+    def read_bytes(self, entry):
+        with self._lock:
+            if entry.bundled:
+                return self._open_bundle(self.bundle_path(entry.shard)).read(entry.name)
+        with open(self.path_of(entry), "rb") as f:
+            return f.read()
+
+    def read_text(self, entry):
+        return task_parser.decode_task_bytes(self.read_bytes(entry))[0]
+
+    def split_virtual(self, path):
+        """ARCHIVE/bundles/<分片>.zip/<文件名> -> (分片, 文件名)，不是压缩包内路径时返回 None"""
+        path = Path(path)
+        parent = path.parent
+        if parent.suffix == ".zip" and parent.parent.name == BUNDLES_DIR:
+            return parent.stem, path.name
+        return None
+
+    def entry_for(self, path):
+        """虚拟路径对应的归档记录"""
+        parts = self.split_virtual(path)
+        if parts is None:
+            return None
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT name, task_id, shard, bundled, archived_at, mtime, size FROM entries WHERE name = ? AND shard = ? AND bundled = 1",
+                (parts[1], parts[0])
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    # ---------- 滚动打包 ----------
+    def roll_due(self):
+        now = time.time()
+        if now - self._last_roll < self.roll_interval:
+            return False
+        self._last_roll = now
+        return True
+
+    def _expired_shards(self, now):
+        cutoff = datetime.datetime.fromtimestamp(now) - datetime.timedelta(days=self.bundle_after_days)
+        shards = []
+        try:
+            with os.scandir(self.archive_dir) as it:
+                names = [e.name for e in it if e.is_dir() and SHARD_RE.match(e.name)]
+        except OSError:
+            return shards
+        for name in sorted(names):
+            start = datetime.datetime.strptime(name, SHARD_FORMAT)
+            month_end = (start.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+            if month_end <= cutoff:
+                shards.append(name)
+        return shards
+
+    def roll(self, now=None, progress=None):
+        """把已过期的热分片打包为压缩包，返回 [(原路径, 压缩包内虚拟路径)]；progress(已打包分片数, 总数) 逐分片回调"""
+        moves = []
+        shards = self._expired_shards(now or time.time())
+        for i, shard in enumerate(shards):
+            if progress:
+                progress(i, len(shards))
+            moves.extend(self._bundle_shard(shard))
+        return moves
+
+    def _bundle_shard(self, shard):
+        shard_dir = self.archive_dir / shard
+        files = sorted(p for p in shard_dir.iterdir() if p.is_file() and p.name.endswith(".md"))
+        names = {p.name for p in files}
+        bundle_path = self.bundle_path(shard)
+        self.bundles_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = bundle_path.with_name(f".{bundle_path.name}.tmp")
+        # 过期分片不会再写入新任务，压缩在锁外进行 (打包期间按 ID 查询与新的归档不受影响)
+        manifest = []
+        with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=self.compress_level) as zf:
+            # 同一月份已有压缩包时 (如旧文件被补收编) 合并其中的内容
+            if bundle_path.exists():
+                with zipfile.ZipFile(bundle_path) as old:
+                    for info in old.infolist():
+                        if info.filename != BUNDLE_MANIFEST and info.filename not in names:
+                            zf.writestr(info, old.read(info.filename))
+                            manifest.append(info.filename)
+            for path in files:
+                zf.write(path, path.name)
+                manifest.append(path.name)
+            zf.writestr(BUNDLE_MANIFEST, json.dumps(
+                [{"name": name, "task_id": task_parser.extract_task_id(name)} for name in manifest],
+                ensure_ascii=False, indent=1))
+        with self._lock:
+            conn = self._connect()
+            known = {row[0] for row in conn.execute("SELECT name FROM entries WHERE shard = ?", (shard,))}
+            # 压缩包落盘之后才更新清单与删除原文件，中途失败时原文件仍然完整
+            cached = self._bundles.pop(bundle_path, None)
+            if cached:
+                cached[1].close()
+            os.replace(tmp_path, bundle_path)
+            with conn:
+                for path in files:
+                    if path.name not in known:
+                        st = path.stat()
+                        self._register(conn, path.name, shard, st.st_mtime, st)
+                        self._remember_id(path.name)
+                    conn.execute("UPDATE entries SET bundled = 1 WHERE name = ?", (path.name,))
+            for path in files:
+                path.unlink()
+            try:
+                shard_dir.rmdir()
+            except OSError:
+                pass
+        return [(path, bundle_path / path.name) for path in files]
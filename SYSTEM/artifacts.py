@@ -0,0 +1,438 @@
+import os
+import re
+import hashlib
+import threading
+from pathlib import Path, PurePosixPath
+from typing import NamedTuple, Optional, List
+
+# 代码块: ```lang[:路径] ... ```
+FENCE_RE = re.compile(r'^```([^\n`]*)\n(.*?)^```[ \t]*$', re.MULTILINE | re.DOTALL)
+# 代码块信息串中的路径: title="a/b.py" / file=a/b.py / path: a/b.py
+INFO_PATH_ATTR_RE = re.compile(r'(?:title|file|path|filename)\s*[=:]\s*["\']?([^"\'\s]+)')
+# 代码块之前一行的路径提示: "文件: a/b.py" / "**a/b.py**" / "### `a/b.py`" / "[DIFF] a/b.py"
+PATH_HINT_RE = re.compile(
+    r'^[#>*\-\s]*(?:\[DIFF\]\s*)?(?:(?:文件名?|路径|File|Path|FILE|PATH)\s*[:：]\s*)?(?:\[DIFF\]\s*)?'
+    r'[*`]*([\w\-./\\]+\.[\w]+|[\w\-.]+/[\w\-./]+)[*`]*\s*[:：]?\s*$'
+)
+# 代码块首行的路径注释: "# file: a/b.py" / "// 文件: a/b.py" / "<!-- file: a.html -->"
+FIRST_LINE_PATH_RE = re.compile(
+    r'^\s*(?:#|//|--|/\*|<!--|;)\s*(?:file|文件|path|路径)\s*[:：]\s*([^\s*]+?)\s*(?:\*/|-->)?\s*$',
+    re.IGNORECASE
+)
+BARE_FILENAME_RE = re.compile(r'^[\w\-]+\.[A-Za-z]\w*$')
+HUNK_HEADER_RE = re.compile(r'^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@')
+DIFF_LANGS = ("diff", "patch", "udiff")
+DEFAULT_FEATURES_DIR = "features"
+# 补丁定位的最大 fuzz 等级 (忽略空白差异 / 丢弃首尾上下文行)
+DEFAULT_PATCH_FUZZ = 2
+
+
+class Hunk(NamedTuple):
+    old_start: int
+    lines: List[tuple]      # [(" " | "-" | "+", 行文本)]
+
+
+class FilePatch(NamedTuple):
+    path: str
+    hunks: List[Hunk]
+    is_new: bool
+
+
+class ArtifactOp(NamedTuple):
+    """从模型回复中解析出的一个产出操作"""
+    kind: str               # "file" 完整文件 / "diff" 统一格式补丁 / "invalid" 非法路径
+    path: str               # 相对于特性分支根目录的路径
+    content: Optional[str]
+    patch: Optional[FilePatch]
+
+
+class PatchError(Exception):
+    """补丁无法应用到目标文件 (上下文不匹配)"""
+
+
+class ArtifactResult:
+    """一次产出物落盘的结果: 已写入的文件与冲突列表"""
+    def __init__(self, branch_dir):
+        self.branch_dir = branch_dir
+        self.written = []       # [(相对路径, kind, 说明)]
+        self.conflicts = []     # [(相对路径, 原因)]
+        self.failed_patches = []    # 补丁无法应用的相对路径 (可回退为整文件重写)
+        self.patch_tokens = 0       # 以补丁形式写入的文件: 补丁本身的估算 Token
+        self.full_tokens = 0        # 同一批文件若整文件重写所需的估算 Token
+
+    def __bool__(self):
+        return bool(self.written or self.conflicts)
+
+
+def normalize_path(path):
+    """规范化模型给出的路径；绝对路径、越界路径 (..) 返回 None"""
+    p = path.strip().strip('`"\'*').replace("\\", "/")
+    while p.startswith("./"):
+        p = p[2:]
+    if p.startswith("/") or re.match(r'^[A-Za-z]:', p):
+        return None
+    # 模型常带上 PROJECT_SPACE/ 或 PROJECT_SPACE/features/IDxxx/ 前缀
+    if p.startswith("PROJECT_SPACE/"):
+        p = p[len("PROJECT_SPACE/"):]
+    if p.startswith(DEFAULT_FEATURES_DIR + "/"):
+        p = p.split("/", 2)[2] if p.count("/") >= 2 else ""
+    parts = PurePosixPath(p).parts
+    if not parts or ".." in parts:
+        return None
+    return str(PurePosixPath(*parts))
+
+
+def _strip_diff_path(path):
+    path = path.split("\t")[0].strip()
+    if path == "/dev/null":
+        return None
+    if path[:2] in ("a/", "b/"):
+        path = path[2:]
+    return path
+
+
+def parse_unified_diff(text, default_path=None):
+    """解析统一格式 diff，支持一个代码块中包含多个文件；没有 ---/+++ 头时使用 default_path"""
+    patches = []
+    path, is_new, hunks, current = default_path, False, [], None
+    lines = text.splitlines()
+
+    def flush():
+        if path and hunks:
+            patches.append(FilePatch(path, list(hunks), is_new))
+
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.startswith("--- ") and i + 1 < len(lines) and lines[i + 1].startswith("+++ "):
+            flush()
+            old_path = _strip_diff_path(line[4:])
+            new_path = _strip_diff_path(lines[i + 1][4:])
+            path, is_new, hunks, current = new_path or old_path, old_path is None, [], None
+            i += 2
+            continue
+        m = HUNK_HEADER_RE.match(line)
+        if m:
+            current = Hunk(int(m.group(1)), [])
+            hunks.append(current)
+        elif current is not None:
+            if line.startswith(("+", "-", " ")):
+                current.lines.append((line[0], line[1:]))
+            elif line == "":
+                # 部分模型会省略空上下文行前的空格
+                current.lines.append((" ", ""))
+            # "\ No newline at end of file" 等其他行忽略
+        i += 1
+    flush()
+    return patches
+
+
+def extract_artifacts(text):
+    """从模型回复中解析带路径标注的代码块与 [DIFF] 补丁，按出现顺序返回 ArtifactOp 列表"""
+    ops = []
+    for m in FENCE_RE.finditer(text):
+        info = m.group(1).strip()
+        body = m.group(2)
+        lang, _, info_rest = info.partition(" ")
+        path = None
+
+        # 1. 信息串: ```python:src/app.py 或 ```python title="src/app.py"
+        if ":" in lang:
+            lang, _, path = lang.partition(":")
+        elif "/" in lang or BARE_FILENAME_RE.match(lang):
+            path, lang = lang, lang.rsplit(".", 1)[-1]
+        if not path:
+            attr = INFO_PATH_ATTR_RE.search(info_rest)
+            if attr:
+                path = attr.group(1)
+
+        # 2. 代码块前一行的提示
+        preceding = text[:m.start()].rstrip("\n").rsplit("\n", 1)[-1]
+        is_diff = lang.lower() in DIFF_LANGS or "[DIFF]" in preceding
+        if not path:
+            hint = PATH_HINT_RE.match(preceding)
+            if hint:
+                path = hint.group(1)
+
+        # 3. 代码块首行注释
+        if not path and not is_diff:
+            first, _, remainder = body.partition("\n")
+            first_match = FIRST_LINE_PATH_RE.match(first)
+            if first_match:
+                path = first_match.group(1)
+                body = remainder
+
+        if is_diff or body.startswith("--- "):
+            for patch in parse_unified_diff(body, default_path=path):
+                rel = normalize_path(patch.path)
+                if rel:
+                    ops.append(ArtifactOp("diff", rel, None, patch._replace(path=rel)))
+                else:
+                    ops.append(ArtifactOp("invalid", patch.path, None, None))
+            continue
+
+        if path:
+            rel = normalize_path(path)
+            ops.append(ArtifactOp("file", rel, body, None) if rel else ArtifactOp("invalid", path, None, None))
+    return ops
+
+
+def _loose(line):
+    """宽松比较: 忽略行内空白差异"""
+    return " ".join(line.split())
+
+
+def _find_block(lines, block, expected, key=None):
+    """在 lines 中查找 block，优先从 expected 位置向两侧搜索，找不到返回 -1"""
+    n = len(block)
+    limit = len(lines) - n
+    if limit < 0:
+        return -1
+    if key:
+        lines = [key(line) for line in lines]
+        block = [key(line) for line in block]
+    expected = min(max(expected, 0), limit)
+    for delta in range(0, limit + 1):
+        for pos in (expected - delta, expected + delta):
+            if 0 <= pos <= limit and lines[pos:pos + n] == block:
+                return pos
+        if expected - delta < 0 and expected + delta > limit:
+            break
+    return -1
+
+
+def _locate_hunk(lines, hunk_lines, expected, fuzz):
+    """
+    定位 hunk，返回 (位置, 实际使用的 hunk 行, fuzz 等级)，失败返回 None。
+    fuzz 等级依次为: 精确匹配 -> 忽略空白差异 -> 丢弃首尾各 1..fuzz 行上下文 (同 GNU patch)。
+    """
+    for trim in range(fuzz + 1):
+        lead = 0
+        while lead < trim and lead < len(hunk_lines) and hunk_lines[lead][0] == " ":
+            lead += 1
+        tail = len(hunk_lines)
+        while len(hunk_lines) - tail < trim and tail > lead and hunk_lines[tail - 1][0] == " ":
+            tail -= 1
+        if trim and lead == 0 and tail == len(hunk_lines):
+            break
+        candidate = hunk_lines[lead:tail]
+        old = [t for op, t in candidate if op in (" ", "-")]
+        if not old:
+            continue
+        for key in (None, _loose):
+            pos = _find_block(lines, old, expected + lead, key)
+            if pos >= 0:
+                level = trim + (1 if key else 0)
+                return pos, candidate, level
+    return None
+
+
+def apply_patch(text, patch, fuzz=0):
+    """
+    将 FilePatch 应用到 text，返回 (新文本, 使用的最大 fuzz 等级)；无法定位时抛出 PatchError。
+    宽松匹配时上下文行保留文件中的原文，只替换 "-" / "+" 行。
+    """
+    trailing_newline = text.endswith("\n") or not text
+    lines = text.splitlines()
+    offset = 0
+    max_level = 0
+    for index, hunk in enumerate(patch.hunks):
+        old = [t for op, t in hunk.lines if op in (" ", "-")]
+        # 纯新增的 hunk (如新文件) 中 old_start 表示插入点之前的行号
+        base = hunk.old_start - 1 if old else hunk.old_start
+        if not old:
+            pos = min(max(base + offset, 0), len(lines))
+            hunk_lines = hunk.lines
+        else:
+            located = _locate_hunk(lines, hunk.lines, base + offset, fuzz)
+            if located is None:
+                raise PatchError(f"第 {index + 1} 个 hunk (原第 {hunk.old_start} 行) 上下文不匹配")
+            pos, hunk_lines, level = located
+            max_level = max(max_level, level)
+        replacement = []
+        cursor = pos
+        for op, t in hunk_lines:
+            if op == " ":
+                replacement.append(lines[cursor])
+                cursor += 1
+            elif op == "-":
+                cursor += 1
+            else:
+                replacement.append(t)
+        consumed = cursor - pos
+        lines[pos:cursor] = replacement
+        offset = pos - base + len(replacement) - consumed
+    result = "\n".join(lines)
+    return (result + "\n" if trailing_newline and lines else result), max_level
+
+
+def estimate_tokens(text):
+    """粗略估算 Token 数 (中文 UTF-8 约 3 字节/Token)"""
+    return len(text.encode("utf-8")) // 3 + 1 if text else 0
+
+
+def patch_text(patch):
+    """FilePatch 在回复中大致占用的文本 (用于估算 Diff 模式节省的输出 Token)"""
+    return "\n".join(f"{op}{t}" for hunk in patch.hunks for op, t in hunk.lines)
+
+
+def _hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest() if text is not None else None
+
+
+class ArtifactWriter:
+    """
+    把模型回复中的产出物落盘到 PR 暂存区 PROJECT_SPACE/features/<任务ID>/。
+    - 补丁的基准优先取特性分支中的同名文件，其次取主干 PROJECT_SPACE 中的文件
+    - 整批产出先全部写入临时文件，全部成功后再逐个原子重命名，失败时不留下半成品
+    - 冲突 (同一文件两次给出不同的完整内容 / 补丁无法应用 / 基准文件在生成期间被修改) 记录后跳过；
+      "生成期间" 以调用方传入的 base_hashes (构建提示词时读取的基准，见 DiffContext.build) 为起点，
+      未传入时只能发现解析回复到写盘之间的修改
+    """
+    _lock = threading.Lock()
+
+    def __init__(self, project_space_dir, features_dir=DEFAULT_FEATURES_DIR, fuzz=DEFAULT_PATCH_FUZZ):
+        self.project_space_dir = Path(project_space_dir)
+        self.features_root = self.project_space_dir / features_dir
+        self.fuzz = fuzz
+
+    def branch_dir(self, task_id):
+        return self.features_root / task_id
+
+    def resolve(self, task_id, rel, base_dirs=()):
+        """按 特性分支 -> 上游任务的特性分支 -> 主干 的顺序查找文件，不存在时返回 None"""
+        for root in (self.branch_dir(task_id), *base_dirs, self.project_space_dir):
+            candidate = Path(root) / rel
+            if candidate.is_file():
+                return candidate
+        return None
+
+    def _read_base(self, task_id, rel, base_dirs):
+        """读取补丁基准，返回 (磁盘路径, 文本, 内容哈希)；文件不存在时返回 (None, None, None)"""
+        candidate = self.resolve(task_id, rel, base_dirs)
+        if candidate is None:
+            return None, None, None
+        data = candidate.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()
+        try:
+            return candidate, data.decode("utf-8"), digest
+        except UnicodeDecodeError:
+            return candidate, data.decode("gbk", errors="replace"), digest
+
+    def _stage(self, task_id, reply_text, base_dirs=(), base_hashes=None):
+        """解析产出物并在内存中应用补丁，返回 (ArtifactResult, 待写入内容, 补丁基准)，不写盘"""
+        result = ArtifactResult(self.branch_dir(task_id))
+        ops = extract_artifacts(reply_text)
+        staged = {}         # 相对路径 -> [新内容, kind, 说明]
+        bases = {}          # 相对路径 -> (磁盘路径, 读取时的哈希)
+        full_writes = {}    # 相对路径 -> 完整内容的哈希
+        for op in ops:
+            if op.kind == "invalid":
+                result.conflicts.append((op.path, "路径为绝对路径或越出特性分支目录"))
+                continue
+            if op.path in full_writes and op.kind == "file" and full_writes[op.path] != _hash_text(op.content):
+                result.conflicts.append((op.path, "同一文件给出了两份不同的完整内容，保留第一份"))
+                continue
+            if op.kind == "file":
+                content = op.content if op.content.endswith("\n") else op.content + "\n"
+                full_writes[op.path] = _hash_text(op.content)
+                staged[op.path] = [content, "file", f"完整文件，{content.count(chr(10))} 行"]
+                continue
+
+            if op.path in staged:
+                base_text = staged[op.path][0]
+            else:
+                base_path, base_text, base_hash = self._read_base(task_id, op.path, base_dirs)
+                expected = (base_hashes or {}).get(op.path)
+                if expected is not None and (base_path is None or (Path(base_path), base_hash) != expected):
+                    result.conflicts.append((op.path, "基准文件在生成期间已被修改"))
+                    continue
+                if base_path is not None:
+                    bases[op.path] = (base_path, base_hash)
+                elif not op.patch.is_new:
+                    result.conflicts.append((op.path, "补丁的目标文件不存在"))
+                    continue
+                else:
+                    base_text = ""
+            try:
+                new_text, level = apply_patch(base_text, op.patch, self.fuzz)
+            except PatchError as e:
+                result.conflicts.append((op.path, str(e)))
+                result.failed_patches.append(op.path)
+                continue
+            added = sum(1 for h in op.patch.hunks for o, _ in h.lines if o == "+")
+            removed = sum(1 for h in op.patch.hunks for o, _ in h.lines if o == "-")
+            detail = f"DIFF +{added} -{removed}" + (f"，fuzz {level}" if level else "")
+            staged[op.path] = [new_text, "diff", detail]
+            result.patch_tokens += estimate_tokens(patch_text(op.patch))
+            result.full_tokens += estimate_tokens(new_text)
+        return result, staged, bases
+
+    def dry_run(self, task_id, reply_text, base_dirs=(), base_hashes=None):
+        """只检查产出物能否应用到当前版本 (补丁失败、路径非法等记录在 conflicts 中)，不写盘"""
+        return self._stage(task_id, reply_text, base_dirs, base_hashes)[0]
+
+    def materialize(self, task_id, reply_text, base_dirs=(), base_hashes=None):
+        """
+        解析 reply_text 并把产出物写入特性分支，返回 ArtifactResult。
+        base_dirs 为补丁基准的额外查找目录 (如上游任务的特性分支)；
+        base_hashes 为构建提示词时的 {相对路径: (磁盘路径, 内容哈希)}，补丁基准与之不一致时记为冲突。
+        """
+        result, staged, bases = self._stage(task_id, reply_text, base_dirs, base_hashes)
+        if not staged:
+            return result
+        branch = result.branch_dir
+
+        with self._lock:
+            # 解析回复之后、写盘之前基准文件又被其他任务修改时同样放弃该文件
+            for rel, (base_path, base_hash) in bases.items():
+                if rel not in staged:
+                    continue
+                try:
+                    current = hashlib.sha256(base_path.read_bytes()).hexdigest()
+                except OSError:
+                    current = None
+                if current != base_hash:
+                    result.conflicts.append((rel, "基准文件在生成期间已被修改"))
+                    del staged[rel]
+
+            temp_files = []
+            try:
+                for rel, (content, kind, detail) in staged.items():
+                    target = branch / rel
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    tmp = target.with_name(f".{target.name}.{os.getpid()}.tmp")
+                    with open(tmp, "w", encoding="utf-8", newline="") as f:
+                        f.write(content)
+                        f.flush()
+                        os.fsync(f.fileno())
+                    temp_files.append((tmp, target, rel, kind, detail))
+            except OSError:
+                for tmp, *_ in temp_files:
+                    try:
+                        tmp.unlink()
+                    except OSError:
+                        pass
+                raise
+            for tmp, target, rel, kind, detail in temp_files:
+                os.replace(tmp, target)
+                result.written.append((rel, kind, detail))
+        return result
+
+
+def format_report(result, project_space_dir, title="产出文件"):
+    """生成追加到任务文件中的产出文件清单 (Markdown)"""
+    if not result:
+        return ""
+    try:
+        branch = result.branch_dir.relative_to(Path(project_space_dir).parent)
+    except ValueError:
+        branch = result.branch_dir
+    lines = [f"\n\n### {title} ({branch.as_posix()}/)"]
+    for rel, kind, detail in result.written:
+        lines.append(f"- `{rel}` ({detail})")
+    if result.conflicts:
+        lines.append("\n**未写入 (冲突)**")
+        for rel, reason in result.conflicts:
+            lines.append(f"- `{rel}`: {reason}")
+    return "\n".join(lines) + "\n"
@@ -1,5 +1,6 @@
 import os
 import sys
+import hashlib
 import subprocess
 import venv
 from pathlib import Path
@@ -11,6 +12,9 @@ if sys.stdout.encoding.lower() != 'utf-8':
 # 虚拟环境目录名称
 VENV_DIR = ".venv"
 REQUIREMENTS = ["rich", "questionary", "openai", "pyyaml", "gradio"]
+REQUIREMENTS_FILE = "requirements.txt"
+# 上次成功安装依赖时的需求哈希，未变化时跳过依赖检查 (删除该文件或加 --reinstall 可强制重新检查)
+REQUIREMENTS_STAMP = os.path.join(VENV_DIR, ".requirements.sha256")
 
 def is_in_venv():
     """判断当前是否已在虚拟环境中"""
@@ -23,7 +27,29 @@ def get_venv_python():
     else:
         return os.path.join(VENV_DIR, "bin", "python")
 
+def requirements_hash(venv_python):
+    """需求清单 (requirements.txt，缺失时为内置列表) 与虚拟环境解释器的哈希"""
+    digest = hashlib.sha256()
+    if os.path.exists(REQUIREMENTS_FILE):
+        with open(REQUIREMENTS_FILE, "rb") as f:
+            digest.update(f.read())
+    else:
+        digest.update("\n".join(REQUIREMENTS).encode("utf-8"))
+    digest.update(os.path.abspath(venv_python).encode("utf-8"))
+    return digest.hexdigest()
+
+def requirements_up_to_date(current_hash):
+    try:
+        with open(REQUIREMENTS_STAMP, "r", encoding="utf-8") as f:
+            return f.read().strip() == current_hash
+    except OSError:
+        return False
+
 def setup():
+    # --reinstall 只由本脚本处理，不传给核心引擎
+    force_check = "--reinstall" in sys.argv
+    engine_args = [arg for arg in sys.argv[1:] if arg != "--reinstall"]
+
     print("=========================================")
     print("    🚀 A1_Nexus 环境自检与初始化模块")
     print("=========================================")
@@ -46,26 +72,25 @@ def setup():
         print("建议删除 .venv 文件夹后重新运行本脚本。")
         sys.exit(1)
 
-    # 2. 自动安装依赖
-    print(">> 正在检测并安装必须的依赖库 (rich, questionary, openai, pyyaml)...")
-    try:
-        # 使用虚拟环境的 python -m pip，避免 pip.exe 路径硬编码导致的 Fatal error in launcher
-        pip_cmd = [venv_python, "-m", "pip"]
-        
-        # 检查是否已经安装了依赖，避免每次都运行 pip install
+    # 2. 自动安装依赖 (需求清单未变化时跳过，避免每次启动都运行 pip)
+    current_hash = requirements_hash(venv_python)
+    if not force_check and requirements_up_to_date(current_hash):
+        print(">> 依赖清单未变化，跳过依赖检查 (加 --reinstall 可强制重新检查)。")
+    else:
+        print(">> 正在检测并安装必须的依赖库...")
         try:
-            import rich
-            import questionary
-            import openai
-            import yaml
-            import gradio
-            print("   ✅ 依赖包已安装！")
-        except ImportError:
-            subprocess.check_call(pip_cmd + ["install", "--quiet"] + REQUIREMENTS)
-            print("   ✅ 依赖包安装完成！")
-    except subprocess.CalledProcessError as e:
-        print(f"   ❌ 依赖安装失败，错误码: {e.returncode}")
-        sys.exit(1)
+            # 使用虚拟环境的 python -m pip，避免 pip.exe 路径硬编码导致的 Fatal error in launcher
+            pip_cmd = [venv_python, "-m", "pip", "install", "--quiet"]
+            if os.path.exists(REQUIREMENTS_FILE):
+                subprocess.check_call(pip_cmd + ["-r", REQUIREMENTS_FILE])
+            else:
+                subprocess.check_call(pip_cmd + REQUIREMENTS)
+            with open(REQUIREMENTS_STAMP, "w", encoding="utf-8") as f:
+                f.write(current_hash)
+            print("   ✅ 依赖包已就绪！")
+        except subprocess.CalledProcessError as e:
+            print(f"   ❌ 依赖安装失败，错误码: {e.returncode}")
+            sys.exit(1)
 
     print("=========================================")
     print("环境准备就绪！")
@@ -80,8 +105,8 @@ def setup():
 
     try:
         # 使用虚拟环境的 python 启动核心脚本
-        # 传递所有参数，包括 --auto
-        subprocess.call([venv_python, main_script] + sys.argv[1:])
+        # 传递其余参数，包括 --auto
+        subprocess.call([venv_python, main_script] + engine_args)
     except KeyboardInterrupt:
         print("\n>> 您已手动终止调度系统。")
 
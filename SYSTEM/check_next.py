@@ -1,8 +1,9 @@
 import os
-import re
 import sys
 from pathlib import Path
 
+from task_parser import parse_task_filename
+
 # 强制设置标准输出编码为 utf-8，解决 Windows 下打印 emoji 报错的问题
 if sys.stdout.encoding.lower() != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
@@ -28,13 +29,14 @@ def main():
         has_tasks = True
         filename = file_path.name
         
+        # 与调度引擎共用同一套文件名解析规则
+        name = parse_task_filename(filename)
+        
         # 提取状态前缀：例如 [NEW], [READ], [DONE], [FAIL], 等
-        status_match = re.match(r'^(\[.*?\])', filename)
-        status = status_match.group(1) if status_match else "无状态"
+        status = f"[{name.status}]" if name and name.status is not None else "无状态"
         
-        # 提取接收者 (TO_后面的部分直到下划线)
-        receiver_match = re.search(r'TO_([^_]+)_', filename)
-        receiver = receiver_match.group(1) if receiver_match else "未知接收者"
+        # 提取接收者 (TO_ 与任务 ID 之间的部分)
+        receiver = name.receiver if name else "未知接收者"
 
         print(f"📄 文件名: {filename}")
         print(f"  -> 状态标签: {status}")
@@ -49,6 +51,8 @@ def main():
             print(f"  => 🗑️ [等待清理] 二次迭代已完成，等待 P9-行政 进行 GC 垃圾回收。")
         elif "[FAIL]" in status:
             print(f"  => 💥 [熔断警告] 任务多次失败！需要上级重新评估并下发新任务。")
+        elif "[EXPIRED]" in status:
+            print(f"  => 🗑️ [死信] 任务长期无进展已过期，等待 P9 回收至 ARCHIVE/DEAD_LETTER/。")
             
         print("------------------------------------------------------------")
 
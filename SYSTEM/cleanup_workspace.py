@@ -1,77 +1,114 @@
 import os
+import sys
 import shutil
+import argparse
 import datetime
 
-def cleanup_workspace():
-    print("==================================================")
-    print("        A1_Nexus 工作区清理与归档工具")
-    print("==================================================")
-    print("警告：此操作将清理当前工作区，为新项目做准备。")
-    print("请确保您已经将 PROJECT_SPACE 中的重要产出物保存或移走！\n")
-    
-    confirm = input("您确定要继续清理吗？(y/n): ")
-    if confirm.lower() != 'y':
-        print("清理已取消。")
-        return
+from snapshot_store import SnapshotStore
+
+
+def _clear_dir(directory, log):
+    for filename in os.listdir(directory):
+        file_path = os.path.join(directory, filename)
+        try:
+            if os.path.isfile(file_path) or os.path.islink(file_path):
+                os.unlink(file_path)
+            elif os.path.isdir(file_path):
+                shutil.rmtree(file_path)
+        except Exception as e:
+            log(f"[错误] 无法删除 {file_path}. 原因: {e}")
+
+
+def _load_snapshot_store():
+    from search_index import load_system_config
+    return SnapshotStore.from_config(load_system_config().get("snapshots"))
+
+
+def cleanup_workspace(assume_yes=False, snapshot=False, store=None, log=print, progress=None,
+                      archive_dir="ARCHIVE", messages_dir="MESSAGES", project_space="PROJECT_SPACE"):
+    """
+    清理工作区，为新项目做准备 (多项目时传入该项目的 ARCHIVE / MESSAGES / PROJECT_SPACE 目录)。
+    - assume_yes: 不询问确认 (供 Web UI / 定时任务调用)；此时只有 snapshot=True 才会清空 PROJECT_SPACE
+    - snapshot: 先为 PROJECT_SPACE 创建增量快照，再清空 PROJECT_SPACE
+    - progress: 快照进度回调 progress(done, total) (后台作业使用)
+    返回是否完成 (取消或快照失败时返回 False)
+    """
+    log("==================================================")
+    log("        A1_Nexus 工作区清理与归档工具")
+    log("==================================================")
+    if not assume_yes:
+        log("警告：此操作将清理当前工作区，为新项目做准备。")
+        log("请确保您已经将 PROJECT_SPACE 中的重要产出物保存或移走！\n")
+
+        confirm = input("您确定要继续清理吗？(y/n): ")
+        if confirm.lower() != 'y':
+            log("清理已取消。")
+            return False
 
     # 1. 归档 ARCHIVE 目录
-    archive_dir = "ARCHIVE"
+    archive_dir = str(archive_dir)
     if os.path.exists(archive_dir) and os.listdir(archive_dir):
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        backup_folder = f"ARCHIVE_BACKUP_{timestamp}"
+        backup_folder = f"{archive_dir}_BACKUP_{timestamp}"
+        n = 1
+        while os.path.exists(backup_folder):
+            n += 1
+            backup_folder = f"{archive_dir}_BACKUP_{timestamp}_{n}"
         os.rename(archive_dir, backup_folder)
         os.makedirs(archive_dir)
-        print(f"[成功] 旧任务已归档至: {backup_folder}")
+        log(f"[成功] 旧任务已归档至: {backup_folder}")
     else:
-        print("[跳过] ARCHIVE 目录为空，无需归档。")
+        log("[跳过] ARCHIVE 目录为空，无需归档。")
 
     # 2. 清空 MESSAGES 目录
-    messages_dir = "MESSAGES"
+    messages_dir = str(messages_dir)
     if os.path.exists(messages_dir):
-        for filename in os.listdir(messages_dir):
-            file_path = os.path.join(messages_dir, filename)
-            try:
-                if os.path.isfile(file_path) or os.path.islink(file_path):
-                    os.unlink(file_path)
-                elif os.path.isdir(file_path):
-                    shutil.rmtree(file_path)
-            except Exception as e:
-                print(f"[错误] 无法删除 {file_path}. 原因: {e}")
-        print(f"[成功] MESSAGES 目录已清空。")
+        _clear_dir(messages_dir, log)
+        log(f"[成功] MESSAGES 目录已清空。")
 
     # 3. 提示清理 PROJECT_SPACE
-    project_space = "PROJECT_SPACE"
+    project_space = str(project_space)
     if os.path.exists(project_space) and os.listdir(project_space):
-        print(f"\n[注意] PROJECT_SPACE 目录中仍有文件。")
-        clean_ps = input("是否要一并清空 PROJECT_SPACE 目录？(y/n): ")
-        if clean_ps.lower() == 'y':
-            # 备份 PROJECT_SPACE
-            timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-            backup_folder = f"PROJECT_BACKUP_{timestamp}"
+        if assume_yes:
+            clean_ps = snapshot
+        else:
+            log(f"\n[注意] PROJECT_SPACE 目录中仍有文件。")
+            clean_ps = input("是否要一并清空 PROJECT_SPACE 目录？(y/n): ").lower() == 'y'
+        if clean_ps:
+            # 增量快照: 与已有快照内容相同的文件不会重复存储
+            store = store or _load_snapshot_store()
             try:
-                shutil.copytree(project_space, backup_folder)
-                print(f"[成功] PROJECT_SPACE 已备份至: {backup_folder}")
+                info = store.create(project_space, label="cleanup", progress=progress)
+                log(f"[成功] PROJECT_SPACE 已创建快照: {info.describe()}")
+                log(f"       恢复命令: python SYSTEM/snapshot_store.py restore {info.id}")
             except Exception as e:
-                print(f"[错误] 备份 PROJECT_SPACE 失败: {e}")
-                print("为安全起见，取消清理 PROJECT_SPACE。")
-                return
-
-            for filename in os.listdir(project_space):
-                file_path = os.path.join(project_space, filename)
-                try:
-                    if os.path.isfile(file_path) or os.path.islink(file_path):
-                        os.unlink(file_path)
-                    elif os.path.isdir(file_path):
-                        shutil.rmtree(file_path)
-                except Exception as e:
-                    print(f"[错误] 无法删除 {file_path}. 原因: {e}")
-            print(f"[成功] PROJECT_SPACE 目录已清空。")
+                log(f"[错误] 创建 PROJECT_SPACE 快照失败: {e}")
+                log("为安全起见，取消清理 PROJECT_SPACE。")
+                return False
+
+            _clear_dir(project_space, log)
+            log(f"[成功] PROJECT_SPACE 目录已清空。")
+            dropped, objects, freed = store.prune()
+            if dropped:
+                log(f"[成功] 已删除 {dropped} 个旧快照 (保留最近 {store.keep} 个)，回收 {objects} 个对象")
         else:
-            print("[跳过] PROJECT_SPACE 目录保留。")
+            log("[跳过] PROJECT_SPACE 目录保留。")
+
+    log("\n==================================================")
+    log("清理完成！系统已准备好迎接下一个项目。")
+    log("==================================================")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A1_Nexus 工作区清理与归档工具")
+    parser.add_argument("--yes", "-y", action="store_true", help="不询问确认 (可用于定时任务)")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="为 PROJECT_SPACE 创建增量快照后清空它 (配合 --yes 使用；不加时保留 PROJECT_SPACE)")
+    args = parser.parse_args()
+    if not cleanup_workspace(assume_yes=args.yes, snapshot=args.snapshot):
+        sys.exit(1)
 
-    print("\n==================================================")
-    print("清理完成！系统已准备好迎接下一个项目。")
-    print("==================================================")
 
 if __name__ == "__main__":
-    cleanup_workspace()
+    main()
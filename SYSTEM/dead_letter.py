@@ -0,0 +1,226 @@
+import os
+import re
+import time
+from pathlib import Path
+
+import task_parser
+
+# 任务头部的失败计数与最近一次失败原因
+FAIL_COUNT_RE = re.compile(r'^\**FAIL_COUNT:\s*(\d+)\**[ \t]*$', re.MULTILINE)
+LAST_ERROR_LINE_RE = re.compile(r'^\**LAST_ERROR:[^\n]*\n?', re.MULTILINE)
+# LAST_ERROR 行开头的时间即最近一次执行 (失败) 的时间
+LAST_ERROR_TIME_RE = re.compile(r'^\**LAST_ERROR:\s*(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})', re.MULTILINE)
+LAST_ERROR_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+DEPENDS_ON_LINE_RE = re.compile(r'^[^\n]*DEPENDS_ON:[^\n]*\n', re.MULTILINE)
+
+DEAD_LETTER_DIR = "DEAD_LETTER"
+DEFAULT_MAX_FAILURES = 2
+# 制度总纲: 超过 2 个周期的无响应任务直接回收 (看板周期按天计)
+DEFAULT_EXPIRE_AFTER_HOURS = 48
+DEFAULT_SWEEP_INTERVAL_SECONDS = 60
+LAST_ERROR_MAX_CHARS = 200
+# 已结束的状态不参与过期回收
+FINAL_STATUSES = ("DONE", "FAIL", "EXPIRED")
+# 环境错误 (与任务内容无关，不计入失败次数): 连接失败 / 超时 / 限流 / 服务端 5xx / 鉴权失败 / 模型不存在
+ENVIRONMENT_ERROR_NAMES = {
+    "ConnectionError", "TimeoutError", "APIConnectionError", "APITimeoutError", "RateLimitError",
+    "InternalServerError", "AuthenticationError", "PermissionDeniedError", "NotFoundError",
+}
+ENVIRONMENT_STATUS_CODES = (401, 403, 404, 408, 429)
+# 执行节点回报的错误为 "异常类名: 说明"
+REMOTE_ERROR_NAME_RE = re.compile(r'^(\w+): ')
+
+
+def is_environment_error(error):
+    """
+    模型请求的异常是否属于环境问题 (服务不可达、限流、5xx、鉴权或模型配置错误)，而不是任务本身导致的失败。
+    远程调用的 RemoteError 按执行节点回报的异常类名判断；没有类名 (执行节点失联、未返回内容) 同样视为环境问题。
+    """
+    names = {cls.__name__ for cls in type(error).__mro__}
+    if "RemoteError" in names:
+        match = REMOTE_ERROR_NAME_RE.match(str(error))
+        return match is None or match.group(1) in ENVIRONMENT_ERROR_NAMES
+    status = getattr(error, "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status in ENVIRONMENT_STATUS_CODES
+    return bool(names & ENVIRONMENT_ERROR_NAMES)
+
+
+def read_fail_count(text):
+    match = FAIL_COUNT_RE.search(text or "")
+    return int(match.group(1)) if match else 0
+
+
+def read_last_attempt(text):
+    """最近一次执行失败的时间戳 (秒)，从未执行过 (或未失败过) 时为 None"""
+    match = LAST_ERROR_TIME_RE.search(text or "")
+    if not match:
+        return None
+    try:
+        return time.mktime(time.strptime(match.group(1), LAST_ERROR_TIME_FORMAT))
+    except (ValueError, OverflowError):
+        return None
+
+
+def set_failure_headers(text, count, reason):
+    """更新任务头部的 FAIL_COUNT / LAST_ERROR (没有时插入到 DEPENDS_ON 之后)"""
+    reason = " ".join(str(reason).split())[:LAST_ERROR_MAX_CHARS]
+    lines = f"**FAIL_COUNT: {count}**\n**LAST_ERROR: {time.strftime(LAST_ERROR_TIME_FORMAT)} {reason}**\n"
+    text = LAST_ERROR_LINE_RE.sub("", text, count=1)
+    if FAIL_COUNT_RE.search(text):
+        return FAIL_COUNT_RE.sub(lines.rstrip("\n"), text, count=1)
+    anchor = DEPENDS_ON_LINE_RE.search(text)
+    if anchor:
+        return text[:anchor.end()] + lines + text[anchor.end():]
+    return lines + "\n" + text
+
+
+class DeadLetterQueue:
+    """
+    熔断与死信回收 (对应制度总纲中的 [FAIL] / [EXPIRED]):
+    - 任务每失败一次，头部的 FAIL_COUNT 加一；达到 max_failures 后标记为 [FAIL] 并移入 ARCHIVE/DEAD_LETTER/
+    - 超过 expire_after_hours 无进展的任务标记为 [EXPIRED] 并移入同一目录 (见 sweep_expired)
+    死信任务的下游不会被执行 (依赖永远无法满足)，其余分支照常调度；上级在宽限期内未下发 Fix 任务时下游随之过期。
+    死信文件的修改时间即进入死信的时间。
+    """
+    def __init__(self, archive_dir, messages_dir, max_failures=DEFAULT_MAX_FAILURES,
+                 expire_after_hours=DEFAULT_EXPIRE_AFTER_HOURS, sweep_interval=DEFAULT_SWEEP_INTERVAL_SECONDS):
+        self.archive_dir = Path(archive_dir)
+        self.messages_dir = Path(messages_dir)
+        self.dir = self.archive_dir / DEAD_LETTER_DIR
+        self.max_failures = max(1, max_failures)
+        self.expire_after_hours = expire_after_hours
+        self.sweep_interval = sweep_interval
+        self._last_sweep = 0.0
+
+    @classmethod
+    def from_config(cls, archive_dir, messages_dir, cfg):
+        cfg = cfg or {}
+        return cls(
+            archive_dir, messages_dir,
+            max_failures=cfg.get("max_failures", DEFAULT_MAX_FAILURES),
+            expire_after_hours=cfg.get("expire_after_hours", DEFAULT_EXPIRE_AFTER_HOURS),
+            sweep_interval=cfg.get("sweep_interval_seconds", DEFAULT_SWEEP_INTERVAL_SECONDS),
+        )
+
+    def _move(self, path, status):
+        """改写状态标签并移入死信目录，返回新路径"""
+        self.dir.mkdir(parents=True, exist_ok=True)
+        dest = self.dir / task_parser.with_status(path.name, status)
+        os.replace(path, dest)
+        # os.replace 保留原修改时间，这里改为进入死信的时间 (下游的过期回收从此时算起)
+        os.utime(dest)
+        return dest
+
+    def record_failure(self, task, reason):
+        """记录一次失败，返回 (累计失败次数, 熔断后的死信路径或 None)"""
+        path = Path(task['file'])
+        encoding = task.get('encoding', 'utf-8')
+        text = task_parser.read_task_body(path, encoding)
+        count = read_fail_count(text) + 1
+        tmp_path = path.with_name(f".{path.name}.tmp")
+        with open(tmp_path, "w", encoding=encoding) as f:
+            f.write(set_failure_headers(text, count, reason))
+        os.replace(tmp_path, path)
+        if count < self.max_failures:
+            return count, None
+        return count, self._move(path, "FAIL")
+
+    def dead_ids(self):
+        """死信目录中的任务 ID"""
+        if not self.dir.exists():
+            return set()
+        return {task_id for task_id in (task_parser.extract_task_id(p.name) for p in self.dir.glob("*.md")) if task_id}
+
+    def dead_times(self):
+        """死信目录中的任务 ID -> 进入死信的时间戳 (秒)"""
+        if not self.dir.exists():
+            return {}
+        times = {}
+        for path in self.dir.glob("*.md"):
+            task_id = task_parser.extract_task_id(path.name)
+            if not task_id:
+                continue
+            try:
+                times[task_id] = path.stat().st_mtime
+            except OSError:
+                continue
+        return times
+
+    @staticmethod
+    def blocked_since(tasks, dead_times):
+        """tasks 中被死信任务阻塞的任务 ID -> 开始被阻塞的时间 (最早进入死信的上游的时间)"""
+        children = {}
+        for t in tasks:
+            for dep in t["depends_on"]:
+                children.setdefault(dep, []).append(t["id"])
+        since = {}
+        # 按进入死信的先后多源遍历: 先到达的时间即最早的阻塞时间，每个任务只访问一次
+        for root, dead_at in sorted(dead_times.items(), key=lambda item: item[1]):
+            queue = [root]
+            while queue:
+                for child in children.get(queue.pop(), []):
+                    if child not in since:
+                        since[child] = dead_at
+                        queue.append(child)
+        return since
+
+    @staticmethod
+    def downstream_of(tasks, roots):
+        """tasks 中直接或间接依赖 roots 的任务 ID (即需要跳过的下游子图)"""
+        children = {}
+        for t in tasks:
+            for dep in t["depends_on"]:
+                children.setdefault(dep, []).append(t["id"])
+        blocked = set()
+        queue = list(roots)
+        while queue:
+            for child in children.get(queue.pop(), []):
+                if child not in blocked:
+                    blocked.add(child)
+                    queue.append(child)
+        return blocked
+
+    def sweep_due(self):
+        """距离上次过期回收已超过 sweep_interval 秒 (过期回收关闭时始终为 False)"""
+        now = time.time()
+        if not self.expire_after_hours or now - self._last_sweep < self.sweep_interval:
+            return False
+        self._last_sweep = now
+        return True
+
+    def sweep_expired(self, tasks, done_ids, busy=()):
+        """
+        回收超过 expire_after_hours 无进展的任务，返回 [(死信路径, 原因)]。"无进展" 按以下时间计算
+        (而不是文件的创建 / 修改时间):
+        - 上游已进入死信 ([FAIL] / [EXPIRED]) 的下游: 从上游进入死信的时间算起 (宽限期内上级可下发 Fix 任务并改写依赖)
+        - 执行失败后未再次执行的任务: 从头部 LAST_ERROR 记录的最近一次执行时间算起
+        从未执行过的可执行任务、仍在等待 MESSAGES 中未完成上游的任务属于正常排队，不会被回收。
+        busy 为正在执行的任务 ID (回收在后台进行时可能与执行重叠)，同样跳过。
+        """
+        if not self.expire_after_hours:
+            return []
+        live = {t["id"] for t in tasks if not any(s in (t["status"] or "").upper() for s in FINAL_STATUSES)}
+        cutoff = time.time() - self.expire_after_hours * 3600
+        blocked = self.blocked_since(tasks, self.dead_times())
+        expired = []
+        for t in tasks:
+            if t["id"] not in live or t["id"] in busy:
+                continue
+            path = Path(t["file"])
+            try:
+                if t["id"] in blocked:
+                    if blocked[t["id"]] > cutoff:
+                        continue
+                    reason = f"上游进入死信后超过 {self.expire_after_hours} 小时未下发 Fix 任务"
+                else:
+                    if any(dep in live and dep not in done_ids for dep in t["depends_on"]):
+                        continue
+                    attempted = read_last_attempt(task_parser.read_task_body(path, t.get("encoding", "utf-8")))
+                    if attempted is None or attempted > cutoff:
+                        continue
+                    reason = f"执行失败后超过 {self.expire_after_hours} 小时未再次执行"
+                expired.append((self._move(path, "EXPIRED"), reason))
+            except OSError:
+                continue
+        return expired
@@ -0,0 +1,121 @@
+import re
+import hashlib
+from pathlib import Path
+
+from artifacts import normalize_path
+
+# 任务头部显式声明要修改的文件: TARGET_FILES: src/a.py, src/b.py
+TARGET_FILES_RE = re.compile(r'TARGET_FILES:\s*([^\n]+)')
+# 正文中提及的文件路径 (含扩展名)
+PATH_MENTION_RE = re.compile(r'(?<![\w/.\-])((?:[\w\-.]+/)*[\w\-]+\.[A-Za-z][\w]{0,7})(?![\w/])')
+
+DEFAULT_DIFF_MAX_FILES = 5
+DEFAULT_DIFF_CONTEXT_CHARS = 16000
+
+
+class DiffContext:
+    """
+    Diff 模式的上下文构建器:
+    找出任务要修改的已有文件，带行号注入提示词，并要求模型只输出 [DIFF] 统一格式补丁；
+    补丁无法应用时由引擎回退为对应文件的整文件重写。
+    """
+    def __init__(self, writer, max_files=DEFAULT_DIFF_MAX_FILES, context_chars=DEFAULT_DIFF_CONTEXT_CHARS):
+        self.writer = writer
+        self.max_files = max_files
+        self.context_chars = context_chars
+
+    def targets(self, task_id, task_text, base_dirs=()):
+        """返回 [(相对路径, 磁盘路径)]：TARGET_FILES 声明优先，其次为正文中提及且已存在的文件"""
+        candidates = []
+        declared = TARGET_FILES_RE.search(task_text)
+        if declared:
+            candidates.extend(p.strip(" *`") for p in declared.group(1).split(","))
+        candidates.extend(m.group(1) for m in PATH_MENTION_RE.finditer(task_text))
+
+        found = []
+        seen = set()
+        for raw in candidates:
+            rel = normalize_path(raw) if raw else None
+            if not rel or rel in seen:
+                continue
+            seen.add(rel)
+            path = self.writer.resolve(task_id, rel, base_dirs)
+            if path is not None:
+                found.append((rel, path))
+            if len(found) >= self.max_files:
+                break
+        return found
+
+    @staticmethod
+    def _decode(data):
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            return data.decode("gbk", errors="replace")
+
+    @classmethod
+    def _read(cls, path):
+        return cls._decode(Path(path).read_bytes())
+
+    def build(self, targets, bases=None):
+        """
+        生成带行号的目标文件上下文 (受总长度预算限制)，没有目标文件时返回空串。
+        bases 为 dict 时写入 {相对路径: (磁盘路径, 内容哈希)}，即模型看到的补丁基准，
+        落盘时 (ArtifactWriter.materialize 的 base_hashes) 据此检查基准文件是否在生成期间被修改。
+        """
+        if not targets:
+            return ""
+        parts = []
+        used = 0
+        for rel, path in targets:
+            try:
+                data = Path(path).read_bytes()
+            except OSError:
+                continue
+            if bases is not None:
+                bases[rel] = (Path(path), hashlib.sha256(data).hexdigest())
+            lines = self._decode(data).splitlines()
+            width = len(str(len(lines)))
+            numbered = "\n".join(f"{i:>{width}}| {line}" for i, line in enumerate(lines, 1))
+            block = f"### {rel} (共 {len(lines)} 行)\n```\n{numbered}\n```\n"
+            if used + len(block) > self.context_chars:
+                parts.append(f"### {rel} (共 {len(lines)} 行，超出上下文预算未展开)\n")
+                continue
+            parts.append(block)
+            used += len(block)
+        if not parts:
+            return ""
+        return (
+            "以下文件已存在。修改它们时只输出 [DIFF] 统一格式补丁 (--- a/路径 / +++ b/路径 / @@ 行号 @@)，"
+            "禁止重复输出整个文件；行号前缀 \"N| \" 仅用于定位，不要写入补丁：\n\n" + "\n".join(parts)
+        )
+
+    def fallback_prompt(self, targets_by_rel, failed):
+        """补丁无法应用时，请求模型只重写失败的文件"""
+        lines = ["以下文件的补丁无法应用到当前版本，请针对这些文件输出修改后的完整内容，"
+                 "每个文件使用带路径的代码块 (```语言:路径)，不要输出其他文件：\n"]
+        for rel in failed:
+            path = targets_by_rel.get(rel)
+            current = ""
+            if path is not None:
+                try:
+                    current = self._read(path)
+                except OSError:
+                    pass
+            lines.append(f"### {rel} 当前内容\n```\n{current}\n```\n")
+        return "\n".join(lines)
+
+
+def savings_report(result, completion_tokens, llm_seconds):
+    """
+    估算 Diff 模式相对整文件重写节省的输出 Token 与耗时。
+    耗时按本次调用的实际输出速度 (completion_tokens / llm_seconds) 折算。
+    返回 (节省 Token, 节省秒数)；没有以补丁形式写入的文件时返回 None。
+    """
+    if not result.full_tokens:
+        return None
+    saved_tokens = max(result.full_tokens - result.patch_tokens, 0)
+    rate = completion_tokens / llm_seconds if completion_tokens and llm_seconds else 0
+    saved_seconds = saved_tokens / rate if rate else 0.0
+    return saved_tokens, saved_seconds
+
@@ -0,0 +1,361 @@
+import mmap
+import time
+import bisect
+import threading
+from pathlib import Path, PurePosixPath
+
+from task_parser import decode_task_bytes
+from workspace_tree import format_size
+
+# 编码探测只读取文件开头的少量字节
+PREFIX_BYTES = 8192
+DEFAULT_PAGE_LINES = 200
+# 单页最多解码的字节数 (压缩后的单行 JS / JSON 也不会整行塞进浏览器)
+DEFAULT_PAGE_BYTES = 64 * 1024
+DEFAULT_HEX_BYTES = 512
+HEX_ROW_BYTES = 16
+# 行号索引的检查点间隔: 每 1MB 记录一次 (字节偏移, 之前的换行数)
+LINE_INDEX_CHUNK = 1 << 20
+TRUNCATED_NOTE = "行过长，已按字节截断"
+
+BOMS = (
+    (b"\xef\xbb\xbf", "utf-8-sig"),
+    (b"\xff\xfe", "utf-16-le"),
+    (b"\xfe\xff", "utf-16-be"),
+)
+# 常见二进制格式的文件头
+MAGIC_TYPES = (
+    (b"\x89PNG\r\n\x1a\n", "PNG 图片"),
+    (b"\xff\xd8\xff", "JPEG 图片"),
+    (b"GIF8", "GIF 图片"),
+    (b"RIFF", "RIFF 容器 (WAV / WEBP / AVI)"),
+    (b"%PDF", "PDF 文档"),
+    (b"PK\x03\x04", "ZIP 压缩包 (含 docx / xlsx / jar)"),
+    (b"\x1f\x8b", "GZIP 压缩包"),
+    (b"\x7fELF", "ELF 可执行文件"),
+    (b"MZ", "Windows 可执行文件"),
+    (b"SQLite format 3\x00", "SQLite 数据库"),
+    (b"\x00asm", "WebAssembly 模块"),
+)
+
+
+def detect_encoding(prefix, truncated=False):
+    """按前缀判定编码，返回编码名；判定为二进制时返回 None"""
+    for bom, encoding in BOMS:
+        if prefix.startswith(bom):
+            return encoding
+    if b"\x00" in prefix:
+        return None
+    try:
+        return decode_task_bytes(prefix, truncated=truncated)[1]
+    except UnicodeDecodeError:
+        return None
+
+
+def describe_binary(prefix):
+    for magic, name in MAGIC_TYPES:
+        if prefix.startswith(magic):
+            return name
+    return "未知二进制格式"
+
+
+def hexdump(data, offset=0):
+    """经典的 偏移 | 十六进制 | ASCII 三栏格式"""
+    rows = []
+    for i in range(0, len(data), HEX_ROW_BYTES):
+        chunk = data[i:i + HEX_ROW_BYTES]
+        hex_part = " ".join(f"{b:02x}" for b in chunk)
+        ascii_part = "".join(chr(b) if 32 <= b < 127 else "." for b in chunk)
+        rows.append(f"{offset + i:08x}  {hex_part:<{HEX_ROW_BYTES * 3 - 1}}  |{ascii_part}|")
+    return "\n".join(rows)
+
+
+class PreviewPage:
+    """一次预览的结果: 文本内容及其在文件中的位置，供分页 / 跟随继续读取"""
+    def __init__(self, kind, text, size=0, encoding=None, start=0, end=0, first_line=None, line_count=0,
+                 total_lines=None, has_more=False, note=""):
+        self.kind = kind                # text / binary / empty / error
+        self.text = text
+        self.size = size
+        self.encoding = encoding
+        self.start = start              # 本页起止字节偏移
+        self.end = end
+        self.first_line = first_line    # 本页第一行的行号 (从 1 开始)，按字节预览时为 None
+        self.line_count = line_count
+        self.total_lines = total_lines  # 仅当行号索引已覆盖全文时才知道总行数
+        self.has_more = has_more
+        self.note = note
+
+    def header(self):
+        """预览框上方的一行说明"""
+        if self.kind in ("empty", "error"):
+            return self.note or self.text
+        parts = [format_size(self.size)]
+        if self.encoding:
+            parts.append(self.encoding)
+        if self.first_line is not None and self.line_count:
+            total = f" / 共 {self.total_lines} 行" if self.total_lines is not None else ""
+            parts.append(f"第 {self.first_line}-{self.first_line + self.line_count - 1} 行{total}")
+        else:
+            parts.append(f"字节 {self.start}-{self.end}")
+        if self.has_more:
+            parts.append("后面还有内容")
+        if self.note:
+            parts.append(self.note)
+        return " · ".join(parts)
+
+
+class _LineIndex:
+    """稀疏行号索引: 每 LINE_INDEX_CHUNK 字节一个检查点，只向后扩展到实际访问到的位置"""
+    def __init__(self, mtime_ns):
+        self.mtime_ns = mtime_ns
+        self.offsets = [0]      # 检查点字节偏移
+        self.lines = [0]        # 检查点之前的换行数
+        self.total_lines = None
+
+    def extend(self, mm, size, target_line=None, target_offset=None):
+        """扫描到覆盖 target_line / target_offset (或文件末尾) 为止"""
+        while self.offsets[-1] < size:
+            if target_line is not None and self.lines[-1] > target_line:
+                return
+            if target_offset is not None and self.offsets[-1] > target_offset:
+                return
+            start = self.offsets[-1]
+            end = min(size, start + LINE_INDEX_CHUNK)
+            self.offsets.append(end)
+            self.lines.append(self.lines[-1] + mm[start:end].count(b"\n"))
+        newlines = self.lines[-1]
+        # 末尾没有换行时最后一行也算一行
+        self.total_lines = newlines + (1 if size and mm[size - 1:size] != b"\n" else 0)
+
+    def line_start(self, mm, size, line):
+        """第 line 行 (从 0 开始) 的起始偏移，超出文件时返回 None"""
+        if line == 0:
+            return 0
+        self.extend(mm, size, target_line=line)
+        # 从之前换行数少于 line 的最后一个检查点向后数换行
+        i = bisect.bisect_left(self.lines, line) - 1
+        pos, seen = self.offsets[i], self.lines[i]
+        while seen < line:
+            nl = mm.find(b"\n", pos, size)
+            if nl < 0:
+                return None
+            pos, seen = nl + 1, seen + 1
+        return pos if pos < size else None
+
+
+class FilePreviewer:
+    """
+    PROJECT_SPACE 文件的分段预览: 以 mmap 只读映射文件，按行 / 字节范围取一页，
+    编码从文件开头的少量字节判定，二进制文件给出十六进制与元数据预览。
+    无论文件多大，每次只解码并返回当前页的字节；跳到第 N 行依赖按需扩展的稀疏行号索引。
+    """
+    def __init__(self, root_dir, page_lines=DEFAULT_PAGE_LINES, page_bytes=DEFAULT_PAGE_BYTES):
+        self.root_dir = Path(root_dir)
+        self.page_lines = page_lines
+        self.page_bytes = page_bytes
+        self._indexes = {}      # 路径 -> _LineIndex
+        self._lock = threading.Lock()
+
+    def resolve(self, rel):
+        rel = (rel or "").strip().strip("/")
+        path = PurePosixPath(rel)
+        if not rel or path.is_absolute() or ".." in path.parts:
+            return None
+        return self.root_dir / rel
+
+    def _open(self, rel):
+        """返回 (路径, 大小, mtime_ns, 编码, 前缀) 或错误页"""
+        path = self.resolve(rel)
+        if path is None:
+            return PreviewPage("error", "❌ 非法路径")
+        try:
+            st = path.stat()
+        except OSError:
+            return PreviewPage("error", "❌ 文件不存在")
+        if not path.is_file():
+            return PreviewPage("error", "❌ 不是文件")
+        if st.st_size == 0:
+            return PreviewPage("empty", "", note="(空文件)")
+        with open(path, "rb") as f:
+            prefix = f.read(PREFIX_BYTES)
+        encoding = detect_encoding(prefix, truncated=st.st_size > len(prefix))
+        return path, st.st_size, st.st_mtime_ns, encoding, prefix
+
+    def _index(self, path, mtime_ns, size):
+        with self._lock:
+            index = self._indexes.get(path)
+            # 文件只增长 (日志) 时沿用已有检查点；被改写或截断时重建
+            if index is None or (index.mtime_ns != mtime_ns and index.offsets[-1] > size):
+                index = _LineIndex(mtime_ns)
+                self._indexes[path] = index
+            elif index.mtime_ns != mtime_ns:
+                index.mtime_ns = mtime_ns
+                # 最后一个检查点可能落在旧的文件末尾，退回一格重新计数
+                if len(index.offsets) > 1:
+                    index.offsets.pop()
+                    index.lines.pop()
+                index.total_lines = None
+            return index
+
+    @staticmethod
+    def _decode(data, encoding):
+        """解码一段字节，丢弃首尾被截断的 UTF-8 多字节字符"""
+        if encoding in ("utf-8", "utf-8-sig"):
+            head = 0
+            while head < min(3, len(data)) and 0x80 <= data[head] < 0xC0:
+                head += 1
+            data = data[head:]
+            return data.decode("utf-8", errors="ignore").lstrip("\ufeff")
+        return data.decode(encoding, errors="replace").lstrip("\ufeff")
+
+    def metadata(self, rel):
+        opened = self._open(rel)
+        if isinstance(opened, PreviewPage):
+            return opened
+        path, size, mtime_ns, encoding, prefix = opened
+        kind = f"文本 ({encoding})" if encoding else describe_binary(prefix)
+        text = (f"路径: {rel}\n大小: {format_size(size)} ({size} 字节)\n"
+                f"修改时间: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime_ns / 1e9))}\n"
+                f"类型: {kind}\n")
+        return PreviewPage("binary" if encoding is None else "text", text, size=size, encoding=encoding, end=0)
+
+    def hex(self, rel, offset=0, length=DEFAULT_HEX_BYTES):
+        opened = self._open(rel)
+        if isinstance(opened, PreviewPage):
+            return opened
+        path, size, _, encoding, _ = opened
+        offset = max(0, min(offset, size - 1)) // HEX_ROW_BYTES * HEX_ROW_BYTES
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[offset:offset + length]
+        end = offset + len(data)
+        return PreviewPage("binary", hexdump(data, offset), size=size, encoding=encoding, start=offset, end=end,
+                           has_more=end < size)
+
+    def bytes_range(self, rel, offset=0, length=None):
+        """按字节范围预览 (二进制文件自动改为十六进制)"""
+        opened = self._open(rel)
+        if isinstance(opened, PreviewPage):
+            return opened
+        path, size, _, encoding, _ = opened
+        if encoding is None:
+            return self.hex(rel, offset)
+        length = length or self.page_bytes
+        offset = max(0, min(offset, size))
+        if encoding.startswith("utf-16"):
+            offset -= offset % 2
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            data = mm[offset:offset + length]
+        end = offset + len(data)
+        return PreviewPage("text", self._decode(data, encoding), size=size, encoding=encoding, start=offset, end=end,
+                           has_more=end < size)
+
+    def _line_page(self, mm, size, encoding, start, first_line, max_lines):
+        """从 start 偏移起读取至多 max_lines 行 (且不超过 page_bytes 字节)"""
+        pos, count, note = start, 0, ""
+        limit = min(size, start + self.page_bytes)
+        while count < max_lines and pos < size:
+            nl = mm.find(b"\n", pos, limit)
+            if nl < 0:
+                if limit < size:
+                    # 单行超过 page_bytes (压缩后的代码 / 单行 JSON): 本页截断在字节上限处
+                    note = TRUNCATED_NOTE
+                    if count == 0:
+                        pos, count = limit, 1
+                    break
+                pos, count = size, count + 1
+                break
+            pos, count = nl + 1, count + 1
+        text = self._decode(mm[start:pos], encoding)
+        return PreviewPage("text", text, size=size, encoding=encoding, start=start, end=pos,
+                           first_line=first_line + 1, line_count=count, has_more=pos < size, note=note)
+
+    def lines(self, rel, start_line=1, count=None):
+        """按行号分页预览，start_line 从 1 开始"""
+        opened = self._open(rel)
+        if isinstance(opened, PreviewPage):
+            return opened
+        path, size, mtime_ns, encoding, _ = opened
+        if encoding is None:
+            return self.hex(rel)
+        if encoding.startswith("utf-16"):
+            # UTF-16 的换行不是单字节 \n，只能按字节分页
+            return self.bytes_range(rel, 0)
+        count = count or self.page_lines
+        line = max(0, start_line - 1)
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            index = self._index(str(path), mtime_ns, size)
+            start = index.line_start(mm, size, line)
+            if start is None:
+                index.extend(mm, size)
+                total = index.total_lines or 1
+                line = max(0, total - count)
+                start = index.line_start(mm, size, line) or 0
+            page = self._line_page(mm, size, encoding, start, line, count)
+            if index.offsets[-1] >= size:
+                page.total_lines = index.total_lines
+        return page
+
+    def tail(self, rel, count=None):
+        """文件最后 count 行 (从末尾向前查找换行，不扫描全文)"""
+        opened = self._open(rel)
+        if isinstance(opened, PreviewPage):
+            return opened
+        path, size, mtime_ns, encoding, _ = opened
+        if encoding is None:
+            return self.hex(rel, max(0, size - DEFAULT_HEX_BYTES))
+        if encoding.startswith("utf-16"):
+            return self.bytes_range(rel, max(0, size - self.page_bytes))
+        count = count or self.page_lines
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            floor = max(0, size - self.page_bytes)
+            pos = size - 1 if mm[size - 1:size] == b"\n" else size
+            found = 0
+            while found < count:
+                nl = mm.rfind(b"\n", floor, pos)
+                if nl < 0:
+                    break
+                pos, found = nl, found + 1
+            note = ""
+            if found == count or (found and floor):
+                # 字节上限内放不下 count 行时，丢弃被截断的第一行
+                start = pos + 1
+            else:
+                start = floor
+                if floor:
+                    note = TRUNCATED_NOTE
+            text = self._decode(mm[start:size], encoding)
+        line_count = text.count("\n") + (0 if text.endswith("\n") else 1)
+        index = self._indexes.get(str(path))
+        first_line = None
+        total_lines = None
+        if index is not None and index.mtime_ns == mtime_ns and index.total_lines is not None:
+            total_lines = index.total_lines
+            first_line = total_lines - line_count + 1
+        return PreviewPage("text", text, size=size, encoding=encoding, start=start, end=size,
+                           first_line=first_line, line_count=line_count, total_lines=total_lines, note=note)
+
+    def follow(self, rel, offset):
+        """
+        跟随增长中的文件: 返回 offset 之后新写入的完整行 (最多 page_bytes 字节)。
+        文件变得比 offset 更短 (被截断或轮转) 时重新从末尾开始。
+        """
+        opened = self._open(rel)
+        if isinstance(opened, PreviewPage):
+            return opened
+        path, size, _, encoding, _ = opened
+        if encoding is None or encoding.startswith("utf-16"):
+            return self.bytes_range(rel, offset)
+        if size < offset:
+            page = self.tail(rel)
+            page.note = "文件已被截断或轮转，已重新定位到末尾"
+            return page
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            limit = min(size, offset + self.page_bytes)
+            end = mm.rfind(b"\n", offset, limit) + 1
+            if end <= 0:
+                # 还没有写完一整行；超长行则按字节上限输出
+                end = limit if limit < size else offset
+            text = self._decode(mm[offset:end], encoding)
+        return PreviewPage("text", text, size=size, encoding=encoding, start=offset, end=end,
+                           line_count=text.count("\n"), has_more=end < size)
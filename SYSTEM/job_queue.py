@@ -0,0 +1,287 @@
+import time
+import itertools
+import threading
+from collections import deque
+
+DEFAULT_WORKERS = 1
+DEFAULT_KEEP_FINISHED = 50
+# 每个作业保留的最近进度事件数
+MAX_EVENTS = 20
+# 进度事件的最小间隔 (秒)，避免逐文件回调刷屏
+EVENT_INTERVAL = 0.5
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+STATE_LABELS = {QUEUED: "⏳ 排队中", RUNNING: "🔄 运行中", DONE: "✅ 完成", FAILED: "❌ 失败", CANCELLED: "⏹️ 已取消"}
+
+
+class JobCancelled(Exception):
+    """作业在检查点发现取消请求时抛出"""
+
+
+class Job:
+    """
+    一个后台作业。作业函数以 fn(job, *args, **kwargs) 调用，
+    通过 job.update() 报告进度，在检查点调用 job.check() 响应取消。
+    """
+    def __init__(self, job_id, kind, title, fn, args, kwargs, dedupe_key=None, quiet=False):
+        self.id = job_id
+        self.kind = kind
+        self.title = title
+        self.dedupe_key = dedupe_key
+        self.quiet = quiet
+        self.status = QUEUED
+        self.done = 0
+        self.total = None
+        self.message = ""
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self.events = deque(maxlen=MAX_EVENTS)
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._last_event = 0.0
+        self._queue = None
+
+    # ---------- 作业函数内使用 ----------
+    @property
+    def cancel_requested(self):
+        return self._cancel.is_set()
+
+    def check(self):
+        if self._cancel.is_set():
+            raise JobCancelled(self.id)
+
+    def update(self, done=None, total=None, message=None):
+        """报告进度 (done / total 为已处理数 / 总数，message 为当前阶段说明)，同时作为取消检查点"""
+        self.report(done, total, message)
+        self.check()
+
+    def report(self, done=None, total=None, message=None):
+        """只报告进度，不检查取消 (作业需要在取消前完成收尾时使用)"""
+        if done is not None:
+            self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        now = time.time()
+        if message is not None or now - self._last_event >= EVENT_INTERVAL or (self.total and self.done >= self.total):
+            self._last_event = now
+            self.events.append((now, self.done, self.total, self.message))
+            if self._queue is not None:
+                self._queue._notify(self)
+
+    def progress_callback(self, message):
+        """供存储层使用的 progress(done, total) 回调"""
+        return lambda done, total: self.update(done, total, message)
+
+    def log(self, message):
+        self.update(message=message)
+
+    # ---------- 查询 ----------
+    @property
+    def active(self):
+        return self.status not in FINISHED_STATES
+
+    @property
+    def fraction(self):
+        if self.status == DONE:
+            return 1.0
+        if not self.total:
+            return None
+        return min(1.0, self.done / self.total)
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def wait(self, timeout=None):
+        """等待作业结束，返回是否已结束"""
+        return self._finished.wait(timeout)
+
+    def describe(self):
+        progress = f" {self.fraction * 100:.0f}%" if self.fraction is not None and self.status == RUNNING else ""
+        counts = f" ({self.done}/{self.total})" if self.total and self.status == RUNNING else ""
+        detail = self.error if self.status == FAILED else self.message
+        return f"{STATE_LABELS[self.status]}{progress}{counts} {self.title}" + (f" — {detail}" if detail else "")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "title": self.title,
+            "status": self.status,
+            "done": self.done,
+            "total": self.total,
+            "message": self.message,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """
+    后台作业队列: 归档、备份、清理、索引重建、快照等耗时的整理工作在后台线程中排队执行，
+    调度 tick 只提交作业、不等待。默认单个工作线程，作业按提交顺序串行执行
+    (归档与清理都会移动 ARCHIVE 中的文件，串行执行可避免互相干扰)。
+    - dedupe_key 相同且仍在排队的作业只保留一个 (每个 tick 都请求归档时不会堆积)
+    - 排队中的作业取消后直接跳过；运行中的作业在下一个检查点 (job.update / job.check) 结束
+    - quiet=True 的作业成功完成且没有返回结果 (如没有可归档的任务) 时不保留在作业列表中
+    """
+    def __init__(self, workers=DEFAULT_WORKERS, keep_finished=DEFAULT_KEEP_FINISHED):
+        self.workers = max(1, workers)
+        self.keep_finished = keep_finished
+        self._jobs = {}             # 作业 ID -> Job (按提交顺序)
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+        self._running = 0
+        self._ids = itertools.count(1)
+        self._listeners = []
+        self._closed = False
+
+    @classmethod
+    def from_config(cls, cfg):
+        cfg = cfg or {}
+        return cls(
+            workers=cfg.get("workers", DEFAULT_WORKERS),
+            keep_finished=cfg.get("keep_finished", DEFAULT_KEEP_FINISHED),
+        )
+
+    def add_listener(self, fn):
+        """fn(job) 在作业状态变化或报告进度时调用 (在工作线程中执行，不应阻塞)"""
+        self._listeners.append(fn)
+
+    def _notify(self, job):
+        for fn in list(self._listeners):
+            try:
+                fn(job)
+            except Exception:
+                pass
+
+    def _ensure_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._worker, name=f"nexus-jobs-{len(self._threads) + 1}", daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def submit(self, kind, title, fn, *args, dedupe_key=None, quiet=False, **kwargs):
+        """提交作业并立即返回 Job；已有相同 dedupe_key 的作业在排队时返回该作业"""
+        with self._cond:
+            if self._closed:
+                raise RuntimeError("作业队列已关闭")
+            if dedupe_key is not None:
+                for job in self._pending:
+                    if job.dedupe_key == dedupe_key:
+                        return job
+            job = Job(f"job-{next(self._ids)}", kind, title, fn, args, kwargs, dedupe_key, quiet)
+            job._queue = self
+            self._jobs[job.id] = job
+            self._pending.append(job)
+            self._prune_finished()
+            self._ensure_workers()
+            self._cond.notify()
+        self._notify(job)
+        return job
+
+    def _prune_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if not job.active]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                job = self._pending.popleft()
+                job.status = RUNNING
+                job.started = time.time()
+                self._running += 1
+            self._notify(job)
+            try:
+                job.check()
+                job.result = job._fn(job, *job._args, **job._kwargs)
+                job.status = DONE
+            except JobCancelled:
+                job.status = CANCELLED
+            except Exception as e:
+                job.error = f"{type(e).__name__}: {e}"
+                job.status = FAILED
+            finally:
+                job.finished = time.time()
+                job._fn = job._args = job._kwargs = None
+                with self._cond:
+                    self._running -= 1
+                    if job.quiet and job.status == DONE and not job.result:
+                        self._jobs.pop(job.id, None)
+                    self._cond.notify_all()
+                job._finished.set()
+                self._notify(job)
+
+    def cancel(self, job_id):
+        """取消作业，返回是否发出了取消请求"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or not job.active:
+                return False
+            job._cancel.set()
+            if job.status == QUEUED:
+                self._pending.remove(job)
+                job.status = CANCELLED
+                job.finished = time.time()
+                job._finished.set()
+                self._cond.notify_all()
+        self._notify(job)
+        return True
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def list(self, limit=None):
+        """最近的作业 (新的在前)"""
+        with self._cond:
+            jobs = list(reversed(list(self._jobs.values())))
+        return jobs[:limit] if limit else jobs
+
+    def active(self):
+        return [job for job in self.list() if job.active]
+
+    def wait_idle(self, timeout=None):
+        """等待所有已提交的作业结束，返回是否已全部结束"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._cond:
+            while self._pending or self._running:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def shutdown(self, wait=True, cancel_pending=False):
+        with self._cond:
+            self._closed = True
+            if cancel_pending:
+                for job in list(self._pending):
+                    job._cancel.set()
+                    job.status = CANCELLED
+                    job.finished = time.time()
+                    job._finished.set()
+                self._pending.clear()
+            self._cond.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
@@ -0,0 +1,297 @@
+"""
+分布式执行的协调者一侧: 远程模型调用的租约队列 (nexus_cli.py serve --remote)。
+
+协调者保留 DAG、任务文件与提示词组装，执行线程把模型调用放入 LeaseBoard 后等待结果；
+执行节点 (nexus_cli.py worker，见 nexus_worker.py) 通过 HTTP API 领取租约、调用模型并回报结果。
+- 领取时附带租约有效期 lease_seconds，执行节点定期发送心跳续约
+- 租约到期未续约 (执行节点崩溃、断网) 时调用重新排队并改派给其他节点，超过 max_reassign 次按请求失败处理
+- 已改派或已取消的租约再回报结果时被拒绝，同一次调用只会被采纳一次
+"""
+import time
+import uuid
+import threading
+from collections import deque
+from types import SimpleNamespace
+
+from nexus_trace import tracer
+
+DEFAULT_LEASE_SECONDS = 30
+DEFAULT_MAX_REASSIGN = 2
+DEFAULT_MAX_INFLIGHT = 32
+DEFAULT_WORKER_CONCURRENCY = 4
+# 等待结果的执行线程检查租约是否到期的间隔 (秒)
+REAP_INTERVAL = 1.0
+# 调用的状态
+QUEUED, LEASED, DONE = "queued", "leased", "done"
+
+
+class RemoteError(Exception):
+    """远程调用失败 (执行节点回报的模型请求错误，或多次失联后放弃)"""
+
+
+class RemoteCancelled(RemoteError):
+    """协调者停止时尚未完成的远程调用被取消 (不计入任务失败次数)"""
+
+
+class RemoteCall:
+    """一次等待执行节点完成的模型调用"""
+    def __init__(self, project, task_id, receiver, provider, model, messages, temperature):
+        self.id = None
+        self.project = project
+        self.task_id = task_id
+        self.receiver = receiver
+        self.provider = provider
+        self.model = model
+        self.messages = messages
+        self.temperature = temperature
+        self.state = QUEUED
+        self.worker = None
+        self.expires = 0.0
+        self.reassigned = 0
+        self.queued_at = time.monotonic()
+        self.text = None
+        self.usage = None
+        self.error = None
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def to_job(self, lease_seconds):
+        """发给执行节点的内容"""
+        return {
+            "lease": self.id,
+            "project": self.project,
+            "task_id": self.task_id,
+            "receiver": self.receiver,
+            "provider": self.provider,
+            "model": self.model,
+            "messages": self.messages,
+            "temperature": self.temperature,
+            "lease_seconds": lease_seconds,
+        }
+
+
+class WorkerInfo:
+    """已连接的执行节点"""
+    def __init__(self, worker_id, capacity=None):
+        self.id = worker_id
+        self.capacity = capacity
+        self.joined = time.time()
+        self.last_seen = time.monotonic()
+        self.leases = set()
+        self.completed = 0
+        self.failed = 0
+        self.lost = 0
+        self.alive = True
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "alive": self.alive,
+            "capacity": self.capacity,
+            "active": len(self.leases),
+            "completed": self.completed,
+            "failed": self.failed,
+            "lost_leases": self.lost,
+            "idle_seconds": round(time.monotonic() - self.last_seen, 1),
+        }
+
+
+class LeaseBoard:
+    """
+    远程模型调用的租约队列 (线程安全)。
+    - 协调者一侧: call() 排队并阻塞等待结果，返回 (回复文本, usage)；close() 取消全部未完成的调用
+    - 执行节点一侧 (经 HTTP API): lease() 长轮询领取，heartbeat() 续约，complete() 回报结果
+    - on_event(event, **data) 接收 worker.joined / worker.lost / task.reassigned 事件
+    """
+    def __init__(self, lease_seconds=DEFAULT_LEASE_SECONDS, max_reassign=DEFAULT_MAX_REASSIGN, on_event=None):
+        self.lease_seconds = lease_seconds
+        self.max_reassign = max_reassign
+        self.on_event = on_event or (lambda event, **data: None)
+        self._queue = deque()
+        self._leased = {}         # 租约 ID -> RemoteCall
+        self._workers = {}        # 执行节点 ID -> WorkerInfo
+        self._lock = threading.Lock()
+        self._available = threading.Condition(self._lock)
+        self._closed = False
+        self.completed = 0
+        self.failed = 0
+        self.reassigned = 0
+
+    @classmethod
+    def from_config(cls, cfg, **kwargs):
+        cfg = cfg or {}
+        return cls(
+            lease_seconds=cfg.get("lease_seconds", DEFAULT_LEASE_SECONDS),
+            max_reassign=cfg.get("max_reassign", DEFAULT_MAX_REASSIGN),
+            **kwargs
+        )
+
+    # ---------- 协调者 ----------
+    def call(self, project, task, provider, model, messages, temperature=0.2):
+        """排队等待执行节点完成模型调用，返回 (回复文本, usage)；失败时抛出 RemoteError"""
+        call = RemoteCall(project, task['id'], task['receiver'], provider, model, messages, temperature)
+        with tracer.span("remote.call", **{"task.id": task['id'], "llm.provider": provider}) as span:
+            with self._lock:
+                if self._closed:
+                    raise RemoteCancelled("协调者正在停止")
+                self._queue.append(call)
+                self._available.notify()
+            while not call.done.wait(REAP_INTERVAL):
+                self.reap()
+            span.set_attribute("remote.worker", call.worker or "")
+            span.set_attribute("remote.reassigned", call.reassigned)
+        if call.cancelled:
+            raise RemoteCancelled(call.error)
+        if call.error is not None:
+            raise RemoteError(call.error)
+        return call.text, SimpleNamespace(**call.usage) if call.usage else None
+
+    def reap(self):
+        """租约到期的调用重新排队 (改派)，长时间没有心跳的执行节点标记为失联"""
+        now = time.monotonic()
+        events = []
+        with self._lock:
+            for lease_id, call in list(self._leased.items()):
+                if call.expires > now:
+                    continue
+                del self._leased[lease_id]
+                worker = self._workers.get(call.worker)
+                if worker is not None:
+                    worker.leases.discard(lease_id)
+                    worker.lost += 1
+                call.reassigned += 1
+                self.reassigned += 1
+                if call.reassigned > self.max_reassign:
+                    call.error = f"执行节点 {call.worker} 失联，已改派 {self.max_reassign} 次仍未完成"
+                    self._finish(call)
+                else:
+                    # 放回队首，优先于后来的调用
+                    call.state = QUEUED
+                    self._queue.appendleft(call)
+                    self._available.notify()
+                events.append(("task.reassigned", {"project": call.project, "task_id": call.task_id,
+                                                   "worker": call.worker, "attempt": call.reassigned}))
+            for worker in self._workers.values():
+                if worker.alive and now - worker.last_seen > self.lease_seconds:
+                    worker.alive = False
+                    events.append(("worker.lost", {"worker": worker.id}))
+        for event, data in events:
+            self.on_event(event, **data)
+
+    def close(self):
+        """取消排队中与执行中的全部调用 (协调者停止时)，之后的 call() 立即失败"""
+        with self._lock:
+            self._closed = True
+            calls = list(self._queue) + list(self._leased.values())
+            self._queue.clear()
+            self._leased.clear()
+            for call in calls:
+                call.cancelled = True
+                call.error = "协调者已停止，远程调用被取消"
+                self._finish(call)
+            self._available.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def _finish(self, call):
+        call.state = DONE
+        call.done.set()
+
+    # ---------- 执行节点 ----------
+    def _touch(self, worker_id, capacity=None):
+        """记录执行节点的心跳 (需持有锁)，返回 (节点, 是否为新加入或失联后恢复的节点)"""
+        worker = self._workers.get(worker_id)
+        rejoined = worker is None or not worker.alive
+        if worker is None:
+            worker = self._workers[worker_id] = WorkerInfo(worker_id, capacity)
+        worker.last_seen = time.monotonic()
+        worker.alive = True
+        if capacity:
+            worker.capacity = capacity
+        return worker, rejoined
+
+    def lease(self, worker_id, max_jobs=1, wait=0.0, capacity=None):
+        """领取至多 max_jobs 个调用；队列为空时最多等待 wait 秒。返回发给执行节点的任务列表"""
+        self.reap()
+        deadline = time.monotonic() + max(0.0, wait)
+        with self._lock:
+            worker, rejoined = self._touch(worker_id, capacity)
+            while not self._queue and not self._closed:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._available.wait(remaining)
+            jobs = []
+            now = time.monotonic()
+            while self._queue and len(jobs) < max(1, max_jobs):
+                call = self._queue.popleft()
+                call.id = uuid.uuid4().hex[:16]
+                call.state = LEASED
+                call.worker = worker_id
+                call.expires = now + self.lease_seconds
+                self._leased[call.id] = call
+                worker.leases.add(call.id)
+                worker.last_seen = now
+                jobs.append(call.to_job(self.lease_seconds))
+        if rejoined:
+            self.on_event("worker.joined", worker=worker_id, capacity=capacity)
+        return jobs
+
+    def heartbeat(self, worker_id, lease_ids=(), capacity=None):
+        """续约执行节点持有的租约，返回 {"lease_seconds", "unknown": 已失效 (改派 / 取消) 的租约}"""
+        with self._lock:
+            worker, rejoined = self._touch(worker_id, capacity)
+            expires = time.monotonic() + self.lease_seconds
+            unknown = []
+            for lease_id in lease_ids:
+                call = self._leased.get(lease_id)
+                if call is None or call.worker != worker_id:
+                    unknown.append(lease_id)
+                else:
+                    call.expires = expires
+        if rejoined:
+            self.on_event("worker.joined", worker=worker_id, capacity=capacity)
+        return {"lease_seconds": self.lease_seconds, "unknown": unknown}
+
+    def complete(self, worker_id, lease_id, text=None, usage=None, error=None):
+        """回报调用结果，租约已失效时返回 False (结果被丢弃)"""
+        with self._lock:
+            worker, _ = self._touch(worker_id)
+            call = self._leased.get(lease_id)
+            if call is None or call.worker != worker_id:
+                return False
+            del self._leased[lease_id]
+            worker.leases.discard(lease_id)
+            if error is not None or text is None:
+                call.error = error or "执行节点未返回内容"
+                worker.failed += 1
+                self.failed += 1
+            else:
+                call.text = text
+                call.usage = usage
+                worker.completed += 1
+                self.completed += 1
+            self._finish(call)
+        return True
+
+    # ---------- 状态 ----------
+    def workers(self):
+        with self._lock:
+            return [worker.to_dict() for worker in self._workers.values()]
+
+    def stats(self):
+        with self._lock:
+            queued = len(self._queue)
+            leased = len(self._leased)
+            alive = sum(1 for worker in self._workers.values() if worker.alive)
+        return {
+            "queued": queued,
+            "leased": leased,
+            "alive": alive,
+            "completed": self.completed,
+            "failed": self.failed,
+            "reassigned": self.reassigned,
+            "lease_seconds": self.lease_seconds,
+        }
@@ -0,0 +1,245 @@
+import re
+import json
+import time
+import threading
+from pathlib import Path
+
+import task_parser
+
+SNAPSHOT_HEADER_RE = re.compile(r'^\**SNAPSHOT:\s*(v\d+\.\d+)\**\s*$', re.MULTILINE)
+SNAPSHOT_FILE_RE = re.compile(r'^MILESTONE_(v\d+\.\d+)_SNAPSHOT\.md$')
+
+DEFAULT_EVERY_TASKS = 20
+DEFAULT_EVERY_TOKENS = 60000
+DEFAULT_SNAPSHOT_RECEIVER = "P8_记忆员"
+DEFAULT_SNAPSHOT_MAX_CHARS = 4000
+# 结果体积到 Token 的粗略换算 (中文 UTF-8 约 3 字节/Token)
+BYTES_PER_TOKEN = 3
+
+
+class MilestoneManager:
+    """
+    全局快照 (Snapshot) 协议的自动化实现:
+    每归档 N 个任务或累计约 M 个 Token 的执行结果，自动向 P8_记忆员 下发一个快照任务；
+    快照任务完成后其产出保存为 ARCHIVE/MILESTONES/MILESTONE_vX.Y_SNAPSHOT.md，
+    之后的任务只读取最新快照，不再回溯被快照覆盖的历史。
+    """
+    def __init__(self, archive_dir, messages_dir, every_tasks=DEFAULT_EVERY_TASKS,
+                 every_tokens=DEFAULT_EVERY_TOKENS, receiver=DEFAULT_SNAPSHOT_RECEIVER,
+                 snapshot_max_chars=DEFAULT_SNAPSHOT_MAX_CHARS, enabled=True):
+        self.messages_dir = Path(messages_dir)
+        self.milestones_dir = Path(archive_dir) / "MILESTONES"
+        self.state_file = self.milestones_dir / "state.json"
+        self.every_tasks = every_tasks
+        self.every_tokens = every_tokens
+        self.receiver = receiver
+        self.snapshot_max_chars = snapshot_max_chars
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._latest_cache = None
+
+    @classmethod
+    def from_config(cls, archive_dir, messages_dir, snapshot_cfg):
+        snapshot_cfg = snapshot_cfg or {}
+        return cls(
+            archive_dir,
+            messages_dir,
+            every_tasks=snapshot_cfg.get("every_tasks", DEFAULT_EVERY_TASKS),
+            every_tokens=snapshot_cfg.get("every_tokens", DEFAULT_EVERY_TOKENS),
+            receiver=snapshot_cfg.get("receiver", DEFAULT_SNAPSHOT_RECEIVER),
+            snapshot_max_chars=snapshot_cfg.get("max_chars", DEFAULT_SNAPSHOT_MAX_CHARS),
+            enabled=snapshot_cfg.get("enabled", True),
+        )
+
+    # ---------- 状态持久化 ----------
+    def _load_state(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"version": "v0.0", "covered_ids": [], "since_last": {"ids": [], "tokens": 0}, "pending": None}
+
+    def _save_state(self, state):
+        self.milestones_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_file.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.state_file)
+
+    @staticmethod
+    def _next_version(version):
+        major, minor = version.lstrip("v").split(".")
+        return f"v{major}.{int(minor) + 1}"
+
+    # ---------- 触发 ----------
+    def is_snapshot_filename(self, filename):
+        return "_MILESTONE_" in filename
+
+    def on_archived(self, archived_paths):
+        """归档后调用: 累计任务数与结果体积，返回是否达到快照阈值"""
+        if not self.enabled or not archived_paths:
+            return False
+        with self._lock:
+            state = self._load_state()
+            since = state["since_last"]
+            for path in archived_paths:
+                path = Path(path)
+                if self.is_snapshot_filename(path.name):
+                    continue
+                task_id = task_parser.extract_task_id(path.name)
+                if task_id and task_id not in since["ids"]:
+                    since["ids"].append(task_id)
+                    try:
+                        since["tokens"] += path.stat().st_size // BYTES_PER_TOKEN
+                    except OSError:
+                        pass
+            self._reclaim_pending(state)
+            self._save_state(state)
+            return self._threshold_reached(state)
+
+    def _threshold_reached(self, state):
+        since = state["since_last"]
+        return bool(since["ids"]) and (
+            len(since["ids"]) >= self.every_tasks or since["tokens"] >= self.every_tokens
+        )
+
+    def _pending_alive(self, state):
+        pending = state.get("pending")
+        if not pending:
+            return False
+        return any(self.messages_dir.glob(f"*{pending['task_id']}*MILESTONE_*.md"))
+
+    def _reclaim_pending(self, state):
+        """
+        进行中的快照任务已不在 MESSAGES 中却没有完成 (进入死信 [FAIL] / [EXPIRED] 或被删除) 时，
+        把它覆盖的任务放回 since_last，由下一个快照任务合并，避免这些任务永远不进入任何快照
+        """
+        pending = state.get("pending")
+        if not pending or self._pending_alive(state):
+            return False
+        since = state["since_last"]
+        since["ids"] = list(dict.fromkeys(pending.get("covers", []) + since["ids"]))
+        since["tokens"] += pending.get("tokens", 0)
+        state["pending"] = None
+        return True
+
+    def maybe_create_snapshot_task(self, create_task, summary_lookup):
+        """
+        达到阈值且没有进行中的快照任务时，在 MESSAGES 中创建快照任务。
+        create_task(spec) 创建单个任务并返回 (任务 ID, 文件名)，spec 格式同 NexusEngine.create_tasks
+        (经由它分配 ID 并更新检索索引，仅在确实创建时调用)；
+        summary_lookup(task_id) 返回该任务的摘要记录 (见 UpstreamContext.get_summary)。
+        返回创建的文件名，未创建时返回 None。
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            state = self._load_state()
+            self._reclaim_pending(state)
+            if not self._threshold_reached(state) or self._pending_alive(state):
+                return None
+
+            version = self._next_version(state["version"])
+            covers = list(state["since_last"]["ids"])
+            previous = self.latest_text()
+
+            summaries = []
+            for covered_id in covers:
+                record = summary_lookup(covered_id)
+                if record:
+                    summaries.append(f"### {record['id']} ({record['receiver']}) {record.get('title', '')}\n{record['summary']}\n")
+
+            description = f"""生成全局快照 MILESTONE_{version}_SNAPSHOT
+
+请根据《公司制度总纲》的全局快照协议，将“上一版快照”与“本周期新完成的任务摘要”合并为一份新的全局快照。
+快照必须自包含：重启的 AI 仅阅读这份快照即可恢复全局认知。请使用结构化格式 (表格/列表)，包含：
+1. 项目目标与当前版本
+2. 已完成模块与关键产出物路径
+3. 关键决策与数据契约
+4. 未完成事项与下一步
+总长度请控制在 {self.snapshot_max_chars} 字以内。
+
+## 上一版快照
+{previous or "(无，这是第一份快照)"}
+
+## 本周期新完成的任务摘要 (共 {len(covers)} 个)
+{chr(10).join(summaries) if summaries else "(无摘要)"}
+"""
+            task_id, filename = create_task({
+                "receiver": self.receiver,
+                "description": description,
+                "name": f"MILESTONE_{version}_SNAPSHOT",
+                "headers": {"SNAPSHOT": version},
+            })
+
+            state["pending"] = {"task_id": task_id, "version": version, "covers": covers,
+                                "tokens": state["since_last"]["tokens"]}
+            state["since_last"] = {"ids": [], "tokens": 0}
+            self._save_state(state)
+            return filename
+
+    # ---------- 完成 ----------
+    def snapshot_version_of(self, task_text):
+        """若任务正文声明了 SNAPSHOT: vX.Y，返回版本号"""
+        match = SNAPSHOT_HEADER_RE.search(task_text or "")
+        return match.group(1) if match else None
+
+    def complete(self, task_id, task_text, response_text):
+        """快照任务被接受时调用: 保存为版本化的快照文件并更新覆盖范围"""
+        version = self.snapshot_version_of(task_text)
+        if not version:
+            return None
+        with self._lock:
+            state = self._load_state()
+            pending = state.get("pending") or {}
+            covers = pending.get("covers", []) if pending.get("task_id") == task_id else []
+
+            self.milestones_dir.mkdir(parents=True, exist_ok=True)
+            snapshot_path = self.milestones_dir / f"MILESTONE_{version}_SNAPSHOT.md"
+            tmp_path = snapshot_path.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(f"<!-- 生成时间: {time.strftime('%Y-%m-%d %H:%M:%S')} | 快照任务: {task_id} -->\n")
+                f.write(response_text)
+            tmp_path.replace(snapshot_path)
+
+            state["version"] = version
+            state["covered_ids"] = sorted(set(state.get("covered_ids", [])) | set(covers))
+            state["pending"] = None
+            self._save_state(state)
+            self._latest_cache = None
+            return snapshot_path
+
+    # ---------- 读取 ----------
+    def latest(self):
+        """返回最新快照 (版本号, 正文, 已覆盖的任务 ID 集合)；没有快照时返回 None"""
+        state = self._load_state()
+        if state["version"] == "v0.0":
+            return None
+        path = self.milestones_dir / f"MILESTONE_{state['version']}_SNAPSHOT.md"
+        cache_key = (state["version"], len(state.get("covered_ids", [])))
+        if self._latest_cache and self._latest_cache[0] == cache_key:
+            return self._latest_cache[1]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                text = f.read()
+        except OSError:
+            return None
+        if len(text) > self.snapshot_max_chars * 2:
+            text = text[:self.snapshot_max_chars * 2] + "\n...(快照过长已截断)"
+        result = (state["version"], text, frozenset(state.get("covered_ids", [])))
+        self._latest_cache = (cache_key, result)
+        return result
+
+    def latest_text(self):
+        latest = self.latest()
+        return latest[1] if latest else ""
+
+    def list_versions(self):
+        if not self.milestones_dir.exists():
+            return []
+        versions = []
+        for path in self.milestones_dir.iterdir():
+            match = SNAPSHOT_FILE_RE.match(path.name)
+            if match:
+                versions.append(match.group(1))
+        return sorted(versions, key=lambda v: tuple(int(x) for x in v.lstrip("v").split(".")))
@@ -0,0 +1,685 @@
+import os
+import json
+import time
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import task_parser
+from nexus_trace import tracer
+from lease_board import LeaseBoard, DEFAULT_MAX_INFLIGHT
+from task_factory import TaskSpecError
+from task_runner import TaskRunner
+from work_history import get_work_history, record_work_history
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8090
+# 长轮询单次请求的默认 / 最长等待时间 (秒)，客户端需要等待更久时分多次请求
+DEFAULT_WAIT_SECONDS = 30
+MAX_WAIT_SECONDS = 60
+# 外部进程 (Web UI、其他 CLI) 完成的任务不会产生事件，等待时按该间隔重新检查看板
+WAIT_POLL_SECONDS = 1.0
+# SSE 连接空闲时发送心跳注释的间隔 (秒)
+SSE_KEEPALIVE_SECONDS = 15
+# 事件缓冲区保留的最近事件数
+MAX_EVENTS = 10000
+MAX_BODY_BYTES = 16 * 1024 * 1024
+TOKEN_ENV = "NEXUS_API_TOKEN"
+# 不会再变化的任务状态
+TERMINAL_STATUSES = ("DONE", "FAIL", "EXPIRED")
+
+
+class APIError(Exception):
+    """请求错误，status 为 HTTP 状态码"""
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class EventLog:
+    """带递增序号的事件缓冲区: 长轮询与 SSE 客户端用 since=上次收到的序号 继续读取"""
+    def __init__(self, maxlen=MAX_EVENTS):
+        self._events = deque(maxlen=maxlen)
+        self._seq = 0
+        self._cond = threading.Condition()
+
+    @property
+    def last_seq(self):
+        return self._seq
+
+    def publish(self, event, **data):
+        with self._cond:
+            self._seq += 1
+            record = {"seq": self._seq, "time": time.time(), "event": event, **data}
+            self._events.append(record)
+            self._cond.notify_all()
+        return record
+
+    def since(self, seq=0, timeout=0):
+        """序号大于 seq 的事件；暂无新事件时最多等待 timeout 秒"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while self._seq <= seq:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return []
+                self._cond.wait(remaining)
+            return [e for e in self._events if e["seq"] > seq]
+
+    def wait(self, timeout):
+        """等待任意新事件 (或超时)"""
+        with self._cond:
+            seq = self._seq
+            self._cond.wait_for(lambda: self._seq != seq, timeout)
+
+
+def task_to_dict(task, location="messages"):
+    return {
+        "id": task["id"],
+        "status": task["status"],
+        "sender": task["sender"],
+        "receiver": task["receiver"],
+        "depends_on": list(task["depends_on"]),
+        "filename": task["filename"],
+        "location": location,
+    }
+
+
+def _name_to_dict(filename, location):
+    name = task_parser.parse_task_filename(filename)
+    return {
+        "id": name.task_id if name else None,
+        "status": name.status if name else None,
+        "sender": name.sender if name else None,
+        "receiver": name.receiver if name else None,
+        "depends_on": None,
+        "filename": filename,
+        "location": location,
+    }
+
+
+class NexusService:
+    """
+    调度引擎的 JSON 接口: HTTP API 与 nexus 命令行共用，返回值均可直接序列化为 JSON。
+    并行执行由 TaskRunner 负责，任务创建 / 开始 / 完成 / 失败写入事件缓冲区供长轮询与 SSE 读取。
+    传入 registry (ProjectRegistry) 时托管多个项目: 各方法的 project 参数选择项目 (默认为 engine 所属项目)，
+    所有项目共用一个 TaskRunner，按权重与配额公平分配执行线程。
+    remote=True 时为分布式模式的协调者: 模型调用放入 LeaseBoard，由执行节点 (nexus_cli.py worker) 领取执行，
+    执行线程数默认取 system.distributed.max_inflight (同时等待远程结果的任务数)。
+    """
+    def __init__(self, engine=None, config_mgr=None, workers=None, poll_interval=None, registry=None, remote=False):
+        self.registry = registry
+        self.engine = engine or registry.engine()
+        self.config_mgr = config_mgr or self.engine.config_mgr
+        self.api_cfg = self.config_mgr.config["system"].get("api") or {}
+        self.events = EventLog()
+        self.leases = None
+        if remote:
+            dist_cfg = self.config_mgr.config["system"].get("distributed") or {}
+            self.leases = LeaseBoard.from_config(dist_cfg, on_event=self._on_runner_event)
+            self.engine.remote = self.leases
+            workers = workers or dist_cfg.get("max_inflight", DEFAULT_MAX_INFLIGHT)
+        runner_cfg = dict(self.api_cfg)
+        if poll_interval is not None:
+            runner_cfg["poll_interval"] = poll_interval
+        self.runner = TaskRunner.from_config(self.engine, runner_cfg, workers=workers, on_event=self._on_runner_event)
+
+    def _on_runner_event(self, event, **data):
+        self.events.publish(event, **data)
+
+    def engine_for(self, project=None):
+        """项目的引擎 (首次使用时创建并加入调度)"""
+        if not project or project == self.engine.project:
+            return self.engine
+        if self.registry is None:
+            raise APIError(404, f"项目 {project} 不存在 (未启用多项目)")
+        try:
+            engine = self.registry.engine(project)
+        except KeyError as e:
+            raise APIError(404, str(e.args[0]))
+        if self.leases is not None:
+            engine.remote = self.leases
+        if not self.runner.has_project(project):
+            self.runner.add_project(engine)
+        return engine
+
+    # ---------- 查询 ----------
+    def status(self, project=None):
+        engine = self.engine_for(project)
+        tasks = engine.parse_tasks()
+        done = sum(1 for t in tasks if "DONE" in (t["status"] or "").upper())
+        new = sum(1 for t in tasks if t["status"] == "NEW")
+        return {
+            "project": engine.project,
+            "tasks": {"total": len(tasks), "new": new, "done": done, "other": len(tasks) - new - done},
+            "runnable": len(engine.get_runnable_tasks(tasks)) if tasks else 0,
+            "pending": len(engine.pending_tasks(tasks)),
+            "archived": engine.archive.count(),
+            "dead_letter": len(engine.dead_letters.dead_ids()),
+            "busy": sorted(engine._busy_ids),
+            "runner": self.runner.stats(),
+            "jobs": [job.to_dict() for job in engine.jobs.active()],
+            "providers": engine.providers.stats(),
+            "remote": self.leases.stats() if self.leases is not None else None,
+            "event_seq": self.events.last_seq,
+        }
+
+    def projects(self):
+        """已注册的项目及其调度状态"""
+        if self.registry is None:
+            return [{"name": self.engine.project, "root": ".", "loaded": True}]
+        self.registry.refresh()
+        slots = self.runner.stats()["projects"]
+        return [{**self.registry.get(name).to_dict(), "runner": slots.get(name)} for name in self.registry.names()]
+
+    def create_project(self, name, config=None):
+        if self.registry is None:
+            raise APIError(400, "未启用多项目")
+        try:
+            project = self.registry.create(name, config)
+        except ValueError as e:
+            raise APIError(400, str(e))
+        if self.runner.running:
+            self.engine_for(name)
+        return project.to_dict()
+
+    def list_tasks(self, status=None, receiver=None, project=None):
+        tasks = self.engine_for(project).parse_tasks()
+        if status:
+            tasks = [t for t in tasks if (t["status"] or "").upper() == status.upper()]
+        if receiver:
+            tasks = [t for t in tasks if t["receiver"].startswith(receiver)]
+        return [task_to_dict(t) for t in tasks]
+
+    @staticmethod
+    def _dead_letters(engine):
+        dead = {}
+        if engine.dead_letters.dir.exists():
+            for path in engine.dead_letters.dir.glob("*.md"):
+                task_id = task_parser.extract_task_id(path.name)
+                if task_id:
+                    dead[task_id] = path.name
+        return dead
+
+    def task_states(self, task_ids, project=None):
+        """批量查询任务状态: MESSAGES 中的任务、已归档任务 (DONE) 与死信 (FAIL / EXPIRED)，找不到的为 None"""
+        engine = self.engine_for(project)
+        active = {t["id"]: t for t in engine.parse_tasks()}
+        archived = engine.archive.task_ids()
+        dead = None
+        states = {}
+        for task_id in task_ids:
+            if task_id in active:
+                states[task_id] = task_to_dict(active[task_id])
+            elif task_id in archived:
+                entry = engine.archive.find(task_id)
+                states[task_id] = _name_to_dict(entry.name, "archive") if entry else None
+            else:
+                if dead is None:
+                    dead = self._dead_letters(engine)
+                states[task_id] = _name_to_dict(dead[task_id], "dead_letter") if task_id in dead else None
+        return states
+
+    def get_task(self, task_id, content=False, project=None):
+        state = self.task_states([task_id], project)[task_id]
+        if state is None:
+            raise APIError(404, f"任务 {task_id} 不存在")
+        if content:
+            state["content"] = self._read_task(self.engine_for(project), state)
+        return state
+
+    @staticmethod
+    def _read_task(engine, state):
+        if state["location"] == "messages":
+            return task_parser.read_task_body(engine.messages_dir / state["filename"])
+        if state["location"] == "archive":
+            entry = engine.archive.find(state["id"])
+            return engine.archive.read_text(entry) if entry else None
+        return task_parser.read_task_body(engine.dead_letters.dir / state["filename"])
+
+    def history(self, limit=None, project=None):
+        history = get_work_history(self.engine_for(project).history_file)
+        return history[:limit] if limit else history
+
+    def jobs(self, limit=None, project=None):
+        return [job.to_dict() for job in self.engine_for(project).jobs.list(limit)]
+
+    # ---------- 写入 ----------
+    def submit(self, specs, sender="P1", project=None):
+        """批量创建任务 (一次分配整批 ID，批次内可用 ref 相互依赖)，返回 [{"id", "filename"}]"""
+        engine = self.engine_for(project)
+        if isinstance(specs, dict):
+            specs = [specs]
+        if not isinstance(specs, list) or not all(isinstance(spec, dict) for spec in specs):
+            raise APIError(400, "tasks 必须是任务对象或任务对象列表")
+        try:
+            created = engine.create_tasks(specs, sender=sender or "P1")
+        except TaskSpecError as e:
+            raise APIError(400, str(e))
+        result = [{"id": task_id, "filename": filename} for task_id, filename in created]
+        if result:
+            self.events.publish("tasks.created", project=engine.project, task_ids=[item["id"] for item in result])
+            self.runner.wake()
+        return result
+
+    def breakdown(self, description, recursive=False, project=None):
+        """P1 自动拆解宏观任务并创建任务"""
+        from planner import breakdown_task
+        if not description:
+            raise APIError(400, "宏观任务描述不能为空")
+        engine = self.engine_for(project)
+        plan, created = breakdown_task(engine, engine.config_mgr, description, recursive=recursive)
+        result = {
+            "created": [{"id": task_id, "filename": filename} for task_id, filename in created],
+            "requests": plan.requests,
+            "notes": list(plan.notes) if recursive else [f"第 {i} 个子任务无效已跳过: {err}" for i, err in plan.dropped],
+        }
+        if created:
+            self.events.publish("tasks.created", project=engine.project, task_ids=[task_id for task_id, _ in created])
+            self.runner.wake()
+        return result
+
+    # ---------- 执行 ----------
+    def step(self, project=None):
+        """同步执行一个可执行任务"""
+        engine = self.engine_for(project)
+        with engine.profiler.tick("api.schedule"):
+            engine.request_archive()
+            tasks = engine.parse_tasks()
+            runnable = engine.get_runnable_tasks(tasks) if tasks else []
+        if not runnable:
+            return {"task_id": None, "pending": len(engine.pending_tasks(tasks))}
+        task = runnable[0]
+        self.events.publish("task.started", project=engine.project, task_id=task["id"], receiver=task["receiver"])
+        with engine.profiler.tick("api.execute_task"):
+            success = engine.execute_task(task)
+        record_work_history(task, success, engine.history_file)
+        failure = engine.last_failure
+        self.events.publish("task.done" if success else "task.failed", project=engine.project,
+                            task_id=task["id"], receiver=task["receiver"])
+        return {
+            "task_id": task["id"],
+            "success": success,
+            "fail_count": failure[0] if failure else None,
+            "dead_lettered": bool(failure and failure[1]),
+            # 环境问题导致的失败不计入失败次数，任务保持 [NEW]
+            "environment_error": None if success else engine.environment_error,
+        }
+
+    def run(self, workers=None):
+        """在后台开始并行调度 (持续运行，新提交的任务会被立即派发)；多项目时调度所有已注册的项目"""
+        if self.registry is not None:
+            for name in self.registry.refresh():
+                self.engine_for(name)
+        if workers and not self.runner.running:
+            self.runner.workers = max(1, int(workers))
+        started = self.runner.start(stop_when_idle=False)
+        return {"started": started, **self.runner.stats()}
+
+    def stop(self, wait=False):
+        self.runner.stop(wait=wait)
+        return self.runner.stats()
+
+    def close(self):
+        """进程退出前: 取消等待执行节点的远程调用 (任务保持 [NEW])，停止调度并等待后台作业结束"""
+        if self.leases is not None:
+            self.leases.close()
+        self.runner.stop(wait=True)
+        if self.registry is not None:
+            self.registry.close()
+
+    # ---------- 分布式执行节点 ----------
+    def _lease_board(self):
+        if self.leases is None:
+            raise APIError(409, "协调者未启用分布式执行 (nexus_cli.py serve --remote)")
+        return self.leases
+
+    def lease_tasks(self, worker, max_jobs=1, wait=0.0, capacity=None):
+        """执行节点领取模型调用 (长轮询)"""
+        if not worker:
+            raise APIError(400, "缺少执行节点 ID")
+        board = self._lease_board()
+        jobs = board.lease(worker, max_jobs, min(wait, MAX_WAIT_SECONDS), capacity)
+        if not jobs and board.closed:
+            raise APIError(503, "协调者正在停止")
+        return {"leases": jobs}
+
+    def heartbeat(self, worker, leases=(), capacity=None):
+        if not worker:
+            raise APIError(400, "缺少执行节点 ID")
+        return self._lease_board().heartbeat(worker, leases, capacity)
+
+    def post_result(self, worker, lease, text=None, usage=None, error=None):
+        """执行节点回报调用结果，租约已改派或取消时 accepted 为 False"""
+        if not worker or not lease:
+            raise APIError(400, "缺少执行节点 ID 或租约 ID")
+        return {"accepted": self._lease_board().complete(worker, lease, text, usage, error)}
+
+    def workers(self):
+        board = self._lease_board()
+        board.reap()
+        return {"workers": board.workers(), **board.stats()}
+
+    def wait(self, task_ids, timeout=DEFAULT_WAIT_SECONDS, mode="all", project=None):
+        """
+        长轮询: 等待任务进入终态 (DONE / FAIL / EXPIRED)。mode="all" 等待全部，"any" 等待任意一个。
+        返回 {"done": 是否满足条件, "tasks": {任务 ID: 状态}}。
+        """
+        if not task_ids:
+            raise APIError(400, "缺少任务 ID")
+        deadline = time.time() + max(0.0, timeout)
+        with tracer.span("api.wait", **{"wait.tasks": len(task_ids), "wait.mode": mode}):
+            while True:
+                states = self.task_states(task_ids, project)
+                missing = [task_id for task_id, state in states.items() if state is None]
+                if missing:
+                    raise APIError(404, f"任务不存在: {', '.join(missing)}")
+                finished = [state["status"] in TERMINAL_STATUSES for state in states.values()]
+                done = any(finished) if mode == "any" else all(finished)
+                remaining = deadline - time.time()
+                if done or remaining <= 0:
+                    return {"done": done, "tasks": states}
+                # 本进程内的执行结果通过事件立即唤醒，其他进程的结果按间隔轮询
+                self.events.wait(min(remaining, WAIT_POLL_SECONDS))
+
+    def poll_events(self, since=0, timeout=DEFAULT_WAIT_SECONDS):
+        events = self.events.since(since, timeout)
+        return {"events": events, "last_seq": events[-1]["seq"] if events else max(since, 0)}
+
+
+# ---------- HTTP ----------
+def _query_value(query, key, default=None, cast=str):
+    values = query.get(key)
+    if not values or values[0] == "":
+        return default
+    try:
+        return cast(values[0])
+    except ValueError:
+        raise APIError(400, f"参数 {key} 格式不正确")
+
+
+def _split_ids(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return [task_id.strip() for task_id in value or [] if task_id and task_id.strip()]
+
+
+class NexusAPIHandler(BaseHTTPRequestHandler):
+    """
+    JSON API:
+      GET  /api/status                          看板与执行状态
+      GET  /api/projects  POST /api/projects     项目列表 / 新建项目 {"name": "...", "config": {...}}
+      GET  /api/tasks?status=&receiver=          活跃任务列表
+      GET  /api/tasks/<ID>?content=1             单个任务 (含已归档 / 死信)
+      POST /api/tasks                            创建任务 {"tasks": [...], "sender": "P1"}，支持批量
+      POST /api/breakdown                        P1 自动拆解 {"description": "...", "recursive": false}
+      POST /api/step                             同步执行一个任务
+      POST /api/run  {"workers": N}              后台并行调度；POST /api/stop 停止派发
+      GET  /api/wait?ids=ID1,ID2&timeout=&mode=  长轮询等待任务结束
+      GET  /api/events?since=&timeout=           长轮询读取事件
+      GET  /api/events/stream?since=             SSE 事件流
+      GET  /api/history?limit=  /api/jobs        工作历史 / 后台作业
+      GET  /api/workers                          分布式执行节点 (serve --remote)
+      POST /api/workers/lease  {"worker", "max", "wait"}              执行节点领取模型调用 (长轮询)
+      POST /api/workers/heartbeat  {"worker", "leases": [...]}        续约执行中的租约
+      POST /api/workers/result  {"worker", "lease", "text", "usage", "error"}  回报调用结果
+    除 /api/projects、/api/run、/api/stop、事件与执行节点接口外，均可用 project 参数 (查询参数或请求体字段) 选择项目
+    """
+    server_version = "NexusAPI/1.0"
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def service(self):
+        return self.server.service
+
+    def log_message(self, format, *args):
+        # 高频调用时不逐条输出访问日志
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        token = self.server.token
+        return not token or self.headers.get("Authorization", "") == f"Bearer {token}"
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise APIError(413, "请求体过大")
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length).decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise APIError(400, f"请求体不是合法的 JSON: {e}")
+
+    def _handle(self, method):
+        url = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(url.query)
+        path = url.path.rstrip("/")
+        try:
+            if not self._authorized():
+                raise APIError(401, "缺少或错误的访问令牌")
+            if method == "GET" and path == "/api/events/stream":
+                return self._stream_events(_query_value(query, "since", self.service.events.last_seq, int))
+            with tracer.span("api.request", **{"http.method": method, "http.route": path}):
+                payload = self._route(method, path, query)
+            self._send_json(200, payload)
+        except APIError as e:
+            self._send_json(e.status, {"error": str(e)})
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        except Exception as e:
+            self._send_json(500, {"error": f"{type(e).__name__}: {e}"})
+
+    def _route(self, method, path, query):
+        service = self.service
+        if method == "GET":
+            project = _query_value(query, "project")
+            if path == "/api/status":
+                return service.status(project)
+            if path == "/api/projects":
+                return {"projects": service.projects()}
+            if path == "/api/tasks":
+                return {"tasks": service.list_tasks(_query_value(query, "status"), _query_value(query, "receiver"), project)}
+            if path.startswith("/api/tasks/"):
+                return service.get_task(path.rsplit("/", 1)[1], bool(_query_value(query, "content", 0, int)), project)
+            if path == "/api/wait":
+                timeout = min(_query_value(query, "timeout", DEFAULT_WAIT_SECONDS, float), MAX_WAIT_SECONDS)
+                return service.wait(_split_ids(_query_value(query, "ids", "")), timeout,
+                                    _query_value(query, "mode", "all"), project)
+            if path == "/api/events":
+                timeout = min(_query_value(query, "timeout", DEFAULT_WAIT_SECONDS, float), MAX_WAIT_SECONDS)
+                return service.poll_events(_query_value(query, "since", 0, int), timeout)
+            if path == "/api/history":
+                return {"history": service.history(_query_value(query, "limit", None, int), project)}
+            if path == "/api/jobs":
+                return {"jobs": service.jobs(_query_value(query, "limit", None, int), project)}
+            if path == "/api/workers":
+                return service.workers()
+        elif method == "POST":
+            body = self._read_json()
+            if isinstance(body, list):
+                body = {"tasks": body}
+            project = body.get("project") or _query_value(query, "project")
+            if path == "/api/projects":
+                return service.create_project(body.get("name", ""), body.get("config"))
+            if path == "/api/tasks":
+                return {"created": service.submit(body.get("tasks", body), body.get("sender", "P1"), project)}
+            if path == "/api/breakdown":
+                return service.breakdown(body.get("description", ""), bool(body.get("recursive", False)), project)
+            if path == "/api/step":
+                return service.step(project)
+            if path == "/api/run":
+                return service.run(body.get("workers"))
+            if path == "/api/stop":
+                return service.stop()
+            if path == "/api/wait":
+                timeout = min(float(body.get("timeout", DEFAULT_WAIT_SECONDS)), MAX_WAIT_SECONDS)
+                return service.wait(_split_ids(body.get("ids")), timeout, body.get("mode", "all"), project)
+            if path == "/api/workers/lease":
+                return service.lease_tasks(body.get("worker"), int(body.get("max", 1)), float(body.get("wait", 0)),
+                                           body.get("capacity"))
+            if path == "/api/workers/heartbeat":
+                return service.heartbeat(body.get("worker"), body.get("leases") or [], body.get("capacity"))
+            if path == "/api/workers/result":
+                return service.post_result(body.get("worker"), body.get("lease"), body.get("text"),
+                                           body.get("usage"), body.get("error"))
+        raise APIError(404, f"未知接口: {method} {path}")
+
+    def _stream_events(self, since):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while not self.server.stopping:
+                events = self.service.events.since(since, SSE_KEEPALIVE_SECONDS)
+                if not events:
+                    self.wfile.write(b": keep-alive\n\n")
+                for event in events:
+                    data = json.dumps(event, ensure_ascii=False)
+                    self.wfile.write(f"id: {event['seq']}\nevent: {event['event']}\ndata: {data}\n\n".encode("utf-8"))
+                    since = event["seq"]
+                self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+
+class NexusAPIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, service, host=DEFAULT_HOST, port=DEFAULT_PORT, token=None):
+        super().__init__((host, port), NexusAPIHandler)
+        self.service = service
+        self.token = token
+        self.stopping = False
+
+    def shutdown(self):
+        self.stopping = True
+        super().shutdown()
+
+
+def create_server(service, host=None, port=None, token=None):
+    """按 system.api 配置创建 HTTP 服务 (未启动)；访问令牌取参数、环境变量 NEXUS_API_TOKEN 或配置中的 token"""
+    cfg = service.api_cfg
+    token = token or os.environ.get(TOKEN_ENV) or cfg.get("token") or None
+    return NexusAPIServer(service, host or cfg.get("host", DEFAULT_HOST),
+                          port if port is not None else cfg.get("port", DEFAULT_PORT), token)
+
+
+# ---------- 客户端 ----------
+class NexusClient:
+    """HTTP API 客户端，方法与 NexusService 一一对应 (nexus 命令行的 --url 模式)；project 为每次请求选择的项目"""
+    def __init__(self, url, token=None, timeout=MAX_WAIT_SECONDS + 10, project=None):
+        self.url = url.rstrip("/")
+        self.token = token or os.environ.get(TOKEN_ENV)
+        self.timeout = timeout
+        self.project = project
+
+    def _request(self, method, path, query=None, body=None):
+        url = self.url + path
+        if self.project:
+            if body is not None:
+                body = {"project": self.project, **body}
+            else:
+                query = {"project": self.project, **(query or {})}
+        if query:
+            url += "?" + urllib.parse.urlencode({k: v for k, v in query.items() if v is not None})
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method)
+        request.add_header("Content-Type", "application/json; charset=utf-8")
+        if self.token:
+            request.add_header("Authorization", f"Bearer {self.token}")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read().decode("utf-8"))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode("utf-8")).get("error", e.reason)
+            except (ValueError, AttributeError):
+                message = e.reason
+            raise APIError(e.code, message)
+        except urllib.error.URLError as e:
+            raise APIError(503, f"无法连接 {self.url}: {e.reason}")
+
+    def status(self):
+        return self._request("GET", "/api/status")
+
+    def list_tasks(self, status=None, receiver=None):
+        return self._request("GET", "/api/tasks", {"status": status, "receiver": receiver})["tasks"]
+
+    def get_task(self, task_id, content=False):
+        return self._request("GET", f"/api/tasks/{task_id}", {"content": int(content)})
+
+    def submit(self, specs, sender="P1"):
+        return self._request("POST", "/api/tasks", body={"tasks": specs, "sender": sender})["created"]
+
+    def breakdown(self, description, recursive=False):
+        return self._request("POST", "/api/breakdown", body={"description": description, "recursive": recursive})
+
+    def step(self):
+        return self._request("POST", "/api/step", body={})
+
+    def run(self, workers=None):
+        return self._request("POST", "/api/run", body={"workers": workers})
+
+    def stop(self):
+        return self._request("POST", "/api/stop", body={})
+
+    def projects(self):
+        return self._request("GET", "/api/projects")["projects"]
+
+    def create_project(self, name, config=None):
+        return self._request("POST", "/api/projects", body={"name": name, "config": config})
+
+    def wait(self, task_ids, timeout=DEFAULT_WAIT_SECONDS, mode="all"):
+        # 服务端单次最多等待 MAX_WAIT_SECONDS，超过时分多次长轮询
+        deadline = time.time() + timeout
+        while True:
+            remaining = max(0.0, deadline - time.time())
+            result = self._request("POST", "/api/wait", body={"ids": list(task_ids), "mode": mode,
+                                                               "timeout": min(remaining, MAX_WAIT_SECONDS)})
+            if result["done"] or time.time() >= deadline:
+                return result
+
+    def poll_events(self, since=0, timeout=DEFAULT_WAIT_SECONDS):
+        return self._request("GET", "/api/events", {"since": since, "timeout": timeout})
+
+    def history(self, limit=None):
+        return self._request("GET", "/api/history", {"limit": limit})["history"]
+
+    def workers(self):
+        return self._request("GET", "/api/workers")
+
+    def lease_tasks(self, worker, max_jobs=1, wait=0.0, capacity=None):
+        return self._request("POST", "/api/workers/lease",
+                             body={"worker": worker, "max": max_jobs, "wait": wait, "capacity": capacity})["leases"]
+
+    def heartbeat(self, worker, leases=(), capacity=None):
+        return self._request("POST", "/api/workers/heartbeat",
+                             body={"worker": worker, "leases": list(leases), "capacity": capacity})
+
+    def post_result(self, worker, lease, text=None, usage=None, error=None):
+        return self._request("POST", "/api/workers/result",
+                             body={"worker": worker, "lease": lease, "text": text, "usage": usage, "error": error})
+
+    def jobs(self, limit=None):
+        return self._request("GET", "/api/jobs", {"limit": limit})["jobs"]
@@ -0,0 +1,449 @@
+"""
+nexus 命令行: 在不启动 Web UI 的情况下查询看板、提交任务、并行执行与等待任务完成。
+
+默认直接在当前工作区上运行引擎；指定 --url (或环境变量 NEXUS_API_URL) 时改为调用
+`nexus serve` 启动的 HTTP JSON API，便于多个脚本共享同一个调度进程。
+--project (或环境变量 NEXUS_PROJECT) 选择 PROJECTS/ 下的项目，默认为当前工作区 (default)。
+
+示例:
+    python SYSTEM/nexus_cli.py status --json
+    python SYSTEM/nexus_cli.py submit --receiver P8_技术 --desc "实现登录接口" --depends ID003
+    python SYSTEM/nexus_cli.py submit --file tasks.jsonl --wait
+    python SYSTEM/nexus_cli.py run --workers 4
+    python SYSTEM/nexus_cli.py wait ID012 ID013 --timeout 600
+    python SYSTEM/nexus_cli.py serve --port 8090 --run --workers 4
+    python SYSTEM/nexus_cli.py --project acme submit --receiver P8_技术 --desc "搭建框架"
+    python SYSTEM/nexus_cli.py run --all-projects --workers 8
+    python SYSTEM/nexus_cli.py serve --run --remote                       # 协调者: 模型调用交给执行节点
+    python SYSTEM/nexus_cli.py --url http://127.0.0.1:8090 worker --concurrency 4   # 执行节点 (可启动多个)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+# 强制设置标准输出编码为 utf-8，解决 Windows 下打印 emoji 报错的问题
+if sys.stdout.encoding.lower() != 'utf-8':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+from rich.console import Console
+
+from nexus_api import (NexusService, NexusClient, APIError, create_server, TERMINAL_STATUSES,
+                       DEFAULT_WAIT_SECONDS, MAX_WAIT_SECONDS)
+from task_runner import TaskRunner
+
+URL_ENV = "NEXUS_API_URL"
+PROJECT_ENV = "NEXUS_PROJECT"
+# wait 的退出码: 全部完成 / 有任务失败或过期 / 超时
+EXIT_OK, EXIT_FAILED, EXIT_TIMEOUT = 0, 1, 2
+
+# 命令结果输出到标准输出，引擎日志输出到标准错误 (--json 时标准输出只有 JSON)
+out = Console()
+log = Console(stderr=True)
+
+
+def open_backend(args):
+    """--url 时返回 HTTP 客户端，否则在当前工作区上构建所选项目的引擎"""
+    if args.url:
+        return NexusClient(args.url, token=args.token, project=args.project)
+    import nexus_core
+    nexus_core.console = Console(stderr=True, quiet=args.quiet)
+    from projects import ProjectRegistry
+    registry = ProjectRegistry.from_config(auto_mode=True)
+    try:
+        engine = registry.engine(args.project)
+    except KeyError as e:
+        raise APIError(404, str(e.args[0]))
+    return NexusService(engine, workers=getattr(args, "workers", None), registry=registry,
+                        remote=getattr(args, "remote", False))
+
+
+def emit_json(payload):
+    print(json.dumps(payload, ensure_ascii=False, indent=2))
+
+
+def load_specs(args):
+    """从 --file (JSON 数组 / JSONL，- 为标准输入) 或 --receiver/--desc 读取任务"""
+    if args.file:
+        text = sys.stdin.read() if args.file == "-" else open(args.file, "r", encoding="utf-8").read()
+        text = text.strip()
+        if text.startswith("[") or text.startswith("{\"tasks\""):
+            data = json.loads(text)
+            return data["tasks"] if isinstance(data, dict) else data
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    if not args.receiver or not args.desc:
+        raise APIError(400, "请指定 --receiver 与 --desc，或使用 --file 批量提交")
+    return [{"receiver": args.receiver, "description": args.desc, "depends_on": args.depends, "id": args.id}]
+
+
+# ---------- 子命令 ----------
+def cmd_status(backend, args):
+    status = backend.status()
+    if args.json:
+        return emit_json(status)
+    tasks = status["tasks"]
+    if status.get("project") and status["project"] != "default":
+        out.print(f"📁 项目 {status['project']}")
+    out.print(f"📊 活跃任务 {tasks['total']} | ✅ 已完成 {tasks['done']} | ⏳ 待执行 {tasks['new']} | "
+              f"▶️ 可执行 {status['runnable']} | 📦 已归档 {status['archived']} | 🔴 死信 {status['dead_letter']}")
+    runner = status["runner"]
+    if runner["running"] or runner["active"]:
+        out.print(f"🚀 并行执行中: {runner['workers']} 个执行线程，当前任务 {', '.join(runner['active']) or '无'}")
+    remote = status.get("remote")
+    if remote:
+        out.print(f"🛰️ 执行节点 {remote['alive']} 个 | 排队 {remote['queued']} | 执行中 {remote['leased']} | "
+                  f"已完成 {remote['completed']} | 改派 {remote['reassigned']}")
+    for job in status["jobs"]:
+        out.print(f"🧰 后台作业 {job['id']} {job['title']} ({job['status']})")
+
+
+def cmd_list(backend, args):
+    tasks = backend.list_tasks(args.status, args.receiver)
+    if args.json:
+        return emit_json(tasks)
+    if not tasks:
+        out.print("当前没有活跃任务。")
+    for t in tasks:
+        deps = ", ".join(t["depends_on"]) or "无"
+        out.print(f"[{t['status']}] {t['id']}  {t['receiver']:<16} 依赖: {deps}")
+
+
+def cmd_show(backend, args):
+    task = backend.get_task(args.task_id, content=args.content)
+    if args.json:
+        return emit_json(task)
+    out.print(f"{task['id']} [{task['status']}] {task['receiver']} ({task['location']}): {task['filename']}")
+    if args.content:
+        out.print(task.get("content") or "", markup=False, highlight=False)
+
+
+def cmd_submit(backend, args):
+    created = backend.submit(load_specs(args), sender=args.sender)
+    if args.json and not args.wait:
+        return emit_json(created)
+    if not args.json:
+        for item in created:
+            out.print(f"✅ 已创建 {item['id']}: {item['filename']}")
+    if args.wait:
+        return wait_for(backend, [item["id"] for item in created], args)
+
+
+def cmd_breakdown(backend, args):
+    result = backend.breakdown(args.description, recursive=args.recursive)
+    if args.json:
+        return emit_json(result)
+    for item in result["created"]:
+        out.print(f"✅ 已创建 {item['id']}: {item['filename']}")
+    for note in result["notes"]:
+        out.print(f"⚠️ {note}")
+    out.print(f"共 {len(result['created'])} 个任务，{result['requests']} 次模型请求")
+
+
+def cmd_step(backend, args):
+    result = backend.step()
+    if args.json:
+        return emit_json(result)
+    if result["task_id"] is None:
+        out.print("✅ 当前没有可执行的任务" + (f" (仍有 {result['pending']} 个任务等待上游)" if result["pending"] else ""))
+        return EXIT_OK
+    out.print(f"{'✅' if result['success'] else '❌'} {result['task_id']}")
+    return EXIT_OK if result["success"] else EXIT_FAILED
+
+
+def print_event(event):
+    name = event["event"]
+    project = event.get("project", "default")
+    task = TaskRunner.label(project, event["task_id"]) if "task_id" in event else None
+    if name == "task.started":
+        out.print(f"▶️ {task} ({event['receiver']}) 开始执行")
+    elif name == "task.done":
+        out.print(f"✅ {task} 完成，耗时 {event.get('seconds', '-')} 秒")
+    elif name == "task.failed":
+        suffix = "，已熔断" if event.get("dead_lettered") else ""
+        out.print(f"❌ {task} 失败{suffix}")
+    elif name == "task.error":
+        out.print(f"❌ {task} 异常: {event['error']}")
+    elif name == "tasks.created":
+        ids = [TaskRunner.label(project, task_id) for task_id in event["task_ids"]]
+        out.print(f"📝 新任务: {', '.join(ids[:20])}" + (" ..." if len(ids) > 20 else ""))
+    elif name == "project.throttled":
+        out.print(f"⏳ 项目 {project} 已达配额 (执行中 {event['inflight']} 个，最近一小时 {event['started_last_hour']} 个)，暂缓派发")
+    elif name == "project.stopped":
+        out.print(f"🛑 项目 {project} 收到停止信号，已暂停调度")
+    elif name == "project.paused":
+        out.print(f"⏸️ 项目 {project} 已暂停调度 ({event['reason']})，{task} 保持 [NEW]")
+    elif name == "task.reassigned":
+        out.print(f"🔁 {task} 的执行节点 {event['worker']} 租约到期，已重新排队 (第 {event['attempt']} 次改派)")
+    elif name == "worker.joined":
+        out.print(f"🛰️ 执行节点 {event['worker']} 已加入" + (f" (并发 {event['capacity']})" if event.get("capacity") else ""))
+    elif name == "worker.lost":
+        out.print(f"⚠️ 执行节点 {event['worker']} 失联")
+    elif name == "runner.idle":
+        message = f"⏸️ 没有可执行的任务 (待完成 {event['pending']} 个)"
+        if event.get("blocked"):
+            message += f"，{len(event['blocked'])} 个任务的上游已熔断或过期"
+        out.print(message)
+
+
+def cmd_run(backend, args):
+    if isinstance(backend, NexusClient):
+        # 远程模式: 让服务端开始并行调度
+        result = backend.run(args.workers)
+        if args.json:
+            return emit_json(result)
+        out.print(f"🚀 服务端已{'开始' if result['started'] else '在'}并行调度 ({result['workers']} 个执行线程)")
+        return EXIT_OK
+    if args.all_projects:
+        for name in backend.registry.refresh():
+            backend.engine_for(name)
+    backend.runner.on_event = lambda event, **data: (backend.events.publish(event, **data),
+                                                     None if args.json else print_event({"event": event, **data}))
+    started = time.perf_counter()
+    try:
+        executed, failed = backend.runner.run(stop_when_idle=not args.keep_running)
+    except KeyboardInterrupt:
+        log.print("[yellow]已中断，等待执行中的任务结束...[/yellow]")
+        backend.runner.stop(wait=False)
+        executed, failed = backend.runner.executed, backend.runner.failed
+    elapsed = time.perf_counter() - started
+    for project in backend.registry.loaded():
+        project.engine.jobs.wait_idle()
+    summary = {"executed": executed, "failed": failed, "seconds": round(elapsed, 3),
+               "tasks_per_sec": round(executed / elapsed, 3) if elapsed else 0.0}
+    if args.json:
+        emit_json(summary)
+    else:
+        out.print(f"🏁 完成 {executed} 个任务，失败 {failed} 次，耗时 {elapsed:.1f} 秒")
+    return EXIT_OK if not failed else EXIT_FAILED
+
+
+def wait_for(backend, task_ids, args):
+    result = backend.wait(task_ids, timeout=args.timeout, mode="any" if getattr(args, "any", False) else "all")
+    statuses = {task_id: state["status"] for task_id, state in result["tasks"].items()}
+    if args.json:
+        emit_json(result)
+    else:
+        for task_id, status in statuses.items():
+            icon = "✅" if status == "DONE" else ("❌" if status in TERMINAL_STATUSES else "⏳")
+            out.print(f"{icon} {task_id} [{status}]")
+        if not result["done"]:
+            out.print(f"⌛ 等待超时 ({args.timeout} 秒)")
+    if not result["done"]:
+        return EXIT_TIMEOUT
+    return EXIT_FAILED if any(status in ("FAIL", "EXPIRED") for status in statuses.values()) else EXIT_OK
+
+
+def cmd_wait(backend, args):
+    return wait_for(backend, args.task_ids, args)
+
+
+def cmd_events(backend, args):
+    since = args.since
+    while True:
+        result = backend.poll_events(since, timeout=MAX_WAIT_SECONDS if args.follow else 0)
+        for event in result["events"]:
+            if args.json:
+                print(json.dumps(event, ensure_ascii=False), flush=True)
+            else:
+                print_event(event)
+        since = result["last_seq"]
+        if not args.follow:
+            return EXIT_OK
+
+
+def cmd_history(backend, args):
+    history = backend.history(args.limit)
+    if args.json:
+        return emit_json(history)
+    if not history:
+        out.print("暂无工作记录。")
+    for r in history:
+        out.print(f"{r['time']}  {r['task_id']:<8} {r['receiver']:<16} {'✅' if r['status'] == 'Success' else '❌'} {r['status']}")
+
+
+def cmd_projects(backend, args):
+    projects = backend.projects()
+    if args.json:
+        return emit_json(projects)
+    for p in projects:
+        limits = []
+        if p.get("max_concurrent"):
+            limits.append(f"并发 ≤ {p['max_concurrent']}")
+        if p.get("max_tasks_per_hour"):
+            limits.append(f"每小时 ≤ {p['max_tasks_per_hour']}")
+        runner = p.get("runner") or {}
+        out.print(f"{p['name']:<20} {p['root']:<28} 权重 {p.get('weight', 1):g}  {'，'.join(limits) or '不限额'}"
+                  + (f"  已完成 {runner['executed']} 个" if runner else ""))
+
+
+def cmd_new_project(backend, args):
+    quota = {key: value for key, value in (("weight", args.weight), ("max_concurrent", args.max_concurrent),
+                                            ("max_tasks_per_hour", args.max_tasks_per_hour)) if value is not None}
+    project = backend.create_project(args.name, {"system": {"quota": quota}} if quota else None)
+    if args.json:
+        return emit_json(project)
+    out.print(f"✅ 已创建项目 {project['name']}: {project['root']}")
+
+
+def cmd_serve(backend, args):
+    if isinstance(backend, NexusClient):
+        raise APIError(400, "serve 不能与 --url 同时使用")
+    server = create_server(backend, host=args.host, port=args.port, token=args.token)
+    host, port = server.server_address[:2]
+    log.print(f"[bold magenta]A1_Nexus JSON API 已启动: http://{host}:{port}/api/status[/bold magenta]")
+    if server.token:
+        log.print("[dim]已启用访问令牌 (Authorization: Bearer <token>)[/dim]")
+    if args.run:
+        backend.run(args.workers)
+        log.print(f"[dim]并行调度已开启: {backend.runner.workers} 个执行线程[/dim]")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        log.print("\n[yellow]正在停止 API 服务...[/yellow]")
+    finally:
+        server.stopping = True
+        server.server_close()
+        backend.close()
+
+
+def cmd_worker(backend, args):
+    if not isinstance(backend, NexusClient):
+        raise APIError(400, "worker 需要用 --url (或环境变量 NEXUS_API_URL) 指定协调者地址")
+    from nexus_core import ConfigManager
+    from nexus_worker import RemoteWorker
+
+    def on_event(event, **data):
+        if args.json:
+            print(json.dumps({"event": event, **data}, ensure_ascii=False), flush=True)
+            return
+        task = TaskRunner.label(data.get("project", "default"), data["task_id"]) if "task_id" in data else None
+        if event == "lease.started":
+            out.print(f"▶️ {task} ({data['receiver']}) 调用 {data['model']}")
+        elif event == "lease.done":
+            out.print(f"✅ {task} 已回报，耗时 {data['seconds']} 秒")
+        elif event == "lease.failed":
+            out.print(f"❌ {task} 调用失败: {data['error']}")
+        elif event == "lease.rejected":
+            out.print(f"⚠️ {task} 的租约已改派，结果被协调者丢弃")
+        elif event == "worker.disconnected":
+            log.print(f"[yellow]与协调者的连接中断: {data['error']}，稍后重试...[/yellow]")
+        elif event == "worker.connected":
+            log.print("[green]已重新连接协调者[/green]")
+
+    worker = RemoteWorker.from_config(backend, ConfigManager(), concurrency=args.concurrency,
+                                      worker_id=args.id, on_event=on_event)
+    log.print(f"[bold magenta]执行节点 {worker.worker_id} 已启动 (并发 {worker.concurrency})，协调者: {backend.url}[/bold magenta]")
+    try:
+        completed, failed = worker.run(max_calls=args.max_calls)
+    except KeyboardInterrupt:
+        log.print("\n[yellow]正在停止执行节点，等待执行中的调用回报...[/yellow]")
+        worker.stop()
+        completed, failed = worker.completed, worker.failed
+    if not args.json:
+        out.print(f"🏁 执行节点完成 {completed} 个调用，失败 {failed} 个")
+    return EXIT_OK
+
+
+def cmd_workers(backend, args):
+    result = backend.workers()
+    if args.json:
+        return emit_json(result)
+    out.print(f"排队 {result['queued']} | 执行中 {result['leased']} | 已完成 {result['completed']} | "
+              f"失败 {result['failed']} | 改派 {result['reassigned']} (租约 {result['lease_seconds']} 秒)")
+    for w in result["workers"]:
+        state = "在线" if w["alive"] else "失联"
+        out.print(f"{w['id']:<28} {state}  并发 {w['capacity'] or '-'}  执行中 {w['active']}  "
+                  f"完成 {w['completed']}  失败 {w['failed']}  空闲 {w['idle_seconds']} 秒")
+
+
+COMMANDS = {
+    "status": cmd_status, "list": cmd_list, "show": cmd_show, "submit": cmd_submit, "breakdown": cmd_breakdown,
+    "step": cmd_step, "run": cmd_run, "wait": cmd_wait, "events": cmd_events, "history": cmd_history,
+    "serve": cmd_serve, "projects": cmd_projects, "new-project": cmd_new_project,
+    "worker": cmd_worker, "workers": cmd_workers,
+}
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="nexus", description="A1_Nexus 命令行 (无需 Web UI)")
+    parser.add_argument("--url", default=os.environ.get(URL_ENV), help=f"调用已启动的 HTTP API (也可用环境变量 {URL_ENV})")
+    parser.add_argument("--token", help="HTTP API 访问令牌 (默认读取环境变量 NEXUS_API_TOKEN)")
+    parser.add_argument("--project", "-p", default=os.environ.get(PROJECT_ENV),
+                        help=f"项目名 (PROJECTS/<名称>/，默认为当前工作区；也可用环境变量 {PROJECT_ENV})")
+    parser.add_argument("--quiet", "-q", action="store_true", help="不输出引擎日志")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add(name, help_text):
+        p = sub.add_parser(name, help=help_text)
+        p.add_argument("--json", action="store_true", help="以 JSON 输出")
+        return p
+
+    add("status", "看板统计与执行状态")
+    p = add("list", "列出活跃任务")
+    p.add_argument("--status", help="按状态过滤，如 NEW / DONE")
+    p.add_argument("--receiver", help="按接收者前缀过滤，如 P8")
+    p = add("show", "查看单个任务 (含已归档与死信)")
+    p.add_argument("task_id")
+    p.add_argument("--content", action="store_true", help="同时输出任务正文")
+    p = add("submit", "创建任务 (单个或 --file 批量)")
+    p.add_argument("--receiver", help="接收者，如 P8_技术")
+    p.add_argument("--desc", help="任务描述")
+    p.add_argument("--depends", default="NONE", help="依赖的任务 ID，逗号分隔")
+    p.add_argument("--id", help="显式指定任务 ID (默认自动分配)")
+    p.add_argument("--file", help="JSON 数组或 JSONL 文件 (- 为标准输入)，字段同 create_tasks: receiver / description / depends_on / ref / id")
+    p.add_argument("--sender", default="P1")
+    p.add_argument("--wait", action="store_true", help="提交后等待这些任务结束")
+    p.add_argument("--timeout", type=float, default=3600, help="--wait 的最长等待秒数")
+    p = add("breakdown", "P1 自动拆解宏观任务")
+    p.add_argument("description")
+    p.add_argument("--recursive", action="store_true", help="递归拆解 (P8 主管并行细化工作包)")
+    add("step", "执行一个可执行任务")
+    p = add("run", "并行执行所有可执行任务，直到没有可执行的任务")
+    p.add_argument("--workers", type=int, help="并行执行线程数 (默认取 system.api.workers)")
+    p.add_argument("--keep-running", action="store_true", help="没有任务时继续等待新任务 (本地模式)")
+    p.add_argument("--all-projects", action="store_true", help="同时调度所有项目，按权重与配额公平分配执行线程 (本地模式)")
+    p = add("wait", "等待任务结束 (退出码: 0 全部完成 / 1 有任务失败 / 2 超时)")
+    p.add_argument("task_ids", nargs="+")
+    p.add_argument("--timeout", type=float, default=DEFAULT_WAIT_SECONDS * 20)
+    p.add_argument("--any", action="store_true", help="任意一个任务结束即返回")
+    p = add("events", "读取任务事件 (需配合 --url；本地模式只有本进程产生的事件)")
+    p.add_argument("--since", type=int, default=0, help="从该序号之后开始读取")
+    p.add_argument("--follow", "-f", action="store_true", help="持续输出新事件")
+    p = add("history", "工作历史记录")
+    p.add_argument("--limit", type=int, default=20)
+    add("projects", "列出所有项目及其配额")
+    p = add("new-project", "新建项目 (PROJECTS/<名称>/)")
+    p.add_argument("name")
+    p.add_argument("--weight", type=float, help="公平调度的权重 (默认 1)")
+    p.add_argument("--max-concurrent", type=int, help="同时执行的任务数上限")
+    p.add_argument("--max-tasks-per-hour", type=int, help="每小时最多开始执行的任务数")
+    p = sub.add_parser("serve", help="启动 HTTP JSON API (托管所有项目)")
+    p.add_argument("--host", help="监听地址 (默认取 system.api.host，即 127.0.0.1)")
+    p.add_argument("--port", type=int, help="监听端口 (默认取 system.api.port)")
+    p.add_argument("--run", action="store_true", help="同时开始并行调度")
+    p.add_argument("--workers", type=int, help="并行执行线程数 (--remote 时默认取 system.distributed.max_inflight)")
+    p.add_argument("--remote", action="store_true", help="分布式模式: 模型调用交给 worker 执行节点")
+    p = add("worker", "作为执行节点连接协调者 (需 --url)，领取并执行模型调用")
+    p.add_argument("--concurrency", type=int, help="同时执行的调用数 (默认取 system.distributed.worker_concurrency)")
+    p.add_argument("--id", help="执行节点 ID (默认为 主机名-进程号)")
+    p.add_argument("--max-calls", type=int, help="完成指定数量的调用后退出")
+    add("workers", "查看协调者上的执行节点 (分布式模式)")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        backend = open_backend(args)
+        code = COMMANDS[args.command](backend, args)
+    except APIError as e:
+        log.print(f"[red]❌ {e}[/red]")
+        code = EXIT_FAILED
+    except KeyboardInterrupt:
+        code = 130
+    sys.exit(code or EXIT_OK)
+
+
+if __name__ == "__main__":
+    main()
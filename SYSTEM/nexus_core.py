@@ -3,9 +3,13 @@ import sys
 import yaml
 import re
 import glob
+import time
 from pathlib import Path
 import logging
 import argparse
+import sqlite3
+import threading
+from contextlib import nullcontext
 from dotenv import load_dotenv
 
 try:
@@ -13,18 +17,44 @@ try:
     from rich.panel import Panel
     from rich.tree import Tree
     from rich.progress import Progress, SpinnerColumn, TextColumn
-    import questionary
-    from openai import OpenAI
 except ImportError:
     print("错误: 缺少依赖库。请使用 auto_setup.py 启动。")
     exit(1)
 
+from nexus_trace import tracer
+from nexus_profile import TickProfiler, PROFILE_MODES
+import task_parser
+from task_store import TaskStore, DEFAULT_BODY_CACHE_SIZE
+from upstream_context import UpstreamContext, DEFAULT_SUMMARY_MAX_CHARS, DEFAULT_UPSTREAM_BUDGET_CHARS, DEFAULT_UPSTREAM_MAX_DEPTH
+from milestones import MilestoneManager
+from task_factory import TaskFactory
+from artifacts import ArtifactWriter, DEFAULT_FEATURES_DIR, DEFAULT_PATCH_FUZZ, format_report, estimate_tokens
+from workspace_index import (WorkspaceIndex, DEFAULT_TOP_K, DEFAULT_CONTEXT_CHARS, DEFAULT_CHUNK_LINES, DEFAULT_LIST_FILES_BELOW,
+                             DEFAULT_RECONCILE_SECONDS)
+from search_index import SearchIndex
+from archive_store import ArchiveStore
+from file_preview import FilePreviewer, DEFAULT_PAGE_LINES, DEFAULT_PAGE_BYTES
+from workspace_tree import WorkspaceTree, DEFAULT_IGNORE_PATTERNS, DEFAULT_MAX_ENTRIES as DEFAULT_TREE_MAX_ENTRIES
+from snapshot_store import SnapshotStore
+from diff_mode import DiffContext, savings_report, DEFAULT_DIFF_MAX_FILES, DEFAULT_DIFF_CONTEXT_CHARS
+from dead_letter import DeadLetterQueue, is_environment_error
+from job_queue import JobQueue, FAILED
+from work_history import DEFAULT_HISTORY_FILE
+from provider_pool import ProviderPool
+from lease_board import RemoteCancelled
+from speculative import (Speculator, SpeculativeRun, wants_speculation, predicted_record, validate,
+                         ASSUMPTION_INSTRUCTION, DEFAULT_MAX_PARALLEL)
+
 # 初始化 Rich 控制台
 # 强制设置标准输出编码为 utf-8，解决 Windows 下打印 emoji 报错的问题
 if sys.stdout.encoding.lower() != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
 console = Console()
 
+# 未使用项目注册表时的项目名 (即当前目录下的工作区)
+DEFAULT_PROJECT = "default"
+DEFAULT_STOP_SIGNAL_FILE = "SYSTEM/stop_signal.txt"
+
 class ConfigManager:
     """管理配置文件读取与模型供应选择"""
     def __init__(self, config_file="config.yaml"):
@@ -36,11 +66,36 @@ class ConfigManager:
             config_file = os.path.join("SYSTEM", "config.yaml")
             if not os.path.exists(config_file):
                 config_file = os.path.join("A1_Nexus_Improved", "config.yaml")
+        self.config_file = config_file
         with open(config_file, "r", encoding="utf-8") as f:
             self.config = yaml.safe_load(f)
             
         # 替换配置中的环境变量
         self._replace_env_vars(self.config)
+
+    @classmethod
+    def from_dict(cls, config):
+        """由已合并的配置字典构建 (多项目: 基础配置叠加项目配置)"""
+        load_dotenv()
+        config_mgr = cls.__new__(cls)
+        config_mgr.config_file = None
+        config_mgr.config = config
+        config_mgr._replace_env_vars(config_mgr.config)
+        return config_mgr
+
+    def reload(self):
+        """
+        重新读取配置文件 (界面保存配置后调用)，原地替换 self.config，
+        共用本实例的引擎随之读到新的角色模型分配；由字典构建的实例没有配置文件，保持不变。
+        """
+        if self.config_file is None:
+            return self
+        load_dotenv()
+        with open(self.config_file, "r", encoding="utf-8") as f:
+            config = yaml.safe_load(f)
+        self._replace_env_vars(config)
+        self.config = config
+        return self
         
     def _replace_env_vars(self, config_dict):
         """递归替换配置字典中的环境变量"""
@@ -74,8 +129,8 @@ class ConfigManager:
                 
         return provider_name, provider_cfg, model_name
 
-    def get_all_models(self):
-        """获取所有可用的模型列表，用于用户选择"""
+    def get_all_models(self, provider_pool=None):
+        """获取所有可用的模型列表，用于用户选择 (传入 provider_pool 时复用其客户端并缓存模型列表)"""
         models = []
         for provider_name, provider_cfg in self.config["api_providers"]["providers"].items():
             # 尝试从 API 动态拉取模型列表
@@ -84,13 +139,18 @@ class ConfigManager:
             
             if api_key and "YOUR_" not in api_key:
                 try:
-                    client = OpenAI(api_key=api_key, base_url=base_url)
-                    api_models = client.models.list()
-                    for model in api_models.data:
+                    if provider_pool is not None:
+                        model_ids = provider_pool.list_models(provider_cfg)
+                    else:
+                        # openai 导入较慢 (约 0.7 秒)，只在真正请求模型时加载
+                        from openai import OpenAI
+                        client = OpenAI(api_key=api_key, base_url=base_url)
+                        model_ids = [model.id for model in client.models.list().data]
+                    for model_id in model_ids:
                         models.append({
                             "provider": provider_name,
-                            "model_id": model.id,
-                            "display": f"[{provider_name}] {model.id} (API)"
+                            "model_id": model_id,
+                            "display": f"[{provider_name}] {model_id} (API)"
                         })
                     continue # 如果成功拉取，则跳过本地配置的模型
                 except Exception as e:
@@ -106,75 +166,172 @@ class ConfigManager:
         return models
 
 class NexusEngine:
-    """自动调度核心引擎"""
-    def __init__(self, auto_mode=False):
+    """
+    自动调度核心引擎。
+    默认使用当前目录下的 SYSTEM/config.yaml；多项目时由 ProjectRegistry 传入已叠加项目配置的 config_mgr，
+    各目录与状态文件均取自该配置，模型客户端与请求限额通过 provider_pool 在同一进程的项目间共享。
+    """
+    def __init__(self, auto_mode=False, profile=None, config_mgr=None, project=None, provider_pool=None):
         self.auto_mode = auto_mode
-        self.config_mgr = ConfigManager()
+        self.profiler = TickProfiler.from_env(profile)
+        self.config_mgr = config_mgr or ConfigManager()
+        self.project = project or DEFAULT_PROJECT
         self.messages_dir = Path(self.config_mgr.config["system"]["messages_dir"])
         self.archive_dir = Path(self.config_mgr.config["system"]["archive_dir"])
         self.project_space_dir = Path(self.config_mgr.config["system"].get("project_space_dir", "PROJECT_SPACE"))
-        self.personas_dir = Path("PERSONAS")
+        self.personas_dir = Path(self.config_mgr.config["system"].get("personas_dir", "PERSONAS"))
+        self.stop_signal_file = Path(self.config_mgr.config["system"].get("stop_signal_file", DEFAULT_STOP_SIGNAL_FILE))
+        self.history_file = self.config_mgr.config["system"].get("history_file", DEFAULT_HISTORY_FILE)
+        self.providers = provider_pool or ProviderPool.shared(self.config_mgr.config["system"].get("provider_pool"))
+        # 分布式模式 (serve --remote): LeaseBoard，模型调用交给远程执行节点，限额仍按本进程的 ProviderPool 计算
+        self.remote = None
+        # parse_tasks 读取每个任务文件头部的字节上限 (DEPENDS_ON 须声明在此范围内)
+        self.header_read_bytes = self.config_mgr.config["system"].get("header_read_bytes", task_parser.HEADER_READ_BYTES)
+        self.task_store = TaskStore(
+            self.messages_dir,
+            header_read_bytes=self.header_read_bytes,
+            body_cache_size=self.config_mgr.config["system"].get("body_cache_size", DEFAULT_BODY_CACHE_SIZE)
+        )
+        # 归档存储: 按月分片，过期分片打包压缩，清单记录每个任务的位置
+        self.archive = ArchiveStore.from_config(self.archive_dir, self.config_mgr.config["system"].get("archive"))
+        # 上游依赖摘要: 任务完成时生成一次，下游执行时沿 DAG 祖先链注入
+        self.upstream = UpstreamContext(
+            self.archive_dir,
+            self.messages_dir,
+            summary_max_chars=self.config_mgr.config["system"].get("summary_max_chars", DEFAULT_SUMMARY_MAX_CHARS),
+            budget_chars=self.config_mgr.config["system"].get("upstream_context_chars", DEFAULT_UPSTREAM_BUDGET_CHARS),
+            max_depth=self.config_mgr.config["system"].get("upstream_max_depth", DEFAULT_UPSTREAM_MAX_DEPTH),
+            archive_store=self.archive
+        )
+        # 任务创建: 持久化的 ID 分配器 + 批量写入
+        self.task_factory = TaskFactory(self.messages_dir, self.archive_dir, self.archive)
+        # 全局快照: 每归档 N 个任务或累计 M 个 Token 的结果，自动下发 P8_记忆员 快照任务
+        self.milestones = MilestoneManager.from_config(
+            self.archive_dir,
+            self.messages_dir,
+            self.config_mgr.config["system"].get("snapshot")
+        )
+        # 产出物落盘: 解析回复中带路径的代码块与 [DIFF] 补丁，写入 PROJECT_SPACE/features/<任务ID>/
+        artifacts_cfg = self.config_mgr.config["system"].get("artifacts") or {}
+        self.artifacts_enabled = artifacts_cfg.get("enabled", True)
+        self.artifact_writer = ArtifactWriter(
+            self.project_space_dir,
+            features_dir=artifacts_cfg.get("features_dir", DEFAULT_FEATURES_DIR),
+            fuzz=artifacts_cfg.get("fuzz", DEFAULT_PATCH_FUZZ)
+        )
+        # Diff 模式: 带行号注入待修改文件，要求模型输出补丁，补丁失败时才回退为整文件重写
+        diff_cfg = self.config_mgr.config["system"].get("diff_mode") or {}
+        self.diff_mode_enabled = self.artifacts_enabled and diff_cfg.get("enabled", True)
+        self.diff_context = DiffContext(
+            self.artifact_writer,
+            max_files=diff_cfg.get("max_files", DEFAULT_DIFF_MAX_FILES),
+            context_chars=diff_cfg.get("context_chars", DEFAULT_DIFF_CONTEXT_CHARS)
+        )
+        # PROJECT_SPACE 的本地 BM25 索引: 按任务文本检索相关文件片段注入提示词
+        self.retrieval_cfg = self.config_mgr.config["system"].get("retrieval") or {}
+        self.retrieval_enabled = self.retrieval_cfg.get("enabled", True)
+        self.workspace_index = WorkspaceIndex(
+            self.project_space_dir,
+            index_file=self.retrieval_cfg.get("index_file", "SYSTEM/index/workspace_index.json"),
+            chunk_lines=self.retrieval_cfg.get("chunk_lines", DEFAULT_CHUNK_LINES),
+            reconcile_seconds=self.retrieval_cfg.get("reconcile_seconds", DEFAULT_RECONCILE_SECONDS)
+        )
+        # Web UI 的工作区浏览: 逐级列出目录并按目录 mtime 缓存；文件按页 mmap 预览
+        tree_cfg = self.config_mgr.config["system"].get("workspace_tree") or {}
+        self.workspace_tree = WorkspaceTree(
+            self.project_space_dir,
+            ignore_patterns=tree_cfg.get("ignore", DEFAULT_IGNORE_PATTERNS),
+            max_entries=tree_cfg.get("max_entries", DEFAULT_TREE_MAX_ENTRIES)
+        )
+        preview_cfg = self.config_mgr.config["system"].get("file_preview") or {}
+        self.file_previewer = FilePreviewer(
+            self.project_space_dir,
+            page_lines=preview_cfg.get("page_lines", DEFAULT_PAGE_LINES),
+            page_bytes=preview_cfg.get("page_bytes", DEFAULT_PAGE_BYTES)
+        )
+        # 工作区快照 (Web UI 的快照管理与“快照并清理”)
+        self.snapshots = SnapshotStore.from_config(self.config_mgr.config["system"].get("snapshots"))
+        # 全文检索索引: 任务 / 归档 / 工作区文件变化时增量更新
+        search_cfg = self.config_mgr.config["system"].get("search") or {}
+        self.search_index = (SearchIndex.from_config(self.config_mgr.config["system"], archive_store=self.archive)
+                             if search_cfg.get("enabled", True) else None)
+        # 熔断与死信: 连续失败 max_failures 次标记 [FAIL]，长期无进展标记 [EXPIRED]，均移入 ARCHIVE/DEAD_LETTER/
+        self.dead_letters = DeadLetterQueue.from_config(
+            self.archive_dir, self.messages_dir, self.config_mgr.config["system"].get("failure")
+        )
+        # 单次执行的状态按线程保存: 并行执行 (TaskRunner 的多个执行线程) 时互不干扰
+        self._local = threading.local()
+        # 预执行: 上游开始流式输出时提前发起 SPECULATIVE: OK 的下游任务，上游完成后校验并提交或作废 (仅自动模式)
+        spec_cfg = self.config_mgr.config["system"].get("speculative") or {}
+        self.speculative_enabled = spec_cfg.get("enabled", False)
+        self.speculator = Speculator(max_parallel=spec_cfg.get("max_parallel", DEFAULT_MAX_PARALLEL))
+        tracer.configure(self.config_mgr.config["system"].get("tracing"))
+        # 后台作业: 归档、快照、清理、索引重建在后台线程排队执行，调度 tick 只提交不等待
+        jobs_cfg = self.config_mgr.config["system"].get("jobs") or {}
+        self.jobs = JobQueue.from_config(jobs_cfg)
+        self.jobs.add_listener(self._on_job_event)
+        self.background_archive = jobs_cfg.get("background_archive", True)
+        # 提交结果 (追加并改名为 [DONE]) 与归档移动同一批文件，需互斥
+        self._task_io_lock = threading.RLock()
+        self._busy_ids = set()   # 正在执行的任务，死信回收与任务派发时跳过
+        # 终端中的“正在思考”动画 (多个执行线程并行时关闭，rich 同一时间只允许一个动态显示)
+        self.show_spinner = True
         self.ensure_directories()
+
+    # ---------- 按线程保存的执行状态 ----------
+    @property
+    def _failure_reason(self):
+        return getattr(self._local, "failure_reason", None)
+
+    @_failure_reason.setter
+    def _failure_reason(self, value):
+        self._local.failure_reason = value
+
+    @property
+    def last_failure(self):
+        """当前线程最近一次 execute_task 失败的 (失败次数, 死信路径, 被跳过的下游 ID)"""
+        return getattr(self._local, "last_failure", None)
+
+    @last_failure.setter
+    def last_failure(self, value):
+        self._local.last_failure = value
+
+    @property
+    def environment_error(self):
+        """
+        当前线程最近一次 execute_task 因环境问题 (API Key / 模型配置错误、服务不可达、限流、5xx) 失败的原因。
+        此类失败不计入任务失败次数，任务保持 [NEW]；调度循环应暂停，待环境恢复后再继续。
+        """
+        return getattr(self._local, "environment_error", None)
+
+    @environment_error.setter
+    def environment_error(self, value):
+        self._local.environment_error = value
+
+    @property
+    def _speculative_runs(self):
+        runs = getattr(self._local, "speculative_runs", None)
+        if runs is None:
+            runs = self._local.speculative_runs = []
+        return runs
+
+    @_speculative_runs.setter
+    def _speculative_runs(self, value):
+        self._local.speculative_runs = value
         
     def ensure_directories(self):
-        self.messages_dir.mkdir(exist_ok=True)
-        self.archive_dir.mkdir(exist_ok=True)
-        self.project_space_dir.mkdir(exist_ok=True)
+        self.messages_dir.mkdir(parents=True, exist_ok=True)
+        self.archive_dir.mkdir(parents=True, exist_ok=True)
+        self.project_space_dir.mkdir(parents=True, exist_ok=True)
         
+    @tracer.traced("parse_tasks")
     def parse_tasks(self):
         """解析 MESSAGES 目录中的所有任务和依赖关系"""
-        tasks = []
-        for file_path in self.messages_dir.glob("*.md"):
-            filename = file_path.name
-            
-            # 解析文件名 [NEW]P1_TO_P8-技术_ID001_xxx.md (兼容忘记写状态的情况)
-            match = re.match(r'^(?:\[(.*?)\])?(.*?)_TO_(.*?)_(.*)$', filename)
-            if not match:
-                continue
-                
-            status, sender, receiver, rest = match.groups()
-            if not status:
-                status = "NEW"
-            
-            # 尝试提取 ID
-            id_match = re.search(r'(ID\d+)', rest)
-            task_id = id_match.group(1) if id_match else rest.split('_')[0]
-            
-            # 读取文件内容寻找依赖声明: DEPENDS_ON: ID001, ID002
-            depends_on = []
-            content = ""
-            file_encoding = "utf-8"
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-            except UnicodeDecodeError:
-                try:
-                    with open(file_path, "r", encoding="gbk") as f:
-                        content = f.read()
-                        file_encoding = "gbk"
-                except Exception as e:
-                    console.print(f"[red]读取文件 {filename} 失败: {e}[/red]")
-                    continue
-            except Exception as e:
-                console.print(f"[red]读取文件 {filename} 失败: {e}[/red]")
-                continue
-                
-            deps_match = re.search(r'DEPENDS_ON:\s*([^\n]+)', content)
-            if deps_match:
-                # 分割逗号，去除空格和星号
-                depends_on = [d.strip(" *") for d in deps_match.group(1).split(",") if d.strip(" *") and d.strip(" *").upper() != "NONE"]
-            
-            tasks.append({
-                "id": task_id,
-                "file": file_path,
-                "filename": filename,
-                "status": status,
-                "sender": sender,
-                "receiver": receiver,
-                "depends_on": depends_on,
-                "content": content,
-                "encoding": file_encoding
-            })
+        # 返回紧凑的 TaskRecord 列表: 只含头部元数据，正文按需加载
+        tasks = self.task_store.scan(
+            on_error=lambda filename, e: console.print(f"[red]读取文件 {filename} 失败: {e}[/red]")
+        )
+        tracer.current_span().set_attribute("tasks.count", len(tasks))
         return tasks
 
     def draw_dag(self, tasks):
@@ -226,45 +383,89 @@ class NexusEngine:
             
         console.print(Panel(tree, title="调度引擎状态图", border_style="blue"))
 
+    def done_task_ids(self, tasks):
+        """已完成的任务 ID: 已归档的任务 + MESSAGES 中状态为 DONE 的任务"""
+        # 已归档的任务 ID 取自归档清单 (内存缓存)，不再扫描 ARCHIVE 目录
+        with tracer.span("archive.scan_ids") as span:
+            done_ids = set(self.archive.task_ids())
+            span.set_attribute("archive.ids", len(done_ids))
+        done_ids.update(t["id"] for t in tasks if "DONE" in (t["status"] or "").upper())
+        return done_ids
+
+    @staticmethod
+    def pending_tasks(tasks):
+        """尚未完成的任务 (后台归档时，已完成的任务可能还留在 MESSAGES 中)"""
+        return [t for t in tasks if "DONE" not in (t["status"] or "").upper()]
+
+    @tracer.traced("get_runnable_tasks")
     def get_runnable_tasks(self, tasks):
-        """获取当前可执行的任务 (状态为NEW且依赖已全部DONE)"""
-        runnable = []
-        task_status_dict = {t["id"]: t["status"] for t in tasks}
-        
-        # 获取已归档的任务ID列表
-        archived_ids = set()
-        for file_path in self.archive_dir.glob("*.md"):
-            match = re.match(r'^(?:\[(.*?)\])?(.*?)_TO_(.*?)_(.*)$', file_path.name)
-            if match:
-                rest = match.group(4)
-                id_match = re.search(r'(ID\d+)', rest)
-                if id_match:
-                    archived_ids.add(id_match.group(1))
-                else:
-                    archived_ids.add(rest.split('_')[0])
-        
-        for t in tasks:
-            if t["status"] != "NEW":
-                continue
-                
-            can_run = True
-            for dep in t["depends_on"]:
-                # 如果依赖的任务在归档目录中，说明已经 DONE
-                if dep in archived_ids:
-                    continue
-                # 如果依赖的任务不在列表中，或者状态不是 DONE，则阻塞
-                if dep not in task_status_dict or "DONE" not in task_status_dict[dep].upper():
-                    can_run = False
-                    break
-            if can_run:
-                runnable.append(t)
+        """获取当前可执行的任务 (状态为NEW、依赖已全部DONE，且不在执行中)"""
+        # 依赖的任务在归档目录中或状态为 DONE 才算完成，不在列表中的依赖视为阻塞
+        done_ids = self.done_task_ids(tasks)
+        busy = set(self._busy_ids)
+        runnable = [t for t in tasks if t["status"] == "NEW" and t["id"] not in busy
+                    and all(dep in done_ids for dep in t["depends_on"])]
                 
+        tracer.current_span().set_attribute("tasks.runnable", len(runnable))
         return runnable
 
+    def load_task_content(self, task):
+        """按需读取任务正文 (parse_tasks 只解析文件头部)"""
+        if isinstance(task, dict):
+            return task_parser.read_task_body(task['file'], task.get('encoding', 'utf-8'))
+        return self.task_store.load_body(task)
+
     def execute_task(self, task):
         """执行具体的任务: 调用大模型并保存结果"""
-        console.print(f"\n[bold yellow]>>> 开始执行任务: {task['id']} (由 {task['receiver']} 负责)[/bold yellow]")
-        
+        with tracer.span("execute_task", **{"task.id": task['id'], "task.receiver": task['receiver']}) as span:
+            self._speculative_runs = []
+            self._failure_reason = None
+            self.last_failure = None
+            self.environment_error = None
+            self._busy_ids.add(task['id'])
+            try:
+                success = self._execute_task(task)
+            finally:
+                self._busy_ids.discard(task['id'])
+                # 上游没有以 [DONE] 提交时，其预执行结果一律作废
+                self.discard_speculation(f"上游任务 {task['id']} 未完成")
+            # 用户主动取消、环境问题不计入失败次数
+            if not success and self.environment_error:
+                console.print(f"[yellow]⏸️ 环境问题: {self.environment_error}。任务 {task['id']} 保持 [NEW]，不计入失败次数。[/yellow]")
+                span.set_attribute("task.environment_error", self.environment_error)
+            elif not success and self._failure_reason:
+                self.last_failure = self.record_task_failure(task, self._failure_reason)
+            span.set_attribute("task.success", bool(success))
+            return success
+
+    def record_task_failure(self, task, reason):
+        """在任务头部累加失败次数，达到阈值时熔断: 标记 [FAIL] 并移入死信目录，返回 (失败次数, 死信路径, 被跳过的下游 ID)"""
+        with tracer.span("task.failure", **{"task.id": task['id']}) as span:
+            try:
+                count, dead_path = self.dead_letters.record_failure(task, reason)
+            except OSError as e:
+                console.print(f"[red]记录任务 {task['id']} 的失败次数失败: {e}[/red]")
+                return None
+            blocked = self.dead_letters.downstream_of(self.parse_tasks(), {task['id']}) if dead_path else set()
+            if dead_path:
+                self.update_search_index(moved=[(task['file'], dead_path)])
+            else:
+                self.update_search_index(synced=[task['file']])
+            span.set_attribute("task.fail_count", count)
+            span.set_attribute("task.dead_lettered", bool(dead_path))
+        if dead_path:
+            console.print(f"[bold red]🔴 任务 {task['id']} 连续失败 {count} 次，已熔断并移入 {dead_path.parent.name}/{dead_path.name}[/bold red]")
+            if blocked:
+                console.print(f"[red]   其下游 {len(blocked)} 个任务将被跳过: {', '.join(sorted(blocked))}。请由上级下发带新 ID 的 Fix 任务。[/red]")
+        else:
+            console.print(f"[yellow]⚠️ 任务 {task['id']} 第 {count}/{self.dead_letters.max_failures} 次失败: {reason}[/yellow]")
+        return count, dead_path, blocked
+
+    def build_task_prompt(self, task, task_content, upstream_overrides=None):
+        """
+        组装任务的 System Prompt，返回 (system_prompt, 补丁基准目录列表)。
+        upstream_overrides 为 {任务 ID: 摘要记录}，用于预执行时尚未完成的上游任务。
+        """
         # 1. 寻找对应的角色身份卡 (Persona)
         persona_content = ""
         # 匹配角色卡：提取角色级别（如 P7, P8）
@@ -274,25 +475,27 @@ class NexusEngine:
         best_match_file = None
         exact_name = task['receiver'].replace('-', '_').upper()
         
-        # 1. 完全精确匹配 (不含扩展名)
-        for p_file in self.personas_dir.glob("*.md"):
-            if p_file.stem.upper() == exact_name:
-                best_match_file = p_file
-                break
-                
-        # 2. 前缀匹配
-        if not best_match_file:
+        with tracer.span("persona.match") as span:
+            # 1. 完全精确匹配 (不含扩展名)
             for p_file in self.personas_dir.glob("*.md"):
-                if p_file.stem.upper().startswith(exact_name + "_") or p_file.stem.upper().startswith(exact_name):
+                if p_file.stem.upper() == exact_name:
                     best_match_file = p_file
                     break
                     
-        # 3. 级别通用卡匹配
-        if not best_match_file:
-            for p_file in self.personas_dir.glob("*.md"):
-                if p_file.stem.upper().startswith(receiver_level + "_"):
-                    best_match_file = p_file
-                    break
+            # 2. 前缀匹配
+            if not best_match_file:
+                for p_file in self.personas_dir.glob("*.md"):
+                    if p_file.stem.upper().startswith(exact_name + "_") or p_file.stem.upper().startswith(exact_name):
+                        best_match_file = p_file
+                        break
+                        
+            # 3. 级别通用卡匹配
+            if not best_match_file:
+                for p_file in self.personas_dir.glob("*.md"):
+                    if p_file.stem.upper().startswith(receiver_level + "_"):
+                        best_match_file = p_file
+                        break
+            span.set_attribute("persona.file", best_match_file.name if best_match_file else "")
                 
         if best_match_file:
             with open(best_match_file, "r", encoding="utf-8") as f:
@@ -321,25 +524,82 @@ class NexusEngine:
 {dashboard}
 
 ========== 目录结构上下文 ==========
-当前 PROJECT_SPACE 目录结构如下：
 """
-        # 注入 PROJECT_SPACE 目录结构作为上下文
-        project_space_files = list(self.project_space_dir.rglob("*"))
-        if project_space_files:
-            for p in project_space_files:
-                if p.is_file():
-                    system_prompt += f"- {p.relative_to(self.project_space_dir)}\n"
-        else:
-            system_prompt += "(空)\n"
-        system_prompt += "\n"
+        # 注入与本任务相关的 PROJECT_SPACE 文件片段 (本地 BM25 检索)，而不是整个目录清单
+        with tracer.span("project_space.retrieve") as span:
+            workspace_context, hits = self.build_workspace_context(task_content)
+            span.set_attribute("project_space.hits", len(hits))
+            span.set_attribute("project_space.context_chars", len(workspace_context))
+        system_prompt += workspace_context + "\n"
+
+        if self.artifacts_enabled:
+            system_prompt += f"""========== 产出物格式约定 ==========
+需要落盘的文件请使用带路径的代码块 (路径相对于 PROJECT_SPACE，系统会写入特性分支 features/{task['id']}/)：
+```python:src/main.py
+...完整文件内容...
+```
+修改已有文件时请使用 [DIFF] 统一格式补丁，不要重复输出整个文件：
+[DIFF]
+```diff
+--- a/src/main.py
++++ b/src/main.py
+@@ -10,3 +10,3 @@
+...
+```
+
+"""
+        # 注入最新全局快照 + 快照之后的上游产出摘要，提示词长度不随项目历史增长
+        with tracer.span("context.upstream") as span:
+            snapshot = self.milestones.latest()
+            covered = snapshot[2] if snapshot else frozenset()
+            upstream_context = self.upstream.build(task, covered, upstream_overrides)
+            span.set_attribute("context.upstream_chars", len(upstream_context))
+            span.set_attribute("context.snapshot", snapshot[0] if snapshot else "")
+        if snapshot:
+            system_prompt += f"""========== 全局快照 MILESTONE_{snapshot[0]} ==========
+以下为 P8_记忆员 整理的项目全局快照，快照之前的历史不再单独提供：
+{snapshot[1]}
+
+"""
+        if upstream_context:
+            system_prompt += f"""========== 上游依赖产出摘要 ==========
+以下为本任务依赖链上已完成任务的产出摘要，请直接在此基础上继续工作：
+{upstream_context}
+"""
         
+        # 补丁基准: 本任务的特性分支 -> 直接上游任务的特性分支 -> 主干
+        base_dirs = [self.artifact_writer.branch_dir(dep) for dep in task['depends_on']]
+        # 注入提示词的待修改文件的内容哈希，落盘时据此发现生成期间被其他任务修改的基准文件
+        base_hashes = {}
+        if self.diff_mode_enabled:
+            with tracer.span("context.diff_targets") as span:
+                diff_targets = self.diff_context.targets(task['id'], task_content, base_dirs)
+                diff_section = self.diff_context.build(diff_targets, bases=base_hashes)
+                span.set_attribute("diff.targets", len(diff_targets))
+                span.set_attribute("diff.context_chars", len(diff_section))
+            if diff_section:
+                system_prompt += f"""========== 待修改文件 (Diff 模式) ==========
+{diff_section}
+"""
+
+        return system_prompt, base_dirs, base_hashes
+
+    def _execute_task(self, task):
+        console.print(f"\n[bold yellow]>>> 开始执行任务: {task['id']} (由 {task['receiver']} 负责)[/bold yellow]")
+
+        with tracer.span("task.load_body"):
+            task_content = self.load_task_content(task)
+        system_prompt, base_dirs, base_hashes = self.build_task_prompt(task, task_content)
+
         # 4. 获取 API 配置并初始化 Client
         provider_name, provider_cfg, model_name = self.config_mgr.get_provider_config(task['receiver'])
         
         # 4.1 提示用户确认或切换模型
         console.print(f"\n[bold cyan]🤖 默认分配模型:[/bold cyan] [green]{provider_name} -> {model_name}[/green]")
         
-        all_models = self.config_mgr.get_all_models()
+        with tracer.span("config.get_all_models") as span:
+            all_models = self.config_mgr.get_all_models(self.providers)
+            span.set_attribute("models.count", len(all_models))
         model_choices = [m["display"] for m in all_models]
         
         # 找到默认模型在列表中的索引
@@ -365,6 +625,7 @@ class NexusEngine:
             selected_model_display = default_display
             console.print(f"[dim]自动模式: 已自动选择默认模型 {selected_model_display}[/dim]")
         else:
+            import questionary
             selected_model_display = questionary.select(
                 f"请确认 {task['receiver']} 使用的模型 (可上下选择切换):",
                 choices=model_choices,
@@ -379,6 +640,7 @@ class NexusEngine:
         selected_model_info = next((m for m in all_models if m["display"] == selected_model_display), None)
         if not selected_model_info:
             console.print(f"[red]❌ 错误: 无法找到选定的模型信息: {selected_model_display}[/red]")
+            self.environment_error = f"无法找到模型信息: {selected_model_display}"
             return False
         provider_name = selected_model_info["provider"]
         model_name = selected_model_info["model_id"]
@@ -386,57 +648,93 @@ class NexusEngine:
 
         if "YOUR_" in provider_cfg["api_key"]:
             console.print(f"[red]❌ 错误: 您尚未在 config.yaml 中配置 {provider_name} 的 API Key！[/red]")
+            self.environment_error = f"未配置 {provider_name} 的 API Key"
             return False
             
-        client = OpenAI(
-            api_key=provider_cfg["api_key"],
-            base_url=provider_cfg["base_url"]
-        )
-
         console.print(f"📡 正在连接 [cyan]{provider_name}[/cyan] API (模型: [green]{model_name}[/green])...")
 
+        # 预执行: 本任务开始流式输出时，提前发起声明了 SPECULATIVE: OK 且只差本任务的下游任务
+        spec_candidates = self.speculation_candidates(task)
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"请处理以下任务文件内容：\n\n{task_content}"}
+        ]
+
         # 5. 发起请求并展示进度动画 (带重试机制)
         response_text = ""
+        completion_tokens = 0
+        llm_seconds = 0.0
         max_retries = 3
         retry_count = 0
         
         while retry_count < max_retries:
-            with Progress(
+            spinner = Progress(
                 SpinnerColumn(),
                 TextColumn("[progress.description]{task.description}"),
                 transient=True,
-            ) as progress:
+                console=console,
+            ) if self.show_spinner else nullcontext()
+            with spinner as progress:
                 desc = f"AI [{task['receiver']}] 正在思考与编码中..."
                 if retry_count > 0:
                     desc += f" (重试 {retry_count}/{max_retries-1})"
-                progress.add_task(description=desc, total=None)
+                if progress is not None:
+                    progress.add_task(description=desc, total=None)
                 
                 try:
-                    response = client.chat.completions.create(
-                        model=model_name,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": f"请处理以下任务文件内容：\n\n{task['content']}"}
-                        ],
-                        temperature=0.2 # 编程任务偏向确定性
-                    )
-                    response_text = response.choices[0].message.content
-                    
-                    # 尝试获取 Token 消耗 (不同提供商返回结构可能略有不同)
-                    if hasattr(response, 'usage') and response.usage:
-                        tokens = response.usage.total_tokens
-                        console.print(f"[dim]💡 消耗 Token 数量: ~{tokens}[/dim]")
+                    with tracer.span("llm.call", **{"llm.provider": provider_name, "llm.model": model_name, "llm.attempt": retry_count + 1}) as span:
+                        llm_start = time.perf_counter()
+                        if spec_candidates:
+                            # 流式读取，收到第一段输出时发起下游预执行
+                            usage = None
+                            parts = []
+                            with self.providers.request(provider_name, provider_cfg) as client:
+                                stream = client.chat.completions.create(
+                                    model=model_name,
+                                    messages=messages,
+                                    temperature=0.2,
+                                    stream=True
+                                )
+                                for chunk in stream:
+                                    if getattr(chunk, "usage", None):
+                                        usage = chunk.usage
+                                    if not chunk.choices or not chunk.choices[0].delta.content:
+                                        continue
+                                    if not self._speculative_runs:
+                                        self.launch_speculation(task, task_content, spec_candidates)
+                                    parts.append(chunk.choices[0].delta.content)
+                            response_text = "".join(parts)
+                        else:
+                            response_text, usage = self.request_completion(task, provider_name, provider_cfg, model_name, messages)
+                        llm_seconds = time.perf_counter() - llm_start
+                        completion_tokens = estimate_tokens(response_text)
+                        
+                        # 尝试获取 Token 消耗 (不同提供商返回结构可能略有不同)
+                        if usage:
+                            tokens = usage.total_tokens
+                            completion_tokens = getattr(usage, "completion_tokens", None) or completion_tokens
+                            span.set_attribute("llm.total_tokens", tokens)
+                            console.print(f"[dim]💡 消耗 Token 数量: ~{tokens}[/dim]")
                     
                     break # 成功则跳出重试循环
                         
+                except RemoteCancelled as e:
+                    # 协调者停止: 任务保持 [NEW]，不计入失败次数
+                    console.print(f"[yellow]{e}，任务 {task['id']} 保持 [NEW] 状态。[/yellow]")
+                    return False
                 except Exception as e:
                     retry_count += 1
                     console.print(f"[yellow]请求 API 失败 ({retry_count}/{max_retries}): {e}[/yellow]")
                     if retry_count >= max_retries:
                         console.print(f"[red]❌ 达到最大重试次数，任务执行失败。[/red]")
+                        # 服务不可达 / 限流 / 5xx / 鉴权失败与任务无关，不计入失败次数
+                        if is_environment_error(e):
+                            self.environment_error = f"请求 API 失败 {max_retries} 次: {e}"
+                        else:
+                            self._failure_reason = f"请求 API 失败 {max_retries} 次: {e}"
                         return False
-                    import time
-                    time.sleep(2) # 失败后等待2秒再试
+                    with tracer.span("llm.retry_backoff"):
+                        time.sleep(2) # 失败后等待2秒再试
 
         # 6. 交互审批
         console.print(Panel(response_text[:500] + "\n...\n(内容已截断)", title=f"{task['receiver']} 的输出预览", border_style="green"))
@@ -445,6 +743,7 @@ class NexusEngine:
             action = "1. 接受并写入文件 (标记为 [DONE])"
             console.print("[dim]自动模式: 已自动接受并写入文件[/dim]")
         else:
+            import questionary
             action = questionary.select(
                 "审批上述产出：",
                 choices=[
@@ -454,23 +753,39 @@ class NexusEngine:
                 ]
             ).ask()
 
+        # 结果区中记录 Trace ID，便于从任务文件反查对应的追踪链路
+        trace_id = tracer.current_trace_id()
+        trace_line = f"TRACE_ID: {trace_id}\n\n" if trace_id else ""
+
+        def rewrite(prompt):
+            """补丁无法应用时的回退: 在同一会话中请求模型重写失败的文件"""
+            with tracer.span("llm.rewrite_fallback", **{"llm.provider": provider_name, "llm.model": model_name}):
+                try:
+                    fallback, _ = self.request_completion(task, provider_name, provider_cfg, model_name, [
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": f"请处理以下任务文件内容：\n\n{task_content}"},
+                        {"role": "assistant", "content": response_text},
+                        {"role": "user", "content": prompt}
+                    ])
+                    return fallback
+                except Exception as e:
+                    console.print(f"[red]整文件重写回退请求失败: {e}[/red]")
+                    return None
+
+        artifact_report = ""
+        if action and action[0] in ("1", "3"):
+            # 回复中的代码块 / [DIFF] 补丁整批写入特性分支，产出文件清单记录在任务文件中
+            artifact_report = self.materialize_artifacts(
+                task, response_text, base_dirs, base_hashes=base_hashes,
+                rewrite=rewrite if self.diff_mode_enabled else None,
+                llm_stats=(completion_tokens, llm_seconds)
+            )
+
         if action and action.startswith("1"):
-            # 将新内容追加到文件中，并修改文件名为 [DONE]
-            # 使用读取时记录的编码
-            file_encoding = task.get('encoding', 'utf-8')
-            with open(task['file'], "a", encoding=file_encoding) as f:
-                f.write("\n\n---\n## AI 执行结果:\n")
-                f.write(response_text)
-            
-            # 只替换开头的状态标签，如果没有状态标签则添加
-            if re.match(r'^\[.*?\]', task['filename']):
-                new_filename = re.sub(r'^\[.*?\]', '[DONE]', task['filename'])
-            else:
-                new_filename = f"[DONE]{task['filename']}"
-                
-            new_path = self.messages_dir / new_filename
-            os.rename(task['file'], new_path)
-            console.print(f"✅ 文件已更新并重命名为: {new_filename}")
+            self.commit_task_result(task, task_content, response_text, artifact_report, trace_line)
+            # 上游已完成: 用最终产出校验预执行结果，通过的直接提交
+            if self._speculative_runs:
+                self.resolve_speculation(task, response_text + artifact_report)
             
             # 自动模式下，执行完一个任务后返回 True，让主循环继续
             return True
@@ -479,31 +794,356 @@ class NexusEngine:
             file_encoding = task.get('encoding', 'utf-8')
             with open(task['file'], "a", encoding=file_encoding) as f:
                 f.write("\n\n---\n## AI 执行结果 (待人工复核):\n")
+                f.write(trace_line)
                 f.write(response_text)
+                f.write(artifact_report)
+            self.update_search_index(synced=[task['file']])
             console.print("⚠️ 内容已追加，但未更改文件状态。请人工修改后重命名文件。")
             return True
         else:
             console.print("❌ 任务被打回，文件保持 [NEW] 状态。")
+            if action:
+                self._failure_reason = "产出被审批打回"
             return False
 
-    def archive_done_tasks(self):
-        """P9 归档逻辑：将所有 [DONE] 状态的任务移动到 ARCHIVE 目录"""
-        archived_count = 0
-        for file_path in self.messages_dir.glob("*.md"):
-            if file_path.name.startswith("[DONE]"):
-                dest_path = self.archive_dir / file_path.name
-                try:
-                    os.rename(file_path, dest_path)
-                    archived_count += 1
-                except Exception as e:
-                    console.print(f"[red]归档文件 {file_path.name} 失败: {e}[/red]")
+    def request_completion(self, task, provider_name, provider_cfg, model_name, messages):
+        """
+        非流式调用模型，返回 (回复文本, usage)。
+        同一账号的请求在所有项目间共享客户端连接池与限额 (max_concurrency / rpm)；
+        分布式模式下请求交给远程执行节点，本进程只计算限额。
+        """
+        with self.providers.limit(provider_name, provider_cfg):
+            if self.remote is not None:
+                return self.remote.call(self.project, task, provider_name, model_name, messages)
+            response = self.providers.client(provider_cfg).chat.completions.create(
+                model=model_name,
+                messages=messages,
+                temperature=0.2 # 编程任务偏向确定性
+            )
+            return response.choices[0].message.content, getattr(response, "usage", None)
+
+    def commit_task_result(self, task, task_content, response_text, artifact_report="", trace_line=""):
+        """将执行结果追加到任务文件并标记为 [DONE]，同时生成上游摘要与全局快照"""
+        with tracer.span("task.commit"):
+            # 将新内容追加到文件中，并修改文件名为 [DONE]
+            # 使用读取时记录的编码
+            file_encoding = task.get('encoding', 'utf-8')
+            with self._task_io_lock:
+                with open(task['file'], "a", encoding=file_encoding) as f:
+                    f.write("\n\n---\n## AI 执行结果:\n")
+                    f.write(trace_line)
+                    f.write(response_text)
+                    f.write(artifact_report)
+
+                # 只替换开头的状态标签，如果没有状态标签则添加
+                new_filename = task_parser.with_status(task['filename'], "DONE")
+                new_path = self.messages_dir / new_filename
+                os.rename(task['file'], new_path)
+                self.update_search_index(moved=[(task['file'], new_path)])
+
+            # 任务完成时生成一次摘要，供下游任务注入上下文
+            self.upstream.record_summary(task['id'], task['receiver'], task['depends_on'], task_content, response_text + artifact_report)
+            snapshot_path = self.milestones.complete(task['id'], task_content, response_text)
+        console.print(f"✅ 文件已更新并重命名为: {new_filename}")
+        if snapshot_path:
+            console.print(f"[bold green]📸 全局快照已保存: {snapshot_path.name}[/bold green]")
+        return new_filename
+
+    def speculation_candidates(self, task):
+        """可在本任务执行期间预执行的下游任务: [NEW]、声明 SPECULATIVE: OK，且除本任务外的依赖均已完成"""
+        # 分布式模式下模型调用不在本进程流式读取，不做预执行
+        if not (self.speculative_enabled and self.auto_mode) or self.remote is not None:
+            return []
+        with tracer.span("speculation.candidates") as span:
+            tasks = self.parse_tasks()
+            done_ids = self.done_task_ids(tasks)
+            candidates = []
+            for t in tasks:
+                if t["status"] != "NEW" or task['id'] not in t["depends_on"] or t["id"] in self._busy_ids:
+                    continue
+                if any(dep != task['id'] and dep not in done_ids for dep in t["depends_on"]):
+                    continue
+                if wants_speculation(self.load_task_content(t)):
+                    candidates.append(t)
+                if len(candidates) >= self.speculator.max_parallel:
+                    break
+            span.set_attribute("speculation.candidates", len(candidates))
+        return candidates
+
+    def launch_speculation(self, upstream_task, upstream_content, candidates):
+        """以上游的预测摘要为上下文，在后台发起下游任务的模型调用"""
+        predicted = predicted_record(upstream_task, upstream_content, self.upstream.get_summary(upstream_task['id']))
+        for candidate in candidates:
+            # 预执行中的下游任务不会再被派发给其他执行线程，校验或作废后释放
+            self._busy_ids.add(candidate['id'])
+            run = SpeculativeRun(candidate, upstream_task['id'], predicted["hash"])
+            self._speculative_runs.append(
+                self.speculator.launch(run, lambda r, predicted=predicted: self._speculative_call(r, predicted))
+            )
+        console.print(f"[dim]⚡ 已为 {', '.join(c['id'] for c in candidates)} 发起预执行 (等待 {upstream_task['id']} 完成后校验)[/dim]")
+
+    def _speculative_call(self, run, predicted):
+        """预执行线程: 组装下游任务的提示词并调用模型 (使用角色默认模型)"""
+        task = run.task
+        with tracer.span("speculation.call", **{"task.id": task['id'], "speculation.upstream": run.upstream_id}) as span:
+            run.trace_id = tracer.current_trace_id()
+            run.task_content = self.load_task_content(task)
+            # 预执行的补丁按上游最终产出重新定位 (见 validate 的可应用性检查)，不使用提示词时的基准哈希
+            system_prompt, run.base_dirs, _ = self.build_task_prompt(task, run.task_content, {run.upstream_id: predicted})
+            run.system_prompt = system_prompt + ASSUMPTION_INSTRUCTION.format(upstream_id=run.upstream_id)
+            provider_name, provider_cfg, model_name = self.config_mgr.get_provider_config(task['receiver'])
+            if "YOUR_" in provider_cfg["api_key"]:
+                raise RuntimeError(f"尚未配置 {provider_name} 的 API Key")
+            with self.providers.request(provider_name, provider_cfg) as client:
+                response = client.chat.completions.create(
+                    model=model_name,
+                    messages=[
+                        {"role": "system", "content": run.system_prompt},
+                        {"role": "user", "content": f"请处理以下任务文件内容：\n\n{run.task_content}"}
+                    ],
+                    temperature=0.2
+                )
+            run.response_text = response.choices[0].message.content or ""
+            run.prompt_tokens = estimate_tokens(run.system_prompt + run.task_content)
+            run.completion_tokens = estimate_tokens(run.response_text)
+            usage = getattr(response, "usage", None)
+            if usage:
+                run.prompt_tokens = getattr(usage, "prompt_tokens", None) or run.prompt_tokens
+                run.completion_tokens = getattr(usage, "completion_tokens", None) or run.completion_tokens
+            span.set_attribute("llm.completion_tokens", run.completion_tokens)
+
+    def resolve_speculation(self, upstream_task, final_output):
+        """上游完成后逐个校验预执行结果: 通过则直接提交为 [DONE]，否则作废，下游按正常流程重新执行"""
+        upstream_end = time.perf_counter()
+        record = self.upstream.get_summary(upstream_task['id'])
+        final_hash = record["hash"] if record else None
+        runs, self._speculative_runs = self._speculative_runs, []
+        for run in runs:
+            task = run.task
+            with tracer.span("speculation.resolve", **{"task.id": task['id'], "speculation.upstream": run.upstream_id}) as span:
+                run.future.result()
+                if not Path(task['file']).exists():
+                    committed, reason = False, "下游任务文件已被修改或移动"
+                else:
+                    dry_run = (self.artifact_writer.dry_run(task['id'], run.response_text, run.base_dirs)
+                               if self.artifacts_enabled and run.response_text else None)
+                    committed, reason = validate(run, final_hash, final_output, dry_run)
+                if committed:
+                    artifact_report = self.materialize_artifacts(
+                        task, run.response_text, run.base_dirs,
+                        llm_stats=(run.completion_tokens, run.llm_seconds)
+                    )
+                    trace_line = f"TRACE_ID: {run.trace_id}\n\n" if run.trace_id else ""
+                    trace_line += f"> 预执行结果 (上游 {run.upstream_id} 完成前发起)，校验通过: {reason}\n\n"
+                    self.commit_task_result(task, run.task_content, run.response_text, artifact_report, trace_line)
+                saved = self.speculator.settle(run, committed, upstream_end)
+                self._busy_ids.discard(task['id'])
+                span.set_attribute("speculation.committed", committed)
+                span.set_attribute("speculation.saved_seconds", round(saved, 3))
+            if committed:
+                console.print(f"[green]⚡ 预执行 {task['id']} 校验通过并已提交 ({reason})，节省约 {saved:.1f} 秒[/green]")
+            else:
+                console.print(f"[yellow]⚡ 预执行 {task['id']} 已作废: {reason}，将按正常流程重新执行[/yellow]")
+        console.print(f"[dim]{self.speculator.stats.summary_line()}[/dim]")
+
+    def discard_speculation(self, reason):
+        """上游未能完成 (失败 / 打回 / 待人工复核) 时作废全部预执行"""
+        runs, self._speculative_runs = self._speculative_runs, []
+        upstream_end = time.perf_counter()
+        for run in runs:
+            run.future.result()
+            self.speculator.settle(run, False, upstream_end)
+            self._busy_ids.discard(run.task['id'])
+        if runs:
+            console.print(f"[yellow]⚡ {reason}，已作废 {len(runs)} 个预执行结果[/yellow]")
+
+    def build_workspace_context(self, query):
+        """
+        组装 PROJECT_SPACE 上下文: 文件较少时列出全部路径；
+        启用检索时附加与 query 最相关的文件片段 (受长度预算限制)。返回 (文本, 命中列表)
+        """
+        if not self.retrieval_enabled:
+            files = [p for p in self.project_space_dir.rglob("*") if p.is_file()]
+            listing = "".join(f"- {p.relative_to(self.project_space_dir)}\n" for p in files)
+            return f"当前 PROJECT_SPACE 目录结构如下：\n{listing or '(空)'}\n", []
+
+        # 产出物写入时已增量更新，这里只按 reconcile_seconds 间隔做全量核对 (发现手工修改的文件)
+        self.workspace_index.refresh_if_due()
+        self.workspace_index.save()
+        total = self.workspace_index.file_count()
+        if not total:
+            return "当前 PROJECT_SPACE 目录结构如下：\n(空)\n", []
+
+        text = f"PROJECT_SPACE 共 {total} 个文件。\n"
+        if total <= self.retrieval_cfg.get("list_files_below", DEFAULT_LIST_FILES_BELOW):
+            text += "".join(f"- {rel}\n" for rel in sorted(self.workspace_index.docs))
+        snippets, hits = self.workspace_index.build_context(
+            query,
+            top_k=self.retrieval_cfg.get("top_k", DEFAULT_TOP_K),
+            budget_chars=self.retrieval_cfg.get("context_chars", DEFAULT_CONTEXT_CHARS)
+        )
+        if snippets:
+            text += f"\n与本任务最相关的文件片段 (按相关度排序)：\n{snippets}"
+        return text, hits
+
+    def materialize_artifacts(self, task, response_text, base_dirs=(), rewrite=None, llm_stats=None, base_hashes=None):
+        """
+        把回复中的产出物写入特性分支，返回追加到任务文件中的产出文件清单。
+        base_hashes 为构建提示词时待修改文件的内容哈希 (见 build_task_prompt)，用于发现生成期间被修改的基准文件。
+        rewrite(prompt) 用于补丁失败时请求整文件重写；llm_stats 为 (completion_tokens, 耗时秒数)，用于估算 Diff 模式的节省。
+        """
+        if not self.artifacts_enabled:
+            return ""
+        fallback = None
+        with tracer.span("artifacts.materialize") as span:
+            try:
+                result = self.artifact_writer.materialize(task['id'], response_text, base_dirs, base_hashes)
+                if result.failed_patches and rewrite:
+                    console.print(f"[yellow]⚠️ {len(result.failed_patches)} 个补丁无法应用，回退为整文件重写...[/yellow]")
+                    failed_paths = {rel: self.artifact_writer.resolve(task['id'], rel, base_dirs) for rel in result.failed_patches}
+                    fallback_text = rewrite(self.diff_context.fallback_prompt(failed_paths, result.failed_patches))
+                    if fallback_text:
+                        fallback = self.artifact_writer.materialize(task['id'], fallback_text, base_dirs)
+            except OSError as e:
+                console.print(f"[red]产出物写入失败，已回滚本批次: {e}[/red]")
+                return f"\n\n### 产出文件\n写入失败: {e}\n"
+            span.set_attribute("artifacts.written", len(result.written))
+            span.set_attribute("artifacts.conflicts", len(result.conflicts))
+            span.set_attribute("artifacts.fallback_rewrites", len(fallback.written) if fallback else 0)
+            savings = savings_report(result, *llm_stats) if llm_stats else None
+            if savings:
+                span.set_attribute("diff.saved_tokens", savings[0])
+                span.set_attribute("diff.saved_seconds", round(savings[1], 3))
+
+        for batch in (result, fallback):
+            if not batch:
+                continue
+            if batch.written:
+                console.print(f"[green]📦 已写入 {len(batch.written)} 个产出文件至 {batch.branch_dir}[/green]")
+            for rel, reason in batch.conflicts:
+                console.print(f"[yellow]⚠️ 产出文件 {rel} 未写入: {reason}[/yellow]")
+
+        written = [batch.branch_dir / rel for batch in (result, fallback) if batch for rel, _, _ in batch.written]
+        self.update_search_index(synced=written)
+        if self.retrieval_enabled and written:
+            self.workspace_index.sync_paths(written)
+        report = format_report(result, self.project_space_dir)
+        if fallback:
+            report += format_report(fallback, self.project_space_dir, title="整文件重写回退")
+        if savings:
+            saved_tokens, saved_seconds = savings
+            console.print(f"[dim]✂️ Diff 模式: 相比整文件重写约节省 {saved_tokens} 个输出 Token (约 {saved_seconds:.1f} 秒)[/dim]")
+            report += f"\n> Diff 模式: 相比整文件重写约节省 {saved_tokens} 个输出 Token (约 {saved_seconds:.1f} 秒)\n"
+        return report
+
+    def next_task_id(self):
+        """分配下一个任务 ID (持久化、加锁，覆盖 MESSAGES 与 ARCHIVE，不会重复使用已归档任务的 ID)"""
+        return self.task_factory.allocator.allocate(1)[0]
+
+    def create_tasks(self, specs, sender="P1", legacy_batch_ids=False):
+        """批量创建任务 (一次分配整批 ID 并映射批次内的符号依赖)，返回 [(任务 ID, 文件名)]"""
+        with tracer.span("tasks.create_batch", **{"tasks.count": len(specs)}):
+            created = self.task_factory.create_tasks(specs, sender=sender, legacy_batch_ids=legacy_batch_ids)
+        self.update_search_index(synced=[self.messages_dir / filename for _, filename in created])
+        return created
+
+    def request_archive(self):
+        """调度 tick 中请求归档: 开启 background_archive 时提交为后台作业 (排队中的归档请求会合并)，否则同步执行"""
+        if not self.background_archive:
+            self.archive_done_tasks()
+            return None
+        return self.jobs.submit("archive", "P9 归档", lambda job: self.archive_done_tasks(job=job),
+                                dedupe_key="archive", quiet=True)
+
+    def _on_job_event(self, job):
+        if job.status == FAILED:
+            console.print(f"[red]后台作业 {job.id} ({job.title}) 失败: {job.error}[/red]")
+
+    @tracer.traced("archive_done_tasks")
+    def archive_done_tasks(self, job=None):
+        """
+        P9 归档逻辑：将所有 [DONE] 状态的任务移入 ARCHIVE 的当月分片，并把过期分片打包压缩，返回归档后的路径列表。
+        job 为后台作业时报告进度并响应取消。
+        """
+        archived = []
+        cancelled = False
+        done_files = [file_path for file_path in self.messages_dir.glob("*.md") if file_path.name.startswith("[DONE]")]
+        for i, file_path in enumerate(done_files):
+            if job is not None:
+                job.report(i, len(done_files), "归档 [DONE] 任务")
+                # 取消时已移动的文件仍需更新索引与快照计数，收尾后再结束作业
+                if job.cancel_requested:
+                    cancelled = True
+                    break
+            try:
+                with self._task_io_lock, tracer.span("archive.rename", **{"file.name": file_path.name}):
+                    dest_path = self.archive.add(file_path)
+                archived.append(dest_path)
+            except FileNotFoundError:
+                continue
+            except Exception as e:
+                console.print(f"[red]归档文件 {file_path.name} 失败: {e}[/red]")
+        tracer.current_span().set_attribute("archive.moved", len(archived))
+        self.update_search_index(moved=[(self.messages_dir / dest.name, dest) for dest in archived])
+        if not cancelled:
+            self._archive_housekeeping(job)
         
-        if archived_count > 0:
-            console.print(f"[dim]🧹 P9 审计完成: 已将 {archived_count} 个 [DONE] 任务归档至 {self.archive_dir.name}/ 目录。[/dim]")
+        if archived:
+            console.print(f"[dim]🧹 P9 审计完成: 已将 {len(archived)} 个 [DONE] 任务归档至 {self.archive_dir.name}/ 目录。[/dim]")
+            # 达到快照阈值时自动向 P8_记忆员 下发快照任务
+            if self.milestones.on_archived(archived):
+                snapshot_task = self.milestones.maybe_create_snapshot_task(
+                    lambda spec: self.create_tasks([spec])[0], self.upstream.get_summary)
+                if snapshot_task:
+                    console.print(f"[bold cyan]📸 已达到快照阈值，自动创建全局快照任务: {snapshot_task}[/bold cyan]")
+        if cancelled:
+            job.check()
+
+        # 死信回收: 长期无进展的任务标记 [EXPIRED] (按 sweep_interval_seconds 节流)
+        if self.dead_letters.sweep_due():
+            with tracer.span("dead_letter.sweep") as span:
+                tasks = self.parse_tasks()
+                expired = self.dead_letters.sweep_expired(tasks, self.done_task_ids(tasks), busy=set(self._busy_ids))
+                span.set_attribute("dead_letter.expired", len(expired))
+            sources = {t["id"]: t["file"] for t in tasks}
+            self.update_search_index(moved=[(sources.get(task_parser.extract_task_id(path.name), path), path) for path, _ in expired])
+            for path, reason in expired:
+                console.print(f"[dim]🗑️ P9 死信回收: {path.name} {reason}，已移入 {path.parent.name}/[/dim]")
+        return archived
+
+    def _archive_housekeeping(self, job=None):
+        """收编 ARCHIVE/ 顶层的旧版平铺文件，并按 roll_interval 打包过期分片"""
+        # 直接放在 ARCHIVE/ 顶层的任务文件 (旧版本的扁平归档) 收编进分片
+        adopted = self.archive.adopt_loose()
+        if adopted:
+            self.update_search_index(moved=adopted)
+            console.print(f"[dim]📦 已将 ARCHIVE/ 顶层的 {len(adopted)} 个任务文件收编进按月分片。[/dim]")
+        if self.archive.roll_due():
+            # 已打包的分片需要更新索引，打包过程中只报告进度、不响应取消
+            report = (lambda done, total: job.report(done, total, "打包过期分片")) if job is not None else None
+            with tracer.span("archive.roll") as span:
+                rolled = self.archive.roll(progress=report)
+                span.set_attribute("archive.bundled", len(rolled))
+            if rolled:
+                self.update_search_index(renamed=rolled)
+                console.print(f"[dim]🗜️ P9 归档压缩: {len(rolled)} 个过期任务已打包至 {self.archive.bundles_dir}/[/dim]")
+
+    def update_search_index(self, synced=(), moved=(), renamed=()):
+        """
+        增量更新全文索引: synced 为新增 / 修改的文件，moved 为 [(旧路径, 新路径)]，
+        renamed 为内容不变、只改变位置的文件 (如打包进压缩包)；失败只提示，不影响调度
+        """
+        if self.search_index is None or not (synced or moved or renamed):
+            return
+        with tracer.span("search.update", **{"search.synced": len(synced), "search.moved": len(moved)}):
+            try:
+                self.search_index.update(synced, moved, renamed)
+            except sqlite3.Error as e:
+                console.print(f"[yellow]⚠️ 全文索引更新失败: {e}[/yellow]")
 
     def check_stop_signal(self):
         """检查是否存在停止信号文件"""
-        stop_file = Path("SYSTEM/stop_signal.txt")
+        stop_file = self.stop_signal_file
         if stop_file.exists():
             console.print("\n[bold red]🛑 检测到停止信号 (stop_signal.txt)，系统正在安全退出...[/bold red]")
             try:
@@ -523,57 +1163,78 @@ class NexusEngine:
             if self.check_stop_signal():
                 break
 
-            # 执行 P9 归档逻辑
-            self.archive_done_tasks()
+            # 每一轮调度作为一个 tick，开启 --profile 时逐 tick 输出剖析数据
+            with self.profiler.tick("scheduler.tick"):
+                # 执行 P9 归档逻辑 (默认在后台作业中进行，tick 不等待)
+                self.request_archive()
             
-            tasks = self.parse_tasks()
+                tasks = self.parse_tasks()
             
-            if not tasks:
-                console.print("[dim]当前 MESSAGES 目录为空，暂无任务。[/dim]")
-                break
+                if not self.pending_tasks(tasks):
+                    console.print("[dim]当前 MESSAGES 目录中没有待执行的任务。[/dim]")
+                    break
                 
-            self.draw_dag(tasks)
+                self.draw_dag(tasks)
             
-            runnable_tasks = self.get_runnable_tasks(tasks)
-            if not runnable_tasks:
-                console.print("[yellow]当前没有可以立即执行的任务。可能都在等待前置依赖完成。[/yellow]")
-                break
+                runnable_tasks = self.get_runnable_tasks(tasks)
+                if not runnable_tasks:
+                    console.print("[yellow]当前没有可以立即执行的任务。可能都在等待前置依赖完成。[/yellow]")
+                    blocked = self.dead_letters.downstream_of(tasks, self.dead_letters.dead_ids())
+                    if blocked:
+                        console.print(f"[red]其中 {len(blocked)} 个任务的上游已熔断或过期，需要上级下发 Fix 任务: {', '.join(sorted(blocked))}[/red]")
+                    break
                 
-            console.print(f"\n找到 [bold green]{len(runnable_tasks)}[/bold green] 个可开工任务。")
+                console.print(f"\n找到 [bold green]{len(runnable_tasks)}[/bold green] 个可开工任务。")
             
-            if self.auto_mode:
-                target_task = runnable_tasks[0]
-                console.print(f"[dim]自动模式: 自动选择任务 {target_task['id']} ({target_task['receiver']})[/dim]")
-                success = self.execute_task(target_task)
-                if not success:
-                    console.print("[red]自动模式下任务执行失败，系统退出。[/red]")
-                    break
-            else:
-                task_choices = [f"{t['id']} ({t['receiver']})" for t in runnable_tasks]
-                task_choices.append("退回终端 (Exit)")
+                if self.auto_mode:
+                    target_task = runnable_tasks[0]
+                    console.print(f"[dim]自动模式: 自动选择任务 {target_task['id']} ({target_task['receiver']})[/dim]")
+                    success = self.execute_task(target_task)
+                    if not success and self.environment_error:
+                        # 环境问题会让所有任务失败: 暂停调度，任务保持 [NEW]，修复配置或等待服务恢复后重新启动
+                        console.print("[bold yellow]⏸️ 调度已暂停: 请检查 API 配置与网络后重新启动。[/bold yellow]")
+                        break
+                    if not success and self.last_failure is None:
+                        # 失败次数未能记录 (或执行被取消): 继续调度会反复执行同一个任务
+                        console.print("[bold yellow]⏸️ 任务失败且未能记录失败次数，调度已停止。[/bold yellow]")
+                        break
+                    if not success:
+                        # 失败计入任务头部，达到阈值后熔断；其余分支继续调度
+                        console.print("[yellow]任务执行失败，继续调度其余任务。[/yellow]")
+                else:
+                    import questionary
+                    task_choices = [f"{t['id']} ({t['receiver']})" for t in runnable_tasks]
+                    task_choices.append("退回终端 (Exit)")
                 
-                selected = questionary.select(
-                    "请选择要调度执行的任务：",
-                    choices=task_choices
-                ).ask()
+                    selected = questionary.select(
+                        "请选择要调度执行的任务：",
+                        choices=task_choices
+                    ).ask()
                 
-                if not selected or selected == "退回终端 (Exit)":
-                    break
+                    if not selected or selected == "退回终端 (Exit)":
+                        break
                     
-                # 获取选中的任务
-                selected_id = selected.split(" ")[0]
-                target_task = next((t for t in runnable_tasks if t['id'] == selected_id), None)
+                    # 获取选中的任务
+                    selected_id = selected.split(" ")[0]
+                    target_task = next((t for t in runnable_tasks if t['id'] == selected_id), None)
                 
-                if target_task:
-                    self.execute_task(target_task)
+                    if target_task:
+                        self.execute_task(target_task)
+
+        # 退出前等待后台作业 (如最后一批归档) 完成
+        if self.jobs.active():
+            console.print("[dim]等待后台作业完成...[/dim]")
+            self.jobs.wait_idle()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="A1_Nexus 自动调度系统")
     parser.add_argument("--auto", action="store_true", help="启用全自动模式，无需人工干预")
+    parser.add_argument("--profile", nargs="?", const="cprofile", choices=PROFILE_MODES,
+                        help="逐个调度 tick 进行性能剖析 (cprofile 输出 .prof，sample 输出火焰图 .folded)，结果保存在 SYSTEM/profiles/")
     args = parser.parse_args()
     
     try:
-        engine = NexusEngine(auto_mode=args.auto)
+        engine = NexusEngine(auto_mode=args.auto, profile=args.profile)
         engine.run()
     except KeyboardInterrupt:
         console.print("\n[yellow]已退出调度控制台。[/yellow]")
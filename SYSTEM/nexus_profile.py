@@ -0,0 +1,114 @@
+import os
+import sys
+import json
+import time
+import cProfile
+import threading
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+PROFILE_MODES = ("cprofile", "sample")
+
+
+class _StackSampler(threading.Thread):
+    """定时采样目标线程的调用栈，累计为 folded stack 格式 (flamegraph.pl / speedscope 可直接读取)"""
+    def __init__(self, target_thread_id, interval):
+        super().__init__(name="nexus-profile-sampler", daemon=True)
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+class TickProfiler:
+    """
+    调度 tick 级别的性能剖析钩子。
+    - cprofile: 每个 tick 输出一份 .prof (可用 snakeviz / pstats 查看)
+    - sample:   每个 tick 输出一份 .folded 火焰图数据
+    每个 tick 的耗时与产物路径追加记录在 ticks.jsonl 中。
+    """
+    def __init__(self, mode=None, output_dir=None, interval=0.005):
+        if mode and mode not in PROFILE_MODES:
+            raise ValueError(f"未知的剖析模式: {mode}，可选: {', '.join(PROFILE_MODES)}")
+        self.mode = mode
+        self.interval = interval
+        self.output_dir = Path(output_dir) if output_dir else Path("SYSTEM/profiles") / time.strftime("%Y%m%d_%H%M%S")
+        self.tick_count = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, mode=None):
+        """命令行参数优先，其次读取环境变量 NEXUS_PROFILE / NEXUS_PROFILE_DIR"""
+        mode = mode or os.environ.get("NEXUS_PROFILE") or None
+        return cls(mode, os.environ.get("NEXUS_PROFILE_DIR"))
+
+    @property
+    def enabled(self):
+        return self.mode is not None
+
+    def tick(self, label="tick"):
+        """包裹一次调度 tick；未开启剖析时为零开销的空上下文"""
+        if not self.enabled:
+            return nullcontext()
+        return self._profile_tick(label)
+
+    @contextmanager
+    def _profile_tick(self, label):
+        with self._lock:
+            self.tick_count += 1
+            index = self.tick_count
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stem = f"tick_{index:05d}_{label.replace('.', '_')}"
+
+        start = time.perf_counter()
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                artifact = self.output_dir / f"{stem}.prof"
+                profiler.dump_stats(str(artifact))
+                self._record(index, label, start, artifact)
+        else:
+            sampler = _StackSampler(threading.get_ident(), self.interval)
+            sampler.start()
+            try:
+                yield
+            finally:
+                sampler.stop()
+                artifact = self.output_dir / f"{stem}.folded"
+                with open(artifact, "w", encoding="utf-8") as f:
+                    for stack, count in sampler.counts.most_common():
+                        f.write(f"{stack} {count}\n")
+                self._record(index, label, start, artifact)
+
+    def _record(self, index, label, start, artifact):
+        record = {
+            "tick": index,
+            "label": label,
+            "duration_ms": round((time.perf_counter() - start) * 1000, 3),
+            "artifact": artifact.name,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        with self._lock:
+            with open(self.output_dir / "ticks.jsonl", "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import secrets
+import inspect
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+
+# OTLP 常量: SpanKind.INTERNAL / StatusCode
+SPAN_KIND_INTERNAL = 1
+STATUS_UNSET = 0
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+# 导出文件的大小上限 (字节)，超过后轮转为 .1 / .2 ...；0 为不限
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 3
+
+# 当前线程/协程中正在进行的 Span
+_current_span = contextvars.ContextVar("nexus_current_span", default=None)
+
+
+def _otlp_value(value):
+    """将 Python 值转换为 OTLP JSON 的 AnyValue 结构"""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class Span:
+    """一个追踪区间，对应 OTLP 中的一个 span"""
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.events = []
+        self.status = STATUS_UNSET
+        self.status_message = ""
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def add_event(self, name, **attributes):
+        self.events.append((time.time_ns(), name, attributes))
+
+    def set_error(self, message):
+        self.status = STATUS_ERROR
+        self.status_message = str(message)
+
+    @property
+    def duration_ms(self):
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_otlp(self):
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KIND_INTERNAL,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or time.time_ns()),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in self.attributes.items()],
+            "status": {"code": self.status},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        if self.status_message:
+            span["status"]["message"] = self.status_message
+        if self.events:
+            span["events"] = [
+                {
+                    "timeUnixNano": str(ts),
+                    "name": name,
+                    "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attrs.items()],
+                }
+                for ts, name, attrs in self.events
+            ]
+        return span
+
+
+class _NoopSpan:
+    """追踪关闭时使用的空 Span，保证调用方代码无需判断"""
+    trace_id = None
+    span_id = None
+    duration_ms = 0.0
+
+    def set_attribute(self, key, value):
+        pass
+
+    def add_event(self, name, **attributes):
+        pass
+
+    def set_error(self, message):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+
+
+class Tracer:
+    """
+    OpenTelemetry 风格的轻量追踪器。
+    每条 trace 的根 Span 结束时，整条链路以 OTLP/JSON (ExportTraceServiceRequest) 格式
+    追加写入一行到本地文件，可直接被 OTel Collector 的 otlpjsonfile receiver 或
+    otel-desktop-viewer 等标准工具离线读取。
+    导出文件超过 max_bytes 时轮转 (traces.otlp.jsonl.1 为上一份，最多保留 backups 份)。
+    """
+    def __init__(self, service_name="a1-nexus", export_file=None, enabled=False,
+                 max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS):
+        self.service_name = service_name
+        self.export_file = Path(export_file) if export_file else None
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._size = None      # 导出文件的当前大小 (首次写入时读取)
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def configure(self, tracing_cfg):
+        """根据 config.yaml 中 system.tracing 配置启用或关闭追踪"""
+        tracing_cfg = tracing_cfg or {}
+        # 环境变量优先，方便临时关闭: NEXUS_TRACING=0
+        env_flag = os.environ.get("NEXUS_TRACING")
+        if env_flag is not None:
+            self.enabled = env_flag.lower() not in ("0", "false", "no", "off")
+        else:
+            self.enabled = bool(tracing_cfg.get("enabled", False))
+        self.service_name = tracing_cfg.get("service_name", self.service_name)
+        export_file = os.environ.get("NEXUS_TRACE_FILE") or tracing_cfg.get("export_file", "SYSTEM/traces/traces.otlp.jsonl")
+        self.export_file = Path(export_file)
+        self.max_bytes = tracing_cfg.get("max_bytes", DEFAULT_MAX_BYTES)
+        self.backups = tracing_cfg.get("backups", DEFAULT_BACKUPS)
+        self._size = None
+
+    def current_span(self):
+        return _current_span.get() or _NOOP_SPAN
+
+    def current_trace_id(self):
+        span = _current_span.get()
+        return span.trace_id if span else None
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """开启一个子 Span (若当前没有活动 Span 则开启新的 trace)"""
+        if not self.enabled:
+            yield _NOOP_SPAN
+            return
+
+        parent = _current_span.get()
+        trace_id = parent.trace_id if parent else secrets.token_hex(16)
+        span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.set_error(f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            span.end_ns = time.time_ns()
+            if span.status == STATUS_UNSET:
+                span.status = STATUS_OK
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # 生成器型处理函数可能在不同线程的 Context 中恢复执行
+                _current_span.set(parent)
+            self._finish(span, is_root=parent is None)
+
+    def traced(self, name=None):
+        """函数装饰器版本的 span"""
+        def decorator(func):
+            span_name = name or func.__qualname__
+
+            if inspect.isgeneratorfunction(func):
+                @functools.wraps(func)
+                def gen_wrapper(*args, **kwargs):
+                    with self.span(span_name):
+                        yield from func(*args, **kwargs)
+                return gen_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.span(span_name):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def _finish(self, span, is_root):
+        with self._lock:
+            self._pending.setdefault(span.trace_id, []).append(span)
+            if not is_root:
+                return
+            spans = self._pending.pop(span.trace_id)
+        self._export(spans)
+
+    def _export(self, spans):
+        payload = {
+            "resourceSpans": [{
+                "resource": {
+                    "attributes": [
+                        {"key": "service.name", "value": {"stringValue": self.service_name}},
+                        {"key": "process.pid", "value": {"intValue": str(os.getpid())}},
+                    ]
+                },
+                "scopeSpans": [{
+                    "scope": {"name": "nexus_trace"},
+                    "spans": [s.to_otlp() for s in spans],
+                }],
+            }]
+        }
+        try:
+            self.export_file.parent.mkdir(parents=True, exist_ok=True)
+            data = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+            with self._lock:
+                if self._size is None:
+                    self._size = self.export_file.stat().st_size if self.export_file.exists() else 0
+                if self.max_bytes and self._size and self._size + len(data) > self.max_bytes:
+                    self._rotate()
+                with open(self.export_file, "ab") as f:
+                    f.write(data)
+                self._size += len(data)
+        except Exception:
+            # 追踪失败绝不能影响任务执行
+            pass
+
+
+    def _rotate(self):
+        """traces.otlp.jsonl -> .1 -> .2 ...，超出 backups 份的最旧文件被覆盖 (需持有锁)"""
+        if self.backups > 0:
+            for i in range(self.backups - 1, 0, -1):
+                older = self.export_file.with_name(f"{self.export_file.name}.{i}")
+                if older.exists():
+                    os.replace(older, self.export_file.with_name(f"{self.export_file.name}.{i + 1}"))
+            os.replace(self.export_file, self.export_file.with_name(f"{self.export_file.name}.1"))
+        else:
+            self.export_file.unlink()
+        self._size = 0
+
+
+# 全局追踪器，由 NexusEngine 初始化时根据配置启用
+tracer = Tracer()
@@ -0,0 +1,197 @@
+"""
+分布式执行节点 (命令行: python SYSTEM/nexus_cli.py --url http://协调者:8090 worker --concurrency 4)。
+
+执行节点不读写任务文件，只向协调者 (nexus_cli.py serve --remote) 领取模型调用、请求模型并回报结果:
+- 供应商按名称取自本机的 SYSTEM/config.yaml，API Key 只保存在执行节点本地，不经协调者传输
+- 执行期间每 lease_seconds / 3 秒发送一次心跳续约；节点崩溃或断网时租约到期，协调者把调用改派给其他节点
+- 与协调者的连接中断时按间隔重试，协调者重启后自动重新加入
+"""
+import os
+import time
+import socket
+import threading
+
+from lease_board import DEFAULT_WORKER_CONCURRENCY, DEFAULT_LEASE_SECONDS
+from nexus_api import APIError, MAX_WAIT_SECONDS
+from provider_pool import ProviderPool
+
+# 单次长轮询领取任务的等待时间 (秒)
+LEASE_POLL_SECONDS = 20
+# 连接协调者失败后的重试间隔 (秒)
+RECONNECT_SECONDS = 2.0
+# 心跳线程检查是否需要续约的间隔 (秒)；租约有效期随任务下发，可能短于启动时的默认心跳间隔
+HEARTBEAT_TICK = 0.5
+
+
+def usage_to_dict(usage):
+    if not usage:
+        return None
+    return {
+        "total_tokens": getattr(usage, "total_tokens", None),
+        "prompt_tokens": getattr(usage, "prompt_tokens", None),
+        "completion_tokens": getattr(usage, "completion_tokens", None),
+    }
+
+
+class RemoteWorker:
+    """
+    执行节点: concurrency 个线程各自长轮询领取一个模型调用并执行，另有一个心跳线程为执行中的租约续约。
+    on_event(event, **data) 接收 lease.started / lease.done / lease.failed / lease.rejected /
+    worker.disconnected / worker.connected 事件。
+    """
+    def __init__(self, client, config_mgr, concurrency=DEFAULT_WORKER_CONCURRENCY, worker_id=None,
+                 provider_pool=None, poll_seconds=LEASE_POLL_SECONDS, on_event=None):
+        self.client = client
+        self.config_mgr = config_mgr
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.providers = provider_pool or ProviderPool.shared(config_mgr.config["system"].get("provider_pool"))
+        self.poll_seconds = min(poll_seconds, MAX_WAIT_SECONDS)
+        self.on_event = on_event or (lambda event, **data: None)
+        self.heartbeat_interval = DEFAULT_LEASE_SECONDS / 3.0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._active = {}            # 租约 ID -> 任务
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._drained = threading.Event()   # 领取线程全部退出后置位，心跳线程随之结束
+        self._disconnected = False
+
+    @classmethod
+    def from_config(cls, client, config_mgr, concurrency=None, **kwargs):
+        cfg = config_mgr.config["system"].get("distributed") or {}
+        return cls(client, config_mgr,
+                   concurrency=concurrency or cfg.get("worker_concurrency", DEFAULT_WORKER_CONCURRENCY), **kwargs)
+
+    # ---------- 控制 ----------
+    def run(self, max_calls=None):
+        """前台运行直到 stop() (或完成 max_calls 个调用)，返回 (成功数, 失败数)"""
+        self._max_calls = max_calls
+        self._drained.clear()
+        # openai 导入较慢 (约 0.7 秒)，在领取调用之前加载，避免首批租约因此超时或拖慢
+        import openai
+        threads = [threading.Thread(target=self._heartbeat_loop, name="nexus-worker-heartbeat", daemon=True)]
+        threads += [threading.Thread(target=self._lease_loop, name=f"nexus-worker-{i}", daemon=True)
+                    for i in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self._stop.is_set():
+                self._stop.wait(0.5)
+        finally:
+            self._stop.set()
+            for thread in threads[1:]:
+                thread.join()
+            # 心跳线程最后退出: 执行中的调用回报结果之前租约必须一直有效
+            self._drained.set()
+            threads[0].join()
+        return self.completed, self.failed
+
+    def stop(self):
+        """不再领取新调用，执行中的调用完成并回报后退出"""
+        self._stop.set()
+
+    def stats(self):
+        with self._lock:
+            active = sorted(job["task_id"] for job in self._active.values())
+        return {"worker": self.worker_id, "concurrency": self.concurrency, "active": active,
+                "completed": self.completed, "failed": self.failed, "rejected": self.rejected}
+
+    # ---------- 与协调者通信 ----------
+    def _connection_lost(self, error):
+        if not self._disconnected:
+            self._disconnected = True
+            self.on_event("worker.disconnected", error=str(error))
+
+    def _connected(self):
+        if self._disconnected:
+            self._disconnected = False
+            self.on_event("worker.connected")
+
+    def _lease_loop(self):
+        while not self._stop.is_set():
+            try:
+                jobs = self.client.lease_tasks(self.worker_id, 1, wait=self.poll_seconds, capacity=self.concurrency)
+            except APIError as e:
+                if e.status in (401, 403):
+                    self.on_event("worker.disconnected", error=str(e))
+                    self._stop.set()
+                    return
+                self._connection_lost(e)
+                self._stop.wait(RECONNECT_SECONDS)
+                continue
+            self._connected()
+            for job in jobs:
+                self._execute(job)
+            if self._max_calls and self.completed + self.failed >= self._max_calls:
+                self._stop.set()
+
+    def _heartbeat_loop(self):
+        """为执行中的租约续约；stop() 之后仍持续到领取线程全部退出 (执行中的调用均已回报)"""
+        last = time.monotonic()
+        while not self._drained.wait(HEARTBEAT_TICK):
+            if time.monotonic() - last < self.heartbeat_interval:
+                continue
+            last = time.monotonic()
+            with self._lock:
+                leases = list(self._active)
+            try:
+                result = self.client.heartbeat(self.worker_id, leases, capacity=self.concurrency)
+            except APIError:
+                continue
+            self.heartbeat_interval = max(1.0, result.get("lease_seconds", DEFAULT_LEASE_SECONDS) / 3.0)
+
+    # ---------- 执行 ----------
+    def _execute(self, job):
+        with self._lock:
+            self._active[job["lease"]] = job
+        self.heartbeat_interval = max(1.0, job.get("lease_seconds", DEFAULT_LEASE_SECONDS) / 3.0)
+        self.on_event("lease.started", project=job["project"], task_id=job["task_id"],
+                      receiver=job["receiver"], model=job["model"])
+        started = time.perf_counter()
+        text, usage, error = None, None, None
+        try:
+            provider_cfg = self.config_mgr.config["api_providers"]["providers"].get(job["provider"])
+            if provider_cfg is None:
+                raise ValueError(f"执行节点 {self.worker_id} 未配置供应商 {job['provider']}")
+            with self.providers.request(job["provider"], provider_cfg) as client:
+                response = client.chat.completions.create(
+                    model=job["model"],
+                    messages=job["messages"],
+                    temperature=job.get("temperature", 0.2)
+                )
+            text = response.choices[0].message.content
+            usage = usage_to_dict(getattr(response, "usage", None))
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        seconds = round(time.perf_counter() - started, 3)
+        accepted = self._post_result(job, text, usage, error)
+        with self._lock:
+            self._active.pop(job["lease"], None)
+            if not accepted:
+                self.rejected += 1
+            elif error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if not accepted:
+            self.on_event("lease.rejected", project=job["project"], task_id=job["task_id"])
+        elif error is None:
+            self.on_event("lease.done", project=job["project"], task_id=job["task_id"], seconds=seconds)
+        else:
+            self.on_event("lease.failed", project=job["project"], task_id=job["task_id"], error=error)
+
+    def _post_result(self, job, text, usage, error):
+        """回报结果；协调者暂时不可达时重试到租约到期为止，返回结果是否被采纳"""
+        deadline = time.monotonic() + job.get("lease_seconds", DEFAULT_LEASE_SECONDS)
+        while True:
+            try:
+                result = self.client.post_result(self.worker_id, job["lease"], text=text, usage=usage, error=error)
+                self._connected()
+                return result["accepted"]
+            except APIError as e:
+                if e.status != 503 or time.monotonic() >= deadline:
+                    return False
+                self._connection_lost(e)
+                time.sleep(RECONNECT_SECONDS)
@@ -0,0 +1,722 @@
+import re
+import json
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import NamedTuple, List
+
+from nexus_trace import tracer
+from task_factory import short_description
+
+# 结构化输出模式，按优先级依次尝试；供应商不支持时自动降级并记住结果
+FORMAT_MODES = ("json_schema", "json_object", "plain")
+# (base_url, model) -> 可用的 FORMAT_MODES 下标
+_FORMAT_SUPPORT = {}
+
+MAX_FIX_ATTEMPTS = 2
+# 递归拆解的默认限制
+DEFAULT_MAX_DEPTH = 2
+DEFAULT_MAX_FAN_OUT = 6
+DEFAULT_MAX_WORKERS = 4
+# 可继续细化的角色级别 -> 细化后子任务的角色级别
+DEFAULT_EXPAND_LEVELS = {"P8": "P7"}
+PERSONA_PROMPT_CHARS = 2000
+TASK_ID_RE = re.compile(r'^ID\d+$')
+BARE_LITERALS = {"True": "true", "False": "false", "None": "null"}
+
+
+def breakdown_schema(personas=()):
+    """任务拆解方案的 JSON Schema (根节点必须是对象，以兼容 OpenAI strict 模式)"""
+    receiver = {"type": "string"}
+    if personas:
+        receiver["enum"] = sorted(personas)
+    return {
+        "type": "object",
+        "properties": {
+            "tasks": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "ref": {"type": "string"},
+                        "receiver": receiver,
+                        "depends_on": {"type": "array", "items": {"type": "string"}},
+                        "description": {"type": "string"},
+                    },
+                    "required": ["ref", "receiver", "depends_on", "description"],
+                    "additionalProperties": False,
+                },
+            }
+        },
+        "required": ["tasks"],
+        "additionalProperties": False,
+    }
+
+
+def repair_json(text):
+    """
+    本地修复常见的 JSON 瑕疵 (不调用模型):
+    去掉 // 与 /* */ 注释、多余的尾逗号，字符串内的裸换行转义，Python 字面量 True/False/None，
+    以及输出被截断时补齐未闭合的字符串与括号。
+    """
+    out = []
+    stack = []
+    in_str = False
+    esc = False
+    i = 0
+    n = len(text)
+
+    def drop_trailing_comma():
+        j = len(out) - 1
+        while j >= 0 and out[j].isspace():
+            j -= 1
+        if j >= 0 and out[j] == ",":
+            del out[j]
+
+    while i < n:
+        ch = text[i]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+            elif ch == "\n":
+                out.append("\\n")
+                i += 1
+                continue
+            out.append(ch)
+            i += 1
+            continue
+        if ch == '"':
+            in_str = True
+        elif ch == "/" and text.startswith("//", i):
+            end = text.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        elif ch == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            continue
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]":
+            drop_trailing_comma()
+            if stack:
+                stack.pop()
+        elif ch.isalpha():
+            word = re.match(r'[A-Za-z]+', text[i:]).group(0)
+            out.append(BARE_LITERALS.get(word, word))
+            i += len(word)
+            continue
+        out.append(ch)
+        i += 1
+
+    if in_str:
+        if esc:
+            out.pop()
+        out.append('"')
+    drop_trailing_comma()
+    # 截断在 "key": 之后时补一个 null，保证可解析
+    tail = "".join(out).rstrip()
+    if tail.endswith(":"):
+        out.append(" null")
+    out.extend(reversed(stack))
+    return "".join(out)
+
+
+class PlanStreamParser:
+    """
+    容错的流式解析器: 随着模型输出逐块 feed()，按括号深度切分出 tasks 数组中的每个顶层对象。
+    单个对象格式有误只影响该对象本身，不会让整个拆解方案作废；
+    输出被截断时，最后一个不完整的对象也会作为片段返回，交给本地修复或模型修正。
+    """
+    def __init__(self):
+        self.buffer = ""
+        self.fragments = []
+        self._pos = 0
+        self._array_start = None
+        self._depth = 0
+        self._in_str = False
+        self._esc = False
+        self._item_start = None
+
+    def _find_array(self):
+        """定位 tasks 数组的起点: 优先 "tasks": [；根节点为对象时等待 tasks 键出现；否则取第一个 ["""
+        m = re.search(r'"tasks"\s*:\s*\[', self.buffer)
+        if m:
+            return m.end()
+        head = re.sub(r'^\s*(?:```\w*\s*)?', '', self.buffer)
+        if not head or head.startswith("{"):
+            return None
+        idx = self.buffer.find("[")
+        return idx + 1 if idx >= 0 else None
+
+    def feed(self, chunk):
+        """追加一段输出，返回本次新解析出的完整片段数"""
+        self.buffer += chunk
+        before = len(self.fragments)
+        if self._array_start is None:
+            start = self._find_array()
+            if start is None:
+                return 0
+            self._array_start = self._pos = start
+        buf = self.buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if self._in_str:
+                if self._esc:
+                    self._esc = False
+                elif ch == "\\":
+                    self._esc = True
+                elif ch == '"':
+                    self._in_str = False
+            elif ch == '"':
+                self._in_str = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._item_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0 and ch == "]":
+                    # tasks 数组结束
+                    self._pos = len(buf)
+                    self._array_start = -1
+                    return len(self.fragments) - before
+                self._depth -= 1
+                if self._depth == 0 and self._item_start is not None:
+                    self.fragments.append(buf[self._item_start:i + 1])
+                    self._item_start = None
+            i += 1
+        self._pos = i
+        return len(self.fragments) - before
+
+    def finish(self):
+        """输出结束: 返回全部片段 (含被截断的最后一个对象)"""
+        if self._item_start is not None and self._array_start != -1:
+            self.fragments.append(self.buffer[self._item_start:])
+            self._item_start = None
+        return list(self.fragments)
+
+
+def parse_fragment(fragment):
+    """解析单个任务对象: 先严格解析，失败时本地修复后再试。返回 (dict 或 None, 错误信息)"""
+    try:
+        return json.loads(fragment), None
+    except ValueError as e:
+        error = str(e)
+    try:
+        return json.loads(repair_json(fragment)), None
+    except ValueError:
+        return None, error
+
+
+def match_receiver(receiver, personas):
+    """将模型给出的角色名对齐到现有角色卡 (精确 -> 忽略大小写与 -/_ -> 唯一前缀)"""
+    if not personas or receiver in personas:
+        return receiver
+    norm = receiver.replace("-", "_").upper()
+    for p in personas:
+        if p.replace("-", "_").upper() == norm:
+            return p
+    candidates = [p for p in personas if p.replace("-", "_").upper().startswith(norm)]
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def validate_item(item, index, personas, known_refs, existing_ids):
+    """校验并规范化一个子任务，返回 (规范化后的 dict, 错误信息)"""
+    if not isinstance(item, dict):
+        return None, "不是 JSON 对象"
+    description = item.get("description")
+    if not isinstance(description, str) or not description.strip():
+        return None, "description 缺失或为空"
+    receiver = match_receiver(str(item.get("receiver", "")).strip(), personas)
+    if not receiver:
+        return None, f"receiver {item.get('receiver')!r} 不是现有角色 ({', '.join(sorted(personas))})"
+    deps = item.get("depends_on") or []
+    if isinstance(deps, str):
+        deps = [] if deps.strip().upper() == "NONE" else deps.split(",")
+    deps = [str(d).strip() for d in deps if str(d).strip() and str(d).strip().upper() != "NONE"]
+    unknown = [d for d in deps if d not in known_refs and not (TASK_ID_RE.match(d) and d in existing_ids)]
+    if unknown:
+        return None, f"depends_on 中的 {', '.join(unknown)} 既不是本方案中的 ref，也不是已有任务 ID"
+    return {
+        "ref": str(item.get("ref") or f"T{index + 1}"),
+        "receiver": receiver,
+        "depends_on": deps,
+        "description": description.strip(),
+    }, None
+
+
+class PlanResult(NamedTuple):
+    tasks: List[dict]           # 通过校验的子任务 (可直接交给 create_tasks)
+    dropped: List[tuple]        # [(片段序号, 错误信息)] 修正后仍无效而被丢弃的子任务
+    requests: int               # 本次拆解消耗的模型请求数
+    mode: str                   # 实际使用的结构化输出模式
+
+
+class BreakdownPlanner:
+    """
+    结构化输出的任务拆解:
+    1. 优先使用 response_format=json_schema，不支持时降级为 json_object，再降级为纯文本
+    2. 流式读取输出，用容错解析器逐个切分子任务对象，并在本地修复常见瑕疵
+    3. 仍然无效的子任务只把该片段发回模型修正，而不是重新生成整个方案
+    """
+    def __init__(self, client, model, personas=(), existing_ids=(), base_url="", on_progress=None, external_refs=()):
+        self.client = client
+        self.model = model
+        self.personas = set(personas)
+        self.existing_ids = set(existing_ids)
+        # 方案外部可被依赖的引用名 (如递归拆解时其他工作包的 ref)
+        self.external_refs = set(external_refs)
+        self.cache_key = (base_url, model)
+        self.on_progress = on_progress or (lambda count: None)
+        self.requests = 0
+
+    def _response_format(self, mode):
+        if mode == "json_schema":
+            return {"type": "json_schema",
+                    "json_schema": {"name": "task_breakdown", "strict": True, "schema": breakdown_schema(self.personas)}}
+        if mode == "json_object":
+            return {"type": "json_object"}
+        return None
+
+    def _stream(self, messages, mode):
+        """以指定模式流式请求，返回 PlanStreamParser"""
+        kwargs = {"model": self.model, "messages": messages, "temperature": 0.2, "stream": True}
+        response_format = self._response_format(mode)
+        if response_format:
+            kwargs["response_format"] = response_format
+        self.requests += 1
+        parser = PlanStreamParser()
+        for chunk in self.client.chat.completions.create(**kwargs):
+            if not getattr(chunk, "choices", None):
+                continue
+            delta = chunk.choices[0].delta.content or ""
+            if delta and parser.feed(delta):
+                self.on_progress(len(parser.fragments))
+        return parser
+
+    @staticmethod
+    def _is_format_rejection(error):
+        """供应商因不支持 response_format 而拒绝请求 (HTTP 400/404/422)"""
+        return getattr(error, "status_code", None) in (400, 404, 422)
+
+    def _request_plan(self, messages):
+        start = _FORMAT_SUPPORT.get(self.cache_key, 0)
+        last_error = None
+        for index in range(start, len(FORMAT_MODES)):
+            mode = FORMAT_MODES[index]
+            try:
+                parser = self._stream(messages, mode)
+            except Exception as e:
+                if index + 1 < len(FORMAT_MODES) and self._is_format_rejection(e):
+                    last_error = e
+                    continue
+                raise
+            _FORMAT_SUPPORT[self.cache_key] = index
+            return parser, mode
+        raise last_error
+
+    def _fix_fragment(self, messages, fragment, error):
+        """只把无效的片段发回模型修正，返回修正后的文本"""
+        self.requests += 1
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=messages + [{
+                "role": "user",
+                "content": f"你输出的拆解方案中有一个子任务无效：{error}\n\n无效片段：\n{fragment}\n\n"
+                           "请只输出修正后的这一个 JSON 对象 (包含 ref、receiver、depends_on、description)，不要输出其他内容。"
+            }],
+            temperature=0,
+        )
+        return response.choices[0].message.content or ""
+
+    @staticmethod
+    def _whole_fragments(text):
+        start = min([i for i in (text.find("{"), text.find("[")) if i >= 0], default=-1)
+        if start < 0:
+            raise ValueError(f"无法从模型输出中解析出任务列表:\n{text[:500]}")
+        try:
+            data = json.loads(repair_json(text[start:].rstrip().rstrip("`")))
+        except ValueError:
+            raise ValueError(f"无法从模型输出中解析出任务列表:\n{text[:500]}")
+        if isinstance(data, dict):
+            data = data.get("tasks") or next((v for v in data.values() if isinstance(v, list)), [])
+        return [json.dumps(item, ensure_ascii=False) for item in data if isinstance(data, list)]
+
+    def plan(self, system_prompt, user_prompt, limit=None):
+        """请求并解析拆解方案；limit 为子任务数量上限，超出部分 (及依赖它们的子任务) 被丢弃"""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+        parser, mode = self._request_plan(messages)
+        fragments = parser.finish()
+        if not fragments:
+            # 没有切分出任何对象 (如数组键名不是 tasks): 整体修复后再解析一次
+            fragments = self._whole_fragments(parser.buffer)
+
+        parsed = [parse_fragment(f) for f in fragments]
+        refs = [str(item.get("ref") or f"T{i + 1}") if isinstance(item, dict) else f"T{i + 1}"
+                for i, (item, _) in enumerate(parsed)]
+        known_refs = set(refs) | self.external_refs
+
+        valid, dropped = {}, []
+        for i, (fragment, (item, error)) in enumerate(zip(fragments, parsed)):
+            normalized = None
+            if item is not None:
+                normalized, error = validate_item(item, i, self.personas, known_refs, self.existing_ids)
+            attempts = 0
+            while normalized is None and attempts < MAX_FIX_ATTEMPTS:
+                attempts += 1
+                fixed_text = self._fix_fragment(messages, fragment, error)
+                start, end = fixed_text.find("{"), fixed_text.rfind("}")
+                fragment = fixed_text[start:end + 1] if start >= 0 else fixed_text
+                item, error = parse_fragment(fragment)
+                if item is not None:
+                    normalized, error = validate_item(item, i, self.personas, known_refs, self.existing_ids)
+            if normalized is None:
+                dropped.append((i + 1, error))
+            else:
+                valid[i] = normalized
+
+        if limit and len(valid) > limit:
+            for i in sorted(valid)[limit:]:
+                del valid[i]
+                dropped.append((i + 1, f"超出每次拆解 {limit} 个子任务的上限"))
+
+        # 依赖了被丢弃子任务的子任务一并丢弃，避免在前置工作缺失时提前执行
+        internal_refs = set(refs)
+        changed = True
+        while changed:
+            changed = False
+            kept_refs = {t["ref"] for t in valid.values()}
+            for i, t in list(valid.items()):
+                missing = [d for d in t["depends_on"] if d in internal_refs and d not in kept_refs]
+                if missing:
+                    del valid[i]
+                    dropped.append((i + 1, f"依赖的子任务 {', '.join(missing)} 已被丢弃"))
+                    changed = True
+        tasks = [valid[i] for i in sorted(valid)]
+        return PlanResult(tasks, dropped, self.requests, mode)
+
+
+class PlanNode:
+    """递归拆解树中的一个节点: 未展开的节点即为最终落盘的任务"""
+    def __init__(self, ref, receiver, description, depends_on, parent=None):
+        self.ref = ref
+        self.receiver = receiver
+        self.description = description
+        self.depends_on = list(depends_on)
+        self.parent = parent
+        self.children = []
+
+    @property
+    def depth(self):
+        return 1 if self.parent is None else self.parent.depth + 1
+
+    def leaves(self):
+        if not self.children:
+            return [self]
+        return [leaf for child in self.children for leaf in child.leaves()]
+
+    def ancestors(self):
+        node = self.parent
+        while node is not None:
+            yield node
+            node = node.parent
+
+
+class HierarchicalPlan(NamedTuple):
+    tasks: List[dict]           # 合并后的叶子任务 (可直接交给 create_tasks)
+    notes: List[str]            # 丢弃的子任务、展开失败的工作包、被忽略的循环依赖等
+    requests: int               # 所有层级累计的模型请求数
+    packages: int               # 顶层工作包数量
+
+
+class HierarchicalPlanner:
+    """
+    递归拆解:
+    1. P1 先输出少量顶层工作包 (不超过 max_fan_out 个)，分配给各 P8 主管
+    2. 同一层级中可细化的工作包并行交给对应主管展开为下一级子任务，直到达到 max_depth
+    3. 合并为一张 DAG: 工作包之间的依赖落到叶子任务上，跨工作包的引用指向被依赖工作包的收尾任务
+    规划耗时约等于各层最慢分支之和，而不是所有工作包规划耗时之和。
+    """
+    def __init__(self, client, model, personas=(), personas_dir="PERSONAS", existing_ids=(), base_url="",
+                 max_depth=DEFAULT_MAX_DEPTH, max_fan_out=DEFAULT_MAX_FAN_OUT, max_workers=DEFAULT_MAX_WORKERS,
+                 expand_levels=None, on_progress=None):
+        self.client = client
+        self.model = model
+        self.personas = list(personas)
+        self.personas_dir = Path(personas_dir)
+        self.existing_ids = set(existing_ids)
+        self.base_url = base_url
+        self.max_depth = max(1, max_depth)
+        self.max_fan_out = max(1, max_fan_out)
+        self.max_workers = max(1, max_workers)
+        self.expand_levels = expand_levels or DEFAULT_EXPAND_LEVELS
+        self.on_progress = on_progress or (lambda desc: None)
+        self.requests = 0
+        self.notes = []
+
+    @staticmethod
+    def _level(receiver):
+        return re.split(r'[_\-]', receiver, 1)[0].upper()
+
+    def _child_personas(self, receiver):
+        child_level = self.expand_levels.get(self._level(receiver))
+        if not child_level:
+            return []
+        return [p for p in self.personas if self._level(p) == child_level.upper()]
+
+    def _persona_text(self, receiver):
+        path = self.personas_dir / f"{receiver}.md"
+        try:
+            return path.read_text(encoding="utf-8")[:PERSONA_PROMPT_CHARS]
+        except OSError:
+            return f"你是 {receiver}。"
+
+    def _planner(self, personas, external_refs=()):
+        return BreakdownPlanner(self.client, self.model, personas=personas, existing_ids=self.existing_ids,
+                                base_url=self.base_url, external_refs=external_refs)
+
+    def _expand(self, node, siblings):
+        """请 node 的负责人把工作包细化为下一级子任务，返回 (PlanResult, 子任务角色列表)"""
+        children = self._child_personas(node.receiver)
+        others = "\n".join(f"- {s.ref}: {short_description(s.description, 40)}" for s in siblings if s is not node)
+        system_prompt = f"""{self._persona_text(node.receiver)}
+
+P1 把下面的工作包分配给了你 ({node.receiver})。请把它细化为不超过 {self.max_fan_out} 个可以由执行层直接完成的子任务。
+请严格按照以下 JSON 格式输出，不要输出任何其他废话：
+{{"tasks": [{{"ref": "S1", "receiver": "{children[0]}", "depends_on": [], "description": "..."}}]}}
+注意：
+1. receiver 必须是以下角色之一：{", ".join(children)}。
+2. ref 是本工作包内的引用名 (S1、S2...)，depends_on 填写所依赖子任务的 ref；没有依赖填 []。
+3. 如果某个子任务需要等待其他工作包完成，depends_on 中可以直接填写该工作包的 ref：
+{others or "(无其他工作包)"}
+4. description 必须自成一体，执行者看不到工作包原文。
+"""
+        planner = self._planner(children, external_refs=[s.ref for s in siblings if s is not node])
+        with tracer.span("planning.expand", **{"plan.package": node.ref, "plan.receiver": node.receiver,
+                                                "plan.depth": node.depth}) as span:
+            result = planner.plan(system_prompt, f"工作包 {node.ref}：\n\n{node.description}", limit=self.max_fan_out)
+            span.set_attribute("plan.children", len(result.tasks))
+        return result
+
+    def _expand_level(self, nodes, siblings_of):
+        """并行展开同一层级的工作包；单个工作包展开失败时保留为一个任务交给负责人完成"""
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(nodes))) as pool:
+            futures = [(node, pool.submit(context.copy().run, self._expand, node, siblings_of[node]))
+                       for node in nodes]
+            expanded = []
+            for done, (node, future) in enumerate(futures, 1):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.notes.append(f"工作包 {node.ref} 细化失败，保留为单个任务: {e}")
+                    continue
+                self.requests += result.requests
+                self.notes.extend(f"工作包 {node.ref} 的第 {i} 个子任务无效已跳过: {err}" for i, err in result.dropped)
+                if not result.tasks:
+                    continue
+                prefix = f"{node.ref}."
+                local = {t["ref"] for t in result.tasks}
+                for t in result.tasks:
+                    deps = [prefix + d if d in local else d for d in t["depends_on"]]
+                    node.children.append(PlanNode(prefix + t["ref"], t["receiver"], t["description"], deps, node))
+                expanded.append(node)
+                self.on_progress(f"已细化 {done}/{len(nodes)} 个工作包 (第 {node.depth + 1} 层)")
+        return expanded
+
+    def _merge(self, roots):
+        """把拆解树合并为叶子任务列表，返回 create_tasks 所需的 specs"""
+        by_ref = {}
+        stack = list(roots)
+        while stack:
+            node = stack.pop()
+            by_ref[node.ref] = node
+            stack.extend(node.children)
+
+        def sinks(node):
+            """工作包内没有被其他叶子依赖的收尾任务"""
+            leaves = node.leaves()
+            depended = set()
+            for leaf in leaves:
+                for d in leaf.depends_on:
+                    target = by_ref.get(d)
+                    if target is not None and (target is node or node in target.ancestors()):
+                        depended.update(l.ref for l in target.leaves())
+            return [leaf for leaf in leaves if leaf.ref not in depended] or leaves
+
+        def resolve(deps):
+            """把对工作包的依赖展开为其收尾任务，已有任务 ID 原样保留"""
+            out = []
+            for d in deps:
+                target = by_ref.get(d)
+                if target is None:
+                    out.append(d)
+                elif target.children:
+                    out.extend(leaf.ref for leaf in sinks(target))
+                else:
+                    out.append(target.ref)
+            return out
+
+        leaves = [leaf for root in roots for leaf in root.leaves()]
+        graph = {leaf.ref: [] for leaf in leaves}
+
+        def reachable(src, dst):
+            seen, todo = set(), [src]
+            while todo:
+                cur = todo.pop()
+                if cur == dst:
+                    return True
+                if cur in seen:
+                    continue
+                seen.add(cur)
+                todo.extend(graph.get(cur, []))
+            return False
+
+        def add_edge(leaf, dep, origin):
+            if dep == leaf.ref or dep in graph[leaf.ref]:
+                return
+            if dep in graph and reachable(dep, leaf.ref):
+                self.notes.append(f"忽略会形成循环的依赖: {leaf.ref} -> {dep} (来自 {origin})")
+                return
+            graph[leaf.ref].append(dep)
+
+        # 先加叶子自身的依赖，再把祖先工作包的依赖下放给其中的起始任务
+        for leaf in leaves:
+            for dep in resolve(leaf.depends_on):
+                add_edge(leaf, dep, leaf.ref)
+        for leaf in leaves:
+            for ancestor in leaf.ancestors():
+                inside = {l.ref for l in ancestor.leaves()}
+                if any(d in inside for d in graph[leaf.ref]):
+                    continue
+                for dep in resolve(ancestor.depends_on):
+                    if dep not in inside:
+                        add_edge(leaf, dep, ancestor.ref)
+
+        specs = []
+        for leaf in leaves:
+            spec = {"ref": leaf.ref, "receiver": leaf.receiver, "description": leaf.description,
+                    "depends_on": graph[leaf.ref]}
+            if leaf.parent is not None:
+                spec["headers"] = {"WORK_PACKAGE": f"{leaf.parent.ref} {short_description(leaf.parent.description, 30)}"}
+            specs.append(spec)
+        return specs
+
+    def plan(self, system_prompt, user_prompt):
+        with tracer.span("planning.hierarchical", **{"plan.max_depth": self.max_depth,
+                                                      "plan.max_fan_out": self.max_fan_out}) as span:
+            self.on_progress("正在由 P1 拆分顶层工作包...")
+            top = self._planner(self.personas)
+            result = top.plan(system_prompt, user_prompt, limit=self.max_fan_out)
+            self.requests += result.requests
+            self.notes.extend(f"第 {i} 个工作包无效已跳过: {err}" for i, err in result.dropped)
+            roots = [PlanNode(t["ref"], t["receiver"], t["description"], t["depends_on"]) for t in result.tasks]
+
+            level = roots
+            siblings_of = {node: roots for node in roots}
+            while level and level[0].depth < self.max_depth:
+                expandable = [node for node in level if self._child_personas(node.receiver)]
+                if not expandable:
+                    break
+                self.on_progress(f"正在并行细化 {len(expandable)} 个工作包 (第 {level[0].depth + 1} 层)...")
+                expanded = self._expand_level(expandable, siblings_of)
+                level = [child for node in expanded for child in node.children]
+                siblings_of = {child: node.children for node in expanded for child in node.children}
+
+            specs = self._merge(roots)
+            span.set_attribute("plan.packages", len(roots))
+            span.set_attribute("plan.tasks", len(specs))
+            span.set_attribute("plan.requests", self.requests)
+        return HierarchicalPlan(specs, self.notes, self.requests, len(roots))
+
+
+BREAKDOWN_SYSTEM_PROMPT = """你是 P1-首席执行架构师 (Nexus-001)。
+你的任务是将用户的宏大目标拆解为多个子任务，下发给各个虚拟员工。
+请严格按照以下 JSON 格式输出拆解后的任务列表，不要输出任何其他废话：
+{{
+  "tasks": [
+    {{
+      "ref": "T1",
+      "receiver": "P8_技术主管",
+      "depends_on": [],
+      "description": "搭建基础框架..."
+    }},
+    {{
+      "ref": "T2",
+      "receiver": "P8_文案主管",
+      "depends_on": ["T1"],
+      "description": "编写文案..."
+    }}
+  ]
+}}
+注意：
+1. receiver 必须是现有的角色名，当前可用的角色有：{personas}。
+2. ref 是本次拆解内的引用名 (T1、T2...)，depends_on 填写所依赖子任务的 ref；没有依赖填 []。真实任务 ID 由系统统一分配。
+"""
+RECURSIVE_PROMPT_NOTE = """3. 只拆分为不超过 {max_fan_out} 个顶层工作包，优先分配给 P8 主管，由主管再细化为执行层任务；不要自己拆到执行细节。
+"""
+
+
+def breakdown_task(engine, config_mgr, macro_task_desc, recursive=False, on_progress=None):
+    """
+    P1 自动拆解宏观任务并批量创建任务 (Web UI、HTTP API 与命令行共用)。
+    on_progress(fraction, desc) 报告进度；返回 (拆解方案, [(任务 ID, 文件名)])，
+    拆解方案为 PlanResult 或 HierarchicalPlan (recursive=True)。
+    """
+    on_progress = on_progress or (lambda fraction, desc: None)
+    on_progress(0, "正在调用 P1 思考拆解方案...")
+
+    # 获取当前可用的角色列表
+    available_personas = [p.stem for p in engine.personas_dir.glob("*.md")]
+    personas_str = ", ".join(available_personas) if available_personas else "P8_技术, P8_文案, P9_行政合规审计"
+    planning_cfg = config_mgr.config["system"].get("planning") or {}
+    system_prompt = BREAKDOWN_SYSTEM_PROMPT.format(personas=personas_str)
+    if recursive:
+        system_prompt += RECURSIVE_PROMPT_NOTE.format(max_fan_out=planning_cfg.get("max_fan_out", DEFAULT_MAX_FAN_OUT))
+
+    # 获取 P1 的模型配置
+    provider_name, provider_cfg, model_name = config_mgr.get_provider_config("P1_Nexus")
+    client = engine.providers.client(provider_cfg)
+
+    # 结构化输出 + 容错流式解析: 单个子任务格式有误时只请求模型修正该片段
+    existing_ids = engine.task_factory.allocator.existing_ids()
+    if recursive:
+        planner = HierarchicalPlanner(
+            client, model_name,
+            personas=available_personas,
+            personas_dir=engine.personas_dir,
+            existing_ids=existing_ids,
+            base_url=provider_cfg["base_url"],
+            max_depth=planning_cfg.get("max_depth", DEFAULT_MAX_DEPTH),
+            max_fan_out=planning_cfg.get("max_fan_out", DEFAULT_MAX_FAN_OUT),
+            max_workers=planning_cfg.get("max_workers", DEFAULT_MAX_WORKERS),
+            expand_levels=planning_cfg.get("expand_levels"),
+            on_progress=lambda desc: on_progress(0.25, desc),
+        )
+    else:
+        planner = BreakdownPlanner(
+            client, model_name,
+            personas=available_personas,
+            existing_ids=existing_ids,
+            base_url=provider_cfg["base_url"],
+            on_progress=lambda count: on_progress(min(0.1 + count * 0.05, 0.45), f"已解析 {count} 个子任务..."),
+        )
+
+    plan = planner.plan(system_prompt, f"请拆解以下宏观任务：\n\n{macro_task_desc}")
+    if not plan.tasks:
+        raise ValueError("拆解方案中没有有效的子任务")
+
+    on_progress(0.5, "正在生成任务文件...")
+    # 整个拆解方案一次性分配 ID 并写入，批次内的 ref 依赖映射为真实 ID
+    # (模型可能沿用旧提示词按批次顺序从 ID001 编号，只有拆解方案才按批次序号兼容解析)
+    created = engine.create_tasks(plan.tasks, legacy_batch_ids=True)
+    on_progress(1.0, "拆解完成！")
+    return plan, created
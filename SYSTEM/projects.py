@@ -0,0 +1,191 @@
+"""
+多项目注册表: 一个进程托管多个相互隔离的项目 (命令行: python SYSTEM/nexus_cli.py projects | new-project <名称>)。
+
+- default 项目即当前目录下的工作区 (MESSAGES / ARCHIVE / PROJECT_SPACE / PERSONAS 与 SYSTEM/config.yaml)
+- 其他项目位于 PROJECTS/<名称>/，各自拥有 MESSAGES、ARCHIVE、PROJECT_SPACE 与状态目录 .nexus/
+  (检索索引、全文索引、快照、停止信号、工作历史)；没有 PERSONAS/ 时共用 default 的角色
+- PROJECTS/<名称>/project.yaml 为配置叠加层，按键深度合并到 SYSTEM/config.yaml 之上，
+  例如只覆盖 role_overrides 或 system.quota
+- 所有项目的引擎共用同一个 ProviderPool: 相同账号的模型客户端、连接池与请求限额只有一份
+"""
+import re
+import copy
+import threading
+from pathlib import Path
+
+import yaml
+
+from nexus_core import NexusEngine, ConfigManager, DEFAULT_PROJECT
+from provider_pool import ProviderPool
+from task_runner import quota_from_config
+
+DEFAULT_PROJECTS_DIR = "PROJECTS"
+PROJECT_CONFIG_FILE = "project.yaml"
+STATE_DIR = ".nexus"
+# 项目名只允许字母、数字、下划线、连字符与中文 (用作目录名)
+PROJECT_NAME_PATTERN = re.compile(r"^[\w\-]{1,64}$")
+
+# 项目内的路径配置: 配置键路径 -> 相对项目目录的默认值；叠加层中给出的相对路径同样相对项目目录
+PROJECT_PATHS = {
+    ("messages_dir",): "MESSAGES",
+    ("archive_dir",): "ARCHIVE",
+    ("project_space_dir",): "PROJECT_SPACE",
+    ("personas_dir",): "PERSONAS",
+    ("retrieval", "index_file"): f"{STATE_DIR}/index/workspace_index.json",
+    ("search", "db_file"): f"{STATE_DIR}/index/search.db",
+    ("snapshots", "dir"): f"{STATE_DIR}/snapshots",
+    ("stop_signal_file",): f"{STATE_DIR}/stop_signal.txt",
+    ("history_file",): f"{STATE_DIR}/work_history.json",
+}
+
+
+def deep_merge(base, overlay):
+    """返回 base 与 overlay 深度合并后的新字典 (overlay 优先，字典逐键合并，其他类型整体替换)"""
+    merged = copy.deepcopy(base)
+    for key, value in (overlay or {}).items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = deep_merge(merged[key], value)
+        else:
+            merged[key] = copy.deepcopy(value)
+    return merged
+
+
+def _get_path(cfg, keys):
+    for key in keys:
+        if not isinstance(cfg, dict) or key not in cfg:
+            return None
+        cfg = cfg[key]
+    return cfg
+
+
+def _set_path(cfg, keys, value):
+    for key in keys[:-1]:
+        if not isinstance(cfg.get(key), dict):
+            cfg[key] = {}
+        cfg = cfg[key]
+    cfg[keys[-1]] = value
+
+
+class Project:
+    """注册表中的一个项目: 目录、合并后的配置与调度配额，引擎在首次使用时创建"""
+    def __init__(self, name, root, config):
+        self.name = name
+        self.root = Path(root)
+        self.config = config
+        self.weight, self.max_concurrent, self.max_tasks_per_hour = quota_from_config(config["system"])
+        self.engine = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "root": str(self.root),
+            "loaded": self.engine is not None,
+            "weight": self.weight,
+            "max_concurrent": self.max_concurrent,
+            "max_tasks_per_hour": self.max_tasks_per_hour,
+        }
+
+
+class ProjectRegistry:
+    """
+    项目注册表: 扫描 PROJECTS/ 下的项目目录，按需创建各项目的 NexusEngine。
+    所有引擎共用 provider_pool (默认为进程级共享的 ProviderPool)。
+    """
+    def __init__(self, config_mgr=None, projects_dir=DEFAULT_PROJECTS_DIR, auto_mode=True, provider_pool=None):
+        self.base_config_mgr = config_mgr or ConfigManager()
+        self.projects_dir = Path(projects_dir)
+        self.auto_mode = auto_mode
+        self.providers = provider_pool or ProviderPool.shared(self.base_config_mgr.config["system"].get("provider_pool"))
+        self._projects = {}
+        self._lock = threading.RLock()
+        self.refresh()
+
+    @classmethod
+    def from_config(cls, config_mgr=None, **kwargs):
+        config_mgr = config_mgr or ConfigManager()
+        cfg = config_mgr.config["system"].get("projects") or {}
+        return cls(config_mgr, projects_dir=cfg.get("dir", DEFAULT_PROJECTS_DIR), **kwargs)
+
+    # ---------- 项目 ----------
+    def refresh(self):
+        """重新扫描 PROJECTS/ (新建的项目目录无需重启即可使用)，已加载的项目保持不变"""
+        with self._lock:
+            if DEFAULT_PROJECT not in self._projects:
+                self._projects[DEFAULT_PROJECT] = Project(DEFAULT_PROJECT, ".", self.base_config_mgr.config)
+            if self.projects_dir.is_dir():
+                for path in sorted(self.projects_dir.iterdir()):
+                    if path.is_dir() and PROJECT_NAME_PATTERN.match(path.name) and path.name not in self._projects:
+                        self._projects[path.name] = Project(path.name, path, self._project_config(path))
+        return self.names()
+
+    def _project_config(self, root):
+        overlay = {}
+        config_file = root / PROJECT_CONFIG_FILE
+        if config_file.exists():
+            with open(config_file, "r", encoding="utf-8") as f:
+                overlay = yaml.safe_load(f) or {}
+        config = deep_merge(self.base_config_mgr.config, overlay)
+        # 项目内的目录与状态文件: 叠加层未指定时使用项目目录下的默认位置，相对路径一律相对项目目录
+        for keys, default in PROJECT_PATHS.items():
+            value = _get_path(overlay.get("system"), keys) or default
+            path = Path(value) if Path(value).is_absolute() else root / value
+            if keys == ("personas_dir",) and not path.exists() and not _get_path(overlay.get("system"), keys):
+                # 项目没有自己的角色目录时共用 default 项目的角色
+                path = Path(self.base_config_mgr.config["system"].get("personas_dir", "PERSONAS"))
+            _set_path(config["system"], keys, str(path))
+        return config
+
+    def names(self):
+        with self._lock:
+            return list(self._projects)
+
+    def get(self, name=None):
+        name = name or DEFAULT_PROJECT
+        with self._lock:
+            project = self._projects.get(name)
+            if project is None:
+                self.refresh()
+                project = self._projects.get(name)
+        if project is None:
+            raise KeyError(f"项目 {name} 不存在")
+        return project
+
+    def engine(self, name=None):
+        """项目的引擎 (首次使用时创建)"""
+        project = self.get(name)
+        with self._lock:
+            if project.engine is None:
+                config_mgr = (self.base_config_mgr if project.name == DEFAULT_PROJECT
+                              else ConfigManager.from_dict(project.config))
+                project.engine = NexusEngine(auto_mode=self.auto_mode, config_mgr=config_mgr,
+                                             project=project.name, provider_pool=self.providers)
+            return project.engine
+
+    def loaded(self):
+        """已创建引擎的项目"""
+        with self._lock:
+            return [project for project in self._projects.values() if project.engine is not None]
+
+    def create(self, name, overlay=None):
+        """新建项目目录 (可附带 project.yaml 配置叠加层)，返回 Project"""
+        if not PROJECT_NAME_PATTERN.match(name or "") or name == DEFAULT_PROJECT:
+            raise ValueError(f"无效的项目名: {name!r} (只允许字母、数字、下划线、连字符与中文)")
+        root = self.projects_dir / name
+        with self._lock:
+            if name in self._projects or root.exists():
+                raise ValueError(f"项目 {name} 已存在")
+            root.mkdir(parents=True)
+            for sub in ("MESSAGES", "ARCHIVE", "PROJECT_SPACE", STATE_DIR):
+                (root / sub).mkdir()
+            if overlay:
+                with open(root / PROJECT_CONFIG_FILE, "w", encoding="utf-8") as f:
+                    yaml.safe_dump(overlay, f, allow_unicode=True, sort_keys=False)
+            self._projects[name] = Project(name, root, self._project_config(root))
+            return self._projects[name]
+
+    def close(self):
+        """等待各项目的后台作业结束并关闭归档清单"""
+        for project in self.loaded():
+            project.engine.jobs.shutdown(wait=True)
+            project.engine.archive.close()
+
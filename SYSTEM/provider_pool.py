@@ -0,0 +1,165 @@
+import time
+import threading
+from contextlib import contextmanager
+
+from nexus_trace import tracer
+
+# 模型列表缓存时长 (秒)；执行每个任务前都要列出可选模型，缓存后不再逐任务请求 /models
+DEFAULT_MODELS_CACHE_SECONDS = 300
+
+
+class RateLimiter:
+    """
+    单个供应商账号的请求限额，同一进程内所有项目共享:
+    - max_concurrency: 同时进行中的请求数上限 (0 为不限)
+    - rpm: 每分钟请求数上限 (令牌桶，允许 rpm 个请求的突发；0 为不限)
+    """
+    def __init__(self, max_concurrency=0, rpm=0):
+        self.max_concurrency = max_concurrency or 0
+        self.rpm = rpm or 0
+        self._slots = threading.BoundedSemaphore(self.max_concurrency) if self.max_concurrency else None
+        self._lock = threading.Lock()
+        self._tokens = float(self.rpm)
+        self._refilled = time.monotonic()
+        self.requests = 0
+        self.active = 0
+        self.waited_seconds = 0.0
+
+    def _take_token(self):
+        """取一个令牌，返回需要等待的秒数 (0 表示已取得)"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.rpm), self._tokens + (now - self._refilled) * self.rpm / 60.0)
+            self._refilled = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) * 60.0 / self.rpm
+
+    def acquire(self):
+        """占用一个请求名额，超出限额时阻塞等待；返回等待的秒数。用完后必须调用 release()"""
+        started = time.perf_counter()
+        if self._slots is not None:
+            self._slots.acquire()
+        if self.rpm:
+            while True:
+                delay = self._take_token()
+                if not delay:
+                    break
+                time.sleep(delay)
+        waited = time.perf_counter() - started
+        with self._lock:
+            self.requests += 1
+            self.active += 1
+            self.waited_seconds += waited
+        return waited
+
+    def release(self):
+        with self._lock:
+            self.active = max(0, self.active - 1)
+        if self._slots is not None:
+            self._slots.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "rpm": self.rpm,
+                "active": self.active,
+                "requests": self.requests,
+                "waited_seconds": round(self.waited_seconds, 3),
+            }
+
+
+class ProviderPool:
+    """
+    进程内共享的模型供应商资源:
+    - 每个账号 (base_url + api_key) 只创建一个 OpenAI 客户端，复用其 HTTP 连接池
+    - 同一账号的请求共用一个 RateLimiter (限额取自供应商配置的 max_concurrency / rpm)
+    - 模型列表按账号缓存 models_cache_seconds 秒
+    同一进程中的多个项目引擎默认使用 ProviderPool.shared()，因此共享连接与限额。
+    """
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self, models_cache_seconds=DEFAULT_MODELS_CACHE_SECONDS):
+        self.models_cache_seconds = models_cache_seconds
+        self._clients = {}
+        self._limiters = {}
+        self._models = {}     # 账号 -> (拉取时间, 模型 ID 列表)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg):
+        cfg = cfg or {}
+        return cls(models_cache_seconds=cfg.get("models_cache_seconds", DEFAULT_MODELS_CACHE_SECONDS))
+
+    @classmethod
+    def shared(cls, cfg=None):
+        """进程级共享实例 (首次调用时按 cfg 创建，之后忽略 cfg)"""
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls.from_config(cfg)
+            return cls._shared
+
+    @staticmethod
+    def _account(provider_cfg):
+        return provider_cfg.get("base_url", ""), provider_cfg.get("api_key", "")
+
+    def client(self, provider_cfg):
+        account = self._account(provider_cfg)
+        with self._lock:
+            client = self._clients.get(account)
+            if client is None:
+                # openai 导入较慢 (约 0.7 秒)，只在真正请求模型时加载
+                from openai import OpenAI
+                client = self._clients[account] = OpenAI(api_key=account[1], base_url=account[0])
+            return client
+
+    def limiter(self, provider_name, provider_cfg):
+        account = self._account(provider_cfg)
+        with self._lock:
+            limiter = self._limiters.get(account)
+            if limiter is None:
+                limiter = self._limiters[account] = RateLimiter(
+                    max_concurrency=provider_cfg.get("max_concurrency", 0),
+                    rpm=provider_cfg.get("rpm", 0),
+                )
+                limiter.provider = provider_name
+            return limiter
+
+    @contextmanager
+    def limit(self, provider_name, provider_cfg):
+        """只占用该账号的一个请求名额 (分布式模式下请求由执行节点发出，限额仍在协调者统一计算)"""
+        limiter = self.limiter(provider_name, provider_cfg)
+        with tracer.span("provider.acquire", **{"llm.provider": provider_name}) as span:
+            waited = limiter.acquire()
+            span.set_attribute("provider.wait_ms", round(waited * 1000, 1))
+        try:
+            yield limiter
+        finally:
+            limiter.release()
+
+    @contextmanager
+    def request(self, provider_name, provider_cfg):
+        """占用该账号的一个请求名额并返回共享客户端: with pool.request(name, cfg) as client: ..."""
+        with self.limit(provider_name, provider_cfg):
+            yield self.client(provider_cfg)
+
+    def list_models(self, provider_cfg):
+        """该账号可用的模型 ID (缓存 models_cache_seconds 秒)，请求失败时抛出异常且不缓存"""
+        account = self._account(provider_cfg)
+        with self._lock:
+            cached = self._models.get(account)
+        if cached and time.monotonic() - cached[0] < self.models_cache_seconds:
+            return cached[1]
+        model_ids = [model.id for model in self.client(provider_cfg).models.list().data]
+        with self._lock:
+            self._models[account] = (time.monotonic(), model_ids)
+        return model_ids
+
+    def stats(self):
+        with self._lock:
+            limiters = list(self._limiters.values())
+            clients = len(self._clients)
+        return {"clients": clients, "limits": [{"provider": l.provider, **l.stats()} for l in limiters]}
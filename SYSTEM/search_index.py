@@ -0,0 +1,503 @@
+import os
+import sys
+import json
+import time
+import fnmatch
+import sqlite3
+import argparse
+import datetime
+import threading
+from pathlib import Path
+
+import task_parser
+from archive_store import ArchiveStore
+
+# 强制设置标准输出编码为 utf-8，解决 Windows 下打印 emoji 报错的问题
+if sys.stdout.encoding.lower() != 'utf-8':
+    sys.stdout.reconfigure(encoding='utf-8')
+
+DEFAULT_DB_FILE = "SYSTEM/index/search.db"
+DEFAULT_MAX_FILE_BYTES = 1024 * 1024
+DEFAULT_LIMIT = 20
+# 摘要片段的词元数 (trigram 下约等于字符数，FTS5 上限 64)
+SNIPPET_TOKENS = 48
+# 全量核对时每处理多少个文件回调一次进度
+PROGRESS_EVERY = 200
+SCHEMA_VERSION = 1
+# 索引的文件类型: 任务 (MESSAGES) / 归档 (ARCHIVE，含 DEAD_LETTER 等子目录) / 工作区 (PROJECT_SPACE)
+KINDS = ("task", "archive", "workspace")
+DEFAULT_IGNORE_PATTERNS = (".git", "node_modules", "__pycache__", ".venv", "venv", "dist", "build",
+                           ".idea", ".vscode", "*.pyc", ".DS_Store", ".*.tmp")
+# trigram 分词器要求每个检索词至少 3 个字符，更短的词改用 instr() 子串过滤 (trigram 表上的 LIKE 在部分 SQLite 版本中恒返回空)
+TRIGRAM_MIN_CHARS = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS docs (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    kind TEXT NOT NULL,
+    task_id TEXT,
+    sender TEXT,
+    receiver TEXT,
+    status TEXT,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS docs_task_id ON docs (task_id);
+CREATE INDEX IF NOT EXISTS docs_receiver ON docs (receiver);
+CREATE INDEX IF NOT EXISTS docs_mtime ON docs (mtime);
+"""
+
+
+class SearchHit:
+    def __init__(self, path, kind, task_id, receiver, status, mtime, snippet):
+        self.path = path
+        self.kind = kind
+        self.task_id = task_id
+        self.receiver = receiver
+        self.status = status
+        self.mtime = mtime
+        self.snippet = snippet
+
+    def to_dict(self):
+        return {
+            "path": self.path, "kind": self.kind, "task_id": self.task_id, "receiver": self.receiver,
+            "status": self.status, "date": datetime.datetime.fromtimestamp(self.mtime).strftime("%Y-%m-%d %H:%M"),
+            "snippet": self.snippet,
+        }
+
+
+def parse_date(value, end=False):
+    """YYYY-MM-DD -> 时间戳 (end=True 时取当天结束)"""
+    if not value:
+        return None
+    day = datetime.datetime.strptime(value, "%Y-%m-%d")
+    if end:
+        day += datetime.timedelta(days=1)
+    return day.timestamp()
+
+
+class SearchIndex:
+    """
+    MESSAGES / ARCHIVE / PROJECT_SPACE 的本地全文索引 (SQLite FTS5，可用时使用 trigram 分词以支持中文与代码片段)。
+    - docs 表记录每个文件的元数据 (任务 ID / 接收者 / 状态 / 修改时间)，按 (mtime, size) 判断是否需要重新索引
+    - 引擎在任务创建、执行完成、归档与产出物写入时调用 sync_paths / remove_paths 增量更新
+    - refresh() 对三个目录做一次全量核对 (只 stat，不读取未变化的文件)
+    - 提供 archive_store 时，已打包进压缩包的归档任务以 ARCHIVE/bundles/<分片>.zip/<文件名> 的虚拟路径收录，
+      直接从压缩包读取，无需解包
+    """
+    def __init__(self, db_file, messages_dir, archive_dir, project_space_dir,
+                 ignore_patterns=DEFAULT_IGNORE_PATTERNS, max_file_bytes=DEFAULT_MAX_FILE_BYTES, archive_store=None):
+        self.db_file = Path(db_file)
+        self.roots = {
+            "task": self._normalize(messages_dir),
+            "archive": self._normalize(archive_dir),
+            "workspace": self._normalize(project_space_dir),
+        }
+        self.ignore_patterns = tuple(ignore_patterns)
+        self.max_file_bytes = max_file_bytes
+        self.archive_store = archive_store
+        self._lock = threading.Lock()
+        self._conn = None
+        self.trigram = False
+        # 索引被全量核对占用时暂存的增量更新 [(synced, moved, renamed)]
+        self._pending = []
+        self._pending_lock = threading.Lock()
+
+    # ---------- 连接与表结构 ----------
+    def _connect(self):
+        if self._conn is not None:
+            return self._conn
+        self.db_file.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.db_file), check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(SCHEMA)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'tokenizer'").fetchone()
+        if row is None:
+            try:
+                conn.execute("CREATE VIRTUAL TABLE fts USING fts5(title, body, tokenize='trigram')")
+                tokenizer = "trigram"
+            except sqlite3.OperationalError:
+                # SQLite < 3.34 没有 trigram 分词器
+                conn.execute("CREATE VIRTUAL TABLE fts USING fts5(title, body, tokenize='unicode61')")
+                tokenizer = "unicode61"
+            conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)",
+                             [("tokenizer", tokenizer), ("version", str(SCHEMA_VERSION))])
+            conn.commit()
+        else:
+            tokenizer = row[0]
+        self.trigram = tokenizer == "trigram"
+        self._conn = conn
+        return conn
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # ---------- 文件分类与读取 ----------
+    def _ignored(self, rel_parts):
+        return any(fnmatch.fnmatch(part, pattern) for part in rel_parts for pattern in self.ignore_patterns)
+
+    @staticmethod
+    def _normalize(path):
+        """索引中的路径统一为相对项目根目录 (当前工作目录) 的 POSIX 路径"""
+        path = Path(path)
+        if path.is_absolute():
+            try:
+                path = path.relative_to(Path.cwd())
+            except ValueError:
+                pass
+        return path
+
+    def _classify(self, path):
+        """返回 (kind, 元数据 dict)；不属于任何索引目录或被忽略时返回 (None, None)"""
+        for kind, root in self.roots.items():
+            try:
+                rel = path.relative_to(root)
+            except ValueError:
+                continue
+            if self._ignored(rel.parts):
+                return None, None
+            if kind == "workspace":
+                # 特性分支 features/<任务ID>/ 下的文件归属于产出它的任务
+                parts = rel.parts
+                task_id = parts[1] if len(parts) > 2 and parts[0] == "features" and task_parser.TASK_ID_RE.fullmatch(parts[1]) else None
+                return kind, {"task_id": task_id, "sender": None, "receiver": None, "status": None}
+            if path.suffix != ".md":
+                return None, None
+            name = task_parser.parse_task_filename(path.name)
+            if name is None:
+                return kind, {"task_id": None, "sender": None, "receiver": None, "status": None}
+            return kind, {"task_id": name.task_id, "sender": name.sender, "receiver": name.receiver, "status": name.status}
+        return None, None
+
+    def _read(self, path, size):
+        with open(path, "rb") as f:
+            data = f.read(self.max_file_bytes)
+        if b"\x00" in data[:8192]:
+            return None
+        try:
+            return task_parser.decode_task_bytes(data, truncated=size > len(data))[0]
+        except UnicodeDecodeError:
+            return None
+
+    def _read_entry(self, entry):
+        try:
+            return task_parser.decode_task_bytes(self.archive_store.read_bytes(entry)[:self.max_file_bytes], truncated=True)[0]
+        except (OSError, KeyError, UnicodeDecodeError):
+            return None
+
+    @staticmethod
+    def _title(kind, path, text):
+        if kind == "workspace":
+            return path.name
+        for line in text.splitlines():
+            if line.strip():
+                return line.strip().lstrip("# ")
+        return path.name
+
+    # ---------- 增量更新 ----------
+    def _upsert(self, conn, path, known=None, entry=None):
+        """索引单个文件，返回是否写入。known 为 path -> (mtime, size) 的已有记录，entry 为已查到的压缩包内归档记录"""
+        path = self._normalize(path)
+        kind, info = self._classify(path)
+        if kind is None:
+            return False
+        key = path.as_posix()
+        if entry is None and self.archive_store is not None:
+            entry = self.archive_store.entry_for(path)
+        if entry is not None:
+            mtime, size = entry.mtime, entry.size
+        else:
+            try:
+                st = os.stat(path)
+            except OSError:
+                return self._delete(conn, key)
+            mtime, size = st.st_mtime, st.st_size
+        if known is None:
+            row = conn.execute("SELECT mtime, size FROM docs WHERE path = ?", (key,)).fetchone()
+            current = tuple(row) if row else None
+        else:
+            current = known.get(key)
+        if current == (mtime, size):
+            return False
+        text = self._read_entry(entry) if entry is not None else self._read(path, size)
+        if text is None:
+            return self._delete(conn, key)
+        self._delete(conn, key)
+        cur = conn.execute(
+            "INSERT INTO docs (path, kind, task_id, sender, receiver, status, mtime, size) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, kind, info["task_id"], info["sender"], info["receiver"], info["status"], mtime, size)
+        )
+        conn.execute("INSERT INTO fts (rowid, title, body) VALUES (?, ?, ?)", (cur.lastrowid, self._title(kind, path, text), text))
+        return True
+
+    @staticmethod
+    def _delete(conn, key):
+        row = conn.execute("SELECT id FROM docs WHERE path = ?", (key,)).fetchone()
+        if row is None:
+            return False
+        conn.execute("DELETE FROM fts WHERE rowid = ?", (row[0],))
+        conn.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+        return True
+
+    def sync_paths(self, paths):
+        """新增或修改的文件重新索引 (未变化的文件只做一次 stat)，返回实际更新的数量"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return sum(1 for path in paths if self._upsert(conn, path))
+
+    def remove_paths(self, paths):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                return sum(1 for path in paths if self._delete(conn, self._normalize(path).as_posix()))
+
+    def _move_rows(self, conn, moves):
+        for old, new in moves:
+            self._delete(conn, self._normalize(old).as_posix())
+            self._upsert(conn, new)
+
+    def _rename_rows(self, conn, moves):
+        for old, new in moves:
+            old_key, new_key = self._normalize(old).as_posix(), self._normalize(new).as_posix()
+            self._delete(conn, new_key)
+            conn.execute("UPDATE docs SET path = ? WHERE path = ?", (new_key, old_key))
+
+    def move(self, moves):
+        """文件被重命名 / 归档: [(旧路径, 新路径)]"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._move_rows(conn, moves)
+
+    def rename(self, moves):
+        """内容不变、只改变位置的文件 (如归档分片打包进压缩包): 只更新路径，不重新读取与分词"""
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                self._rename_rows(conn, moves)
+
+    def update(self, synced=(), moved=(), renamed=()):
+        """
+        调度过程中的增量更新入口: 索引正被全量核对占用时不等待，先记入待办，
+        由持有索引的一方在释放前补做 (后台重建索引期间提交任务不会被阻塞)
+        """
+        with self._pending_lock:
+            self._pending.append((list(synced), list(moved), list(renamed)))
+        self._drain_pending()
+
+    def _apply_pending(self, conn):
+        while True:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            with conn:
+                for synced, moved, renamed in batch:
+                    self._rename_rows(conn, renamed)
+                    self._move_rows(conn, moved)
+                    for path in synced:
+                        self._upsert(conn, path)
+
+    def _drain_pending(self):
+        while True:
+            if not self._lock.acquire(blocking=False):
+                return
+            try:
+                self._apply_pending(self._connect())
+            finally:
+                self._lock.release()
+            # 释放前后又有其他线程记入待办时再处理一次
+            with self._pending_lock:
+                if not self._pending:
+                    return
+
+    def _walk(self, kind):
+        """产出 (路径, 压缩包内归档记录或 None)"""
+        root = self.roots[kind]
+        if kind == "archive" and self.archive_store is not None:
+            for entry in self.archive_store.bundled_entries():
+                yield self.archive_store.path_of(entry), entry
+        if not root.exists():
+            return
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames if not any(fnmatch.fnmatch(d, p) for p in self.ignore_patterns)]
+            for filename in filenames:
+                if kind != "workspace" and not filename.endswith(".md"):
+                    continue
+                if any(fnmatch.fnmatch(filename, p) for p in self.ignore_patterns):
+                    continue
+                yield Path(dirpath) / filename, None
+
+    def refresh(self, kinds=KINDS, progress=None):
+        """全量核对: 索引新增 / 修改的文件，移除已删除的文件，返回 (更新数, 删除数)。progress(已核对, 总数) 定期回调 (可抛出异常中止并回滚)"""
+        try:
+            with self._lock:
+                conn = self._connect()
+                updated = removed = checked = 0
+                # 以上次收录的文档数估算总量
+                estimate = conn.execute(
+                    f"SELECT COUNT(*) FROM docs WHERE kind IN ({','.join('?' * len(kinds))})", tuple(kinds)
+                ).fetchone()[0]
+                with conn:
+                    for kind in kinds:
+                        known = {path: (mtime, size) for path, mtime, size in
+                                 conn.execute("SELECT path, mtime, size FROM docs WHERE kind = ?", (kind,))}
+                        seen = set()
+                        for path, entry in self._walk(kind):
+                            seen.add(path.as_posix())
+                            if self._upsert(conn, path, known, entry):
+                                updated += 1
+                            checked += 1
+                            if progress and checked % PROGRESS_EVERY == 0:
+                                progress(checked, max(estimate, checked))
+                        for key in set(known) - seen:
+                            removed += self._delete(conn, key)
+                # 核对期间记入的增量更新
+                self._apply_pending(conn)
+                return updated, removed
+        finally:
+            self._drain_pending()
+
+    # ---------- 检索 ----------
+    def _match_expression(self, query):
+        """把用户输入拆成检索词: 每个词作为短语做 AND 匹配；trigram 下过短的词改为子串过滤"""
+        terms = [t for t in query.split() if t]
+        phrases, short_terms = [], []
+        for term in terms:
+            if self.trigram and len(term) < TRIGRAM_MIN_CHARS:
+                short_terms.append(term)
+            else:
+                phrases.append('"' + term.replace('"', '""') + '"')
+        return " AND ".join(phrases), short_terms
+
+    def search(self, query, task_id=None, receiver=None, status=None, kind=None, since=None, until=None,
+               limit=DEFAULT_LIMIT):
+        """
+        全文检索，返回 [SearchHit] (按相关度排序)。
+        过滤条件: task_id (精确)、receiver (前缀)、status (如 DONE / FAIL)、kind (task / archive / workspace)、
+        since / until (YYYY-MM-DD，按文件修改时间)。
+        """
+        with self._lock:
+            # 分词器 (self.trigram) 在首次连接时才从 meta 表读出，拆分检索词之前先连接
+            self._connect()
+        match, short_terms = self._match_expression(query or "")
+        where, params = [], []
+        if match:
+            where.append("fts MATCH ?")
+            params.append(match)
+        # 不足 3 个字符的词: trigram 表上的 LIKE 在部分 SQLite 版本 (如 3.40) 中恒返回空，改用 instr 逐行子串匹配
+        for term in short_terms:
+            where.append("(instr(lower(fts.body), lower(?)) > 0 OR instr(lower(fts.title), lower(?)) > 0)")
+            params.extend([term] * 2)
+        if task_id:
+            where.append("docs.task_id = ?")
+            params.append(task_id)
+        if receiver:
+            where.append("docs.receiver LIKE ?")
+            params.append(f"{receiver}%")
+        if status:
+            where.append("docs.status = ?")
+            params.append(status.strip("[]").upper())
+        if kind:
+            where.append("docs.kind = ?")
+            params.append(kind)
+        if since:
+            where.append("docs.mtime >= ?")
+            params.append(parse_date(since))
+        if until:
+            where.append("docs.mtime < ?")
+            params.append(parse_date(until, end=True))
+        order = "rank" if match else "docs.mtime DESC"
+        snippet = f"snippet(fts, 1, '【', '】', '…', {SNIPPET_TOKENS})" if match else "substr(fts.body, 1, 160)"
+        sql = (f"SELECT docs.path, docs.kind, docs.task_id, docs.receiver, docs.status, docs.mtime, {snippet} "
+               f"FROM fts JOIN docs ON docs.id = fts.rowid "
+               f"{'WHERE ' + ' AND '.join(where) if where else ''} ORDER BY {order} LIMIT ?")
+        params.append(limit)
+        with self._lock:
+            conn = self._connect()
+            try:
+                rows = conn.execute(sql, params).fetchall()
+            except sqlite3.OperationalError as e:
+                raise ValueError(f"检索表达式无效: {e}") from e
+        return [SearchHit(*row[:6], " ".join(row[6].split())) for row in rows]
+
+    def stats(self):
+        with self._lock:
+            conn = self._connect()
+            counts = dict(conn.execute("SELECT kind, COUNT(*) FROM docs GROUP BY kind").fetchall())
+        return {kind: counts.get(kind, 0) for kind in KINDS}
+
+    @classmethod
+    def from_config(cls, system_cfg, archive_store=None):
+        cfg = system_cfg.get("search") or {}
+        tree_cfg = system_cfg.get("workspace_tree") or {}
+        return cls(
+            cfg.get("db_file", DEFAULT_DB_FILE),
+            system_cfg.get("messages_dir", "MESSAGES"),
+            system_cfg.get("archive_dir", "ARCHIVE"),
+            system_cfg.get("project_space_dir", "PROJECT_SPACE"),
+            ignore_patterns=tree_cfg.get("ignore", DEFAULT_IGNORE_PATTERNS),
+            max_file_bytes=cfg.get("max_file_bytes", DEFAULT_MAX_FILE_BYTES),
+            archive_store=archive_store,
+        )
+
+
+def load_system_config():
+    """命令行独立运行时直接读取 config.yaml (不加载调度引擎)"""
+    import yaml
+    for config_file in ("config.yaml", os.path.join("SYSTEM", "config.yaml")):
+        if os.path.exists(config_file):
+            with open(config_file, "r", encoding="utf-8") as f:
+                return yaml.safe_load(f).get("system", {})
+    return {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A1_Nexus 全文检索 (任务 / 归档 / 工作区)")
+    parser.add_argument("query", nargs="?", default="", help="检索词，多个词之间为 AND 关系")
+    parser.add_argument("--id", dest="task_id", help="按任务 ID 过滤，如 ID012")
+    parser.add_argument("--receiver", help="按接收者过滤 (前缀匹配)，如 P8")
+    parser.add_argument("--status", help="按状态过滤，如 DONE / FAIL / EXPIRED")
+    parser.add_argument("--kind", choices=KINDS, help="只检索任务 / 归档 / 工作区")
+    parser.add_argument("--since", help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--until", help="截止日期 YYYY-MM-DD")
+    parser.add_argument("--limit", type=int, default=DEFAULT_LIMIT)
+    parser.add_argument("--reindex", action="store_true", help="检索前先全量核对索引 (只重新读取有变化的文件)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    system_cfg = load_system_config()
+    archive_store = ArchiveStore.from_config(system_cfg.get("archive_dir", "ARCHIVE"), system_cfg.get("archive"))
+    index = SearchIndex.from_config(system_cfg, archive_store=archive_store)
+    if args.reindex or not index.db_file.exists():
+        started = time.perf_counter()
+        updated, removed = index.refresh()
+        print(f"🔄 索引核对完成: 更新 {updated}，移除 {removed}，耗时 {time.perf_counter() - started:.2f} 秒", file=sys.stderr)
+
+    started = time.perf_counter()
+    try:
+        hits = index.search(args.query, task_id=args.task_id, receiver=args.receiver, status=args.status,
+                            kind=args.kind, since=args.since, until=args.until, limit=args.limit)
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        sys.exit(1)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    if args.json:
+        print(json.dumps({"elapsed_ms": round(elapsed_ms, 2), "hits": [h.to_dict() for h in hits]}, ensure_ascii=False, indent=2))
+        return
+    print(f"🔍 共 {len(hits)} 条结果 ({elapsed_ms:.1f} ms)")
+    for hit in hits:
+        meta = " · ".join(x for x in (hit.task_id, hit.receiver, f"[{hit.status}]" if hit.status else None, hit.to_dict()["date"]) if x)
+        print(f"\n📄 {hit.path}\n   {meta}\n   {hit.snippet}")
+
+
+if __name__ == "__main__":
+    main()
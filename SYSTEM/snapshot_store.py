@@ -0,0 +1,477 @@
+import os
+import sys
+import gzip
+import json
+import stat
+import time
+import shutil
+import fnmatch
+import hashlib
+import argparse
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import NamedTuple
+
+DEFAULT_SNAPSHOT_DIR = os.path.join("SYSTEM", "snapshots")
+OBJECTS_DIR = "objects"
+MANIFESTS_DIR = "manifests"
+INDEX_FILE = "index.json"
+DEFAULT_KEEP = 20
+DEFAULT_WORKERS = 4
+HASH_CHUNK = 1024 * 1024
+# 创建快照期间存在的标记文件；回收对象时跳过标记之后写入的对象 (清单尚未落盘)
+CREATING_MARKER = ".creating"
+# 超过该时长的标记视为进程异常退出后的残留
+STALE_MARKER_SECONDS = 24 * 3600
+
+
+class SnapshotInfo(NamedTuple):
+    id: str
+    created: float
+    label: str
+    source: str
+    files: int
+    bytes: int          # 快照中文件的总大小
+    new_files: int      # 本次新写入对象库的文件数
+    new_bytes: int      # 本次新写入对象库的字节数 (其余内容与已有快照共享)
+
+    def describe(self):
+        created = datetime.datetime.fromtimestamp(self.created).strftime("%Y-%m-%d %H:%M:%S")
+        label = f"  [{self.label}]" if self.label else ""
+        return (f"{self.id}  {created}  {self.files} 个文件 / {format_bytes(self.bytes)}"
+                f"  (新增 {self.new_files} 个 / {format_bytes(self.new_bytes)}){label}")
+
+
+def format_bytes(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class SnapshotStore:
+    """
+    工作区快照 (内容寻址、增量去重):
+    - 文件内容按 SHA-256 存入 objects/<前两位>/<哈希>，多个快照中内容相同的文件只存一份
+    - 每个快照是一份 manifests/<ID>.json.gz 清单 (相对路径 -> 哈希、大小、修改时间、权限)
+    - 创建快照时大小与修改时间未变的文件直接沿用上一个快照的哈希，不重新读取
+    - index.json 保存各快照的摘要，列出快照只读这一个文件
+    """
+    def __init__(self, root_dir=DEFAULT_SNAPSHOT_DIR, ignore_patterns=(), keep=DEFAULT_KEEP, workers=DEFAULT_WORKERS):
+        self.root_dir = Path(root_dir)
+        self.objects_dir = self.root_dir / OBJECTS_DIR
+        self.manifests_dir = self.root_dir / MANIFESTS_DIR
+        self.index_file = self.root_dir / INDEX_FILE
+        self.ignore_patterns = tuple(ignore_patterns)
+        self.keep = keep
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, cfg):
+        cfg = cfg or {}
+        return cls(
+            cfg.get("dir", DEFAULT_SNAPSHOT_DIR),
+            ignore_patterns=cfg.get("ignore", ()),
+            keep=cfg.get("keep", DEFAULT_KEEP),
+            workers=cfg.get("workers", DEFAULT_WORKERS),
+        )
+
+    # ---------- 存储 ----------
+    def _object_path(self, digest):
+        return self.objects_dir / digest[:2] / digest
+
+    def _manifest_path(self, snapshot_id):
+        return self.manifests_dir / f"{snapshot_id}.json.gz"
+
+    @staticmethod
+    def _write_atomic(path, data):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _ingest(self, src):
+        """一边计算哈希一边写入临时对象 (只读取源文件一次)，内容已存在时丢弃临时文件。返回 (哈希, 是否新写入)"""
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.objects_dir / f".ingest.{os.getpid()}.{threading.get_ident()}.tmp"
+        h = hashlib.sha256()
+        with open(src, "rb") as fin, open(tmp, "wb") as fout:
+            while True:
+                chunk = fin.read(HASH_CHUNK)
+                if not chunk:
+                    break
+                h.update(chunk)
+                fout.write(chunk)
+        digest = h.hexdigest()
+        dest = self._object_path(digest)
+        if dest.exists():
+            os.unlink(tmp)
+            # 刷新修改时间，避免与正在进行的回收竞争 (见 _gc_cutoff)
+            os.utime(dest)
+            return digest, False
+        dest.parent.mkdir(exist_ok=True)
+        os.replace(tmp, dest)
+        return digest, True
+
+    def _load_index(self):
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                return [SnapshotInfo(**item) for item in json.load(f)]
+        except (OSError, ValueError, TypeError):
+            return self._rebuild_index()
+
+    def _save_index(self, infos):
+        data = json.dumps([info._asdict() for info in infos], ensure_ascii=False, indent=1)
+        self._write_atomic(self.index_file, data.encode("utf-8"))
+
+    def _rebuild_index(self):
+        """index.json 丢失或损坏时从各快照清单重建"""
+        infos = []
+        if self.manifests_dir.exists():
+            for path in self.manifests_dir.glob("*.json.gz"):
+                try:
+                    manifest = self.load_manifest(path.name[:-len(".json.gz")])
+                except (OSError, ValueError):
+                    continue
+                infos.append(SnapshotInfo(**manifest["info"]))
+        infos.sort(key=lambda info: info.created)
+        return infos
+
+    def load_manifest(self, snapshot_id):
+        with gzip.open(self._manifest_path(snapshot_id), "rt", encoding="utf-8") as f:
+            return json.load(f)
+
+    # ---------- 创建 ----------
+    def _ignored(self, name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.ignore_patterns)
+
+    def _scan(self, source):
+        """遍历源目录，产出 (相对路径, os.DirEntry)，并收集空目录与符号链接"""
+        empty_dirs, links = [], {}
+
+        def walk(directory, rel):
+            has_children = False
+            try:
+                with os.scandir(directory) as it:
+                    items = sorted(it, key=lambda e: e.name)
+            except OSError:
+                return
+            for item in items:
+                if self._ignored(item.name):
+                    continue
+                has_children = True
+                item_rel = f"{rel}/{item.name}" if rel else item.name
+                if item.is_symlink():
+                    links[item_rel] = os.readlink(item.path)
+                elif item.is_dir():
+                    yield from walk(item.path, item_rel)
+                elif item.is_file():
+                    yield item_rel, item
+            if rel and not has_children:
+                empty_dirs.append(rel)
+
+        return walk(source, ""), empty_dirs, links
+
+    def _new_id(self, existing):
+        base = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        snapshot_id, n = base, 1
+        while snapshot_id in existing or self._manifest_path(snapshot_id).exists():
+            n += 1
+            snapshot_id = f"{base}_{n}"
+        return snapshot_id
+
+    def _previous_files(self, infos, source):
+        """同一来源最近一个快照的文件表，用于跳过未修改文件的哈希计算"""
+        for info in reversed(infos):
+            if info.source == source:
+                try:
+                    return self.load_manifest(info.id)["files"]
+                except (OSError, ValueError):
+                    return {}
+        return {}
+
+    @contextmanager
+    def _creating(self):
+        self.root_dir.mkdir(parents=True, exist_ok=True)
+        marker = self.root_dir / f"{CREATING_MARKER}.{os.getpid()}.{threading.get_ident()}"
+        marker.touch()
+        try:
+            yield
+        finally:
+            try:
+                marker.unlink()
+            except OSError:
+                pass
+
+    def _gc_cutoff(self):
+        """正在创建的快照中最早的开始时间；没有进行中的快照时为当前时间"""
+        now = time.time()
+        cutoff = now
+        for marker in self.root_dir.glob(f"{CREATING_MARKER}.*"):
+            try:
+                started = marker.stat().st_mtime
+            except OSError:
+                continue
+            if now - started < STALE_MARKER_SECONDS:
+                cutoff = min(cutoff, started)
+        return cutoff
+
+    def create(self, source, label="", progress=None):
+        """为源目录创建快照，返回 SnapshotInfo。progress(已处理, 总数) 在写入新内容时回调 (可抛出异常中止)"""
+        source = Path(source)
+        if not source.is_dir():
+            raise FileNotFoundError(f"快照源目录不存在: {source}")
+        source_key = source.resolve().as_posix()
+        with self._lock, self._creating():
+            infos = self._load_index()
+            previous = self._previous_files(infos, source_key)
+            files = {}
+            pending = []
+            total = new_files = new_bytes = 0
+            entries, empty_dirs, links = self._scan(source)
+            for rel, item in entries:
+                st = item.stat()
+                old = previous.get(rel)
+                if old and old[1] == st.st_size and old[2] == st.st_mtime_ns and self._object_path(old[0]).exists():
+                    files[rel] = [old[0], st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode)]
+                else:
+                    files[rel] = None
+                    pending.append((rel, item.path, st))
+                total += st.st_size
+
+            # 新增 / 修改的文件并行计算哈希并写入对象库 (哈希与文件读写都会释放 GIL)
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                results = pool.map(lambda p: self._ingest(p[1]), pending)
+                try:
+                    for i, ((rel, _, st), (digest, is_new)) in enumerate(zip(pending, results)):
+                        files[rel] = [digest, st.st_size, st.st_mtime_ns, stat.S_IMODE(st.st_mode)]
+                        if is_new:
+                            new_files += 1
+                            new_bytes += st.st_size
+                        if progress:
+                            progress(i + 1, len(pending))
+                except BaseException:
+                    # 中止时不再启动尚未开始的写入；已写入的对象没有清单引用，下次 prune 时回收
+                    pool.shutdown(wait=True, cancel_futures=True)
+                    raise
+
+            info = SnapshotInfo(self._new_id({i.id for i in infos}), time.time(), label, source_key,
+                                len(files), total, new_files, new_bytes)
+            manifest = {"info": info._asdict(), "files": files, "empty_dirs": empty_dirs, "links": links}
+            self._write_atomic(self._manifest_path(info.id),
+                               gzip.compress(json.dumps(manifest, ensure_ascii=False).encode("utf-8"), compresslevel=6))
+            infos.append(info)
+            self._save_index(infos)
+            return info
+
+    # ---------- 查询 ----------
+    def list(self):
+        """按创建时间排列的快照摘要 (只读取 index.json)"""
+        with self._lock:
+            return self._load_index()
+
+    def get(self, snapshot_id):
+        for info in self.list():
+            if info.id == snapshot_id:
+                return info
+        return None
+
+    def latest(self):
+        infos = self.list()
+        return infos[-1] if infos else None
+
+    # ---------- 恢复 ----------
+    def restore(self, snapshot_id, target=None, clean=False, progress=None):
+        """
+        把快照恢复到 target (默认恢复到快照来源目录)。
+        与快照一致的文件 (大小、修改时间相同) 不会重写；clean=True 时删除快照中不存在的文件。
+        返回 (写入数, 未变化数, 删除数)；progress(已处理, 总数) 逐文件回调
+        """
+        manifest = self.load_manifest(snapshot_id)
+        target = Path(target or manifest["info"]["source"])
+        target.mkdir(parents=True, exist_ok=True)
+        written = unchanged = removed = 0
+        total = len(manifest["files"])
+        for i, (rel, (digest, size, mtime_ns, mode)) in enumerate(manifest["files"].items()):
+            if progress and i % 100 == 0:
+                progress(i, total)
+            dest = target / rel
+            try:
+                st = os.lstat(dest)
+                if stat.S_ISREG(st.st_mode) and st.st_size == size and st.st_mtime_ns == mtime_ns:
+                    unchanged += 1
+                    continue
+            except OSError:
+                pass
+            obj = self._object_path(digest)
+            if not obj.exists():
+                raise FileNotFoundError(f"快照 {snapshot_id} 引用的对象已丢失: {digest} ({rel})")
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            tmp = dest.with_name(f".{dest.name}.restore.tmp")
+            shutil.copyfile(obj, tmp)
+            os.chmod(tmp, mode)
+            os.utime(tmp, ns=(mtime_ns, mtime_ns))
+            if os.path.islink(dest) or os.path.isdir(dest):
+                self._remove(dest)
+            os.replace(tmp, dest)
+            written += 1
+        for rel in manifest.get("empty_dirs", []):
+            (target / rel).mkdir(parents=True, exist_ok=True)
+        for rel, link_target in manifest.get("links", {}).items():
+            dest = target / rel
+            if os.path.lexists(dest):
+                if os.path.islink(dest) and os.readlink(dest) == link_target:
+                    continue
+                self._remove(dest)
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            os.symlink(link_target, dest)
+            written += 1
+        if clean:
+            removed = self._remove_extra(target, manifest)
+        return written, unchanged, removed
+
+    @staticmethod
+    def _remove(path):
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+
+    def _remove_extra(self, target, manifest):
+        keep = set(manifest["files"]) | set(manifest.get("links", {}))
+        keep_dirs = set(manifest.get("empty_dirs", []))
+        for rel in keep | keep_dirs:
+            parts = rel.split("/")
+            keep_dirs.update("/".join(parts[:i]) for i in range(1, len(parts)))
+        removed = 0
+        visited = []
+        for dirpath, dirnames, filenames in os.walk(target):
+            rel_dir = Path(dirpath).relative_to(target).as_posix()
+            rel_dir = "" if rel_dir == "." else rel_dir
+            # 被忽略的目录 (如 node_modules) 不在快照中，也不删除
+            dirnames[:] = [d for d in dirnames if not self._ignored(d)]
+            links = [d for d in dirnames if os.path.islink(os.path.join(dirpath, d))]
+            dirnames[:] = [d for d in dirnames if d not in links]
+            for name in filenames + links:
+                rel = f"{rel_dir}/{name}" if rel_dir else name
+                if rel not in keep and not self._ignored(name):
+                    os.unlink(os.path.join(dirpath, name))
+                    removed += 1
+            if rel_dir and rel_dir not in keep_dirs:
+                visited.append(dirpath)
+        for dirpath in reversed(visited):
+            if not os.listdir(dirpath):
+                os.rmdir(dirpath)
+        return removed
+
+    # ---------- 清理 ----------
+    def prune(self, keep=None, snapshot_ids=()):
+        """
+        删除指定的快照，或只保留最近 keep 个快照，并回收不再被任何快照引用的对象。
+        返回 (删除的快照数, 回收的对象数, 释放的字节数)
+        """
+        keep = self.keep if keep is None else keep
+        with self._lock:
+            infos = self._load_index()
+            drop = {i.id for i in infos if i.id in set(snapshot_ids)}
+            if not snapshot_ids and keep is not None and len(infos) > keep:
+                drop = {i.id for i in infos[:len(infos) - keep]}
+            remaining = [i for i in infos if i.id not in drop]
+            self._save_index(remaining)
+            for snapshot_id in drop:
+                try:
+                    self._manifest_path(snapshot_id).unlink()
+                except OSError:
+                    pass
+            objects, freed = self._collect_garbage(remaining)
+            return len(drop), objects, freed
+
+    def _collect_garbage(self, infos):
+        referenced = set()
+        for info in infos:
+            try:
+                referenced.update(entry[0] for entry in self.load_manifest(info.id)["files"].values())
+            except (OSError, ValueError):
+                # 清单无法读取时不回收任何对象，避免误删
+                return 0, 0
+        cutoff = self._gc_cutoff()
+        objects = freed = 0
+        if not self.objects_dir.exists():
+            return 0, 0
+        for bucket in os.scandir(self.objects_dir):
+            if not bucket.is_dir():
+                # 中断的写入留下的临时文件
+                if bucket.name.startswith(".ingest.") and bucket.stat().st_mtime <= cutoff:
+                    os.unlink(bucket.path)
+                continue
+            for obj in os.scandir(bucket.path):
+                if obj.name in referenced:
+                    continue
+                st = obj.stat()
+                if st.st_mtime >= cutoff:
+                    continue
+                os.unlink(obj.path)
+                objects += 1
+                freed += st.st_size
+        return objects, freed
+
+    def disk_usage(self):
+        """对象库实际占用的字节数"""
+        total = 0
+        if self.objects_dir.exists():
+            for dirpath, _, filenames in os.walk(self.objects_dir):
+                total += sum(os.path.getsize(os.path.join(dirpath, name)) for name in filenames)
+        return total
+
+
+def main():
+    from search_index import load_system_config
+
+    parser = argparse.ArgumentParser(description="A1_Nexus 工作区快照 (内容寻址、增量去重)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="列出快照")
+    create_p = sub.add_parser("create", help="为 PROJECT_SPACE (或指定目录) 创建快照")
+    create_p.add_argument("--source", help="快照来源目录，默认 PROJECT_SPACE")
+    create_p.add_argument("--label", default="", help="快照备注")
+    restore_p = sub.add_parser("restore", help="恢复快照")
+    restore_p.add_argument("snapshot_id", help="快照 ID，latest 表示最近一个")
+    restore_p.add_argument("--target", help="恢复到指定目录，默认恢复到快照来源目录")
+    restore_p.add_argument("--clean", action="store_true", help="删除目标目录中快照里不存在的文件")
+    prune_p = sub.add_parser("prune", help="删除旧快照并回收无引用的对象")
+    prune_p.add_argument("--keep", type=int, help="保留最近的快照数 (默认取 system.snapshots.keep)")
+    prune_p.add_argument("snapshot_ids", nargs="*", help="要删除的快照 ID (指定后忽略 --keep)")
+    args = parser.parse_args()
+
+    system_cfg = load_system_config()
+    store = SnapshotStore.from_config(system_cfg.get("snapshots"))
+    if args.command == "list":
+        infos = store.list()
+        for info in infos:
+            print(info.describe())
+        print(f"共 {len(infos)} 个快照，对象库占用 {format_bytes(store.disk_usage())}")
+    elif args.command == "create":
+        source = args.source or system_cfg.get("project_space_dir", "PROJECT_SPACE")
+        info = store.create(source, label=args.label)
+        print(f"[成功] 已创建快照 {info.describe()}")
+    elif args.command == "restore":
+        snapshot_id = args.snapshot_id
+        if snapshot_id == "latest":
+            latest = store.latest()
+            if latest is None:
+                print("[错误] 没有可恢复的快照")
+                sys.exit(1)
+            snapshot_id = latest.id
+        written, unchanged, removed = store.restore(snapshot_id, target=args.target, clean=args.clean)
+        print(f"[成功] 已恢复快照 {snapshot_id}: 写入 {written} 个，未变化 {unchanged} 个，删除 {removed} 个")
+    elif args.command == "prune":
+        dropped, objects, freed = store.prune(keep=args.keep, snapshot_ids=args.snapshot_ids)
+        print(f"[成功] 删除 {dropped} 个快照，回收 {objects} 个对象 ({format_bytes(freed)})")
+
+
+if __name__ == "__main__":
+    main()
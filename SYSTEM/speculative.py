@@ -0,0 +1,184 @@
+import re
+import time
+import hashlib
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from upstream_context import summarize_result, TITLE_RE
+
+# 任务头部声明允许预执行: **SPECULATIVE: OK**
+SPECULATIVE_RE = re.compile(r'SPECULATIVE:\s*OK\b', re.IGNORECASE)
+# 预执行结果中声明的对上游产出的依赖: ASSUMES: src/api.py, UserService
+ASSUMES_RE = re.compile(r'^[ \t>*`]*ASSUMES:\s*(.+?)[ \t*`]*$', re.MULTILINE)
+ASSUMPTION_SPLIT_RE = re.compile(r'[,，、;；]')
+
+DEFAULT_MAX_PARALLEL = 2
+PREDICTED_SUMMARY_CHARS = 800
+
+ASSUMPTION_INSTRUCTION = """========== 预执行说明 ==========
+上游任务 {upstream_id} 仍在执行中，上文中它的摘要是预测值，最终产出可能不同。
+请在回复最后单独一行写出你的产出所依赖的上游具体产出 (文件路径、函数名、接口名、配置键等)：
+ASSUMES: 名称1, 名称2
+系统会在上游完成后逐一核对，任何一项不在上游的最终产出中，本次结果都会作废并在上游完成后重新执行；
+没有写出可核对的 ASSUMES 时，本次结果同样作废。
+"""
+
+
+def wants_speculation(task_text):
+    return bool(SPECULATIVE_RE.search(task_text or ""))
+
+
+def summary_hash(summary):
+    """与 UpstreamContext.record_summary 相同的摘要哈希"""
+    return hashlib.sha256(summary.encode("utf-8")).hexdigest()[:16]
+
+
+def predicted_record(task, task_text, previous=None):
+    """
+    预执行时上游任务的预测摘要: 该任务已有摘要 (如被打回后重跑) 时沿用，
+    否则以其任务要求代替；最终摘要哈希与预测一致时预执行结果可直接提交。
+    """
+    if previous:
+        return dict(previous)
+    title_match = TITLE_RE.search(task_text or "")
+    summary = ("(上游任务仍在执行，以下为其任务要求，实际产出以最终结果为准)\n"
+               + summarize_result(task_text or "", PREDICTED_SUMMARY_CHARS))
+    return {
+        "id": task["id"],
+        "receiver": task["receiver"],
+        "title": title_match.group(1).strip() if title_match else "",
+        "depends_on": list(task["depends_on"]),
+        "summary": summary,
+        "hash": summary_hash(summary),
+    }
+
+
+def declared_assumptions(text):
+    """提取回复中最后一个 ASSUMES 声明的各项"""
+    matches = ASSUMES_RE.findall(text or "")
+    if not matches:
+        return []
+    items = (item.strip(" `*\"'") for item in ASSUMPTION_SPLIT_RE.split(matches[-1]))
+    return [item for item in items if item and item.upper() != "NONE"]
+
+
+def validate(run, final_hash, final_output, dry_run=None):
+    """
+    用上游的最终产出校验预执行结果，返回 (是否提交, 说明)。
+    依次检查: 调用是否成功 -> 补丁能否应用到上游最终文件 -> 摘要哈希 -> ASSUMES 声明的各项是否出现在上游产出中。
+    摘要哈希不一致且没有可核对的 ASSUMES 声明 (未写或只写 NONE) 时无法确认结果成立，一律作废重跑。
+    """
+    if run.error is not None:
+        return False, f"预执行调用失败: {run.error}"
+    if not run.response_text:
+        return False, "预执行没有返回内容"
+    if dry_run is not None and dry_run.failed_patches:
+        return False, f"补丁无法应用到上游最终产出: {', '.join(dry_run.failed_patches)}"
+    if run.predicted_hash and run.predicted_hash == final_hash:
+        return True, "上游摘要哈希与预测一致"
+    assumptions = declared_assumptions(run.response_text)
+    missing = [a for a in assumptions if a not in final_output]
+    if not assumptions:
+        return False, "上游摘要与预测不一致，且未声明可核对的上游依赖 (ASSUMES)"
+    if missing:
+        return False, f"上游最终产出中没有: {', '.join(missing)}"
+    return True, f"{len(assumptions)} 项上游依赖均已核对"
+
+
+class SpeculativeRun:
+    """一次预执行: 下游任务在上游流式输出开始后提前发起的模型调用"""
+    def __init__(self, task, upstream_id, predicted_hash):
+        self.task = task
+        self.upstream_id = upstream_id
+        self.predicted_hash = predicted_hash
+        self.task_content = ""
+        self.system_prompt = ""
+        self.base_dirs = []
+        self.response_text = ""
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.trace_id = None
+        self.error = None
+        self.started = None
+        self.ended = None
+        self.future = None
+
+    @property
+    def llm_seconds(self):
+        if self.started is None or self.ended is None:
+            return 0.0
+        return self.ended - self.started
+
+
+class SpeculationStats:
+    """预执行的累计收益与成本"""
+    def __init__(self):
+        self.launched = 0
+        self.committed = 0
+        self.discarded = 0
+        self.saved_seconds = 0.0     # 已提交的预执行与上游重叠、从关键路径上省下的时间
+        self.wasted_tokens = 0       # 被作废的预执行消耗的 Token (估算)
+
+    def to_dict(self):
+        return {
+            "launched": self.launched,
+            "committed": self.committed,
+            "discarded": self.discarded,
+            "saved_seconds": round(self.saved_seconds, 3),
+            "wasted_tokens": self.wasted_tokens,
+        }
+
+    def summary_line(self):
+        return (f"预执行累计: 发起 {self.launched}，提交 {self.committed}，作废 {self.discarded}，"
+                f"节省约 {self.saved_seconds:.1f} 秒，浪费约 {self.wasted_tokens} Token")
+
+
+class Speculator:
+    """
+    预执行调度器: 在后台线程池中运行下游任务的模型调用，
+    上游完成后由引擎逐个校验，结算节省的时间与浪费的 Token。
+    """
+    def __init__(self, max_parallel=DEFAULT_MAX_PARALLEL):
+        self.max_parallel = max(1, max_parallel)
+        self.stats = SpeculationStats()
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.max_parallel, thread_name_prefix="speculative")
+            return self._pool
+
+    @staticmethod
+    def _run(run, fn):
+        run.started = time.perf_counter()
+        try:
+            fn(run)
+        except Exception as e:
+            run.error = e
+        finally:
+            run.ended = time.perf_counter()
+
+    def launch(self, run, fn):
+        """在后台发起预执行，fn(run) 负责组装提示词并调用模型，把结果写回 run"""
+        context = contextvars.copy_context()
+        run.future = self._executor().submit(context.run, self._run, run, fn)
+        with self._lock:
+            self.stats.launched += 1
+        return run
+
+    def settle(self, run, committed, upstream_end):
+        """结算一次预执行，返回本次节省的秒数"""
+        with self._lock:
+            if not committed:
+                self.stats.discarded += 1
+                self.stats.wasted_tokens += run.prompt_tokens + run.completion_tokens
+                return 0.0
+            # 不预执行时，上游完成后还要完整等待一次下游调用；预执行后只需等待其剩余部分
+            remaining = max(0.0, (run.ended or upstream_end) - upstream_end)
+            saved = max(0.0, run.llm_seconds - remaining)
+            self.stats.committed += 1
+            self.stats.saved_seconds += saved
+            return saved
@@ -0,0 +1,274 @@
+import os
+import re
+import json
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+import task_parser
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# 批次内的符号依赖: "T2" / "#2" / "2" / "第2个"
+SYMBOLIC_REF_RE = re.compile(r'^(?:T|#|第)?\s*(\d+)\s*(?:个)?$', re.IGNORECASE)
+INVALID_FILENAME_CHARS_RE = re.compile(r'[\\/:*?"<>|\[\]\s]+')
+ID_STATE_FILE = ".id_allocator.json"
+ID_LOCK_FILE = ".id_allocator.lock"
+
+
+class TaskSpecError(ValueError):
+    """批量创建任务时的参数错误 (未知依赖 / 循环依赖 / ID 冲突等)"""
+
+
+class IdAllocator:
+    """
+    持久化、加锁的任务 ID 分配器。
+    已分配的最大编号记录在 MESSAGES/.id_allocator.json 中，每次分配时再与 MESSAGES 与 ARCHIVE
+    中实际存在的最大 ID 取较大值，因此手工放入的任务或已归档的任务都不会被重复使用。
+    进程内用线程锁、进程间用文件锁保证并发的 Web UI 请求拿到不同的 ID。
+    使用分片归档 (archive_store) 时，已归档的 ID 直接取自归档清单，不再遍历分片与压缩包。
+    """
+    _thread_lock = threading.Lock()
+
+    def __init__(self, messages_dir, archive_dir, archive_store=None):
+        self.messages_dir = Path(messages_dir)
+        self.archive_dir = Path(archive_dir)
+        self.archive_store = archive_store
+        self.state_file = self.messages_dir / ID_STATE_FILE
+        self.lock_file = self.messages_dir / ID_LOCK_FILE
+
+    @contextmanager
+    def locked(self):
+        """同时持有线程锁与跨进程文件锁"""
+        with self._thread_lock:
+            self.messages_dir.mkdir(exist_ok=True)
+            with open(self.lock_file, "a+b") as f:
+                if fcntl:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                else:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                try:
+                    yield
+                finally:
+                    if fcntl:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+                    else:
+                        f.seek(0)
+                        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def existing_ids(self):
+        """MESSAGES 与 ARCHIVE (含子目录) 中已被任务文件占用的 ID 集合"""
+        ids = set()
+        if self.archive_store is not None:
+            ids.update(self.archive_store.task_ids())
+        for directory in (self.messages_dir, self.archive_dir):
+            if not directory.exists():
+                continue
+            for dirpath, dirnames, filenames in os.walk(directory):
+                if self.archive_store is not None and Path(dirpath) == self.archive_dir:
+                    # 分片与压缩包中的任务已登记在清单里
+                    dirnames[:] = [d for d in dirnames if not self.archive_store.is_managed_dir(d)]
+                for filename in filenames:
+                    if filename.endswith(".md"):
+                        task_id = task_parser.extract_task_id(filename)
+                        if task_id:
+                            ids.add(task_id)
+        return ids
+
+    @staticmethod
+    def _max_number(ids):
+        return max((int(t[2:]) for t in ids if t[2:].isdigit()), default=0)
+
+    def _read_state(self):
+        try:
+            with open(self.state_file, "r", encoding="utf-8") as f:
+                return int(json.load(f).get("last_id", 0))
+        except (OSError, ValueError, AttributeError):
+            return 0
+
+    def _write_state(self, last_id):
+        tmp_path = self.state_file.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"last_id": last_id}, f)
+        tmp_path.replace(self.state_file)
+
+    def allocate_unlocked(self, count=1, existing=None, persist=True):
+        """
+        在已持有 locked() 时分配 count 个连续 ID；existing 为已扫描的 ID 集合 (省略时重新扫描)。
+        persist=False 时只预留不落盘，由调用方在写入成功后调用 commit()。
+        """
+        if existing is None:
+            existing = self.existing_ids()
+        start = max(self._read_state(), self._max_number(existing)) + 1
+        ids = [f"ID{n:03d}" for n in range(start, start + count)]
+        if count and persist:
+            self._write_state(start + count - 1)
+        return ids
+
+    def commit(self, ids):
+        """记录已实际使用的最大 ID (需持有 locked())"""
+        last = self._max_number(ids)
+        if last > self._read_state():
+            self._write_state(last)
+
+    def allocate(self, count=1):
+        with self.locked():
+            return self.allocate_unlocked(count)
+
+
+def short_description(text, limit=10):
+    """从任务描述生成文件名中的简述 (去除文件名非法字符)"""
+    first_line = text.strip().split("\n")[0]
+    return INVALID_FILENAME_CHARS_RE.sub("_", first_line[:limit]).strip("_") or "任务"
+
+
+def render_task(description, depends_on, extra_headers=None):
+    """生成任务文件正文 (与手工创建的任务格式一致)"""
+    deps_str = ", ".join(depends_on) if depends_on else "NONE"
+    headers = "".join(f"**{k}: {v}**\n" for k, v in (extra_headers or {}).items())
+    return f"""# 任务目标：{description.strip().split(chr(10))[0]}
+
+**DEPENDS_ON: {deps_str}**
+{headers}
+## 详细要求
+{description}
+"""
+
+
+class TaskFactory:
+    """
+    批量创建任务: 一次加锁分配整批 ID，把批次内的符号依赖 (ref / 序号) 映射为真实 ID，
+    校验未知依赖与循环依赖后，先写临时文件再逐个重命名，一次性落盘。
+    """
+    def __init__(self, messages_dir, archive_dir, archive_store=None):
+        self.messages_dir = Path(messages_dir)
+        self.allocator = IdAllocator(messages_dir, archive_dir, archive_store)
+
+    @staticmethod
+    def _split_deps(depends_on):
+        if not depends_on:
+            return []
+        if isinstance(depends_on, str):
+            depends_on = depends_on.split(",")
+        deps = []
+        for d in depends_on:
+            d = str(d).strip(" *")
+            if d and d.upper() != "NONE":
+                deps.append(d)
+        return deps
+
+    def _resolve_refs(self, specs, ids, existing, legacy_batch_ids=False):
+        """
+        把每个任务的依赖解析为真实 ID 列表。
+        legacy_batch_ids=True 时 (仅用于模型拆解出的方案)，不存在的 IDnnn 按批次内第 n 个任务解析。
+        """
+        by_ref = {}
+        for i, spec in enumerate(specs):
+            for key in ("ref", "key", "id"):
+                if spec.get(key):
+                    by_ref[str(spec[key]).strip()] = ids[i]
+        resolved = []
+        for i, spec in enumerate(specs):
+            deps = []
+            for dep in self._split_deps(spec.get("depends_on")):
+                if dep in by_ref:
+                    deps.append(by_ref[dep])
+                    continue
+                symbolic = SYMBOLIC_REF_RE.match(dep)
+                if symbolic and 1 <= int(symbolic.group(1)) <= len(specs):
+                    deps.append(ids[int(symbolic.group(1)) - 1])
+                    continue
+                if task_parser.TASK_ID_RE.fullmatch(dep):
+                    if dep in existing:
+                        deps.append(dep)
+                        continue
+                    # 兼容旧提示词: 模型按批次内顺序从 ID001 开始编号
+                    n = int(dep[2:])
+                    if legacy_batch_ids and 1 <= n <= len(specs):
+                        deps.append(ids[n - 1])
+                        continue
+                raise TaskSpecError(f"第 {i + 1} 个任务的依赖 {dep} 既不是已有任务，也不是本批次中的任务")
+            if ids[i] in deps:
+                raise TaskSpecError(f"第 {i + 1} 个任务依赖了自身")
+            resolved.append(list(dict.fromkeys(deps)))
+        return resolved
+
+    @staticmethod
+    def _check_cycles(ids, resolved):
+        """批次内的依赖必须构成 DAG"""
+        graph = dict(zip(ids, resolved))
+        state = {}
+
+        def visit(node, path):
+            if state.get(node) == 1:
+                raise TaskSpecError(f"检测到循环依赖: {' -> '.join(path + [node])}")
+            if state.get(node) == 2 or node not in graph:
+                return
+            state[node] = 1
+            for dep in graph[node]:
+                visit(dep, path + [node])
+            state[node] = 2
+
+        for node in ids:
+            visit(node, [])
+
+    def create_tasks(self, specs, sender="P1", legacy_batch_ids=False):
+        """
+        批量创建任务，specs 为 dict 列表:
+        {"receiver", "description", "depends_on" (列表或逗号分隔字符串), "ref" (可选，批次内引用名),
+         "id" (可选，显式指定 ID), "headers" (可选，额外头部字段), "name" (可选，文件名中的简述，不截断)}
+        legacy_batch_ids 见 _resolve_refs；API / 命令行提交保持 False，依赖了不存在的 ID 时直接报错。
+        返回 [(任务 ID, 文件名)]，失败时抛出 TaskSpecError 且不会写入任何文件。
+        """
+        if not specs:
+            return []
+        for i, spec in enumerate(specs):
+            if not spec.get("receiver") or not spec.get("description"):
+                raise TaskSpecError(f"第 {i + 1} 个任务缺少 receiver 或 description")
+
+        with self.allocator.locked():
+            existing = self.allocator.existing_ids()
+            explicit = [spec.get("id") if spec.get("id") and task_parser.TASK_ID_RE.fullmatch(str(spec["id"])) else None
+                        for spec in specs]
+            for task_id in explicit:
+                if task_id and task_id in existing:
+                    raise TaskSpecError(f"任务 ID {task_id} 已存在")
+            if len(set(t for t in explicit if t)) != len([t for t in explicit if t]):
+                raise TaskSpecError("批次内存在重复的任务 ID")
+            ids = list(explicit)
+            missing = [i for i, t in enumerate(ids) if not t]
+            if missing:
+                # 新分配的 ID 从显式 ID 与现有 ID 的最大值之后开始，避免与本批次的显式 ID 冲突
+                fresh = self.allocator.allocate_unlocked(len(missing), existing | set(t for t in explicit if t), persist=False)
+                for i, task_id in zip(missing, fresh):
+                    ids[i] = task_id
+
+            resolved = self._resolve_refs(specs, ids, existing, legacy_batch_ids)
+            self._check_cycles(ids, resolved)
+
+            staged = []
+            try:
+                for spec, task_id, deps in zip(specs, ids, resolved):
+                    name = short_description(spec["name"], limit=len(spec["name"])) if spec.get("name") else short_description(spec["description"])
+                    filename = f"[NEW]{sender}_TO_{spec['receiver']}_{task_id}_{name}.md"
+                    tmp_path = self.messages_dir / f".{task_id}.tmp"
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        f.write(render_task(spec["description"], deps, spec.get("headers")))
+                    staged.append((tmp_path, self.messages_dir / filename, task_id))
+            except OSError:
+                for tmp_path, _, _ in staged:
+                    try:
+                        tmp_path.unlink()
+                    except OSError:
+                        pass
+                raise
+            for tmp_path, target, _ in staged:
+                os.replace(tmp_path, target)
+            # 校验与写入都成功后才推进分配器，失败的批次不会消耗 ID
+            self.allocator.commit(ids)
+        return [(task_id, target.name) for _, target, task_id in staged]
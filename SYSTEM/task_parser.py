@@ -0,0 +1,113 @@
+import re
+from typing import NamedTuple, Optional, List
+
+# 任务文件名协议: [状态]发送者_TO_接收者_ID_简述[+N].md
+# 优先按 ID 切分 (接收者名中允许出现下划线，如 P8_技术主管)，没有 ID 时回退到旧的宽松格式
+TASK_FILENAME_WITH_ID_RE = re.compile(r'^(?:\[(.*?)\])?(.*?)_TO_(.*?)_(ID\d+)(.*)$')
+TASK_FILENAME_RE = re.compile(r'^(?:\[(.*?)\])?(.*?)_TO_(.*?)_(.*)$')
+TASK_ID_RE = re.compile(r'(ID\d+)')
+STATUS_TAG_RE = re.compile(r'^\[.*?\]')
+DEPENDS_ON_RE = re.compile(r'DEPENDS_ON:\s*([^\n]+)')
+
+# 调度只需要文件头部的元数据 (DEPENDS_ON 等)，读取的字节数上限
+HEADER_READ_BYTES = 4096
+FALLBACK_ENCODINGS = ("utf-8", "gbk")
+
+
+class TaskName(NamedTuple):
+    """从文件名中解析出的任务元数据"""
+    status: Optional[str]   # 不含方括号，如 "NEW"；文件名没有状态标签时为 None
+    sender: str
+    receiver: str
+    task_id: str
+    rest: str               # ID 之后的部分 (简述 / +N 标记)
+
+
+class TaskHeader(NamedTuple):
+    """从文件头部读取的调度元数据"""
+    depends_on: List[str]
+    encoding: str
+
+
+def parse_task_filename(filename):
+    """解析任务文件名，不符合命名协议时返回 None"""
+    match = TASK_FILENAME_WITH_ID_RE.match(filename)
+    if match:
+        status, sender, receiver, task_id, rest = match.groups()
+        return TaskName(status, sender, receiver, task_id, rest.lstrip("_"))
+
+    match = TASK_FILENAME_RE.match(filename)
+    if not match:
+        return None
+    status, sender, receiver, rest = match.groups()
+    # 兼容不带 IDxxx 的旧文件名: 取剩余部分的第一段作为 ID
+    id_match = TASK_ID_RE.search(rest)
+    task_id = id_match.group(1) if id_match else rest.split('_')[0]
+    return TaskName(status, sender, receiver, task_id, rest)
+
+
+def extract_task_id(filename):
+    """仅提取任务 ID (用于归档扫描)，不符合命名协议时返回 None"""
+    name = parse_task_filename(filename)
+    return name.task_id if name else None
+
+
+def with_status(filename, status):
+    """替换文件名开头的状态标签，如果没有状态标签则添加"""
+    if STATUS_TAG_RE.match(filename):
+        return STATUS_TAG_RE.sub(f"[{status}]", filename, count=1)
+    return f"[{status}]{filename}"
+
+
+def parse_depends_on(text):
+    """提取依赖声明: DEPENDS_ON: ID001, ID002 (去除空格和星号，忽略 NONE)"""
+    deps_match = DEPENDS_ON_RE.search(text)
+    if not deps_match:
+        return []
+    deps = []
+    for d in deps_match.group(1).split(","):
+        d = d.strip(" *")
+        if d and d.upper() != "NONE":
+            deps.append(d)
+    return deps
+
+
+def decode_task_bytes(data, truncated=False):
+    """
+    按 UTF-8 -> GBK 的顺序解码，返回 (文本, 编码)。
+    truncated=True 表示 data 只是文件前缀，末尾被截断的多字节字符会被丢弃而不是视为解码失败。
+    """
+    last_error = None
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            return data.decode(encoding), encoding
+        except UnicodeDecodeError as e:
+            # 截断位置恰好落在多字节字符中间 (UTF-8 最多 4 字节)
+            if truncated and e.start >= len(data) - 3:
+                try:
+                    return data[:e.start].decode(encoding), encoding
+                except UnicodeDecodeError as inner:
+                    last_error = inner
+                    continue
+            last_error = e
+    raise last_error
+
+
+def read_task_header(file_path, limit=HEADER_READ_BYTES):
+    """只读取文件开头 limit 个字节，解析调度所需的头部元数据"""
+    with open(file_path, "rb") as f:
+        data = f.read(limit + 1)
+    truncated = len(data) > limit
+    text, encoding = decode_task_bytes(data[:limit], truncated=truncated)
+    return TaskHeader(parse_depends_on(text), encoding)
+
+
+def read_task_body(file_path, encoding="utf-8"):
+    """读取任务文件全文 (仅在真正执行任务时调用)"""
+    with open(file_path, "rb") as f:
+        data = f.read()
+    try:
+        return data.decode(encoding)
+    except UnicodeDecodeError:
+        # 头部前缀不足以判定编码时，以全文重新探测
+        return decode_task_bytes(data)[0]
@@ -0,0 +1,347 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from nexus_trace import tracer
+from nexus_core import DEFAULT_PROJECT
+from work_history import record_work_history
+
+DEFAULT_WORKERS = 1
+# 没有任务完成或提交时，重新扫描看板的间隔 (秒)
+DEFAULT_POLL_INTERVAL = 1.0
+# 项目配额默认值 (system.quota)
+DEFAULT_WEIGHT = 1
+DEFAULT_MAX_CONCURRENT = 0       # 同时执行的任务数上限，0 为不限
+DEFAULT_MAX_TASKS_PER_HOUR = 0   # 每小时最多开始执行的任务数，0 为不限
+QUOTA_WINDOW_SECONDS = 3600
+
+
+def quota_from_config(system_cfg):
+    """system.quota -> (权重, 并发上限, 每小时任务数上限)"""
+    quota = (system_cfg or {}).get("quota") or {}
+    return (
+        max(float(quota.get("weight") or DEFAULT_WEIGHT), 0.01),
+        int(quota.get("max_concurrent") or DEFAULT_MAX_CONCURRENT),
+        int(quota.get("max_tasks_per_hour") or DEFAULT_MAX_TASKS_PER_HOUR),
+    )
+
+
+class ProjectSlot:
+    """调度器中的一个项目: 引擎、配额与公平调度用的虚拟时间"""
+    def __init__(self, name, engine, weight=DEFAULT_WEIGHT, max_concurrent=DEFAULT_MAX_CONCURRENT,
+                 max_tasks_per_hour=DEFAULT_MAX_TASKS_PER_HOUR):
+        self.name = name
+        self.engine = engine
+        self.weight = weight
+        self.max_concurrent = max_concurrent
+        self.max_tasks_per_hour = max_tasks_per_hour
+        self.vtime = 0.0          # 每派发一个任务前进 1 / weight，虚拟时间最小的项目优先
+        self.inflight = 0
+        self.started = deque()    # 最近一小时内开始执行的时间
+        self.executed = 0
+        self.failed = 0
+        self.backlogged = False   # 上一轮是否有待派发或执行中的任务
+        self.throttled = False
+        self.stopped = False
+        self.tasks = []
+
+    def has_quota(self, now):
+        if self.max_concurrent and self.inflight >= self.max_concurrent:
+            return False
+        if self.max_tasks_per_hour:
+            while self.started and now - self.started[0] >= QUOTA_WINDOW_SECONDS:
+                self.started.popleft()
+            if len(self.started) >= self.max_tasks_per_hour:
+                return False
+        return True
+
+    def to_dict(self):
+        return {
+            "weight": self.weight,
+            "max_concurrent": self.max_concurrent,
+            "max_tasks_per_hour": self.max_tasks_per_hour,
+            "inflight": self.inflight,
+            "started_last_hour": len(self.started),
+            "executed": self.executed,
+            "failed": self.failed,
+            "throttled": self.throttled,
+            "stopped": self.stopped,
+        }
+
+
+class TaskRunner:
+    """
+    并行调度: 一个调度线程挑选可执行任务，交给至多 workers 个执行线程调用 engine.execute_task。
+    - 同一任务不会被重复派发 (执行中的任务记在 engine._busy_ids 中)
+    - 任务完成、失败或有新任务提交 (wake) 时立即重新调度，否则每 poll_interval 秒扫描一次看板
+    - 可用 add_project 托管多个项目: 按权重公平分配执行线程 (stride 调度)，并遵守各项目的并发与每小时配额；
+      某个项目出现停止信号时只暂停该项目
+    - 任务因环境问题 (API Key / 模型配置、服务不可达、限流) 失败，或失败次数未能记录时暂停该项目，
+      任务保持 [NEW]；再次 add_project 恢复调度
+    - on_event(event, **data) 接收 task.started / task.done / task.failed / project.throttled / project.stopped /
+      project.paused / runner.idle / runner.stopped 事件
+    """
+    def __init__(self, engine=None, workers=DEFAULT_WORKERS, poll_interval=DEFAULT_POLL_INTERVAL, on_event=None,
+                 record_history=True):
+        self.engine = engine
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.on_event = on_event or (lambda event, **data: None)
+        self.record_history = record_history
+        self.executed = 0
+        self.failed = 0
+        self._projects = {}          # 项目名 -> ProjectSlot (按加入顺序)
+        self._inflight = {}          # (项目名, 任务 ID) -> Future
+        self._vtime = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pool = None
+        if engine is not None:
+            self.add_project(engine)
+
+    @classmethod
+    def from_config(cls, engine, cfg, workers=None, **kwargs):
+        cfg = cfg or {}
+        return cls(
+            engine,
+            workers=workers or cfg.get("workers", DEFAULT_WORKERS),
+            poll_interval=cfg.get("poll_interval", DEFAULT_POLL_INTERVAL),
+            **kwargs
+        )
+
+    def add_project(self, engine, weight=None, max_concurrent=None, max_tasks_per_hour=None):
+        """加入 (或更新) 一个项目，配额未指定时取该项目配置中的 system.quota；已暂停的项目恢复调度"""
+        quota = quota_from_config(engine.config_mgr.config["system"])
+        with self._lock:
+            slot = self._projects.get(engine.project)
+            if slot is None:
+                slot = self._projects[engine.project] = ProjectSlot(engine.project, engine)
+                slot.vtime = self._vtime
+            slot.engine = engine
+            slot.weight = weight or quota[0]
+            slot.max_concurrent = quota[1] if max_concurrent is None else max_concurrent
+            slot.max_tasks_per_hour = quota[2] if max_tasks_per_hour is None else max_tasks_per_hour
+            slot.stopped = False
+        self._wake.set()
+        return slot
+
+    def has_project(self, name):
+        with self._lock:
+            return name in self._projects
+
+    @staticmethod
+    def label(project, task_id):
+        """跨项目的任务标识: default 项目为任务 ID，其他项目为 项目名/任务 ID"""
+        return task_id if project == DEFAULT_PROJECT else f"{project}/{task_id}"
+
+    # ---------- 状态 ----------
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def active_ids(self, project=None):
+        """执行中的任务: 指定项目时为任务 ID，否则为跨项目标识"""
+        with self._lock:
+            if project is not None:
+                return sorted(task_id for name, task_id in self._inflight if name == project)
+            return sorted(self.label(name, task_id) for name, task_id in self._inflight)
+
+    def stats(self):
+        with self._lock:
+            projects = {name: slot.to_dict() for name, slot in self._projects.items()}
+        return {
+            "running": self.running,
+            "workers": self.workers,
+            "active": self.active_ids(),
+            "executed": self.executed,
+            "failed": self.failed,
+            "projects": projects,
+        }
+
+    # ---------- 控制 ----------
+    def start(self, stop_when_idle=False):
+        """在后台线程中开始调度 (已在运行时忽略)"""
+        if self.running:
+            return False
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, kwargs={"stop_when_idle": stop_when_idle},
+                                        name="nexus-runner", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, wait=True):
+        """停止派发新任务；wait=True 时等待执行中的任务结束"""
+        self._stop.set()
+        self._wake.set()
+        if wait and self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def wake(self):
+        """有新任务提交时调用，立即重新调度"""
+        self._wake.set()
+
+    def join(self, timeout=None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    # ---------- 调度 ----------
+    def run(self, stop_when_idle=True):
+        """
+        前台调度循环，stop_when_idle=True 时在没有可执行且没有执行中的任务时返回；
+        所有项目都收到停止信号时也会返回。返回 (成功数, 失败数)。
+        """
+        with self._lock:
+            slots = list(self._projects.values())
+        # 多个执行线程同时输出时关闭终端动画
+        for slot in slots:
+            slot.stopped = False
+            if self.workers > 1:
+                slot.engine.show_spinner = False
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="nexus-exec")
+        idle_reported = False
+        try:
+            while not self._stop.is_set():
+                self._wake.clear()
+                with tracer.span("runner.schedule") as span:
+                    with self._lock:
+                        slots = list(self._projects.values())
+                        free = self.workers - len(self._inflight)
+                        inflight = set(self._inflight)
+                    candidates = {}
+                    for slot in slots:
+                        if slot.stopped:
+                            continue
+                        engine = slot.engine
+                        if engine.check_stop_signal():
+                            slot.stopped = True
+                            self.on_event("project.stopped", project=slot.name)
+                            continue
+                        if self.workers > 1:
+                            engine.show_spinner = False
+                        engine.request_archive()
+                        slot.tasks = engine.parse_tasks()
+                        candidates[slot.name] = [t for t in engine.get_runnable_tasks(slot.tasks)
+                                                 if (slot.name, t['id']) not in inflight] if slot.tasks else []
+                    if slots and all(slot.stopped for slot in slots):
+                        break
+                    dispatched = self._dispatch_fair(slots, candidates, max(0, free))
+                    span.set_attribute("runner.dispatched", dispatched)
+
+                with self._lock:
+                    busy = bool(self._inflight)
+                waiting = any(candidates.values())
+                if not busy and not waiting:
+                    if not idle_reported:
+                        pending, blocked = 0, []
+                        for slot in slots:
+                            if slot.stopped:
+                                continue
+                            dead = slot.engine.dead_letters.downstream_of(slot.tasks, slot.engine.dead_letters.dead_ids())
+                            pending += len(slot.engine.pending_tasks(slot.tasks))
+                            blocked.extend(self.label(slot.name, task_id) for task_id in dead)
+                        self.on_event("runner.idle", pending=pending, blocked=sorted(blocked))
+                        idle_reported = True
+                    if stop_when_idle:
+                        break
+                else:
+                    idle_reported = False
+                self._wake.wait(self.poll_interval)
+        finally:
+            self._pool.shutdown(wait=True)
+            self._pool = None
+            for slot in slots:
+                slot.engine.show_spinner = True
+            self.on_event("runner.stopped", executed=self.executed, failed=self.failed)
+        return self.executed, self.failed
+
+    def _dispatch_fair(self, slots, candidates, free):
+        """
+        按 stride 调度把空闲执行线程分给各项目: 每次派发给虚拟时间最小且仍有配额的项目，
+        派发后其虚拟时间前进 1 / weight，长期来看各项目占用的执行线程与权重成正比。
+        """
+        now = time.time()
+        for slot in slots:
+            backlogged = bool(candidates.get(slot.name)) or slot.inflight > 0
+            if backlogged and not slot.backlogged:
+                # 刚有新任务的项目从当前虚拟时间开始，不能凭空闲期间“积攒”的份额独占执行线程
+                slot.vtime = max(slot.vtime, self._vtime)
+            slot.backlogged = backlogged
+        dispatched = 0
+        while free > 0:
+            eligible = []
+            for slot in slots:
+                if not candidates.get(slot.name):
+                    continue
+                throttled = not slot.has_quota(now)
+                if throttled and not slot.throttled:
+                    self.on_event("project.throttled", project=slot.name, inflight=slot.inflight,
+                                  started_last_hour=len(slot.started))
+                slot.throttled = throttled
+                if not throttled:
+                    eligible.append(slot)
+            if not eligible:
+                break
+            slot = min(eligible, key=lambda s: s.vtime)
+            self._vtime = slot.vtime
+            slot.vtime += 1.0 / slot.weight
+            self._dispatch(slot, candidates[slot.name].pop(0), now)
+            dispatched += 1
+            free -= 1
+        for slot in slots:
+            if not candidates.get(slot.name):
+                slot.throttled = False
+        return dispatched
+
+    def _dispatch(self, slot, task, now):
+        # 先登记为执行中，避免下一轮调度在执行线程启动前重复派发
+        slot.engine._busy_ids.add(task['id'])
+        with self._lock:
+            slot.inflight += 1
+            slot.started.append(now)
+            self._inflight[(slot.name, task['id'])] = self._pool.submit(self._execute, slot, task)
+
+    def _execute(self, slot, task):
+        engine = slot.engine
+        started = time.perf_counter()
+        self.on_event("task.started", project=slot.name, task_id=task['id'], receiver=task['receiver'])
+        environment_error = None
+        try:
+            success = engine.execute_task(task)
+            environment_error = None if success else engine.environment_error
+        except Exception as e:
+            success = False
+            engine.last_failure = None
+            self.on_event("task.error", project=slot.name, task_id=task['id'], error=f"{type(e).__name__}: {e}")
+        if self.record_history:
+            record_work_history(task, success, engine.history_file)
+        elapsed = round(time.perf_counter() - started, 3)
+        with self._lock:
+            engine._busy_ids.discard(task['id'])
+            self._inflight.pop((slot.name, task['id']), None)
+            slot.inflight -= 1
+            if success:
+                self.executed += 1
+                slot.executed += 1
+            else:
+                self.failed += 1
+                slot.failed += 1
+            # 环境问题会让该项目的所有任务失败，失败次数未能记录时会反复派发同一任务: 两者都暂停该项目
+            paused = (not success and not slot.stopped and not self._stop.is_set()
+                      and bool(environment_error or engine.last_failure is None))
+            if paused:
+                slot.stopped = True
+        if success:
+            self.on_event("task.done", project=slot.name, task_id=task['id'], receiver=task['receiver'], seconds=elapsed)
+        else:
+            failure = engine.last_failure
+            self.on_event("task.failed", project=slot.name, task_id=task['id'], receiver=task['receiver'], seconds=elapsed,
+                          fail_count=failure[0] if failure else None,
+                          dead_lettered=bool(failure and failure[1]))
+        if paused:
+            self.on_event("project.paused", project=slot.name, task_id=task['id'],
+                          reason=environment_error or "任务失败且未计入失败次数")
+        self._wake.set()
+        return success
@@ -0,0 +1,152 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import task_parser
+
+# 默认最多缓存的任务正文数量 (LRU)
+DEFAULT_BODY_CACHE_SIZE = 32
+
+
+class TaskRecord:
+    """
+    紧凑的任务记录: 只保存调度所需的元数据，正文通过 TaskStore 的 LRU 缓存按需加载。
+    兼容原先的 dict 访问方式 (task["id"] / task.get("encoding"))。
+    """
+    __slots__ = ("id", "filename", "status", "sender", "receiver", "depends_on", "encoding", "directory", "_store")
+
+    def __init__(self, task_id, filename, status, sender, receiver, depends_on, encoding, directory, store=None):
+        self.id = task_id
+        self.filename = filename
+        self.status = status
+        self.sender = sender
+        self.receiver = receiver
+        self.depends_on = depends_on
+        self.encoding = encoding
+        self.directory = directory
+        self._store = store
+
+    @property
+    def file(self):
+        return self.directory / self.filename
+
+    @property
+    def content(self):
+        if self._store is not None:
+            return self._store.load_body(self)
+        return task_parser.read_task_body(self.file, self.encoding)
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "file": str(self.file),
+            "filename": self.filename,
+            "status": self.status,
+            "sender": self.sender,
+            "receiver": self.receiver,
+            "depends_on": list(self.depends_on),
+            "encoding": self.encoding,
+        }
+
+    def __repr__(self):
+        return f"TaskRecord({self.id!r}, {self.status!r}, {self.receiver!r}, depends_on={list(self.depends_on)!r})"
+
+
+class TaskStore:
+    """
+    MESSAGES 目录的任务元数据仓库。
+    - 文件头部按 (mtime, size) 缓存，未变化的文件在下一个调度 tick 中无需重复读取
+    - 任务正文只在执行时加载，并保存在容量有限的 LRU 缓存中
+    """
+    def __init__(self, messages_dir, header_read_bytes=task_parser.HEADER_READ_BYTES,
+                 body_cache_size=DEFAULT_BODY_CACHE_SIZE):
+        self.messages_dir = Path(messages_dir)
+        self.header_read_bytes = header_read_bytes
+        self.body_cache_size = body_cache_size
+        self._headers = {}
+        self._bodies = OrderedDict()
+        self._lock = threading.Lock()
+
+    def scan(self, on_error=None):
+        """扫描 MESSAGES 目录并返回 TaskRecord 列表；读取失败的文件交给 on_error(filename, exc) 处理"""
+        records = []
+        headers = {}
+        try:
+            entries = list(os.scandir(self.messages_dir))
+        except FileNotFoundError:
+            return records
+
+        for entry in entries:
+            filename = entry.name
+            # 与 Path.glob("*.md") 保持一致: 忽略隐藏文件与目录
+            if filename.startswith(".") or not filename.endswith(".md"):
+                continue
+            name = task_parser.parse_task_filename(filename)
+            if not name:
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+                key = (st.st_mtime_ns, st.st_size)
+                cached = self._headers.get(filename)
+                if cached and cached[0] == key:
+                    header = cached[1]
+                else:
+                    header = task_parser.read_task_header(entry.path, self.header_read_bytes)
+            except FileNotFoundError:
+                # 扫描期间被移走 (如后台归档)
+                continue
+            except Exception as e:
+                if on_error:
+                    on_error(filename, e)
+                continue
+            headers[filename] = (key, header)
+
+            records.append(TaskRecord(
+                name.task_id,
+                filename,
+                sys.intern(name.status or "NEW"),
+                sys.intern(name.sender),
+                sys.intern(name.receiver),
+                tuple(header.depends_on),
+                header.encoding,
+                self.messages_dir,
+                self,
+            ))
+        # 只保留本轮仍存在的文件的头部缓存
+        self._headers = headers
+        return records
+
+    def load_body(self, record):
+        """按需读取任务正文 (LRU 缓存，文件修改后自动失效)"""
+        path = record.file
+        st = os.stat(path)
+        key = (str(path), st.st_mtime_ns, st.st_size)
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+                return body
+        body = task_parser.read_task_body(path, record.encoding)
+        with self._lock:
+            self._bodies[key] = body
+            while len(self._bodies) > self.body_cache_size:
+                self._bodies.popitem(last=False)
+        return body
+
+    def clear(self):
+        with self._lock:
+            self._headers.clear()
+            self._bodies.clear()
@@ -0,0 +1,198 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import deque
+from pathlib import Path
+
+import task_parser
+
+# "AI 执行结果" 段落标题 (兼容 "AI 执行结果 (待人工复核):")
+RESULT_HEADING_RE = re.compile(r'^## AI 执行结果[^\n]*\n', re.MULTILINE)
+TRACE_LINE_RE = re.compile(r'^TRACE_ID: [0-9a-f]+\s*$', re.MULTILINE)
+CODE_BLOCK_RE = re.compile(r'```([^\n`]*)\n(.*?)```', re.DOTALL)
+TITLE_RE = re.compile(r'^#\s*(.+)$', re.MULTILINE)
+
+DEFAULT_SUMMARY_MAX_CHARS = 1200
+DEFAULT_UPSTREAM_BUDGET_CHARS = 6000
+# 沿祖先链回溯的最大层数 (直接依赖为第 1 层)，0 为不限
+DEFAULT_UPSTREAM_MAX_DEPTH = 8
+
+
+def extract_result_sections(text):
+    """提取任务文件中所有 "AI 执行结果" 段落的正文 (按出现顺序)"""
+    matches = list(RESULT_HEADING_RE.finditer(text))
+    sections = []
+    for i, m in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        body = text[m.end():end]
+        # 去掉下一段之前的分隔线与 Trace ID
+        body = re.sub(r'\n+---\n*$', '', body)
+        body = TRACE_LINE_RE.sub('', body).strip()
+        if body:
+            sections.append(body)
+    return sections
+
+
+def summarize_result(text, max_chars=DEFAULT_SUMMARY_MAX_CHARS):
+    """
+    生成确定性的、有长度上限的产出摘要 (不调用模型):
+    代码块折叠为 "语言 + 行数 + 首行"，保留标题与正文要点，超出上限时截断。
+    """
+    def fold(m):
+        lang = m.group(1).strip() or "text"
+        lines = m.group(2).strip("\n").splitlines()
+        first = lines[0].strip()[:120] if lines else ""
+        return f"[代码块 {lang}，{len(lines)} 行] {first}"
+
+    folded = CODE_BLOCK_RE.sub(fold, text)
+    lines = [line.rstrip() for line in folded.splitlines()]
+    compact = "\n".join(line for line in lines if line.strip())
+    if len(compact) > max_chars:
+        compact = compact[:max_chars].rstrip() + "\n...(摘要已截断)"
+    return compact
+
+
+class UpstreamContext:
+    """
+    上游依赖产出的上下文构建器。
+    每个任务完成时生成一次有长度上限的摘要并缓存到 ARCHIVE/.summaries/，
+    下游任务执行时只沿 DAG 祖先链注入这些摘要，而不是整份历史文件。
+    """
+    def __init__(self, archive_dir, messages_dir, summary_max_chars=DEFAULT_SUMMARY_MAX_CHARS,
+                 budget_chars=DEFAULT_UPSTREAM_BUDGET_CHARS, max_depth=DEFAULT_UPSTREAM_MAX_DEPTH, archive_store=None):
+        self.archive_dir = Path(archive_dir)
+        self.messages_dir = Path(messages_dir)
+        self.archive_store = archive_store
+        self.cache_dir = self.archive_dir / ".summaries"
+        self.summary_max_chars = summary_max_chars
+        self.budget_chars = budget_chars
+        self.max_depth = max_depth
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    def _cache_path(self, task_id):
+        return self.cache_dir / f"{task_id}.json"
+
+    def record_summary(self, task_id, receiver, depends_on, task_text, result_text):
+        """任务完成时调用: 生成摘要并落盘，返回摘要记录"""
+        title_match = TITLE_RE.search(task_text or "")
+        summary = summarize_result(result_text, self.summary_max_chars)
+        record = {
+            "id": task_id,
+            "receiver": receiver,
+            "title": title_match.group(1).strip() if title_match else "",
+            "depends_on": list(depends_on),
+            "summary": summary,
+            "hash": hashlib.sha256(summary.encode("utf-8")).hexdigest()[:16],
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._cache_path(task_id).with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(record, f, ensure_ascii=False, indent=2)
+            tmp_path.replace(self._cache_path(task_id))
+        except OSError:
+            pass
+        with self._lock:
+            self._memory[task_id] = record
+        return record
+
+    def _load_done_task(self, task_id):
+        """读取已完成任务的 (文件名, 全文): 先按清单查归档 (含压缩包)，再查 MESSAGES 与 ARCHIVE 顶层"""
+        if self.archive_store is not None:
+            entry = self.archive_store.find(task_id)
+            if entry is not None:
+                try:
+                    return entry.name, self.archive_store.read_text(entry)
+                except (OSError, KeyError, UnicodeDecodeError):
+                    pass
+        for directory in (self.archive_dir, self.messages_dir):
+            if not directory.exists():
+                continue
+            for path in directory.glob(f"*{task_id}*.md"):
+                name = task_parser.parse_task_filename(path.name)
+                if name and name.task_id == task_id and (name.status or "").upper() == "DONE":
+                    try:
+                        return path.name, task_parser.read_task_body(path)
+                    except OSError:
+                        return None
+        return None
+
+    def get_summary(self, task_id):
+        """读取已完成任务的摘要；旧任务没有缓存时从其归档文件补建一次"""
+        with self._lock:
+            if task_id in self._memory:
+                return self._memory[task_id]
+        path = self._cache_path(task_id)
+        if path.exists():
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    record = json.load(f)
+                with self._lock:
+                    self._memory[task_id] = record
+                return record
+            except (OSError, ValueError):
+                pass
+
+        done_task = self._load_done_task(task_id)
+        if not done_task:
+            return None
+        filename, text = done_task
+        sections = extract_result_sections(text)
+        if not sections:
+            return None
+        name = task_parser.parse_task_filename(filename)
+        return self.record_summary(task_id, name.receiver, task_parser.parse_depends_on(text), text, sections[-1])
+
+    @staticmethod
+    def _block(record):
+        return f"### {record['id']} ({record['receiver']}) {record.get('title', '')}\n{record['summary']}\n"
+
+    def ancestry(self, task, covered=frozenset(), overrides=None, budget_chars=None, max_depth=0):
+        """
+        按 BFS 顺序返回 (祖先摘要记录列表, 因预算或层数省略的祖先数)，直接依赖在前。
+        covered 为已被全局快照覆盖的任务 ID，遇到时既不注入也不再向上回溯。
+        overrides 为 {任务 ID: 摘要记录}，用于尚未完成的上游任务 (如预执行时的预测摘要)。
+        budget_chars 为摘要总长度预算: 第一次放不下时停止回溯，队列中剩余的祖先不再读取摘要；
+        max_depth 为回溯层数上限 (0 为不限)，超出的祖先同样不读取。省略数只计入已知的祖先 ID，是下限。
+        """
+        seen = set()
+        queue = deque((dep, 1) for dep in task["depends_on"])
+        ordered = []
+        used = 0
+        skipped = set()
+        while queue:
+            dep, depth = queue.popleft()
+            if dep in seen or dep in covered:
+                continue
+            seen.add(dep)
+            record = overrides[dep] if overrides and dep in overrides else self.get_summary(dep)
+            if not record:
+                continue
+            if budget_chars is not None:
+                used += len(self._block(record))
+                if used > budget_chars:
+                    skipped.add(dep)
+                    skipped.update(d for d, _ in queue)
+                    break
+            ordered.append(record)
+            parents = record.get("depends_on", [])
+            if max_depth and depth >= max_depth:
+                skipped.update(parents)
+                continue
+            queue.extend((parent, depth + 1) for parent in parents)
+        loaded = {record["id"] for record in ordered}
+        return ordered, len(skipped - loaded - set(covered))
+
+    def build(self, task, covered=frozenset(), overrides=None):
+        """组装注入到 System Prompt 中的上游依赖摘要 (受总长度预算与回溯层数限制)"""
+        records, omitted = self.ancestry(task, covered, overrides, budget_chars=self.budget_chars, max_depth=self.max_depth)
+        if not records and not omitted:
+            return ""
+        parts = [self._block(record) for record in records]
+        if omitted:
+            parts.append(f"(另有至少 {omitted} 个更早的上游任务摘要因长度预算或回溯层数被省略)\n")
+        return "\n".join(parts)
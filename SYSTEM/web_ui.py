@@ -1,9 +1,10 @@
 import os
 import sys
 import gradio as gr
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 import threading
 import time
+import datetime
 import re
 from dotenv import load_dotenv
 
@@ -11,14 +12,44 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # 导入核心引擎
-from nexus_core import NexusEngine, ConfigManager
+from nexus_core import DEFAULT_PROJECT
+from projects import ProjectRegistry
+from nexus_trace import tracer
+from workspace_index import DEFAULT_TOP_K, DEFAULT_CONTEXT_CHARS
+from file_preview import DEFAULT_HEX_BYTES, TRUNCATED_NOTE
+from workspace_tree import format_size, DEFAULT_MAX_DEPTH as DEFAULT_TREE_MAX_DEPTH, DEFAULT_MAX_LINES as DEFAULT_TREE_MAX_LINES
+from task_factory import TaskSpecError
+from cleanup_workspace import cleanup_workspace
+from snapshot_store import DEFAULT_KEEP as DEFAULT_SNAPSHOT_KEEP
+from job_queue import STATE_LABELS, DONE as JOB_DONE
+from work_history import get_work_history, record_work_history
+from planner import breakdown_task
 
-# 初始化引擎
-engine = NexusEngine(auto_mode=True)
-config_mgr = ConfigManager()
+# 注册表托管 PROJECTS/ 下的所有项目，在首次处理请求时创建 (导入本模块与构建界面时不加载配置、不创建引擎)
+# 各浏览器会话选中的项目保存在会话状态 project_state 中，处理函数按传入的项目名取引擎
+registry = None
+_registry_lock = threading.Lock()
 
-def get_system_status():
+def get_registry():
+    """项目注册表 (首次调用时创建)"""
+    global registry
+    with _registry_lock:
+        if registry is None:
+            registry = ProjectRegistry.from_config(auto_mode=True)
+        return registry
+
+def get_engine(project=None):
+    """会话选中项目的引擎 (首次使用时创建，之后常驻并共享模型连接池)"""
+    return get_registry().engine(project or DEFAULT_PROJECT)
+
+def get_config_mgr():
+    """界面自身 (P1 汇报、闲聊、架构师) 使用的配置，与 default 项目的引擎共用同一份"""
+    return get_registry().base_config_mgr
+
+@tracer.traced("web.get_system_status")
+def get_system_status(project):
     """获取系统当前状态"""
+    engine = get_engine(project)
     tasks = engine.parse_tasks()
     
     # 统计任务状态
@@ -26,14 +57,18 @@ def get_system_status():
     done = sum(1 for t in tasks if "DONE" in t["status"].upper())
     new = sum(1 for t in tasks if "NEW" in t["status"].upper())
     
-    # 获取归档任务数
-    archived = len(list(engine.archive_dir.glob("*.md")))
+    # 获取归档任务数 (归档清单中的计数器，不扫描目录)
+    archived = engine.archive.count()
     
     status_text = f"📊 **系统状态**: 共 {total} 个活跃任务 | ✅ 已完成: {done} | ⏳ 待执行: {new} | 📦 已归档: {archived}"
+    if engine.project != DEFAULT_PROJECT:
+        status_text = f"📁 **项目 {engine.project}** | " + status_text
     return status_text
 
-def get_task_list():
+@tracer.traced("web.get_task_list")
+def get_task_list(project):
     """获取任务列表用于展示"""
+    engine = get_engine(project)
     tasks = engine.parse_tasks()
     if not tasks:
         return "当前没有活跃任务。"
@@ -49,15 +84,20 @@ def get_task_list():
         
     return markdown_list
 
-def run_one_step():
+@tracer.traced("web.run_one_step")
+def run_one_step(project):
     """执行一步任务"""
-    engine.archive_done_tasks()
-    tasks = engine.parse_tasks()
+    engine = get_engine(project)
+    # 设置环境变量 NEXUS_PROFILE=cprofile|sample 时，逐 tick 输出剖析数据
+    with engine.profiler.tick("web.schedule"):
+        # 归档在后台作业中进行，不阻塞本次调度
+        engine.request_archive()
+        tasks = engine.parse_tasks()
+        runnable_tasks = engine.get_runnable_tasks(tasks) if tasks else []
     
-    if not tasks:
+    if not engine.pending_tasks(tasks):
         return "✅ 当前没有任务需要执行。"
         
-    runnable_tasks = engine.get_runnable_tasks(tasks)
     if not runnable_tasks:
         return "⏳ 当前没有可立即执行的任务（可能都在等待前置依赖完成）。"
         
@@ -69,55 +109,64 @@ def run_one_step():
     from contextlib import redirect_stdout
     
     f = io.StringIO()
-    with redirect_stdout(f):
+    with redirect_stdout(f), engine.profiler.tick("web.execute_task"):
         success = engine.execute_task(target_task)
         
     output = f.getvalue()
     
     # 记录工作历史
-    re d_work_history(target_task, success)
+    record_work_history(target_task, success, engine.history_file)
     
     if success:
         return log_msg + "✅ 任务执行成功！\n\n" + "```text\n" + output + "\n```"
     else:
         return log_msg + "❌ 任务执行失败。\n\n" + "```text\n" + output + "\n```"
 
-# 全局变量控制自动运行状态
-auto_run_flag = False
+# 正在自动运行的项目 (按项目记录: 不同会话可以同时运行各自的项目，任一会话都能暂停某个项目)
+auto_run_projects = set()
 
-def toggle_auto_run():
-    """切换自动运行状态"""
-    global auto_run_flag
-    auto_run_flag = not auto_run_flag
-    if auto_run_flag:
-        return "⏸️ 暂停自动执行", "🚀 自动流水线已启动..."
-    else:
+def toggle_auto_run(project):
+    """切换项目的自动运行状态"""
+    project = project or DEFAULT_PROJECT
+    if project in auto_run_projects:
+        auto_run_projects.discard(project)
         return "🚀 一键全自动执行", "⏸️ 自动流水线已暂停。"
+    auto_run_projects.add(project)
+    return "⏸️ 暂停自动执行", "🚀 自动流水线已启动..."
 
-def auto_run_all(progress=gr.Progress()):
+def auto_run_button(project):
+    """自动运行按钮的文字 (流水线因任务完成而停止后重置)"""
+    return "⏸️ 暂停自动执行" if (project or DEFAULT_PROJECT) in auto_run_projects else "🚀 一键全自动执行"
+
+@tracer.traced("web.auto_run_all")
+def auto_run_all(project, progress=gr.Progress()):
     """全自动执行所有任务"""
-    global auto_run_flag
-    if not auto_run_flag:
+    engine = get_engine(project)
+    if engine.project not in auto_run_projects:
         yield "⏸️ 自动流水线已暂停。"
         return
         
     log_output = "🚀 开始全自动流水线...\n\n"
     yield log_output
     
-    while auto_run_flag:
-        engine.archive_done_tasks()
-        tasks = engine.parse_tasks()
+    while engine.project in auto_run_projects:
+        with engine.profiler.tick("web.schedule"):
+            engine.request_archive()
+            tasks = engine.parse_tasks()
+            runnable_tasks = engine.get_runnable_tasks(tasks) if tasks else []
         
-        if not tasks:
+        if not engine.pending_tasks(tasks):
             log_output += "✅ 所有任务已完成！\n"
-            auto_run_flag = False
+            auto_run_projects.discard(engine.project)
             yield log_output
             break
             
-        runnable_tasks = engine.get_runnable_tasks(tasks)
         if not runnable_tasks:
             log_output += "⏳ 没有可执行的任务，流水线停止。\n"
-            auto_run_flag = False
+            blocked = engine.dead_letters.downstream_of(tasks, engine.dead_letters.dead_ids())
+            if blocked:
+                log_output += f"🔴 其中 {len(blocked)} 个任务的上游已熔断或过期，需要下发 Fix 任务: {', '.join(sorted(blocked))}\n"
+            auto_run_projects.discard(engine.project)
             yield log_output
             break
             
@@ -131,67 +180,42 @@ def auto_run_all(progress=gr.Progress()):
         import io
         from contextlib import redirect_stdout
         f = io.StringIO()
-        with redirect_stdout(f):
+        with redirect_stdout(f), engine.profiler.tick("web.execute_task"):
             success = engine.execute_task(target_task)
             
         output = f.getvalue()
         
+        # 记录工作历史
+        record_work_history(target_task, success, engine.history_file)
+        
         if not success:
-            log_output += f"❌ 任务执行失败，流水线中止。\n\n{output}\n"
-            auto_run_flag = False
+            # 单个任务失败不再中止整条流水线: 失败次数记入任务头部，达到阈值后熔断，只跳过其下游
+            failure = engine.last_failure
+            if engine.environment_error or not failure:
+                # 环境问题 (API Key / 模型配置、服务不可达、限流) 或失败未计数: 继续执行只会重复失败，暂停流水线
+                reason = engine.environment_error or "任务失败且未计入失败次数"
+                log_output += f"⏸️ {reason}，任务 {target_task['id']} 保持 [NEW]，流水线已暂停。\n\n{output}\n"
+                auto_run_projects.discard(engine.project)
+                yield log_output
+                break
+            if failure[1]:
+                count, dead_path, blocked = failure
+                log_output += f"🔴 任务连续失败 {count} 次，已熔断并移入 {dead_path.parent.name}/，跳过下游 {len(blocked)} 个任务。\n\n{output}\n"
+            else:
+                log_output += f"⚠️ 任务执行失败 (第 {failure[0]}/{engine.dead_letters.max_failures} 次)，继续执行其余任务。\n\n{output}\n"
             yield log_output
-            break
+            time.sleep(1)
+            continue
             
         log_output += f"✅ 任务完成。\n\n{output}\n"
         yield log_output
         
-        # 记录工作历史
-        record_work_history(target_task, success)
-        
         time.sleep(1) # 稍微暂停一下，避免 API 频率过高
 
-def get_work_history():
-    """获取工作历史记录"""
-    history_file = Path("SYSTEM/work_history.json")
-    if not history_file.exists():
-        return []
-    try:
-        import json
-        with open(history_file, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
-
-def record_work_history(task, success):
-    """记录工作历史"""
-    history_file = Path("SYSTEM/work_history.json")
-    history = get_work_history()
-    
-    import datetime
-    now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    
-    record = {
-        "time": now,
-        "task_id": task.get("id", "Unknown"),
-        "receiver": task.get("receiver", "Unknown"),
-        "status": "Success" if success else "Failed",
-        "filename": task.get("filename", "Unknown")
-    }
-    
-    history.insert(0, record) # 插入到最前面
-    # 保留最近 100 条记录
-    history = history[:100]
-    
-    try:
-        import json
-        with open(history_file, "w", encoding="utf-8") as f:
-            json.dump(history, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        print(f"记录工作历史失败: {e}")
-
-def format_history_direct():
+def format_history_direct(project):
     """直接格式化历史记录"""
-    history = get_work_history()
+    engine = get_engine(project)
+    history = get_work_history(engine.history_file)
     if not history:
         return "暂无工作记录。"
         
@@ -205,9 +229,12 @@ def format_history_direct():
         
     return md
 
-def format_history_translated(progress=gr.Progress()):
+@tracer.traced("web.format_history_translated")
+def format_history_translated(project, progress=gr.Progress()):
     """AI 翻译历史记录为人话"""
-    history = get_work_history()
+    engine = get_engine(project)
+    config_mgr = get_config_mgr()
+    history = get_work_history(engine.history_file)
     if not history:
         return "暂无工作记录。"
         
@@ -247,130 +274,48 @@ def format_history_translated(progress=gr.Progress()):
     except Exception as e:
         return f"❌ 翻译失败: {e}\n\n请检查 API 配置或网络连接。"
 
-def create_new_task(receiver, task_desc, depends_on, task_id=None):
+@tracer.traced("web.create_new_task")
+def create_new_task(project, receiver, task_desc, depends_on, task_id=None):
     """创建一个新任务"""
+    engine = get_engine(project)
     if not receiver or not task_desc:
         return "❌ 接收者和任务描述不能为空！"
         
-    # 生成任务 ID
-    if not task_id:
-        tasks = engine.parse_tasks()
-        existing_ids = [int(re.search(r'\d+', t['id']).group()) for t in tasks if re.search(r'\d+', t['id'])]
-        next_id = max(existing_ids) + 1 if existing_ids else 1
-        task_id = f"ID{next_id:03d}"
-    
-    # 格式化依赖
-    deps_str = depends_on if depends_on else "NONE"
-    
-    # 生成文件名
-    short_desc = task_desc[:10].replace(" ", "_").replace("\n", "")
-    filename = f"[NEW]P1_TO_{receiver}_{task_id}_{short_desc}.md"
-    filepath = engine.messages_dir / filename
-    
-    # 写入文件
-    content = f"""# 任务目标：{task_desc.split(chr(10))[0]}
-
-**DEPENDS_ON: {deps_str}**
-
-## 详细要求
-{task_desc}
-"""
-    with open(filepath, "w", encoding="utf-8") as f:
-        f.write(content)
+    # ID 由持久化的分配器统一分配 (覆盖 MESSAGES 与 ARCHIVE，并发请求不会拿到相同 ID)
+    try:
+        created = engine.create_tasks([{
+            "receiver": receiver,
+            "description": task_desc,
+            "depends_on": depends_on,
+            "id": task_id,
+        }])
+    except TaskSpecError as e:
+        return f"❌ 创建任务失败: {e}"
         
-    return f"✅ 成功创建任务: {filename}"
+    return f"✅ 成功创建任务: {created[0][1]}"
 
-def auto_breakdown_task(macro_task_desc, progress=gr.Progress()):
-    """P1 自动拆解宏观任务为多个子任务"""
+@tracer.traced("web.auto_breakdown_task")
+def auto_breakdown_task(project, macro_task_desc, recursive=False, progress=gr.Progress()):
+    """P1 自动拆解宏观任务为多个子任务 (recursive=True 时由 P8 主管并行细化各工作包)"""
+    engine = get_engine(project)
+    config_mgr = get_config_mgr()
     if not macro_task_desc:
         return "❌ 宏观任务描述不能为空！"
         
-    progress(0, desc="正在调用 P1 思考拆解方案...")
-    
-    # 获取当前可用的角色列表
-    available_personas = [p.stem for p in engine.personas_dir.glob("*.md")]
-    personas_str = ", ".join(available_personas) if available_personas else "P8_技术, P8_文案, P9_行政合规审计"
-    
-    # 构造 P1 的 Prompt
-    system_prompt = f"""你是 P1-首席执行架构师 (Nexus-001)。
-你的任务是将用户的宏大目标拆解为多个子任务，下发给各个虚拟员工。
-请严格按照以下 JSON 格式输出拆解后的任务列表，不要输出任何其他废话：
-[
-  {{
-    "receiver": "P8_技术主管",
-    "depends_on": "NONE",
-    "description": "搭建基础框架..."
-  }},
-  {{
-    "receiver": "P8_文案主管",
-    "depends_on": "ID001",
-    "description": "编写文案..."
-  }}
-]
-注意：
-1. receiver 必须是现有的角色名，当前可用的角色有：{personas_str}。
-2. depends_on 如果没有依赖填 NONE，如果有依赖填对应的 ID（如 ID001）。ID 是按顺序生成的，第一个任务是 ID001，第二个是 ID002，依此类推。
-"""
-    
-    # 获取 P1 的模型配置
-    provider_name, provider_cfg, model_name = config_mgr.get_provider_config("P1_Nexus")
-    
-    from openai import OpenAI
-    client = OpenAI(
-        api_key=provider_cfg["api_key"],
-        base_url=provider_cfg["base_url"]
-    )
-    
     try:
-        response = client.chat.completions.create(
-            model=model_name,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"请拆解以下宏观任务：\n\n{macro_task_desc}"}
-            ],
-            temperature=0.2
-        )
-        
-        result_text = response.choices[0].message.content
-        
-        # 尝试解析 JSON
-        import json
-        # 提取 JSON 部分 (防止模型输出带有 markdown 标记)
-        json_match = re.search(r'\[.*\]', result_text, re.DOTALL)
-        if json_match:
-            json_str = json_match.group(0)
+        plan, created = breakdown_task(engine, config_mgr, macro_task_desc, recursive=recursive,
+                                       on_progress=lambda fraction, desc: progress(fraction, desc=desc))
+        lines = [f"✅ 成功创建任务: {filename}" for _, filename in created]
+        if recursive:
+            lines.extend(f"⚠️ {note}" for note in plan.notes)
+            lines.append(f"\n🌲 {plan.packages} 个顶层工作包，共 {len(created)} 个任务，{plan.requests} 次模型请求")
         else:
-            json_str = result_text
-            
-        # 进一步清理，确保只包含 JSON 数组
-        start_idx = json_str.find('[')
-        end_idx = json_str.rfind(']')
-        if start_idx != -1 and end_idx != -1:
-            json_str = json_str[start_idx:end_idx+1]
-            
-        tasks_data = json.loads(json_str)
-        
-        progress(0.5, desc="正在生成任务文件...")
-        
-        created_files = []
-        for i, task_data in enumerate(tasks_data):
-            receiver = task_data.get("receiver", "P8_技术")
-            depends_on = task_data.get("depends_on", "NONE")
-            desc = task_data.get("description", "")
-            task_id = task_data.get("id", None)
-            
-            # 修正依赖 ID (如果模型生成的依赖 ID 不准确，这里可以做一些容错，但目前先信任模型)
-            if isinstance(depends_on, list):
-                depends_on = ", ".join(depends_on)
-            
-            res = create_new_task(receiver, desc, depends_on, task_id)
-            created_files.append(res)
-            
-        progress(1.0, desc="拆解完成！")
-        return "✅ 自动拆解完成！\n\n" + "\n".join(created_files)
+            lines.extend(f"⚠️ 第 {index} 个子任务无效已跳过: {error}" for index, error in plan.dropped)
+            lines.append(f"\n📡 输出模式: {plan.mode}，共 {plan.requests} 次模型请求")
+        return "✅ 自动拆解完成！\n\n" + "\n".join(lines)
         
     except Exception as e:
-        return f"❌ 自动拆解失败: {e}\n\n模型返回内容:\n{result_text if 'result_text' in locals() else '无'}"
+        return f"❌ 自动拆解失败: {e}"
 
 def get_config_yaml():
     """读取 config.yaml 内容"""
@@ -387,25 +332,29 @@ def save_config_yaml(content):
     config_path = Path("SYSTEM/config.yaml")
     if not config_path.exists():
         config_path = Path("config.yaml")
+    if not (content or "").strip():
+        # 配置在页面打开后才加载，加载完成前保存会清空配置文件
+        return "⚠️ 配置内容为空，未保存 (请等待配置加载完成)"
     try:
         with open(config_path, "w", encoding="utf-8") as f:
             f.write(content)
         # 重新加载配置
-        global config_mgr
-        config_mgr = ConfigManager()
+        get_config_mgr().reload()
         return "✅ 配置保存成功！"
     except Exception as e:
         return f"❌ 保存失败: {e}"
 
-def get_personas_list():
+def get_personas_list(project):
     """获取角色列表"""
+    engine = get_engine(project)
     personas = []
     for p_file in engine.personas_dir.glob("*.md"):
         personas.append(p_file.name)
     return personas
 
-def get_persona_content(filename):
+def get_persona_content(project, filename):
     """读取角色文件内容"""
+    engine = get_engine(project)
     if not filename:
         return ""
     filepath = engine.personas_dir / filename
@@ -414,8 +363,9 @@ def get_persona_content(filename):
             return f.read()
     return ""
 
-def save_persona_content(filename, content):
+def save_persona_content(project, filename, content):
     """保存角色文件内容"""
+    engine = get_engine(project)
     if not filename:
         return "❌ 请先选择一个角色文件"
     filepath = engine.personas_dir / filename
@@ -426,8 +376,9 @@ def save_persona_content(filename, content):
     except Exception as e:
         return f"❌ 保存失败: {e}"
 
-def create_new_persona(filename, content):
+def create_new_persona(project, filename, content):
     """创建新角色"""
+    engine = get_engine(project)
     if not filename:
         return "❌ 文件名不能为空", gr.update()
     if not filename.endswith(".md"):
@@ -438,57 +389,344 @@ def create_new_persona(filename, content):
     try:
         with open(filepath, "w", encoding="utf-8") as f:
             f.write(content)
-        return f"✅ 角色 {filename} 创建成功！", gr.update(choices=get_personas_list(), value=filename)
+        return f"✅ 角色 {filename} 创建成功！", gr.update(choices=get_personas_list(project), value=filename)
     except Exception as e:
         return f"❌ 创建失败: {e}", gr.update()
 
-def get_workspace_files():
-    """获取工作区文件树"""
-    tree_str = "### 📁 PROJECT_SPACE 目录结构\n```text\n"
-    
-    def build_tree(dir_path, prefix=""):
-        nonlocal tree_str
-        try:
-            items = list(dir_path.iterdir())
-            items.sort(key=lambda x: (not x.is_dir(), x.name))
-            
-            for i, item in enumerate(items):
-                is_last = i == len(items) - 1
-                connector = "└── " if is_last else "├── "
-                
-                if item.is_dir():
-                    tree_str += f"{prefix}{connector}📂 {item.name}/\n"
-                    extension = "    " if is_last else "│   "
-                    build_tree(item, prefix + extension)
-                else:
-                    tree_str += f"{prefix}{connector}📄 {item.name}\n"
-        except Exception as e:
-            tree_str += f"{prefix}└── ❌ 读取错误: {e}\n"
-            
-    build_tree(engine.project_space_dir)
-    tree_str += "```"
-    return tree_str
+@tracer.traced("web.get_workspace_files")
+def get_workspace_files(project):
+    """获取工作区目录树概览 (深度与行数受限，目录列表按修改时间缓存)"""
+    engine = get_engine(project)
+    tree_cfg = engine.config_mgr.config["system"].get("workspace_tree") or {}
+    tree = engine.workspace_tree.render(
+        max_depth=tree_cfg.get("max_depth", DEFAULT_TREE_MAX_DEPTH),
+        max_lines=tree_cfg.get("max_lines", DEFAULT_TREE_MAX_LINES)
+    )
+    return f"### 📁 PROJECT_SPACE 目录结构\n```text\n{tree or '(空)'}\n```"
+
+@tracer.traced("web.list_workspace_dir")
+def list_workspace_dir(project, rel=""):
+    """逐级浏览: 只列出当前目录，返回 (当前目录, 条目下拉框, 路径提示)"""
+    engine = get_engine(project)
+    rel = (rel or "").strip("/")
+    if engine.workspace_tree.resolve(rel) is None:
+        rel = ""
+    listing = engine.workspace_tree.list_dir(rel)
+    choices = []
+    if rel:
+        choices.append(("⬆️ ..", PARENT_DIR_CHOICE))
+    for entry in listing.entries:
+        if entry.is_dir:
+            choices.append((f"📂 {entry.name}/", entry.rel + "/"))
+        else:
+            choices.append((f"📄 {entry.name}  ({format_size(entry.size)})", entry.rel))
+    crumb = f"**📁 PROJECT_SPACE/{rel}** · {len(listing.entries)} 项"
+    if listing.truncated:
+        crumb += f"，另有 {listing.truncated} 项未列出"
+    if listing.ignored:
+        crumb += f"，已忽略 {listing.ignored} 项"
+    return rel, gr.update(choices=choices, value=None), crumb
+
+# 不改变文件预览区 (内容, 说明, 状态, 起始位置)
+NO_PREVIEW_UPDATE = (gr.update(), gr.update(), gr.update(), gr.update())
+
+@tracer.traced("web.open_workspace_entry")
+def open_workspace_entry(project, selected, rel, mode="文本"):
+    """选中目录时进入该目录，选中文件时填入路径并预览"""
+    if not selected:
+        return (rel, gr.update(), gr.update(), gr.update()) + NO_PREVIEW_UPDATE
+    if selected == PARENT_DIR_CHOICE:
+        parent = str(PurePosixPath(rel).parent)
+        return (*list_workspace_dir(project, "" if parent == "." else parent), gr.update()) + NO_PREVIEW_UPDATE
+    if selected.endswith("/"):
+        return (*list_workspace_dir(project, selected), gr.update()) + NO_PREVIEW_UPDATE
+    return (rel, gr.update(), gr.update(), selected,
+            *preview_workspace_file(project, selected, mode, 0 if mode == "十六进制" else 1))
+
+# 架构师建议: 未填写关注点时，以看板任务与最近归档的任务名作为检索线索
+ARCHITECT_RECENT_ARCHIVED = 200
+
+# 文件预览模式: 按行分页 / 末尾 / 十六进制 / 元数据
+PREVIEW_MODES = ("文本", "末尾", "十六进制", "元数据")
+# 跟随模式下预览框最多保留的字符数
+FOLLOW_KEEP_CHARS = 200000
+
+def _preview_outputs(rel, mode, page):
+    """返回 (预览内容, 说明, 预览状态, 起始位置)"""
+    state = {
+        "path": rel, "mode": mode, "start": page.start, "end": page.end,
+        "first_line": page.first_line, "line_count": page.line_count,
+        "truncated": page.note == TRUNCATED_NOTE,
+    }
+    position = page.first_line if mode == "文本" and page.first_line else page.start
+    return page.text, page.header(), state, position
 
-def read_workspace_file(filepath_str):
-    """读取工作区文件内容"""
+@tracer.traced("web.preview_workspace_file")
+def preview_workspace_file(project, filepath_str, mode="文本", start=1):
+    """分段预览工作区文件: 只读取当前页的字节，二进制文件显示十六进制或元数据"""
+    engine = get_engine(project)
     if not filepath_str:
-        return ""
-    
-    # 简单的安全检查，防止跳出工作区
-    filepath = Path(filepath_str)
-    if ".." in filepath.parts or filepath.is_absolute():
-        return "❌ 非法路径"
-        
-    full_path = engine.project_space_dir / filepath
-    if full_path.exists() and full_path.is_file():
-        try:
-            with open(full_path, "r", encoding="utf-8") as f:
-                return f.read()
-        except UnicodeDecodeError:
-            return "❌ 无法读取二进制文件或非 UTF-8 编码文件"
-        except Exception as e:
-            return f"❌ 读取失败: {e}"
-    return "❌ 文件不存在"
+        return "", "", {}, start
+    previewer = engine.file_previewer
+    start = int(start or 0)
+    if mode == "末尾":
+        page = previewer.tail(filepath_str)
+    elif mode == "十六进制":
+        page = previewer.hex(filepath_str, start)
+    elif mode == "元数据":
+        page = previewer.metadata(filepath_str)
+    else:
+        page = previewer.lines(filepath_str, max(1, start))
+    return _preview_outputs(filepath_str, mode, page)
+
+@tracer.traced("web.page_workspace_file")
+def page_workspace_file(project, state, forward=True):
+    """上一页 / 下一页: 按行分页遇到超长行时改为按字节翻页"""
+    engine = get_engine(project)
+    if not state or not state.get("path"):
+        return gr.update(), gr.update(), state, gr.update()
+    previewer = engine.file_previewer
+    rel, mode = state["path"], state["mode"]
+    if mode == "十六进制":
+        offset = state["end"] if forward else max(0, state["start"] - DEFAULT_HEX_BYTES)
+        page = previewer.hex(rel, offset)
+    elif mode == "元数据":
+        return gr.update(), gr.update(), state, gr.update()
+    elif mode == "文本" and state.get("first_line") and not state.get("truncated"):
+        if forward:
+            page = previewer.lines(rel, state["first_line"] + state["line_count"])
+        else:
+            page = previewer.lines(rel, max(1, state["first_line"] - previewer.page_lines))
+    elif forward:
+        page = previewer.bytes_range(rel, state["end"])
+    else:
+        page = previewer.bytes_range(rel, max(0, state["start"] - previewer.page_bytes))
+    return _preview_outputs(rel, mode, page)
+
+@tracer.traced("web.follow_workspace_file")
+def follow_workspace_file(project, state, current_text):
+    """跟随增长中的文件 (如日志): 把上次读取位置之后新写入的内容追加到预览框"""
+    engine = get_engine(project)
+    if not state or not state.get("path"):
+        return gr.update(), "请先打开一个文件", state, gr.update()
+    page = engine.file_previewer.follow(state["path"], state["end"])
+    if page.kind in ("error", "empty", "binary"):
+        return gr.update(), page.header(), state, gr.update()
+    text = page.text if page.note else (current_text or "") + page.text
+    _, header, new_state, position = _preview_outputs(state["path"], "末尾", page)
+    new_state["start"] = state["start"] if not page.note else page.start
+    return text[-FOLLOW_KEEP_CHARS:], header, new_state, position
+
+SEARCH_KIND_CHOICES = [("全部", ""), ("任务 (MESSAGES)", "task"), ("归档 (ARCHIVE)", "archive"), ("工作区 (PROJECT_SPACE)", "workspace")]
+SEARCH_STATUS_CHOICES = ["", "NEW", "READ", "DONE", "FAIL", "EXPIRED"]
+
+@tracer.traced("web.search_everything")
+def search_everything(project, query, task_id="", receiver="", status="", kind="", since="", until=""):
+    """全文检索任务、归档与工作区文件，返回 Markdown 结果列表"""
+    engine = get_engine(project)
+    if engine.search_index is None:
+        return "⚠️ 全文检索未启用 (config.yaml 中 system.search.enabled)"
+    if not any((query.strip(), task_id, receiver, status, kind, since, until)):
+        return "请输入检索词或过滤条件"
+    started = time.perf_counter()
+    try:
+        hits = engine.search_index.search(
+            query, task_id=task_id.strip() or None, receiver=receiver.strip() or None, status=status or None,
+            kind=kind or None, since=since.strip() or None, until=until.strip() or None
+        )
+    except ValueError as e:
+        return f"❌ {e}"
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    lines = [f"**共 {len(hits)} 条结果** ({elapsed_ms:.1f} ms)\n"]
+    for hit in hits:
+        info = hit.to_dict()
+        meta = " · ".join(x for x in (hit.task_id, hit.receiver, f"[{hit.status}]" if hit.status else None, info["date"]) if x)
+        lines.append(f"- 📄 `{hit.path}`  \n  {meta}  \n  {hit.snippet}")
+    return "\n".join(lines)
+
+# ---------- 后台作业 ----------
+# 界面跟随作业进度的刷新间隔 (秒)
+JOB_POLL_SECONDS = 0.5
+JOB_PANEL_LIMIT = 30
+
+def _job_running_line(job):
+    return f"{job.describe()}  ·  作业 `{job.id}` (可在“后台作业”页取消)"
+
+def _follow_job(job):
+    """等待作业结束，期间定期产出 None 供调用方刷新进度 (关闭页面不影响作业继续执行)"""
+    while not job.wait(JOB_POLL_SECONDS):
+        yield
+
+def _progress_bar(fraction, width=12):
+    if fraction is None:
+        return "…"
+    filled = int(round(fraction * width))
+    return "█" * filled + "░" * (width - filled) + f" {fraction * 100:.0f}%"
+
+def render_jobs(project):
+    """作业列表 Markdown + 可取消作业的下拉框"""
+    engine = get_engine(project)
+    jobs = engine.jobs.list(JOB_PANEL_LIMIT)
+    if not jobs:
+        table = "*暂无后台作业*"
+    else:
+        lines = ["| 作业 | 内容 | 状态 | 进度 | 耗时 | 说明 |", "|---|---|---|---|---|---|"]
+        for job in jobs:
+            detail = job.error if job.error else job.message
+            lines.append(f"| `{job.id}` | {job.title} | {STATE_LABELS[job.status]} | {_progress_bar(job.fraction)} "
+                         f"| {job.elapsed:.1f} 秒 | {detail or ''} |")
+        table = "\n".join(lines)
+    active = [job.id for job in jobs if job.active]
+    return table, gr.update(choices=active, value=active[0] if active else None)
+
+def cancel_job(project, job_id):
+    engine = get_engine(project)
+    if not job_id:
+        return ("⚠️ 请先选择作业",) + render_jobs(project)
+    ok = engine.jobs.cancel(job_id)
+    message = f"⏹️ 已请求取消作业 `{job_id}`" if ok else f"⚠️ 作业 `{job_id}` 已结束"
+    return (message,) + render_jobs(project)
+
+def archive_now(project):
+    engine = get_engine(project)
+    job = engine.request_archive()
+    message = f"📦 已提交归档作业 `{job.id}`" if job else "📦 归档已完成 (未开启后台归档)"
+    return (message,) + render_jobs(project)
+
+def _reindex_job(job, engine):
+    result = engine.search_index.refresh(progress=job.progress_callback("核对全文索引"))
+    # 同时全量核对相关文件检索索引 (平时只在产出物写入时增量更新)
+    job.report(message="核对相关文件检索索引")
+    engine.workspace_index.refresh()
+    engine.workspace_index.save()
+    return result
+
+@tracer.traced("web.rebuild_search_index")
+def rebuild_search_index(project):
+    """在后台全量核对全文索引 (只重新读取有变化的文件)"""
+    engine = get_engine(project)
+    if engine.search_index is None:
+        yield "⚠️ 全文检索未启用"
+        return
+    job = engine.jobs.submit("reindex", "核对全文索引", _reindex_job, engine, dedupe_key="reindex")
+    for _ in _follow_job(job):
+        yield _job_running_line(job)
+    if job.status != JOB_DONE:
+        yield job.describe()
+        return
+    updated, removed = job.result
+    counts = engine.search_index.stats()
+    yield (f"✅ 索引核对完成: 更新 {updated}，移除 {removed}，耗时 {job.elapsed:.2f} 秒。"
+           f" 当前收录: 任务 {counts['task']} / 归档 {counts['archive']} / 工作区 {counts['workspace']}")
+
+def _snapshot_outputs(engine, message=""):
+    """快照列表 Markdown + 快照下拉框"""
+    infos = list(reversed(engine.snapshots.list()))
+    if not infos:
+        table = "*暂无快照*"
+    else:
+        lines = ["| 快照 ID | 创建时间 | 文件数 | 大小 | 新增内容 | 备注 |", "|---|---|---|---|---|---|"]
+        for info in infos:
+            created = datetime.datetime.fromtimestamp(info.created).strftime("%Y-%m-%d %H:%M")
+            lines.append(f"| `{info.id}` | {created} | {info.files} | {format_size(info.bytes)} "
+                         f"| {info.new_files} 个 / {format_size(info.new_bytes)} | {info.label} |")
+        table = "\n".join(lines)
+    choices = [info.id for info in infos]
+    return message, table, gr.update(choices=choices, value=choices[0] if choices else None)
+
+def list_snapshots(project):
+    return _snapshot_outputs(get_engine(project))
+
+@tracer.traced("web.create_snapshot")
+def create_snapshot(project, label):
+    """在后台为 PROJECT_SPACE 创建增量快照 (未变化的文件不重新读取，相同内容只存一份)"""
+    engine = get_engine(project)
+    label = (label or "").strip()
+    job = engine.jobs.submit("snapshot", "创建工作区快照",
+                             lambda job: engine.snapshots.create(engine.project_space_dir, label=label,
+                                                                 progress=job.progress_callback("写入新增内容")))
+    for _ in _follow_job(job):
+        yield _job_running_line(job), gr.update(), gr.update()
+    if job.status != JOB_DONE:
+        yield _snapshot_outputs(engine, job.describe())
+        return
+    info = job.result
+    yield _snapshot_outputs(engine, f"✅ 已创建快照 `{info.id}`: {info.files} 个文件，新增 {info.new_files} 个 "
+                            f"({format_size(info.new_bytes)})，耗时 {job.elapsed:.2f} 秒")
+
+def _restore_job(job, engine, snapshot_id, clean):
+    result = engine.snapshots.restore(snapshot_id, target=engine.project_space_dir, clean=clean,
+                                      progress=job.progress_callback("恢复文件"))
+    if engine.search_index is not None:
+        engine.search_index.refresh(kinds=("workspace",))
+    # 恢复改写了整个 PROJECT_SPACE，相关文件检索索引全量核对一次
+    engine.workspace_index.refresh()
+    return result
+
+@tracer.traced("web.restore_snapshot")
+def restore_snapshot(project, snapshot_id, clean):
+    engine = get_engine(project)
+    if not snapshot_id:
+        yield "⚠️ 请先选择快照"
+        return
+    job = engine.jobs.submit("restore", f"恢复快照 {snapshot_id}", _restore_job, engine, snapshot_id, clean)
+    for _ in _follow_job(job):
+        yield _job_running_line(job)
+    if job.status != JOB_DONE:
+        yield job.describe()
+        return
+    written, unchanged, removed = job.result
+    yield f"✅ 已恢复快照 `{snapshot_id}`: 写入 {written} 个，未变化 {unchanged} 个，删除 {removed} 个"
+
+@tracer.traced("web.prune_snapshots")
+def prune_snapshots(project, keep):
+    engine = get_engine(project)
+    job = engine.jobs.submit("prune", "清理旧快照", lambda job: engine.snapshots.prune(keep=int(keep)))
+    for _ in _follow_job(job):
+        yield _job_running_line(job), gr.update(), gr.update()
+    if job.status != JOB_DONE:
+        yield _snapshot_outputs(engine, job.describe())
+        return
+    dropped, objects, freed = job.result
+    yield _snapshot_outputs(engine, f"✅ 删除 {dropped} 个快照，回收 {objects} 个对象 ({format_size(freed)})")
+
+def _cleanup_job(job, engine):
+    lines = []
+    def log(line):
+        lines.append(line)
+        if line.startswith("[成功]") or line.startswith("[跳过]"):
+            job.report(message=line)
+    # 清理会整体移走 ARCHIVE/，先关闭归档清单与压缩包句柄 (之后访问时自动重新打开)
+    engine.archive.close()
+    ok = cleanup_workspace(assume_yes=True, snapshot=True, store=engine.snapshots, log=log,
+                           progress=job.progress_callback("创建 PROJECT_SPACE 快照"),
+                           archive_dir=engine.archive_dir, messages_dir=engine.messages_dir,
+                           project_space=engine.project_space_dir)
+    if engine.search_index is not None:
+        job.report(message="核对全文索引")
+        engine.search_index.refresh()
+    engine.workspace_index.refresh()
+    return ok, lines
+
+@tracer.traced("web.snapshot_and_cleanup")
+def snapshot_and_cleanup(project, confirmed):
+    """在后台快照 PROJECT_SPACE 后清理工作区 (等同 cleanup_workspace.py --yes --snapshot)"""
+    engine = get_engine(project)
+    if not confirmed:
+        yield _snapshot_outputs(engine, "⚠️ 请先勾选确认：将清空 MESSAGES 与 PROJECT_SPACE，并把 ARCHIVE 移至备份目录")
+        return
+    job = engine.jobs.submit("cleanup", "快照并清理工作区", _cleanup_job, engine)
+    for _ in _follow_job(job):
+        yield _job_running_line(job), gr.update(), gr.update()
+    if job.status != JOB_DONE:
+        yield _snapshot_outputs(engine, job.describe())
+        return
+    ok, lines = job.result
+    report = "\n".join(line.strip("\n") for line in lines if line.strip() and not line.strip().startswith("====="))
+    yield _snapshot_outputs(engine, ("✅ " if ok else "❌ ") + f"清理{'完成' if ok else '中止'}\n```\n{report}\n```")
+
+# 目录下拉框中“返回上一级”的取值 (不会与相对路径冲突)
+PARENT_DIR_CHOICE = "::parent::"
 
 # 闲聊助手预设
 CHAT_PERSONAS = {
@@ -498,12 +736,14 @@ CHAT_PERSONAS = {
     "霸道总裁": "你是一个霸道总裁。A1_Nexus 系统是你名下的一个小产业。你说话总是带着居高临下、霸道但又莫名宠溺的语气。你称呼用户为'女人'或'小家伙'（无论用户性别）。你可以看到系统状态，并用总裁视察工作的口吻向用户汇报。"
 }
 
-def chat_with_assistant(message, history, persona_name):
+@tracer.traced("web.chat_with_assistant")
+def chat_with_assistant(project, message, history, persona_name):
     """闲聊助手对话逻辑"""
+    config_mgr = get_config_mgr()
     if not message:
         return "", history
         
-    system_status = get_system_status()
+    system_status = get_system_status(project)
     persona_prompt = CHAT_PERSONAS.get(persona_name, CHAT_PERSONAS["温柔助手"])
     
     full_system_prompt = f"{persona_prompt}\n\n【当前系统状态参考（仅供参考，用户不问就别主动提）】\n{system_status}"
@@ -543,10 +783,39 @@ def toggle_ui_mode(mode):
         gr.update(visible=is_pro), # manual_task_tab
         gr.update(visible=is_pro), # personas_tab
         gr.update(visible=is_pro), # workspace_tab
+        gr.update(visible=is_pro), # search_tab
+        gr.update(visible=is_pro), # jobs_tab
         gr.update(visible=is_pro), # architect_tab
         gr.update(visible=is_pro)  # settings_tab
     ]
 
+def load_form_defaults(project):
+    """页面打开后填充依赖配置与角色目录的表单默认值: 递归拆解开关、接收者、快照保留数、角色模型分配的角色"""
+    engine = get_engine(project)
+    recursive = (get_config_mgr().config["system"].get("planning") or {}).get("recursive", False)
+    personas = [p.stem for p in engine.personas_dir.glob("*.md")]
+    receivers = personas or ["P8_技术", "P8_文案", "P9_行政合规审计"]
+    # 角色模型分配: 角色目录 + 系统内置角色和聊天助手
+    roles = personas + [role for role in ["P1_Nexus", "P8_架构师"] + list(CHAT_PERSONAS.keys()) if role not in personas]
+    return (gr.update(value=recursive), gr.update(choices=receivers, value=receivers[0]),
+            gr.update(value=engine.snapshots.keep or DEFAULT_SNAPSHOT_KEEP), gr.update(choices=roles))
+
+def list_projects(project):
+    """重新扫描 PROJECTS/，返回项目下拉框的更新"""
+    return gr.update(choices=get_registry().refresh(), value=project)
+
+@tracer.traced("web.switch_project")
+def switch_project(project, name):
+    """
+    切换本会话操作的项目，返回 (项目下拉框, 会话项目, 状态栏)。
+    只改变本会话的 project_state，其他浏览器会话与进行中的自动流水线仍使用各自的项目。
+    """
+    try:
+        engine = get_engine(name)
+    except KeyError as e:
+        return gr.update(value=project), project, f"❌ {e.args[0]}"
+    return gr.update(), engine.project, get_system_status(engine.project)
+
 # 构建 Gradio 界面
 with gr.Blocks(title="A1_Nexus 智能控制台") as demo:
     with gr.Row():
@@ -557,14 +826,18 @@ with gr.Blocks(title="A1_Nexus 智能控制台") as demo:
             ui_mode_radio = gr.Radio(choices=["简洁模式", "专业模式"], value="专业模式", label="界面模式", info="简洁模式隐藏高级配置")
     
     with gr.Row():
-        status_md = gr.Markdown(get_system_status())
+        status_md = gr.Markdown("⏳ 正在加载状态...")
+        # 本会话选中的项目 (每个浏览器会话各自一份)
+        project_state = gr.State(DEFAULT_PROJECT)
+        project_dropdown = gr.Dropdown(choices=[DEFAULT_PROJECT], value=DEFAULT_PROJECT, label="当前项目",
+                                       info="PROJECTS/ 下的项目目录", scale=0, min_width=180)
         refresh_btn = gr.Button("🔄 刷新全局状态", size="sm")
         
     with gr.Tabs() as main_tabs:
         with gr.TabItem("📊 仪表盘 & 任务看板"):
             with gr.Row():
                 with gr.Column(scale=2):
-                    task_list_md = gr.Markdown(get_task_list())
+                    task_list_md = gr.Markdown("")
                 with gr.Column(scale=1):
                     gr.Markdown("### ⚙️ 快捷操作")
                     step_btn = gr.Button("▶️ 执行下一步 (手动)", variant="secondary")
@@ -572,26 +845,29 @@ with gr.Blocks(title="A1_Nexus 智能控制台") as demo:
                     gr.Markdown("### 📝 执行日志")
                     log_output = gr.Textbox(label="执行日志", lines=15, max_lines=30, interactive=False, value="等待执行...")
             
-            step_btn.click(fn=run_one_step, outputs=log_output).then(
-                fn=get_task_list, outputs=task_list_md
+            step_btn.click(fn=run_one_step, inputs=[project_state], outputs=log_output).then(
+                fn=get_task_list, inputs=[project_state], outputs=task_list_md
             ).then(
-                fn=get_system_status, outputs=status_md
+                fn=get_system_status, inputs=[project_state], outputs=status_md
             )
             
             # 自动运行按钮逻辑：先切换状态，再根据状态决定是否执行
             auto_btn.click(
                 fn=toggle_auto_run,
+                inputs=[project_state],
                 outputs=[auto_btn, log_output]
             ).then(
                 fn=auto_run_all,
+                inputs=[project_state],
                 outputs=log_output
             ).then(
-                fn=get_task_list, outputs=task_list_md
+                fn=get_task_list, inputs=[project_state], outputs=task_list_md
             ).then(
-                fn=get_system_status, outputs=status_md
+                fn=get_system_status, inputs=[project_state], outputs=status_md
             ).then(
                 # 执行完毕后，如果是因为任务完成而停止，重置按钮状态
-                fn=lambda: ("🚀 一键全自动执行" if not auto_run_flag else "⏸️ 暂停自动执行"),
+                fn=auto_run_button,
+                inputs=[project_state],
                 outputs=[auto_btn]
             )
             
@@ -613,23 +889,23 @@ with gr.Blocks(title="A1_Nexus 智能控制台") as demo:
                 chat_input = gr.Textbox(show_label=False, placeholder="输入你想说的话，按回车发送...", scale=4)
                 chat_submit = gr.Button("发送", variant="primary", scale=1)
                 
-            chat_input.submit(fn=chat_with_assistant, inputs=[chat_input, chatbot, chat_persona_dropdown], outputs=[chat_input, chatbot])
-            chat_submit.click(fn=chat_with_assistant, inputs=[chat_input, chatbot, chat_persona_dropdown], outputs=[chat_input, chatbot])
+            chat_input.submit(fn=chat_with_assistant, inputs=[project_state, chat_input, chatbot, chat_persona_dropdown], outputs=[chat_input, chatbot])
+            chat_submit.click(fn=chat_with_assistant, inputs=[project_state, chat_input, chatbot, chat_persona_dropdown], outputs=[chat_input, chatbot])
 
         with gr.TabItem(" 工作历史记录", visible=True) as history_tab:
             gr.Markdown("查看系统过去的工作记录。您可以选择查看原始数据，或者让 AI 将其翻译成通俗易懂的汇报。")
             
             with gr.Tabs():
                 with gr.TabItem("📋 原始记录"):
-                    history_direct_md = gr.Markdown(format_history_direct())
+                    history_direct_md = gr.Markdown("")
                     refresh_direct_btn = gr.Button("🔄 刷新记录", size="sm")
-                    refresh_direct_btn.click(fn=format_history_direct, outputs=history_direct_md)
+                    refresh_direct_btn.click(fn=format_history_direct, inputs=[project_state], outputs=history_direct_md)
                     
                 with gr.TabItem("🗣️ AI 汇报 (人话版)"):
                     gr.Markdown("调用 P1 将最近的工作记录翻译成通俗易懂的语言。")
                     history_translated_md = gr.Markdown("点击下方按钮生成汇报...")
                     translate_btn = gr.Button("✨ 生成 AI 汇报", variant="primary")
-                    translate_btn.click(fn=format_history_translated, outputs=history_translated_md)
+                    translate_btn.click(fn=format_history_translated, inputs=[project_state], outputs=history_translated_md)
 
         with gr.TabItem("➕ 下发新任务"):
             gr.Markdown("在这里作为 P1 (总包工头) 向虚拟员工下发任务。")
@@ -638,27 +914,27 @@ with gr.Blocks(title="A1_Nexus 智能控制台") as demo:
                 with gr.TabItem("🤖 AI 自动拆解 (推荐)"):
                     gr.Markdown("输入一个宏大的目标，让 P1 自动为您拆解为多个子任务并下发。")
                     macro_task_input = gr.Textbox(label="宏观任务描述", lines=5, placeholder="例如：帮我写一个贪吃蛇游戏，包含 HTML/CSS/JS，并写一份使用说明。")
+                    recursive_checkbox = gr.Checkbox(
+                        label="🌲 递归拆解 (P1 拆分工作包，各 P8 主管并行细化为执行层任务，适合大型项目)",
+                        value=False
+                    )
                     auto_breakdown_btn = gr.Button("✨ 自动拆解并生成任务", variant="primary")
                     auto_breakdown_result = gr.Markdown("")
                     
                     auto_breakdown_btn.click(
                         fn=auto_breakdown_task,
-                        inputs=[macro_task_input],
+                        inputs=[project_state, macro_task_input, recursive_checkbox],
                         outputs=auto_breakdown_result
                     ).then(
-                        fn=get_task_list, outputs=task_list_md
+                        fn=get_task_list, inputs=[project_state], outputs=task_list_md
                     ).then(
-                        fn=get_system_status, outputs=status_md
+                        fn=get_system_status, inputs=[project_state], outputs=status_md
                     )
 
                 with gr.TabItem("✍️ 手动创建单步任务", visible=True) as manual_task_tab:
-                    # 获取可用角色
-                    personas = [p.stem for p in engine.personas_dir.glob("*.md")]
-                    if not personas:
-                        personas = ["P8_技术", "P8_文案", "P9_行政合规审计"]
-                        
                     with gr.Row():
-                        receiver_dropdown = gr.Dropdown(choices=personas, label="接收者 (虚拟员工)", value=personas[0] if personas else None)
+                        # 可用角色在页面打开后加载
+                        receiver_dropdown = gr.Dropdown(choices=[], label="接收者 (虚拟员工)")
                         depends_input = gr.Textbox(label="依赖任务 ID (逗号分隔，无依赖填 NONE)", value="NONE")
                         
                     task_desc_input = gr.Textbox(label="任务详细描述", lines=10, placeholder="请详细描述任务目标和要求...")
@@ -667,19 +943,19 @@ with gr.Blocks(title="A1_Nexus 智能控制台") as demo:
                     
                     create_btn.click(
                         fn=create_new_task, 
-                        inputs=[receiver_dropdown, task_desc_input, depends_input], 
+                        inputs=[project_state, receiver_dropdown, task_desc_input, depends_input], 
                         outputs=create_result
                     ).then(
-                        fn=get_task_list, outputs=task_list_md
+                        fn=get_task_list, inputs=[project_state], outputs=task_list_md
                     ).then(
-                        fn=get_system_status, outputs=status_md
+                        fn=get_system_status, inputs=[project_state], outputs=status_md
                     )
 
         with gr.TabItem("👥 角色管理 (Personas)", visible=True) as personas_tab:
             gr.Markdown("管理系统中的虚拟员工角色设定。")
             with gr.Row():
                 with gr.Column(scale=1):
-                    persona_list = gr.Dropdown(choices=get_personas_list(), label="选择角色", interactive=True)
+                    persona_list = gr.Dropdown(choices=[], label="选择角色", interactive=True)
                     refresh_personas_btn = gr.Button("🔄 刷新列表", size="sm")
                     
                     gr.Markdown("---")
@@ -692,53 +968,150 @@ with gr.Blocks(title="A1_Nexus 智能控制台") as demo:
                     save_persona_btn = gr.Button("💾 保存修改", variant="primary")
                     persona_msg = gr.Markdown("")
             
-            persona_list.change(fn=get_persona_content, inputs=[persona_list], outputs=[persona_editor])
-            refresh_personas_btn.click(fn=lambda: gr.update(choices=get_personas_list()), outputs=[persona_list])
-            save_persona_btn.click(fn=save_persona_content, inputs=[persona_list, persona_editor], outputs=[persona_msg])
-            create_persona_btn.click(fn=create_new_persona, inputs=[new_persona_name, persona_editor], outputs=[persona_msg, persona_list])
+            persona_list.change(fn=get_persona_content, inputs=[project_state, persona_list], outputs=[persona_editor])
+            refresh_personas_btn.click(fn=lambda project: gr.update(choices=get_personas_list(project)), inputs=[project_state], outputs=[persona_list])
+            save_persona_btn.click(fn=save_persona_content, inputs=[project_state, persona_list, persona_editor], outputs=[persona_msg])
+            create_persona_btn.click(fn=create_new_persona, inputs=[project_state, new_persona_name, persona_editor], outputs=[persona_msg, persona_list])
 
         with gr.TabItem("📁 工作区 (Project Space)", visible=True) as workspace_tab:
-            gr.Markdown("查看 AI 生成的项目文件。")
+            gr.Markdown("查看 AI 生成的项目文件。目录按需逐级展开，打开本页时才会读取。")
+            ws_current_dir = gr.State("")
             with gr.Row():
                 with gr.Column(scale=1):
-                    workspace_tree = gr.Markdown(get_workspace_files())
+                    ws_breadcrumb = gr.Markdown("**📁 PROJECT_SPACE/**")
+                    ws_entries = gr.Dropdown(label="当前目录 (选择目录进入，选择文件预览)", choices=[], interactive=True)
                     refresh_ws_btn = gr.Button("🔄 刷新目录", size="sm")
                     file_to_read = gr.Textbox(label="输入要查看的文件路径 (相对 PROJECT_SPACE)", placeholder="例如: index.html")
                     read_file_btn = gr.Button("📄 查看文件内容")
+                    with gr.Accordion("🌳 目录树概览", open=False):
+                        workspace_tree = gr.Markdown("")
+                        refresh_tree_btn = gr.Button("🔄 生成概览", size="sm")
                 with gr.Column(scale=2):
+                    with gr.Row():
+                        preview_mode = gr.Radio(choices=list(PREVIEW_MODES), value="文本", label="预览方式", scale=3)
+                        preview_start = gr.Number(value=1, precision=0, label="起始行 (十六进制为字节偏移)", scale=1)
+                    preview_info = gr.Markdown("")
                     file_content_view = gr.TextArea(label="文件内容预览", lines=25, interactive=False)
+                    with gr.Row():
+                        prev_page_btn = gr.Button("⬅️ 上一页", size="sm")
+                        next_page_btn = gr.Button("下一页 ➡️", size="sm")
+                        follow_btn = gr.Button("⏬ 跟随新内容", size="sm")
+                    preview_state = gr.State({})
             
-            refresh_ws_btn.click(fn=get_workspace_files, outputs=[workspace_tree])
-            read_file_btn.click(fn=read_workspace_file, inputs=[file_to_read], outputs=[file_content_view])
+            preview_outputs = [file_content_view, preview_info, preview_state, preview_start]
+            ws_outputs = [ws_current_dir, ws_entries, ws_breadcrumb]
+            workspace_tab.select(fn=list_workspace_dir, inputs=[project_state, ws_current_dir], outputs=ws_outputs)
+            refresh_ws_btn.click(fn=list_workspace_dir, inputs=[project_state, ws_current_dir], outputs=ws_outputs)
+            ws_entries.input(fn=open_workspace_entry, inputs=[project_state, ws_entries, ws_current_dir, preview_mode],
+                             outputs=ws_outputs + [file_to_read] + preview_outputs)
+            refresh_tree_btn.click(fn=get_workspace_files, inputs=[project_state], outputs=[workspace_tree])
+            read_file_btn.click(fn=preview_workspace_file, inputs=[project_state, file_to_read, preview_mode, preview_start], outputs=preview_outputs)
+            preview_mode.input(fn=lambda project, path, mode: preview_workspace_file(project, path, mode, 0 if mode == "十六进制" else 1),
+                               inputs=[project_state, file_to_read, preview_mode], outputs=preview_outputs)
+            prev_page_btn.click(fn=lambda project, state: page_workspace_file(project, state, forward=False), inputs=[project_state, preview_state], outputs=preview_outputs)
+            next_page_btn.click(fn=lambda project, state: page_workspace_file(project, state, forward=True), inputs=[project_state, preview_state], outputs=preview_outputs)
+            follow_btn.click(fn=follow_workspace_file, inputs=[project_state, preview_state, file_content_view], outputs=preview_outputs)
+
+            with gr.Accordion("📸 工作区快照", open=False):
+                gr.Markdown("内容寻址的增量快照：未修改的文件不会重复存储。命令行: `python SYSTEM/snapshot_store.py list`")
+                snapshot_table = gr.Markdown("")
+                refresh_snapshots_btn = gr.Button("🔄 刷新快照列表", size="sm")
+                with gr.Row():
+                    snapshot_label = gr.Textbox(label="快照备注", placeholder="例如: v1 交付前", scale=2)
+                    create_snapshot_btn = gr.Button("📸 创建快照", variant="primary", scale=1)
+                with gr.Row():
+                    snapshot_choice = gr.Dropdown(label="选择快照", choices=[], scale=2)
+                    restore_clean = gr.Checkbox(label="删除快照中不存在的文件", value=False, scale=1)
+                    restore_snapshot_btn = gr.Button("⏪ 恢复到 PROJECT_SPACE", scale=1)
+                with gr.Row():
+                    prune_keep = gr.Number(label="保留最近的快照数", value=DEFAULT_SNAPSHOT_KEEP, precision=0, scale=1)
+                    prune_snapshots_btn = gr.Button("🧹 清理旧快照", scale=1)
+                    cleanup_confirm = gr.Checkbox(label="确认清空 MESSAGES / PROJECT_SPACE 并备份 ARCHIVE", value=False, scale=2)
+                    cleanup_btn = gr.Button("🗑️ 快照并清理工作区", variant="stop", scale=1)
+                snapshot_msg = gr.Markdown("")
+
+            snapshot_outputs = [snapshot_msg, snapshot_table, snapshot_choice]
+            refresh_snapshots_btn.click(fn=list_snapshots, inputs=[project_state], outputs=snapshot_outputs)
+            create_snapshot_btn.click(fn=create_snapshot, inputs=[project_state, snapshot_label], outputs=snapshot_outputs)
+            restore_snapshot_btn.click(fn=restore_snapshot, inputs=[project_state, snapshot_choice, restore_clean], outputs=[snapshot_msg])
+            prune_snapshots_btn.click(fn=prune_snapshots, inputs=[project_state, prune_keep], outputs=snapshot_outputs)
+            cleanup_btn.click(fn=snapshot_and_cleanup, inputs=[project_state, cleanup_confirm], outputs=snapshot_outputs)
+
+        with gr.TabItem("🔎 全文检索", visible=True) as search_tab:
+            gr.Markdown("在任务、归档结果与工作区文件中检索 (例如查找是哪个任务产出了某段代码)。多个检索词之间为 AND 关系。")
+            with gr.Row():
+                search_query = gr.Textbox(label="检索词", placeholder="例如: UserService 登录", scale=3)
+                search_btn = gr.Button("🔎 检索", variant="primary", scale=1)
+            with gr.Row():
+                search_task_id = gr.Textbox(label="任务 ID", placeholder="ID012")
+                search_receiver = gr.Textbox(label="接收者 (前缀)", placeholder="P8")
+                search_status = gr.Dropdown(label="状态", choices=SEARCH_STATUS_CHOICES, value="")
+                search_kind = gr.Dropdown(label="范围", choices=SEARCH_KIND_CHOICES, value="")
+                search_since = gr.Textbox(label="起始日期", placeholder="YYYY-MM-DD")
+                search_until = gr.Textbox(label="截止日期", placeholder="YYYY-MM-DD")
+            search_results = gr.Markdown("")
+            with gr.Row():
+                reindex_btn = gr.Button("🔄 核对索引", size="sm")
+                reindex_msg = gr.Markdown("")
+
+            search_inputs = [project_state, search_query, search_task_id, search_receiver, search_status, search_kind, search_since, search_until]
+            search_btn.click(fn=search_everything, inputs=search_inputs, outputs=[search_results])
+            search_query.submit(fn=search_everything, inputs=search_inputs, outputs=[search_results])
+            reindex_btn.click(fn=rebuild_search_index, inputs=[project_state], outputs=[reindex_msg])
+
+        with gr.TabItem("🧰 后台作业", visible=True) as jobs_tab:
+            gr.Markdown("归档、快照、清理与索引核对在后台排队执行，任务调度与执行不会等待它们。")
+            jobs_table = gr.Markdown("")
+            with gr.Row():
+                refresh_jobs_btn = gr.Button("🔄 刷新", size="sm")
+                archive_now_btn = gr.Button("📦 立即归档", size="sm")
+            with gr.Row():
+                cancel_job_choice = gr.Dropdown(label="进行中的作业", choices=[], scale=3)
+                cancel_job_btn = gr.Button("⏹️ 取消作业", variant="stop", scale=1)
+            jobs_msg = gr.Markdown("")
+
+            jobs_outputs = [jobs_table, cancel_job_choice]
+            jobs_tab.select(fn=render_jobs, inputs=[project_state], outputs=jobs_outputs)
+            refresh_jobs_btn.click(fn=render_jobs, inputs=[project_state], outputs=jobs_outputs)
+            archive_now_btn.click(fn=archive_now, inputs=[project_state], outputs=[jobs_msg] + jobs_outputs)
+            cancel_job_btn.click(fn=cancel_job, inputs=[project_state, cancel_job_choice], outputs=[jobs_msg] + jobs_outputs)
 
         with gr.TabItem("💡 架构师建议", visible=True) as architect_tab:
             gr.Markdown("让 P8_架构师 审视当前项目，并主动提出改进建议。")
             
-            def get_architect_suggestion(progress=gr.Progress()):
+            focus_input = gr.Textbox(label="关注点 (可选)", placeholder="例如：登录模块的错误处理、存档数据结构... 留空则以当前看板上的任务为线索")
+
+            @tracer.traced("web.get_architect_suggestion")
+            def get_architect_suggestion(project, focus="", progress=gr.Progress()):
+                engine = get_engine(project)
+                config_mgr = get_config_mgr()
                 progress(0, desc="正在收集项目信息...")
                 
                 # 收集项目文件内容
                 project_info = "### 当前项目文件结构：\n"
-                project_info += get_workspace_files() + "\n\n"
+                project_info += get_workspace_files(project) + "\n\n"
                 
-                project_info += "### 核心文件内容：\n"
-                # 简单读取几个核心文件，避免超出 token 限制
-                for filepath in engine.project_space_dir.rglob("*"):
-                    if filepath.is_file() and filepath.suffix in ['.py', '.js', '.html', '.css', '.md']:
-                        try:
-                            with open(filepath, "r", encoding="utf-8") as f:
-                                content = f.read()
-                                # 截断过长的文件
-                                if len(content) > 2000:
-                                    content = content[:2000] + "\n... (内容过长已截断)"
-                                project_info += f"#### {filepath.relative_to(engine.project_space_dir)}\n```\n{content}\n```\n\n"
-                        except Exception:
-                            pass
+                # 按关注点 (或看板上的任务描述) 从本地索引中检索最相关的文件片段，避免整库塞进提示词
+                query = focus.strip() if focus else ""
+                if not query:
+                    query = " ".join(t["filename"] for t in engine.parse_tasks())
+                    query += " " + " ".join(entry.name for entry in engine.archive.recent(ARCHITECT_RECENT_ARCHIVED))
+                project_info += "### 核心文件内容 (按相关度检索)：\n"
+                with tracer.span("web.architect.retrieve") as span:
+                    engine.workspace_index.refresh_if_due()
+                    engine.workspace_index.save()
+                    snippets, hits = engine.workspace_index.build_context(
+                        query,
+                        top_k=engine.retrieval_cfg.get("top_k", DEFAULT_TOP_K),
+                        budget_chars=engine.retrieval_cfg.get("context_chars", DEFAULT_CONTEXT_CHARS)
+                    )
+                    span.set_attribute("project_space.hits", len(hits))
+                project_info += snippets or "(未检索到相关文件)\n"
                             
                 progress(0.3, desc="正在调用 P8_架构师 分析项目...")
                 
                 # 获取 P8_架构师 的设定
-                persona_content = get_persona_content("P8_架构师.md")
+                persona_content = get_persona_content(project, "P8_架构师.md")
                 if not persona_content:
                     return "❌ 找不到 P8_架构师 的角色设定文件。"
                     
@@ -769,12 +1142,13 @@ with gr.Blocks(title="A1_Nexus 智能控制台") as demo:
             suggest_btn = gr.Button("🧠 获取架构师建议", variant="primary")
             suggestion_output = gr.Markdown("点击上方按钮获取建议...")
             
-            def accept_suggestion(suggestion_text):
+            def accept_suggestion(project, suggestion_text):
                 if not suggestion_text or "点击上方按钮" in suggestion_text or "获取建议失败" in suggestion_text:
                     return "❌ 没有可采纳的建议。"
                 
                 # 自动将建议转化为 P1 给 P8_技术 的任务
                 res = create_new_task(
+                    project,
                     receiver="P8_技术主管", 
                     task_desc=f"请根据以下架构师建议进行代码重构和优化：\n\n{suggestion_text}", 
                     depends_on="NONE"
@@ -790,11 +1164,11 @@ with gr.Blocks(title="A1_Nexus 智能控制台") as demo:
                 
             action_result = gr.Markdown("")
 
-            suggest_btn.click(fn=get_architect_suggestion, outputs=suggestion_output)
-            accept_btn.click(fn=accept_suggestion, inputs=[suggestion_output], outputs=[action_result]).then(
-                fn=get_task_list, outputs=task_list_md
+            suggest_btn.click(fn=get_architect_suggestion, inputs=[project_state, focus_input], outputs=suggestion_output)
+            accept_btn.click(fn=accept_suggestion, inputs=[project_state, suggestion_output], outputs=[action_result]).then(
+                fn=get_task_list, inputs=[project_state], outputs=task_list_md
             ).then(
-                fn=get_system_status, outputs=status_md
+                fn=get_system_status, inputs=[project_state], outputs=status_md
             )
             reject_btn.click(fn=reject_suggestion, outputs=[action_result])
 
@@ -824,9 +1198,8 @@ DEFAULT_MODEL="{model}"
                                 f.write(env_content)
                             # 重新加载环境变量
                             load_dotenv(override=True)
-                            # 重新加载配置管理器
-                            global config_mgr
-                            config_mgr = ConfigManager()
+                            # 重新加载配置 (以新的环境变量替换配置中的 ${...})
+                            get_config_mgr().reload()
                             return "✅ API 配置已保存到 .env 文件！"
                         except Exception as e:
                             return f"❌ 保存失败: {e}"
@@ -877,15 +1250,16 @@ DEFAULT_MODEL="{model}"
                     )
 
                 with gr.TabItem("📝 文本配置 (config.yaml)"):
-                    config_editor = gr.TextArea(label="config.yaml", value=get_config_yaml(), lines=25)
+                    config_editor = gr.TextArea(label="config.yaml", lines=25)
                     save_config_btn = gr.Button("💾 保存配置", variant="primary")
                     config_msg = gr.Markdown("")
                     save_config_btn.click(fn=save_config_yaml, inputs=[config_editor], outputs=[config_msg])
                     
-                with gr.TabItem("🤖 角色模型分配"):
+                with gr.TabItem("🤖 角色模型分配") as role_models_tab:
                     gr.Markdown("为不同的虚拟员工分配特定的 AI 模型。")
                     
                     def get_role_overrides_ui():
+                        config_mgr = get_config_mgr()
                         import yaml
                         config_path = Path("SYSTEM/config.yaml")
                         if not config_path.exists():
@@ -920,7 +1294,7 @@ DEFAULT_MODEL="{model}"
                         return "\n\n".join(ui_elements)
                         
                     def update_role_model(role_name, selected_model_display):
-                        global config_mgr
+                        config_mgr = get_config_mgr()
                         if not role_name or not selected_model_display:
                             return "❌ 请选择角色和模型", get_role_overrides_ui()
                             
@@ -951,38 +1325,31 @@ DEFAULT_MODEL="{model}"
                             yaml.dump(config, f, allow_unicode=True, sort_keys=False)
                             
                         # 重新加载配置
-                        config_mgr = ConfigManager()
+                        config_mgr.reload()
                         
                         return f"✅ 成功将 {role_name} 的模型设置为 {selected_model_display}", get_role_overrides_ui()
 
                     with gr.Row():
                         with gr.Column(scale=1):
                             gr.Markdown("### 当前分配情况")
-                            role_models_display = gr.Markdown(get_role_overrides_ui())
+                            role_models_display = gr.Markdown("")
                             refresh_roles_btn = gr.Button("🔄 刷新显示", size="sm")
                         with gr.Column(scale=1):
                             gr.Markdown("### 修改分配")
-                            # 获取所有角色
-                            personas = [p.stem for p in engine.personas_dir.glob("*.md")]
-                            
-                            # 添加系统内置角色和聊天助手
-                            builtin_roles = ["P1_Nexus", "P8_架构师"] + list(CHAT_PERSONAS.keys())
-                            for role in builtin_roles:
-                                if role not in personas:
-                                    personas.append(role)
-                                    
-                            if not personas:
-                                personas = ["P1_Nexus", "P8_技术", "P8_文案", "P9_行政合规审计"]
-                            
-                            # 获取所有模型
-                            all_models = config_mgr.get_all_models()
-                            model_choices = [m["display"] for m in all_models]
-                            
-                            role_dropdown = gr.Dropdown(choices=personas, label="选择角色")
-                            model_dropdown = gr.Dropdown(choices=model_choices, label="选择模型")
+                            # 角色列表在页面打开后加载
+                            role_dropdown = gr.Dropdown(choices=[], label="选择角色")
+                            # 模型列表需要逐个请求各提供商的 API，打开本页时才拉取
+                            model_dropdown = gr.Dropdown(choices=[], label="选择模型")
                             update_role_btn = gr.Button("💾 保存分配", variant="primary")
                             update_role_msg = gr.Markdown("")
                             
+                    def load_model_choices():
+                        config_mgr = get_config_mgr()
+                        return gr.update(choices=[m["display"] for m in config_mgr.get_all_models()])
+
+                    role_models_tab.select(fn=get_role_overrides_ui, outputs=[role_models_display]).then(
+                        fn=load_model_choices, outputs=[model_dropdown]
+                    )
                     refresh_roles_btn.click(fn=get_role_overrides_ui, outputs=[role_models_display])
                     update_role_btn.click(
                         fn=update_role_model,
@@ -994,10 +1361,23 @@ DEFAULT_MODEL="{model}"
     ui_mode_radio.change(
         fn=toggle_ui_mode,
         inputs=[ui_mode_radio],
-        outputs=[history_tab, manual_task_tab, personas_tab, workspace_tab, architect_tab, settings_tab]
+        outputs=[history_tab, manual_task_tab, personas_tab, workspace_tab, search_tab, jobs_tab, architect_tab, settings_tab]
     )
 
-    refresh_btn.click(fn=get_system_status, outputs=status_md).then(fn=get_task_list, outputs=task_list_md)
+    refresh_btn.click(fn=get_system_status, inputs=[project_state], outputs=status_md).then(fn=get_task_list, inputs=[project_state], outputs=task_list_md)
+    project_dropdown.change(fn=switch_project, inputs=[project_state, project_dropdown],
+                            outputs=[project_dropdown, project_state, status_md]).then(
+        fn=get_task_list, inputs=[project_state], outputs=task_list_md).then(
+        fn=format_history_direct, inputs=[project_state], outputs=history_direct_md).then(
+        fn=auto_run_button, inputs=[project_state], outputs=[auto_btn])
+
+    # 面板数据在页面打开后再加载: 构建界面时不扫描任务、不读取历史与配置，服务启动即可访问
+    demo.load(fn=get_system_status, inputs=[project_state], outputs=status_md).then(fn=get_task_list, inputs=[project_state], outputs=task_list_md)
+    demo.load(fn=format_history_direct, inputs=[project_state], outputs=history_direct_md)
+    demo.load(fn=lambda project: gr.update(choices=get_personas_list(project)), inputs=[project_state], outputs=[persona_list])
+    demo.load(fn=get_config_yaml, outputs=config_editor)
+    demo.load(fn=load_form_defaults, inputs=[project_state], outputs=[recursive_checkbox, receiver_dropdown, prune_keep, role_dropdown])
+    demo.load(fn=list_projects, inputs=[project_state], outputs=project_dropdown)
 
 if __name__ == "__main__":
     # 启动 Web UI，允许局域网访问
@@ -0,0 +1,47 @@
+import os
+import json
+import datetime
+import threading
+from pathlib import Path
+
+DEFAULT_HISTORY_FILE = "SYSTEM/work_history.json"
+# 只保留最近的记录
+MAX_RECORDS = 100
+
+# Web UI、HTTP API 与并行执行线程可能同时写入
+_lock = threading.Lock()
+
+
+def get_work_history(history_file=DEFAULT_HISTORY_FILE):
+    """获取工作历史记录 (新的在前)"""
+    history_file = Path(history_file)
+    if not history_file.exists():
+        return []
+    try:
+        with open(history_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return []
+
+
+def record_work_history(task, success, history_file=DEFAULT_HISTORY_FILE):
+    """记录一次任务执行结果"""
+    record = {
+        "time": datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "task_id": task.get("id", "Unknown"),
+        "receiver": task.get("receiver", "Unknown"),
+        "status": "Success" if success else "Failed",
+        "filename": task.get("filename", "Unknown")
+    }
+    with _lock:
+        history = get_work_history(history_file)
+        history.insert(0, record)  # 插入到最前面
+        history = history[:MAX_RECORDS]
+        try:
+            tmp_path = f"{history_file}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(history, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, history_file)
+        except Exception as e:
+            print(f"记录工作历史失败: {e}")
+    return record
@@ -0,0 +1,300 @@
+import os
+import re
+import json
+import math
+import time
+import threading
+from collections import Counter, defaultdict
+from pathlib import Path
+
+# 英文/数字标识符 (再按驼峰与下划线拆分) 与连续的中日韩字符
+WORD_RE = re.compile(r'[A-Za-z][A-Za-z0-9]*|\d+|[一-鿿]+')
+CAMEL_RE = re.compile(r'[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+')
+STOPWORDS = frozenset("""
+a an the and or not of to in on for is are be it as at by with from this that self return def class
+import if else elif true false none null var let const function new
+""".split())
+
+DEFAULT_IGNORE_DIRS = (".git", "node_modules", "__pycache__", ".venv", "venv", "dist", "build", ".idea", ".vscode")
+DEFAULT_CHUNK_LINES = 60
+DEFAULT_TOP_K = 8
+DEFAULT_CONTEXT_CHARS = 8000
+DEFAULT_MAX_FILE_BYTES = 1024 * 1024
+# 文件数不超过该值时仍在提示词中列出全部路径
+DEFAULT_LIST_FILES_BELOW = 50
+# 全量核对 (遍历整个 PROJECT_SPACE) 的最短间隔 (秒)；其余时候由写入方通过 sync_paths 增量更新，0 为只在首次使用时核对
+DEFAULT_RECONCILE_SECONDS = 300
+INDEX_VERSION = 1
+
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+
+def tokenize(text):
+    """分词: 标识符按驼峰/下划线拆分并转小写，中文按字的二元组切分 (无需外部分词库)"""
+    tokens = []
+    for word in WORD_RE.findall(text):
+        if word[0] >= "一":
+            if len(word) == 1:
+                tokens.append(word)
+            else:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+            continue
+        lower = word.lower()
+        if lower not in STOPWORDS and len(lower) > 1:
+            tokens.append(lower)
+        parts = CAMEL_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts if len(p) > 1 and p.lower() not in STOPWORDS)
+    return tokens
+
+
+class WorkspaceIndex:
+    """
+    PROJECT_SPACE 的本地 BM25 倒排索引 (纯离线，无需向量模型)。
+    - 文件按固定行数切块，以块为检索单位
+    - 产出物写入等已知变化的文件由 sync_paths() 增量更新
+    - refresh() 全量核对: 遍历目录，只对 (mtime, size) 变化的文件重新分词，删除的文件同步移出索引；
+      refresh_if_due() 在首次使用及每隔 reconcile_seconds 秒时执行一次，用于发现手工修改的文件
+    - 索引持久化到 JSON 文件，进程重启后无需全量重建
+    """
+    def __init__(self, root_dir, index_file=None, chunk_lines=DEFAULT_CHUNK_LINES,
+                 ignore_dirs=DEFAULT_IGNORE_DIRS, max_file_bytes=DEFAULT_MAX_FILE_BYTES,
+                 reconcile_seconds=DEFAULT_RECONCILE_SECONDS):
+        self.root_dir = Path(root_dir)
+        self.index_file = Path(index_file) if index_file else None
+        self.chunk_lines = chunk_lines
+        self.ignore_dirs = set(ignore_dirs)
+        self.max_file_bytes = max_file_bytes
+        self.reconcile_seconds = reconcile_seconds
+        self._reconciled_at = None
+        # 相对路径 -> {"key": [mtime_ns, size], "chunks": [[起始行, 结束行, 词数, {词: 词频}], ...]}
+        self.docs = {}
+        self.postings = defaultdict(dict)   # 词 -> {(相对路径, 块序号): 词频}
+        self.total_len = 0
+        self.chunk_count = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._load()
+
+    # ---------- 持久化 ----------
+    def _load(self):
+        if not self.index_file or not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("version") != INDEX_VERSION or data.get("chunk_lines") != self.chunk_lines:
+            return
+        for rel, doc in data.get("docs", {}).items():
+            self._add_doc(rel, doc)
+
+    def save(self):
+        if not self.index_file or not self._dirty:
+            return
+        with self._lock:
+            payload = {"version": INDEX_VERSION, "chunk_lines": self.chunk_lines, "docs": self.docs}
+            self.index_file.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.index_file.with_suffix(".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+            tmp_path.replace(self.index_file)
+            self._dirty = False
+
+    # ---------- 索引维护 ----------
+    def _add_doc(self, rel, doc):
+        self.docs[rel] = doc
+        for i, (_, _, length, tf) in enumerate(doc["chunks"]):
+            for term, count in tf.items():
+                self.postings[term][(rel, i)] = count
+            self.total_len += length
+            self.chunk_count += 1
+
+    def _remove_doc(self, rel):
+        doc = self.docs.pop(rel, None)
+        if not doc:
+            return
+        for i, (_, _, length, tf) in enumerate(doc["chunks"]):
+            for term in tf:
+                bucket = self.postings.get(term)
+                if bucket is not None:
+                    bucket.pop((rel, i), None)
+                    if not bucket:
+                        del self.postings[term]
+            self.total_len -= length
+            self.chunk_count -= 1
+
+    def _read_text(self, path):
+        with open(path, "rb") as f:
+            data = f.read(self.max_file_bytes + 1)
+        if len(data) > self.max_file_bytes or b"\0" in data[:8192]:
+            return None
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            return data.decode("gbk", errors="replace")
+
+    def _build_doc(self, rel, path, key):
+        text = self._read_text(path)
+        if text is None:
+            return None
+        lines = text.splitlines()
+        chunks = []
+        # 路径本身也参与检索 (如 "login" 命中 src/login_view.py)
+        path_tokens = tokenize(rel.replace("/", " "))
+        for start in range(0, max(len(lines), 1), self.chunk_lines):
+            block = lines[start:start + self.chunk_lines]
+            tokens = tokenize("\n".join(block)) + path_tokens
+            if not tokens:
+                continue
+            chunks.append([start + 1, start + len(block), len(tokens), dict(Counter(tokens))])
+        return {"key": list(key), "chunks": chunks}
+
+    def _walk(self):
+        for dirpath, dirnames, filenames in os.walk(self.root_dir):
+            dirnames[:] = [d for d in dirnames if d not in self.ignore_dirs and not d.startswith(".")]
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                yield os.path.join(dirpath, filename)
+
+    def _update_file(self, rel, path, st):
+        """(需持有锁) 文件的 (mtime, size) 变化时重新分词，返回是否更新"""
+        key = [st.st_mtime_ns, st.st_size]
+        doc = self.docs.get(rel)
+        if doc and doc["key"] == key:
+            return False
+        try:
+            new_doc = self._build_doc(rel, path, key)
+        except OSError:
+            return False
+        self._remove_doc(rel)
+        if new_doc:
+            self._add_doc(rel, new_doc)
+        else:
+            # 二进制或过大的文件: 只记录状态，避免每次刷新重复读取
+            self._add_doc(rel, {"key": key, "chunks": []})
+        return True
+
+    def refresh(self):
+        """全量核对: 遍历目录，只重新索引新增或修改过的文件，返回 (更新数, 删除数)"""
+        updated = removed = 0
+        seen = set()
+        with self._lock:
+            for path in self._walk():
+                rel = Path(path).relative_to(self.root_dir).as_posix()
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                seen.add(rel)
+                if self._update_file(rel, path, st):
+                    updated += 1
+            for rel in [r for r in self.docs if r not in seen]:
+                self._remove_doc(rel)
+                removed += 1
+            if updated or removed:
+                self._dirty = True
+            self._reconciled_at = time.monotonic()
+        return updated, removed
+
+    def refresh_if_due(self):
+        """首次使用或距上次全量核对超过 reconcile_seconds 秒时执行 refresh()，返回是否执行"""
+        with self._lock:
+            now = time.monotonic()
+            due = self._reconciled_at is None or (
+                self.reconcile_seconds and now - self._reconciled_at >= self.reconcile_seconds)
+            if due:
+                # 先占位，其他线程不再重复遍历
+                self._reconciled_at = now
+        if due:
+            self.refresh()
+        return bool(due)
+
+    def sync_paths(self, paths):
+        """增量更新已知发生变化 (新增 / 修改 / 删除) 的文件，不遍历目录，返回 (更新数, 删除数)"""
+        updated = removed = 0
+        root = self.root_dir.resolve()
+        with self._lock:
+            for path in paths:
+                try:
+                    rel_path = Path(path).resolve().relative_to(root)
+                except ValueError:
+                    continue
+                rel = rel_path.as_posix()
+                if any(part in self.ignore_dirs or part.startswith(".") for part in rel_path.parts):
+                    continue
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    st = None
+                if st is None or not os.path.isfile(path):
+                    if rel in self.docs:
+                        self._remove_doc(rel)
+                        removed += 1
+                elif self._update_file(rel, path, st):
+                    updated += 1
+            if updated or removed:
+                self._dirty = True
+        return updated, removed
+
+    # ---------- 检索 ----------
+    def search(self, query, top_k=DEFAULT_TOP_K):
+        """BM25 检索，返回 [(相对路径, 起始行, 结束行, 得分)]，同一文件最多返回 2 个块"""
+        terms = set(tokenize(query))
+        if not terms or not self.chunk_count:
+            return []
+        with self._lock:
+            avg_len = self.total_len / self.chunk_count
+            scores = defaultdict(float)
+            for term in terms:
+                bucket = self.postings.get(term)
+                if not bucket:
+                    continue
+                df = len(bucket)
+                idf = math.log(1 + (self.chunk_count - df + 0.5) / (df + 0.5))
+                for chunk_key, tf in bucket.items():
+                    length = self.docs[chunk_key[0]]["chunks"][chunk_key[1]][2]
+                    norm = tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len))
+                    scores[chunk_key] += idf * norm
+            ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+            hits = []
+            per_file = Counter()
+            for (rel, i), score in ranked:
+                if per_file[rel] >= 2:
+                    continue
+                per_file[rel] += 1
+                start, end = self.docs[rel]["chunks"][i][:2]
+                hits.append((rel, start, end, score))
+                if len(hits) >= top_k:
+                    break
+        return hits
+
+    def build_context(self, query, top_k=DEFAULT_TOP_K, budget_chars=DEFAULT_CONTEXT_CHARS):
+        """检索并拼装相关文件片段 (受总长度预算限制)，返回 (Markdown 文本, 命中列表)"""
+        hits = self.search(query, top_k)
+        parts = []
+        used = 0
+        included = []
+        for rel, start, end, score in hits:
+            try:
+                text = self._read_text(self.root_dir / rel) or ""
+            except OSError:
+                continue
+            snippet = "\n".join(text.splitlines()[start - 1:end])
+            block = f"#### {rel} (第 {start}-{end} 行，相关度 {score:.2f})\n```\n{snippet}\n```\n"
+            if used + len(block) > budget_chars:
+                remaining = budget_chars - used
+                if remaining < 400:
+                    break
+                block = block[:remaining - 20] + "\n...(片段已截断)\n```\n"
+            parts.append(block)
+            used += len(block)
+            included.append((rel, start, end, score))
+        return "\n".join(parts), included
+
+    def file_count(self):
+        return len(self.docs)
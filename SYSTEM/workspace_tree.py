@@ -0,0 +1,125 @@
+import os
+import fnmatch
+import threading
+from pathlib import Path, PurePosixPath
+from typing import NamedTuple, List
+
+from workspace_index import DEFAULT_IGNORE_DIRS
+
+DEFAULT_IGNORE_PATTERNS = DEFAULT_IGNORE_DIRS + ("*.pyc", ".DS_Store", "Thumbs.db", ".*.tmp")
+DEFAULT_MAX_DEPTH = 3
+# 单个目录最多列出的条目数，超出部分只显示数量
+DEFAULT_MAX_ENTRIES = 500
+# 概览树最多输出的行数
+DEFAULT_MAX_LINES = 400
+
+
+class DirEntry(NamedTuple):
+    name: str
+    rel: str            # 相对 PROJECT_SPACE 的 POSIX 路径
+    is_dir: bool
+    size: int
+
+
+class DirListing(NamedTuple):
+    entries: List[DirEntry]
+    truncated: int      # 超出 max_entries 未列出的条目数
+    ignored: int        # 被忽略规则过滤掉的条目数
+
+
+def format_size(size):
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024 or unit == "GB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class WorkspaceTree:
+    """
+    PROJECT_SPACE 的按需目录浏览:
+    - 每次只列出一个目录 (os.scandir)，按忽略规则过滤，并限制单目录条目数
+    - 列表按目录自身的 mtime 缓存，目录中增删文件后才会重新读取
+    - 概览树限制深度与总行数，大型工作区 (如含 node_modules) 不会阻塞界面
+    """
+    def __init__(self, root_dir, ignore_patterns=DEFAULT_IGNORE_PATTERNS, max_entries=DEFAULT_MAX_ENTRIES):
+        self.root_dir = Path(root_dir)
+        self.ignore_patterns = tuple(ignore_patterns)
+        self.max_entries = max_entries
+        self._cache = {}    # 相对路径 -> (目录 mtime_ns, DirListing)
+        self._lock = threading.Lock()
+
+    def _ignored(self, name):
+        return any(fnmatch.fnmatch(name, pattern) for pattern in self.ignore_patterns)
+
+    def resolve(self, rel):
+        """把相对路径转换为 PROJECT_SPACE 内的磁盘路径，越出工作区时返回 None"""
+        rel = (rel or "").strip().strip("/")
+        path = PurePosixPath(rel)
+        if path.is_absolute() or ".." in path.parts:
+            return None
+        return self.root_dir / rel if rel else self.root_dir
+
+    def list_dir(self, rel=""):
+        """列出一个目录 (目录在前，按名称排序)，目录不存在或越界时返回空列表"""
+        directory = self.resolve(rel)
+        if directory is None:
+            return DirListing([], 0, 0)
+        try:
+            mtime = directory.stat().st_mtime_ns
+        except OSError:
+            return DirListing([], 0, 0)
+        key = (rel or "").strip("/")
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+        entries = []
+        ignored = 0
+        try:
+            with os.scandir(directory) as it:
+                for item in it:
+                    if self._ignored(item.name):
+                        ignored += 1
+                        continue
+                    try:
+                        is_dir = item.is_dir()
+                        size = 0 if is_dir else item.stat().st_size
+                    except OSError:
+                        continue
+                    entries.append(DirEntry(item.name, f"{key}/{item.name}" if key else item.name, is_dir, size))
+        except OSError:
+            return DirListing([], 0, 0)
+        entries.sort(key=lambda e: (not e.is_dir, e.name.lower()))
+        truncated = max(0, len(entries) - self.max_entries)
+        listing = DirListing(entries[:self.max_entries], truncated, ignored)
+        with self._lock:
+            self._cache[key] = (mtime, listing)
+        return listing
+
+    def render(self, rel="", max_depth=DEFAULT_MAX_DEPTH, max_lines=DEFAULT_MAX_LINES):
+        """生成深度与行数受限的目录树文本 (超出深度的目录只显示名称)"""
+        lines = []
+
+        def walk(dir_rel, prefix, depth):
+            listing = self.list_dir(dir_rel)
+            items = listing.entries
+            for i, entry in enumerate(items):
+                if len(lines) >= max_lines:
+                    return
+                is_last = i == len(items) - 1 and not listing.truncated
+                connector = "└── " if is_last else "├── "
+                if entry.is_dir:
+                    collapsed = " …" if depth >= max_depth else ""
+                    lines.append(f"{prefix}{connector}📂 {entry.name}/{collapsed}")
+                    if depth < max_depth:
+                        walk(entry.rel, prefix + ("    " if is_last else "│   "), depth + 1)
+                else:
+                    lines.append(f"{prefix}{connector}📄 {entry.name}")
+            if listing.truncated and len(lines) < max_lines:
+                lines.append(f"{prefix}└── … 另有 {listing.truncated} 项未列出")
+
+        walk((rel or "").strip("/"), "", 1)
+        if len(lines) >= max_lines:
+            lines.append(f"… 已达到 {max_lines} 行上限，请在目录浏览中逐级展开")
+        return "\n".join(lines)
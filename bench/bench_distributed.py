@@ -0,0 +1,220 @@
+"""
+分布式执行压测 (Distributed Worker Benchmark)
+
+在临时工作区中以分布式模式启动协调者 (NexusService remote=True + HTTP API)，并启动若干个
+nexus_cli.py worker 子进程作为执行节点，模型请求发往本地桩服务。对 --nodes 中的每个节点数分别
+执行同一张合成 DAG，输出吞吐 (tasks/sec) 与相对单节点的扩展效率。
+
+--kill-after 秒后强制结束第一个执行节点 (SIGKILL)，观察其租约到期后被改派、所有任务仍然完成。
+--max-concurrency / --rpm 为供应商限额 (由协调者统一计算)，吞吐在达到限额后不再随节点数增长。
+
+示例:
+    python bench/bench_distributed.py --nodes 1,2,4 --tasks 120 --concurrency 4 --latency 300
+    python bench/bench_distributed.py --nodes 3 --tasks 60 --kill-after 1 --lease-seconds 3
+    python bench/bench_distributed.py --nodes 1,2,4,8 --rpm 1200 --json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import threading
+import subprocess
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SYSTEM_DIR = BENCH_DIR.parent / "SYSTEM"
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(SYSTEM_DIR))
+
+import gen_dag
+from bench_engine import BENCH_CONFIG
+from mock_openai_server import MockSettings, start_server
+
+DISTRIBUTED_CONFIG = """  distributed:
+    lease_seconds: {lease_seconds}
+    max_inflight: {inflight}
+"""
+PROVIDER_LIMITS = """      max_concurrency: {max_concurrency}
+      rpm: {rpm}
+"""
+# 等待执行节点全部加入的最长时间 (秒)
+JOIN_TIMEOUT = 30
+
+
+def prepare_workspace(root, base_url, args):
+    (root / "SYSTEM").mkdir(parents=True, exist_ok=True)
+    (root / "PERSONAS").mkdir(exist_ok=True)
+    config = BENCH_CONFIG.format(base_url=base_url, tracing="false", snapshot_enabled="false",
+                                 snapshot_every=20, speculative="false")
+    config = config.replace('      api_key: "sk-mock"\n', '      api_key: "sk-mock"\n' + PROVIDER_LIMITS.format(
+        max_concurrency=args.max_concurrency, rpm=args.rpm))
+    config += DISTRIBUTED_CONFIG.format(lease_seconds=args.lease_seconds, inflight=args.inflight)
+    with open(root / "SYSTEM" / "config.yaml", "w", encoding="utf-8") as f:
+        f.write(config)
+    with open(root / "PERSONAS" / f"{gen_dag.DEFAULT_RECEIVER}.md", "w", encoding="utf-8") as f:
+        f.write("# 压测角色\n你是压测用的研发工程师。\n")
+    gen_dag.generate(root / "MESSAGES", args.shape, args.tasks, width=args.width,
+                     body_chars=args.body_chars, seed=args.seed)
+
+
+def start_workers(url, root, count, concurrency):
+    cli = str(SYSTEM_DIR / "nexus_cli.py")
+    return [subprocess.Popen([sys.executable, cli, "--url", url, "--quiet", "worker",
+                              "--concurrency", str(concurrency), "--id", f"bench-worker-{i + 1}", "--json"],
+                             cwd=root, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for i in range(count)]
+
+
+def wait_joined(service, count):
+    deadline = time.time() + JOIN_TIMEOUT
+    while service.leases.stats()["alive"] < count:
+        if time.time() > deadline:
+            raise RuntimeError(f"{JOIN_TIMEOUT} 秒内只有 {service.leases.stats()['alive']}/{count} 个执行节点加入")
+        time.sleep(0.05)
+
+
+def run_once(nodes, base_url, args):
+    """一个节点数下的完整运行，返回结果字典"""
+    root = Path(tempfile.mkdtemp(prefix="nexus_dist_"))
+    old_cwd = os.getcwd()
+    workers = []
+    try:
+        prepare_workspace(root, base_url, args)
+        os.chdir(root)
+        from nexus_core import NexusEngine
+        from nexus_api import NexusService, create_server
+        from provider_pool import ProviderPool
+
+        events = {"task.reassigned": 0, "worker.lost": 0}
+
+        def on_event(event, **data):
+            if event in events:
+                events[event] += 1
+
+        # 每轮使用独立的连接池，限额统计互不影响
+        engine = NexusEngine(auto_mode=True, provider_pool=ProviderPool())
+        service = NexusService(engine, remote=True, poll_interval=0.2)
+        service.leases.on_event = on_event
+        server = create_server(service, host="127.0.0.1", port=0)
+        threading.Thread(target=server.serve_forever, name="bench-api", daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+        workers = start_workers(url, root, nodes, args.concurrency)
+        wait_joined(service, nodes)
+        if args.kill_after is not None:
+            threading.Timer(args.kill_after, lambda: workers[0].send_signal(signal.SIGKILL)).start()
+
+        start = time.perf_counter()
+        executed, failed = service.runner.run(stop_when_idle=True)
+        wall = time.perf_counter() - start
+
+        remote = service.leases.stats()
+        pool = engine.providers.stats()
+        service.close()
+        server.shutdown()
+        server.server_close()
+        engine.jobs.shutdown(wait=True)
+        engine.archive.close()
+        return {
+            "nodes": nodes,
+            "executed": executed,
+            "failed": failed,
+            "wall_seconds": round(wall, 3),
+            "tasks_per_sec": round(executed / wall, 3) if wall else 0.0,
+            "reassigned": remote["reassigned"],
+            "workers_lost": events["worker.lost"],
+            "limiter_waited_seconds": sum(limit["waited_seconds"] for limit in pool["limits"]),
+        }
+    finally:
+        for proc in workers:
+            if proc.poll() is None:
+                proc.terminate()
+        for proc in workers:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        os.chdir(old_cwd)
+        if args.keep:
+            print(f"[bench] 工作区保留在: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def run_benchmark(args):
+    settings = MockSettings(args.latency, args.jitter, reply_chars=args.reply_chars, seed=args.seed)
+    server, base_url = start_server(settings=settings)
+    try:
+        import nexus_core
+        from rich.console import Console
+        # 压测时屏蔽协调者的控制台输出
+        nexus_core.console = Console(quiet=True)
+        runs = [run_once(int(n), base_url, args) for n in args.nodes.split(",")]
+    finally:
+        server.shutdown()
+    base = runs[0]["tasks_per_sec"] / runs[0]["nodes"] if runs and runs[0]["tasks_per_sec"] else 0.0
+    for run in runs:
+        # 扩展效率: 相对 (第一轮的单节点吞吐 x 节点数) 的比例
+        run["scaling_efficiency"] = round(run["tasks_per_sec"] / (base * run["nodes"]), 3) if base else 0.0
+    return {
+        "tasks": args.tasks,
+        "shape": args.shape,
+        "concurrency_per_node": args.concurrency,
+        "latency_ms": args.latency,
+        "ideal_tasks_per_sec_per_node": round(args.concurrency * 1000.0 / args.latency, 3) if args.latency else None,
+        "runs": runs,
+        "mock": settings.stats(),
+    }
+
+
+def print_report(report):
+    print(f"{report['tasks']} 个任务 ({report['shape']})，每个执行节点并发 {report['concurrency_per_node']}，"
+          f"桩服务延迟 {report['latency_ms']} 毫秒 (单节点理想吞吐 {report['ideal_tasks_per_sec_per_node']} tasks/sec)")
+    for run in report["runs"]:
+        line = (f"  {run['nodes']:>2} 个节点: 完成 {run['executed']} 个 (失败 {run['failed']})，"
+                f"耗时 {run['wall_seconds']} 秒，吞吐 {run['tasks_per_sec']} tasks/sec，扩展效率 {run['scaling_efficiency']}")
+        if run["reassigned"]:
+            line += f"，改派 {run['reassigned']} 次 (失联节点 {run['workers_lost']} 个)"
+        if run["limiter_waited_seconds"]:
+            line += f"，限额等待 {round(run['limiter_waited_seconds'], 1)} 秒"
+        print(line)
+    print(f"桩服务请求 {report['mock']['requests']} 次")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="A1_Nexus 分布式执行节点压测")
+    parser.add_argument("--nodes", default="1,2,4", help="依次测试的执行节点数，逗号分隔")
+    parser.add_argument("--tasks", type=int, default=120, help="任务数")
+    parser.add_argument("--shape", default="wide", choices=gen_dag.SHAPES, help="DAG 形状")
+    parser.add_argument("--width", type=int, default=16, help="扇出 / 分层宽度")
+    parser.add_argument("--concurrency", type=int, default=4, help="每个执行节点同时执行的调用数")
+    parser.add_argument("--inflight", type=int, default=64, help="协调者同时等待远程结果的任务数")
+    parser.add_argument("--lease-seconds", type=float, default=10, help="租约有效期 (秒)")
+    parser.add_argument("--kill-after", type=float, help="开始执行若干秒后强制结束第一个执行节点")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="供应商同时进行中的请求数上限")
+    parser.add_argument("--rpm", type=int, default=0, help="供应商每分钟请求数上限")
+    parser.add_argument("--latency", type=float, default=300.0, help="桩服务平均延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="桩服务延迟抖动 (毫秒)")
+    parser.add_argument("--reply-chars", type=int, default=400)
+    parser.add_argument("--body-chars", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作区")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
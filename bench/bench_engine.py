@@ -0,0 +1,264 @@
+"""
+A1_Nexus 无头压测框架 (Headless Benchmark Harness)
+
+在临时目录中搭建一套独立的 MESSAGES/ARCHIVE/PROJECT_SPACE/PERSONAS 工作区，
+启动本地 OpenAI 兼容桩服务，生成合成 DAG，然后以自动模式驱动 NexusEngine，
+统计吞吐 (tasks/sec)、每个调度 tick 的开销、解析耗时与内存占用。
+
+示例:
+    python bench/bench_engine.py --shape chain --tasks 200
+    python bench/bench_engine.py --shape diamond --tasks 10000 --execute 50 --latency 20 --json
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+import statistics
+from pathlib import Path
+from contextlib import redirect_stdout
+
+BENCH_DIR = Path(__file__).resolve().parent
+SYSTEM_DIR = BENCH_DIR.parent / "SYSTEM"
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(SYSTEM_DIR))
+
+import gen_dag
+from mock_openai_server import MockSettings, start_server
+
+BENCH_CONFIG = """api_providers:
+  default: mock
+  providers:
+    mock:
+      base_url: "{base_url}"
+      api_key: "sk-mock"
+      models:
+        default: "mock-fast"
+
+system:
+  max_retries: 3
+  messages_dir: "MESSAGES"
+  archive_dir: "ARCHIVE"
+  project_space_dir: "PROJECT_SPACE"
+  tracing:
+    enabled: {tracing}
+    export_file: "SYSTEM/traces/traces.otlp.jsonl"
+  snapshot:
+    enabled: {snapshot_enabled}
+    every_tasks: {snapshot_every}
+  speculative:
+    enabled: {speculative}
+"""
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def summarize_ms(values):
+    values_ms = [v * 1000 for v in values]
+    if not values_ms:
+        return {"count": 0, "mean": 0.0, "p50": 0.0, "p95": 0.0, "max": 0.0}
+    return {
+        "count": len(values_ms),
+        "mean": round(statistics.fmean(values_ms), 3),
+        "p50": round(percentile(values_ms, 50), 3),
+        "p95": round(percentile(values_ms, 95), 3),
+        "max": round(max(values_ms), 3),
+    }
+
+
+def peak_rss_mb():
+    """进程峰值常驻内存 (MB)，Windows 下不可用时返回 None"""
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 单位为 KB，macOS 为字节
+        return round(rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024, 1)
+    except ImportError:
+        return None
+
+
+def prepare_workspace(root, base_url, args):
+    """在临时目录中写入配置、角色卡与合成任务"""
+    (root / "SYSTEM").mkdir(parents=True, exist_ok=True)
+    (root / "PERSONAS").mkdir(exist_ok=True)
+    with open(root / "SYSTEM" / "config.yaml", "w", encoding="utf-8") as f:
+        f.write(BENCH_CONFIG.format(base_url=base_url, tracing="true" if args.trace else "false",
+                                    snapshot_enabled="true" if args.snapshot_every else "false",
+                                    snapshot_every=args.snapshot_every or 20,
+                                    speculative="true" if args.speculative else "false"))
+    with open(root / "PERSONAS" / f"{gen_dag.DEFAULT_RECEIVER}.md", "w", encoding="utf-8") as f:
+        f.write("# 压测角色\n你是压测用的研发工程师。\n")
+    gen_dag.generate(root / "MESSAGES", args.shape, args.tasks, width=args.width,
+                     body_chars=args.body_chars, seed=args.seed, speculative=args.speculative)
+
+
+def measure_cold_parse(engine):
+    """单独测量一次全量 parse_tasks 的耗时与 Python 堆峰值"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    tasks = engine.parse_tasks()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tasks, elapsed, peak
+
+
+def run_benchmark(args):
+    settings = MockSettings(args.latency, args.jitter, args.error_rate, args.rate_429,
+                            reply_chars=args.reply_chars, seed=args.seed, artifact_paths=args.artifacts)
+    server, base_url = start_server(settings=settings)
+    root = Path(tempfile.mkdtemp(prefix="nexus_bench_"))
+    old_cwd = os.getcwd()
+    try:
+        prepare_workspace(root, base_url, args)
+        os.chdir(root)
+
+        import nexus_core
+        from rich.console import Console
+        # 压测时屏蔽引擎的控制台输出
+        nexus_core.console = Console(quiet=True)
+        engine = nexus_core.NexusEngine(auto_mode=True)
+
+        tasks, cold_parse_s, parse_peak = measure_cold_parse(engine)
+        limit = args.execute if args.execute else args.tasks
+
+        archive_times, parse_times, runnable_times, tick_overheads, exec_times = [], [], [], [], []
+        executed = failed = ticks = 0
+        sink = io.StringIO()
+        run_start = time.perf_counter()
+        while executed < limit:
+            t0 = time.perf_counter()
+            if args.background_archive:
+                engine.request_archive()
+            else:
+                engine.archive_done_tasks()
+            t1 = time.perf_counter()
+            tasks = engine.parse_tasks()
+            t2 = time.perf_counter()
+            runnable = engine.get_runnable_tasks(tasks) if tasks else []
+            t3 = time.perf_counter()
+            ticks += 1
+            archive_times.append(t1 - t0)
+            parse_times.append(t2 - t1)
+            runnable_times.append(t3 - t2)
+            tick_overheads.append(t3 - t0)
+            if not runnable:
+                break
+
+            committed_before = engine.speculator.stats.committed
+            e0 = time.perf_counter()
+            with redirect_stdout(sink):
+                ok = engine.execute_task(runnable[0])
+            exec_times.append(time.perf_counter() - e0)
+            sink.seek(0)
+            sink.truncate()
+            if ok:
+                # 预执行校验通过的下游任务在同一次 execute_task 中一并提交
+                executed += 1 + engine.speculator.stats.committed - committed_before
+            else:
+                failed += 1
+                if failed > args.max_failures:
+                    break
+        engine.jobs.wait_idle()
+        engine.archive_done_tasks()
+        wall = time.perf_counter() - run_start
+
+        scheduler_total = sum(tick_overheads)
+        report = {
+            "shape": args.shape,
+            "tasks": args.tasks,
+            "executed": executed,
+            "failed": failed,
+            "ticks": ticks,
+            "wall_seconds": round(wall, 3),
+            "tasks_per_sec": round(executed / wall, 3) if wall else 0.0,
+            "scheduler_share": round(scheduler_total / wall, 4) if wall else 0.0,
+            "cold_parse_ms": round(cold_parse_s * 1000, 3),
+            "cold_parse_peak_kb": round(parse_peak / 1024, 1),
+            "tick_overhead_ms": summarize_ms(tick_overheads),
+            "archive_ms": summarize_ms(archive_times),
+            "parse_ms": summarize_ms(parse_times),
+            "runnable_ms": summarize_ms(runnable_times),
+            "execute_ms": summarize_ms(exec_times),
+            "peak_rss_mb": peak_rss_mb(),
+            "mock": settings.stats(),
+        }
+        if args.speculative:
+            report["speculation"] = engine.speculator.stats.to_dict()
+        return report
+    finally:
+        os.chdir(old_cwd)
+        server.shutdown()
+        if args.keep:
+            print(f"[bench] 工作区保留在: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def print_report(report):
+    print("=" * 60)
+    print(f"A1_Nexus 压测报告  shape={report['shape']}  tasks={report['tasks']}")
+    print("=" * 60)
+    print(f"执行成功: {report['executed']}  失败: {report['failed']}  tick 数: {report['ticks']}")
+    print(f"总耗时: {report['wall_seconds']} s   吞吐: {report['tasks_per_sec']} tasks/s")
+    print(f"调度开销占比: {report['scheduler_share'] * 100:.1f}%")
+    print(f"冷启动解析: {report['cold_parse_ms']} ms  (Python 堆峰值 {report['cold_parse_peak_kb']} KB)")
+    for key, label in [("tick_overhead_ms", "每 tick 调度开销"), ("archive_ms", "  归档"),
+                       ("parse_ms", "  解析"), ("runnable_ms", "  可执行判定"), ("execute_ms", "任务执行")]:
+        s = report[key]
+        print(f"{label:<16} mean={s['mean']}ms p50={s['p50']}ms p95={s['p95']}ms max={s['max']}ms (n={s['count']})")
+    print(f"峰值 RSS: {report['peak_rss_mb']} MB")
+    print(f"桩服务统计: {report['mock']}")
+    if "speculation" in report:
+        print(f"预执行统计: {report['speculation']}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="A1_Nexus 无头压测框架")
+    parser.add_argument("--shape", choices=gen_dag.SHAPES, default="chain")
+    parser.add_argument("--tasks", type=int, default=200, help="生成的任务总数")
+    parser.add_argument("--width", type=int, default=8, help="diamond/layered 的并行宽度")
+    parser.add_argument("--execute", type=int, default=0, help="最多执行的任务数 (0 = 全部)")
+    parser.add_argument("--body-chars", type=int, default=600)
+    parser.add_argument("--latency", type=float, default=0.0, help="桩服务平均延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="桩服务延迟抖动 (毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="桩服务 HTTP 500 概率")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="桩服务 HTTP 429 概率")
+    parser.add_argument("--reply-chars", type=int, default=400)
+    parser.add_argument("--max-failures", type=int, default=5, help="累计失败超过该值后停止")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--trace", action="store_true", help="压测时同时开启链路追踪")
+    parser.add_argument("--snapshot-every", type=int, default=0,
+                        help="每归档 N 个任务自动生成全局快照 (0 = 关闭)，用于观察长链路上的提示词长度")
+    parser.add_argument("--artifacts", action="store_true",
+                        help="桩服务回复带路径标注的代码块，压测产出物写入 PROJECT_SPACE/features/")
+    parser.add_argument("--speculative", action="store_true",
+                        help="任务声明 SPECULATIVE: OK 并开启预执行，观察长链路的总耗时 (需配合 --latency)")
+    parser.add_argument("--background-archive", action="store_true",
+                        help="归档以后台作业提交 (与 Web UI / 自动模式一致)，tick 不等待归档完成")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作区以便检查")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出报告")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""
+任务看板内存基准
+
+对比两种任务表示在大看板 (默认 10k 个任务，每个任务附带若干 KB 的 "AI 执行结果") 下的内存占用:
+- legacy   旧版 parse_tasks: 每个任务一个 dict，并常驻完整正文 content
+- records  当前 parse_tasks: 紧凑的 TaskRecord (__slots__)，正文按需经 LRU 缓存加载
+
+每种模式在独立子进程中运行，分别报告常驻内存 (RSS) 增量与 Python 堆保留量。
+
+示例:
+    python bench/bench_memory.py --tasks 10000 --body-kb 8
+"""
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent / "SYSTEM"))
+
+MODES = ["legacy", "records"]
+
+
+def current_rss_mb():
+    """当前常驻内存 (MB)。优先读取 /proc，其他平台退化为峰值 RSS"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+            rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+        except ImportError:
+            return 0.0
+
+
+def build_board(root, n, body_kb):
+    import gen_dag
+    from bench_engine import BENCH_CONFIG
+    (root / "SYSTEM").mkdir(parents=True, exist_ok=True)
+    with open(root / "SYSTEM" / "config.yaml", "w", encoding="utf-8") as f:
+        f.write(BENCH_CONFIG.format(base_url="http://127.0.0.1:9/v1", tracing="false",
+                                    snapshot_enabled="false", snapshot_every=20,
+                                    speculative="false"))
+    gen_dag.generate(root / "MESSAGES", "layered", n, width=16, body_chars=400)
+    result = ("\n\n---\n## AI 执行结果:\n" + "模拟的模型产出内容。" * (body_kb * 1024 // 30 + 1))
+    for path in (root / "MESSAGES").glob("*.md"):
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(result)
+
+
+def legacy_parse(messages_dir):
+    """复刻旧版 parse_tasks 的内存形态: dict + 完整正文"""
+    import task_parser
+    tasks = []
+    for file_path in Path(messages_dir).glob("*.md"):
+        name = task_parser.parse_task_filename(file_path.name)
+        if not name:
+            continue
+        content, encoding = task_parser.decode_task_bytes(file_path.read_bytes())
+        tasks.append({
+            "id": name.task_id,
+            "file": file_path,
+            "filename": file_path.name,
+            "status": name.status or "NEW",
+            "sender": name.sender,
+            "receiver": name.receiver,
+            "depends_on": task_parser.parse_depends_on(content),
+            "content": content,
+            "encoding": encoding,
+        })
+    return tasks
+
+
+def measure(mode, root):
+    """在当前进程中测量一种模式 (由子进程调用)"""
+    os.chdir(root)
+    import nexus_core
+    from rich.console import Console
+    nexus_core.console = Console(quiet=True)
+    engine = nexus_core.NexusEngine(auto_mode=True)
+
+    rss_before = current_rss_mb()
+    tracemalloc.start()
+    if mode == "legacy":
+        tasks = legacy_parse(engine.messages_dir)
+    else:
+        tasks = engine.parse_tasks()
+    heap_current, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    rss_after = current_rss_mb()
+    return {
+        "mode": mode,
+        "tasks": len(tasks),
+        "rss_delta_mb": round(rss_after - rss_before, 2),
+        "heap_retained_mb": round(heap_current / (1024 * 1024), 2),
+        "heap_peak_mb": round(heap_peak / (1024 * 1024), 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="任务看板内存基准 (旧版 dict+正文 vs TaskRecord)")
+    parser.add_argument("--tasks", type=int, default=10000)
+    parser.add_argument("--body-kb", type=int, default=8, help="每个任务附带的 AI 执行结果大小 (KB)")
+    parser.add_argument("--json", action="store_true")
+    parser.add_argument("--_child", choices=MODES, help=argparse.SUPPRESS)
+    parser.add_argument("--_root", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args._child:
+        print(json.dumps(measure(args._child, args._root)))
+        return
+
+    root = Path(tempfile.mkdtemp(prefix="nexus_mem_"))
+    try:
+        build_board(root, args.tasks, args.body_kb)
+        results = []
+        for mode in MODES:
+            out = subprocess.check_output([sys.executable, __file__, "--_child", mode, "--_root", str(root)])
+            results.append(json.loads(out.decode("utf-8").strip().splitlines()[-1]))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"看板规模: {args.tasks} 个任务，每个附带约 {args.body_kb} KB 执行结果")
+    print(f"{'mode':<10}{'tasks':>8}{'RSS 增量(MB)':>16}{'堆保留(MB)':>14}{'堆峰值(MB)':>14}")
+    for r in results:
+        print(f"{r['mode']:<10}{r['tasks']:>8}{r['rss_delta_mb']:>16}{r['heap_retained_mb']:>14}{r['heap_peak_mb']:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""
+多项目压测 (Multi-Project Benchmark)
+
+在临时目录中创建 --projects 个项目 (PROJECTS/<名称>/)，每个项目生成一张合成 DAG，
+由一个进程内的 TaskRunner 按权重与配额公平调度，所有项目共用同一个 ProviderPool。
+
+输出:
+- 总吞吐 (tasks/sec) 与各项目完成耗时
+- 公平性: 第一个项目完成时各项目按权重归一化的完成数，计算 Jain 公平指数 (1.0 为完全按权重分配)
+- 共享资源: 创建的模型客户端数、/models 请求数 (模型列表缓存)、限额等待时间
+
+示例:
+    python bench/bench_projects.py --projects 4 --tasks 40 --workers 8 --latency 100
+    python bench/bench_projects.py --projects 3 --weights 1,2,4 --workers 6 --json
+    python bench/bench_projects.py --projects 4 --max-concurrency 4 --rpm 600   # 供应商限额在项目间共享
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SYSTEM_DIR = BENCH_DIR.parent / "SYSTEM"
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(SYSTEM_DIR))
+
+import gen_dag
+from bench_engine import BENCH_CONFIG
+from mock_openai_server import MockSettings, start_server
+
+PROVIDER_LIMITS = """      max_concurrency: {max_concurrency}
+      rpm: {rpm}
+"""
+
+
+def jain_index(values):
+    if not values or not any(values):
+        return 0.0
+    return round(sum(values) ** 2 / (len(values) * sum(v * v for v in values)), 4)
+
+
+def prepare_workspace(root, base_url, args, weights):
+    (root / "SYSTEM").mkdir(parents=True, exist_ok=True)
+    (root / "PERSONAS").mkdir(exist_ok=True)
+    config = BENCH_CONFIG.format(base_url=base_url, tracing="false", snapshot_enabled="false",
+                                 snapshot_every=20, speculative="false")
+    config = config.replace('      api_key: "sk-mock"\n', '      api_key: "sk-mock"\n' + PROVIDER_LIMITS.format(
+        max_concurrency=args.max_concurrency, rpm=args.rpm))
+    with open(root / "SYSTEM" / "config.yaml", "w", encoding="utf-8") as f:
+        f.write(config)
+    with open(root / "PERSONAS" / f"{gen_dag.DEFAULT_RECEIVER}.md", "w", encoding="utf-8") as f:
+        f.write("# 压测角色\n你是压测用的研发工程师。\n")
+    os.chdir(root)
+
+    from projects import ProjectRegistry
+    registry = ProjectRegistry.from_config(auto_mode=True)
+    names = []
+    for i, weight in enumerate(weights):
+        quota = {"weight": weight}
+        if args.max_concurrent:
+            quota["max_concurrent"] = args.max_concurrent
+        project = registry.create(f"bench{i + 1}", {"system": {"quota": quota}})
+        gen_dag.generate(project.root / "MESSAGES", args.shape, args.tasks, width=args.width,
+                         body_chars=args.body_chars, seed=args.seed)
+        names.append(project.name)
+    return registry, names
+
+
+def run_benchmark(args):
+    weights = [float(w) for w in args.weights.split(",")] if args.weights else [1.0] * args.projects
+    settings = MockSettings(args.latency, args.jitter, reply_chars=args.reply_chars, seed=args.seed)
+    server, base_url = start_server(settings=settings)
+    root = Path(tempfile.mkdtemp(prefix="nexus_projects_"))
+    old_cwd = os.getcwd()
+    try:
+        import nexus_core
+        from rich.console import Console
+        # 压测时屏蔽引擎的控制台输出
+        nexus_core.console = Console(quiet=True)
+        from task_runner import TaskRunner
+
+        registry, names = prepare_workspace(root, base_url, args, weights)
+        done_at = {name: [] for name in names}
+        lock = threading.Lock()
+
+        def on_event(event, **data):
+            if event == "task.done":
+                with lock:
+                    done_at[data["project"]].append(time.perf_counter())
+
+        runner = TaskRunner(workers=args.workers, poll_interval=0.2, on_event=on_event, record_history=False)
+        for name in names:
+            runner.add_project(registry.engine(name))
+        start = time.perf_counter()
+        executed, failed = runner.run(stop_when_idle=True)
+        wall = time.perf_counter() - start
+        registry.close()
+
+        finish = {name: (times[-1] - start if times else None) for name, times in done_at.items()}
+        first_finish = min(t for t in finish.values() if t is not None) + start
+        # 所有项目都有积压时的分配情况: 截至第一个项目完成时各项目的完成数 / 权重
+        shares = [sum(1 for t in done_at[name] if t <= first_finish) / weight for name, weight in zip(names, weights)]
+        pool = registry.providers.stats()
+        return {
+            "projects": len(names),
+            "tasks_per_project": args.tasks,
+            "workers": args.workers,
+            "executed": executed,
+            "failed": failed,
+            "wall_seconds": round(wall, 3),
+            "tasks_per_sec": round(executed / wall, 3) if wall else 0.0,
+            "jain_fairness": jain_index(shares),
+            "per_project": {
+                name: {"weight": weight, "finish_seconds": round(finish[name], 3) if finish[name] else None,
+                       "done_when_first_finished": sum(1 for t in done_at[name] if t <= first_finish)}
+                for name, weight in zip(names, weights)
+            },
+            "provider_clients": pool["clients"],
+            "provider_limits": pool["limits"],
+            "mock": settings.stats(),
+        }
+    finally:
+        os.chdir(old_cwd)
+        server.shutdown()
+        if args.keep:
+            print(f"[bench] 工作区保留在: {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+
+def print_report(report):
+    print(f"{report['projects']} 个项目 x {report['tasks_per_project']} 个任务，{report['workers']} 个执行线程")
+    print(f"完成 {report['executed']} 个 (失败 {report['failed']})，耗时 {report['wall_seconds']} 秒，"
+          f"吞吐 {report['tasks_per_sec']} tasks/sec")
+    print(f"Jain 公平指数 (按权重归一化): {report['jain_fairness']}")
+    for name, row in report["per_project"].items():
+        print(f"  {name:<10} 权重 {row['weight']:<4g} 完成耗时 {row['finish_seconds']} 秒  "
+              f"第一个项目完成时已完成 {row['done_when_first_finished']} 个")
+    print(f"模型客户端 {report['provider_clients']} 个，桩服务请求 {report['mock']['requests']} 次")
+    for limit in report["provider_limits"]:
+        print(f"  {limit['provider']}: 请求 {limit['requests']} 次，限额等待共 {limit['waited_seconds']} 秒")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="A1_Nexus 多项目公平调度压测")
+    parser.add_argument("--projects", type=int, default=4, help="项目数")
+    parser.add_argument("--tasks", type=int, default=40, help="每个项目的任务数")
+    parser.add_argument("--shape", default="fanout", choices=gen_dag.SHAPES, help="DAG 形状")
+    parser.add_argument("--width", type=int, default=16, help="扇出 / 分层宽度")
+    parser.add_argument("--weights", help="各项目的权重，逗号分隔 (数量决定项目数)，如 1,2,4")
+    parser.add_argument("--workers", type=int, default=8, help="执行线程数")
+    parser.add_argument("--max-concurrent", type=int, default=0, help="每个项目同时执行的任务数上限")
+    parser.add_argument("--max-concurrency", type=int, default=0, help="供应商同时进行中的请求数上限 (所有项目共享)")
+    parser.add_argument("--rpm", type=int, default=0, help="供应商每分钟请求数上限 (所有项目共享)")
+    parser.add_argument("--latency", type=float, default=100.0, help="桩服务平均延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="桩服务延迟抖动 (毫秒)")
+    parser.add_argument("--reply-chars", type=int, default=400)
+    parser.add_argument("--body-chars", type=int, default=400)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--keep", action="store_true", help="保留临时工作区")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+启动耗时基准 (Startup Benchmark)
+
+每项在全新的子进程中运行 (冷启动，不受本进程已导入模块影响)，取多次重复的中位数:
+- cli_help       python SYSTEM/nexus_core.py --help (命令行可用)
+- import_core    import nexus_core
+- engine_ready   导入 + 构建 NexusEngine + 首次解析看板 (--tasks 个合成任务)
+- import_openai  import openai (仅供对照: 引擎只在真正调用模型时导入)
+- web_ui_build   导入 web_ui 并构建界面 (未安装 gradio 时跳过)
+
+目标: 命令行与引擎就绪均在 --target 秒 (默认 1 秒) 以内。
+
+示例:
+    python bench/bench_startup.py
+    python bench/bench_startup.py --tasks 1000 --repeat 7 --json
+"""
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import importlib.util
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+SYSTEM_DIR = BENCH_DIR.parent / "SYSTEM"
+sys.path.insert(0, str(BENCH_DIR))
+
+import gen_dag
+from bench_engine import BENCH_CONFIG
+
+DEFAULT_TARGET_SECONDS = 1.0
+# 计入目标的项目
+TARGET_CASES = ("cli_help", "engine_ready")
+
+TIMED = """
+import sys, time
+start = time.perf_counter()
+sys.path.insert(0, {system_dir!r})
+{body}
+print(time.perf_counter() - start)
+"""
+
+CASES = {
+    "import_core": "import nexus_core",
+    "engine_ready": (
+        "import nexus_core\n"
+        "from rich.console import Console\n"
+        "nexus_core.console = Console(quiet=True)\n"
+        "nexus_core.NexusEngine(auto_mode=True).parse_tasks()"
+    ),
+    "import_openai": "import openai",
+    "web_ui_build": "import web_ui",
+}
+
+
+def prepare_workspace(root, tasks):
+    (root / "SYSTEM").mkdir(parents=True, exist_ok=True)
+    with open(root / "SYSTEM" / "config.yaml", "w", encoding="utf-8") as f:
+        f.write(BENCH_CONFIG.format(base_url="http://127.0.0.1:9/v1", tracing="false",
+                                    snapshot_enabled="false", snapshot_every=20, speculative="false"))
+    gen_dag.generate(root / "MESSAGES", "fanout", tasks, width=16, body_chars=400)
+
+
+def run_case(name, root):
+    """在子进程中运行一次，返回耗时 (秒)。cli_help 计整个进程的墙钟时间"""
+    if name == "cli_help":
+        start = time.perf_counter()
+        subprocess.run([sys.executable, str(SYSTEM_DIR / "nexus_core.py"), "--help"], cwd=root,
+                       check=True, stdout=subprocess.DEVNULL)
+        return time.perf_counter() - start
+    code = TIMED.format(system_dir=str(SYSTEM_DIR), body=CASES[name])
+    out = subprocess.run([sys.executable, "-c", code], cwd=root, check=True, capture_output=True, text=True).stdout
+    return float(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A1_Nexus 启动耗时基准")
+    parser.add_argument("--tasks", type=int, default=200, help="看板中的合成任务数")
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数，取中位数")
+    parser.add_argument("--target", type=float, default=DEFAULT_TARGET_SECONDS, help="命令行 / 引擎就绪的目标耗时 (秒)")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    cases = ["cli_help", "import_core", "engine_ready"]
+    if importlib.util.find_spec("openai"):
+        cases.append("import_openai")
+    if importlib.util.find_spec("gradio"):
+        cases.append("web_ui_build")
+
+    root = Path(tempfile.mkdtemp(prefix="nexus_startup_"))
+    try:
+        prepare_workspace(root, args.tasks)
+        results = {}
+        for name in cases:
+            samples = [run_case(name, root) for _ in range(args.repeat)]
+            results[name] = {
+                "median_ms": round(statistics.median(samples) * 1000, 1),
+                "min_ms": round(min(samples) * 1000, 1),
+                "max_ms": round(max(samples) * 1000, 1),
+            }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    passed = all(results[name]["median_ms"] <= args.target * 1000 for name in TARGET_CASES)
+    if args.json:
+        print(json.dumps({"tasks": args.tasks, "target_seconds": args.target, "passed": passed, "results": results}, indent=2))
+    else:
+        print(f"{'case':<15} {'median':>10} {'min':>10} {'max':>10}")
+        for name, row in results.items():
+            mark = (" ✅" if row["median_ms"] <= args.target * 1000 else " ❌") if name in TARGET_CASES else ""
+            print(f"{name:<15} {row['median_ms']:>8.1f}ms {row['min_ms']:>8.1f}ms {row['max_ms']:>8.1f}ms{mark}")
+        skipped = [name for name in CASES if name not in results]
+        if skipped:
+            print(f"(未安装依赖，已跳过: {', '.join(skipped)})")
+        print(f"目标 {args.target:.1f} 秒: {'达成' if passed else '未达成'}")
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == "__main__":
+    main()
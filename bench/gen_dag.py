@@ -0,0 +1,104 @@
+"""
+合成 DAG 任务生成器
+
+向指定的 MESSAGES 目录写入符合命名协议的 [NEW] 任务文件，用于压测调度与 I/O 路径。
+支持的拓扑:
+- chain    线性链      ID001 <- ID002 <- ID003 ...
+- fanout   宽扇出      ID001 <- (ID002 ... IDn)
+- diamond  菱形串联    root -> k 个并行节点 -> 汇聚节点 -> 下一个菱形 ...
+- wide     完全独立    n 个无依赖任务
+- layered  分层随机    每层随机依赖上一层的 1~3 个节点
+
+独立运行:
+    python bench/gen_dag.py /tmp/bench/MESSAGES --shape diamond --tasks 10000
+"""
+import random
+import argparse
+from pathlib import Path
+
+SHAPES = ["chain", "fanout", "diamond", "wide", "layered"]
+DEFAULT_RECEIVER = "P7_研发工程师"
+
+
+def task_id(i):
+    return f"ID{i:03d}"
+
+
+def build_edges(shape, n, width=8, seed=0):
+    """返回 {任务序号: [依赖的任务序号]}，序号从 1 开始"""
+    rng = random.Random(seed)
+    deps = {i: [] for i in range(1, n + 1)}
+    if shape == "chain":
+        for i in range(2, n + 1):
+            deps[i] = [i - 1]
+    elif shape == "fanout":
+        for i in range(2, n + 1):
+            deps[i] = [1]
+    elif shape == "diamond":
+        # 每个菱形: 1 个顶点 + width 个并行节点 + 1 个汇聚节点 (汇聚节点兼作下一菱形顶点)
+        i = 1
+        while i < n:
+            top = i
+            mids = list(range(top + 1, min(top + 1 + width, n + 1)))
+            for m in mids:
+                deps[m] = [top]
+            sink = top + len(mids) + 1
+            if sink > n:
+                break
+            deps[sink] = mids
+            i = sink
+    elif shape == "wide":
+        pass
+    elif shape == "layered":
+        prev_layer = []
+        i = 1
+        while i <= n:
+            layer = list(range(i, min(i + width, n + 1)))
+            for t in layer:
+                if prev_layer:
+                    deps[t] = sorted(rng.sample(prev_layer, min(len(prev_layer), rng.randint(1, 3))))
+            prev_layer = layer
+            i += width
+    else:
+        raise ValueError(f"未知拓扑: {shape}，可选: {', '.join(SHAPES)}")
+    return deps
+
+
+def generate(messages_dir, shape="chain", n=100, width=8, receiver=DEFAULT_RECEIVER, body_chars=600, seed=0,
+             speculative=False):
+    """生成任务文件，返回写入的文件数；speculative=True 时任务头部声明 SPECULATIVE: OK"""
+    messages_dir = Path(messages_dir)
+    messages_dir.mkdir(parents=True, exist_ok=True)
+    deps = build_edges(shape, n, width=width, seed=seed)
+    filler = ("这是一段用于压测的任务描述。" * (body_chars // 14 + 1))[:body_chars]
+    for i in range(1, n + 1):
+        depends = ", ".join(task_id(d) for d in deps[i]) or "NONE"
+        speculative_header = "\n**SPECULATIVE: OK**" if speculative else ""
+        content = f"""# 任务目标：合成任务 {task_id(i)} ({shape})
+
+**DEPENDS_ON: {depends}**{speculative_header}
+
+## 详细要求
+{filler}
+"""
+        filename = f"[NEW]P1_TO_{receiver}_{task_id(i)}_bench.md"
+        with open(messages_dir / filename, "w", encoding="utf-8") as f:
+            f.write(content)
+    return n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成合成 DAG 任务文件")
+    parser.add_argument("messages_dir")
+    parser.add_argument("--shape", choices=SHAPES, default="chain")
+    parser.add_argument("--tasks", type=int, default=100)
+    parser.add_argument("--width", type=int, default=8, help="diamond/layered 的并行宽度")
+    parser.add_argument("--body-chars", type=int, default=600)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    count = generate(args.messages_dir, args.shape, args.tasks, args.width, body_chars=args.body_chars, seed=args.seed)
+    print(f"已生成 {count} 个 {args.shape} 任务 -> {args.messages_dir}")
+
+
+if __name__ == "__main__":
+    main()
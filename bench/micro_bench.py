@@ -0,0 +1,151 @@
+"""
+调度热路径微基准 (Microbenchmarks)
+
+针对纯 Python 热路径在不同看板规模 (默认 10 ~ 10k 个文件，可至 100k) 下计时:
+- filename_regex   任务文件名解析
+- decode           UTF-8 / GBK 回退解码 (约 10% 文件为 GBK 编码)
+- depends_on       DEPENDS_ON 依赖声明提取
+- archive_scan     归档目录 ID 扫描 (get_runnable_tasks 的前置步骤)
+- parse_tasks      引擎全量解析 (端到端)
+- runnable         可执行任务判定
+- draw_dag         DAG 树构建 (渲染输出被丢弃)
+
+每项取多次重复中的最小值，结果可复现对比。
+
+示例:
+    python bench/micro_bench.py
+    python bench/micro_bench.py --sizes 10 1000 100000 --repeat 5 --json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR))
+sys.path.insert(0, str(BENCH_DIR.parent / "SYSTEM"))
+
+import gen_dag
+import task_parser
+from bench_engine import BENCH_CONFIG
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def build_board(root, n, shape="fanout", seed=0):
+    """生成 n 个活跃任务 + n 个已归档任务，其中每 10 个活跃任务有 1 个为 GBK 编码"""
+    (root / "SYSTEM").mkdir(parents=True, exist_ok=True)
+    with open(root / "SYSTEM" / "config.yaml", "w", encoding="utf-8") as f:
+        f.write(BENCH_CONFIG.format(base_url="http://127.0.0.1:9/v1", tracing="false",
+                                    snapshot_enabled="false", snapshot_every=20,
+                                    speculative="false"))
+    messages_dir = root / "MESSAGES"
+    gen_dag.generate(messages_dir, shape, n, width=16, body_chars=400, seed=seed)
+    for i, path in enumerate(sorted(messages_dir.glob("*.md"))):
+        if i % 10 == 0:
+            text = path.read_text(encoding="utf-8")
+            path.write_bytes(text.encode("gbk"))
+
+    archive_dir = root / "ARCHIVE"
+    archive_dir.mkdir(exist_ok=True)
+    for i in range(n + 1, 2 * n + 1):
+        name = f"[DONE]P1_TO_{gen_dag.DEFAULT_RECEIVER}_{gen_dag.task_id(i)}_archived.md"
+        with open(archive_dir / name, "w", encoding="utf-8") as f:
+            f.write("**DEPENDS_ON: NONE**\n\n---\n## AI 执行结果:\nok\n")
+
+
+def best_of(func, repeat):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def bench_size(n, repeat, dag_max, shape="fanout"):
+    root = Path(tempfile.mkdtemp(prefix="nexus_micro_"))
+    old_cwd = os.getcwd()
+    try:
+        build_board(root, n, shape)
+        os.chdir(root)
+
+        import nexus_core
+        from rich.console import Console
+        nexus_core.console = Console(quiet=True)
+        engine = nexus_core.NexusEngine(auto_mode=True)
+
+        paths = list(engine.messages_dir.glob("*.md"))
+        names = [p.name for p in paths]
+        raw = [p.read_bytes() for p in paths]
+
+        def filename_regex():
+            return [task_parser.parse_task_filename(name) for name in names]
+
+        def decode():
+            return [task_parser.decode_task_bytes(data)[0] for data in raw]
+
+        texts = decode()
+
+        def depends_on():
+            return [task_parser.parse_depends_on(t) for t in texts]
+
+        results = {"size": n}
+        results["filename_regex"], _ = best_of(filename_regex, repeat)
+        results["decode"], _ = best_of(decode, repeat)
+        results["depends_on"], _ = best_of(depends_on, repeat)
+        results["archive_scan"], _ = best_of(lambda: engine.get_runnable_tasks([]), repeat)
+        results["parse_tasks"], tasks = best_of(engine.parse_tasks, repeat)
+        results["runnable"], _ = best_of(lambda: engine.get_runnable_tasks(tasks), repeat)
+        if n <= dag_max:
+            results["draw_dag"], _ = best_of(lambda: engine.draw_dag(tasks), repeat)
+        else:
+            results["draw_dag"] = None
+        return results
+    finally:
+        os.chdir(old_cwd)
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def print_table(rows):
+    columns = ["filename_regex", "decode", "depends_on", "archive_scan", "parse_tasks", "runnable", "draw_dag"]
+    print(f"{'size':>8} " + " ".join(f"{c:>15}" for c in columns))
+    for row in rows:
+        cells = []
+        for c in columns:
+            v = row[c]
+            cells.append(f"{'skipped':>15}" if v is None else f"{v * 1000:>13.3f}ms")
+        print(f"{row['size']:>8} " + " ".join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A1_Nexus 调度热路径微基准")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="看板规模 (文件数)")
+    parser.add_argument("--repeat", type=int, default=3, help="每项重复次数，取最小值")
+    parser.add_argument("--shape", choices=gen_dag.SHAPES, default="fanout",
+                        help="看板拓扑。注意 draw_dag 会为每条路径复制子树，diamond/layered 下规模呈指数增长，chain 会触及递归深度上限")
+    parser.add_argument("--dag-max", type=int, default=2000, help="超过该规模时跳过 draw_dag (fanout 下其复杂度为 O(n^2))")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    args = parser.parse_args()
+
+    rows = []
+    for n in args.sizes:
+        repeat = args.repeat if n <= 10000 else 1
+        rows.append(bench_size(n, repeat, args.dag_max, args.shape))
+        if not args.json:
+            print(f"[micro] size={n} 完成", file=sys.stderr)
+
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print_table(rows)
+
+
+if __name__ == "__main__":
+    main()
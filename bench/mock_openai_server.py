@@ -0,0 +1,249 @@
+"""
+本地 OpenAI 兼容桩服务 (Mock Server)
+
+用于在不消耗真实 API 额度的情况下压测调度引擎。支持:
+- GET  /v1/models                 模型列表
+- POST /v1/chat/completions       普通与流式 (stream=true, SSE) 两种返回
+可配置固定延迟、随机抖动、错误率 (HTTP 500) 与限流率 (HTTP 429)。
+
+独立运行:
+    python bench/mock_openai_server.py --port 18080 --latency 50 --jitter 20 --error-rate 0.01 --rate-429 0.05
+"""
+import re
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+MOCK_MODELS = ["mock-fast", "mock-coder", "mock-reasoner"]
+
+
+class MockSettings:
+    """桩服务的行为参数，可在运行中修改"""
+    def __init__(self, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, rate_429=0.0,
+                 reply_chars=400, stream_chunk_chars=40, seed=None, artifact_paths=False):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.reply_chars = reply_chars
+        self.stream_chunk_chars = stream_chunk_chars
+        # 为 True 时回复中的代码块带路径标注 (```text:mock/IDxxx.txt)，用于压测产出物落盘
+        self.artifact_paths = artifact_paths
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # 统计信息
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self.prompt_tokens = []
+
+    def roll(self):
+        """返回本次请求的 (延迟秒数, 需要返回的状态码)"""
+        with self.lock:
+            self.requests += 1
+            delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+            r = self.random.random()
+            if r < self.rate_429:
+                self.throttled += 1
+                status = 429
+            elif r < self.rate_429 + self.error_rate:
+                self.errors += 1
+                status = 500
+            else:
+                status = 200
+        return max(delay, 0.0) / 1000.0, status
+
+    def record_prompt(self, tokens):
+        with self.lock:
+            self.prompt_tokens.append(tokens)
+
+    def stats(self):
+        with self.lock:
+            prompt = self.prompt_tokens
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "throttled": self.throttled,
+                "prompt_tokens_mean": round(sum(prompt) / len(prompt), 1) if prompt else 0.0,
+                "prompt_tokens_max": max(prompt) if prompt else 0,
+                "prompt_tokens_last": prompt[-1] if prompt else 0,
+            }
+
+
+def _build_reply(messages, size, artifact_paths=False):
+    """根据用户消息构造一段确定长度的伪回复"""
+    user_text = ""
+    for m in messages:
+        if m.get("role") == "user":
+            user_text = str(m.get("content", ""))
+    head = f"MOCK_REPLY for: {user_text[:60]!r}\n"
+    info = "text"
+    if artifact_paths:
+        id_match = re.search(r'ID\d+', user_text)
+        info = f"text:mock/{id_match.group(0) if id_match else 'reply'}.txt"
+    body = f"```{info}\n" + ("lorem ipsum " * (size // 12 + 1))[:size] + "\n```\n"
+    # 预执行请求: 声明依赖上游回复中必然出现的 MOCK_REPLY，使校验可以核对
+    if any("ASSUMES:" in str(m.get("content", "")) for m in messages):
+        body += "ASSUMES: MOCK_REPLY\n"
+    return head + body
+
+
+def _estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    settings = MockSettings()
+
+    def log_message(self, format, *args):
+        # 压测时不输出访问日志
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/models"):
+            self._send_json(200, {
+                "object": "list",
+                "data": [{"id": m, "object": "model", "created": 0, "owned_by": "mock"} for m in MOCK_MODELS],
+            })
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json"}})
+            return
+
+        delay, status = self.settings.roll()
+        if status == 429:
+            self._send_json(429, {"error": {"message": "rate limited (mock)", "type": "rate_limit_error"}},
+                            headers={"Retry-After": "0"})
+            return
+        if status != 200:
+            self._send_json(status, {"error": {"message": "internal error (mock)", "type": "server_error"}})
+            return
+
+        messages = body.get("messages", [])
+        model = body.get("model", MOCK_MODELS[0])
+        reply = _build_reply(messages, self.settings.reply_chars, self.settings.artifact_paths)
+        prompt_tokens = sum(_estimate_tokens(str(m.get("content", ""))) for m in messages)
+        completion_tokens = _estimate_tokens(reply)
+        self.settings.record_prompt(prompt_tokens)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        created = int(time.time())
+
+        if body.get("stream"):
+            self._stream(model, reply, usage, created, delay)
+            return
+
+        time.sleep(delay)
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": reply}, "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _stream(self, model, reply, usage, created, delay):
+        """以 SSE 形式分块返回，首块前等待一半延迟，其余延迟均摊到各块之间"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        step = max(1, self.settings.stream_chunk_chars)
+        chunks = [reply[i:i + step] for i in range(0, len(reply), step)] or [""]
+        time.sleep(delay / 2)
+        per_chunk = (delay / 2) / len(chunks)
+
+        def emit(payload):
+            self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+        try:
+            for i, piece in enumerate(chunks):
+                delta = {"content": piece}
+                if i == 0:
+                    delta["role"] = "assistant"
+                emit({
+                    "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": None}],
+                })
+                if per_chunk:
+                    time.sleep(per_chunk)
+            emit({
+                "id": "chatcmpl-mock", "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+def start_server(host="127.0.0.1", port=0, settings=None):
+    """在后台线程中启动桩服务，返回 (server, base_url)。port=0 表示自动分配端口"""
+    handler = type("BoundMockHandler", (MockHandler,), {"settings": settings or MockSettings()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, name="mock-openai", daemon=True)
+    thread.start()
+    base_url = f"http://{host}:{server.server_address[1]}/v1"
+    return server, base_url
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A1_Nexus 本地 OpenAI 兼容桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency", type=float, default=50.0, help="平均响应延迟 (毫秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="延迟随机抖动幅度 (毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 HTTP 500 的概率")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 HTTP 429 的概率")
+    parser.add_argument("--reply-chars", type=int, default=400, help="每次回复的正文长度")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    settings = MockSettings(args.latency, args.jitter, args.error_rate, args.rate_429,
+                            reply_chars=args.reply_chars, seed=args.seed)
+    server, base_url = start_server(args.host, args.port, settings)
+    print(f"Mock OpenAI server listening on {base_url}  (Ctrl+C 退出)")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print(f"\n统计: {settings.stats()}")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
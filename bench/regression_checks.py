@@ -0,0 +1,360 @@
+"""
+回归检查 (Regression Checks)
+
+不依赖模型与网络的快速检查，覆盖曾经出错的边界情况；任一检查失败时以非零状态退出。
+- speculative_no_assumes   预执行未声明 ASSUMES 且摘要哈希与预测不一致时必须作废
+- search_short_terms       全文检索中不足 3 个字符的词 (如两个汉字) 也能命中，包括重新打开已有索引时
+- upstream_budget          长链路只读取长度预算 / 回溯层数以内的祖先摘要
+- worker_stop_in_flight    执行节点 stop() 后继续为执行中的调用续约，结果被采纳而不是改派
+- unknown_dependency       API / 命令行提交依赖不存在的 IDnnn 时报错，不会被当作批次内第 n 个任务
+- snapshot_reclaim         快照任务进入死信后，它覆盖的任务并入下一个快照
+- base_changed             补丁基准在构建提示词之后被修改时记为冲突，不覆盖他人的产出
+- dead_letter_expiry       上游进入死信超过宽限期的下游被回收为 [EXPIRED]，从未执行过的可执行任务不会过期
+- environment_error        限流 / 5xx / 连接失败等环境问题不计入失败次数，调度器暂停该项目而不是反复派发
+
+示例:
+    python bench/regression_checks.py
+    python bench/regression_checks.py --only speculative_no_assumes
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import traceback
+from contextlib import contextmanager
+from pathlib import Path
+from types import SimpleNamespace
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "SYSTEM"))
+
+from artifacts import ArtifactWriter
+from dead_letter import DeadLetterQueue, is_environment_error
+from diff_mode import DiffContext
+from lease_board import LeaseBoard
+from milestones import MilestoneManager
+from nexus_worker import RemoteWorker
+from search_index import SearchIndex
+from task_factory import TaskFactory, TaskSpecError
+from task_runner import ProjectSlot, TaskRunner
+from speculative import SpeculativeRun, predicted_record, summary_hash, validate
+from upstream_context import UpstreamContext, summarize_result
+
+
+def check_speculative_no_assumes():
+    upstream = {"id": "ID001", "receiver": "P7_研发", "depends_on": []}
+    predicted = predicted_record(upstream, "# 实现登录接口\n在 src/api.py 中新增 login()")
+    final_output = "已在 src/auth.py 中实现 sign_in()"
+    final_hash = summary_hash(summarize_result(final_output, 800))
+    assert predicted["hash"] != final_hash
+
+    def run_with(text):
+        run = SpeculativeRun({"id": "ID002"}, "ID001", predicted["hash"])
+        run.response_text = text
+        return run
+
+    # 未声明 / 只声明 NONE: 无法核对，作废
+    for text in ("调用 login() 完成前端登录页", "调用 login() 完成前端登录页\nASSUMES: NONE"):
+        committed, reason = validate(run_with(text), final_hash, final_output)
+        assert not committed, reason
+    # 声明的依赖不在上游产出中: 作废
+    committed, reason = validate(run_with("...\nASSUMES: src/api.py, login"), final_hash, final_output)
+    assert not committed, reason
+    # 声明的依赖均在上游产出中: 提交
+    committed, reason = validate(run_with("...\nASSUMES: src/auth.py, sign_in"), final_hash, final_output)
+    assert committed, reason
+    # 摘要哈希与预测一致: 无需声明即可提交
+    committed, reason = validate(run_with("调用 login()"), predicted["hash"], final_output)
+    assert committed, reason
+    # 补丁无法应用: 作废
+    committed, reason = validate(run_with("...\nASSUMES: sign_in"), final_hash, final_output,
+                                 SimpleNamespace(failed_patches=["src/auth.py"]))
+    assert not committed, reason
+
+
+def check_search_short_terms():
+    root = Path(tempfile.mkdtemp(prefix="nexus_check_"))
+    try:
+        for name in ("MESSAGES", "ARCHIVE", "PROJECT_SPACE"):
+            (root / name).mkdir()
+        with open(root / "MESSAGES" / "[NEW]P1_TO_P7_ID001_登录.md", "w", encoding="utf-8") as f:
+            f.write("# 实现用户登录接口\n**DEPENDS_ON: 无**\n\n完成 UI 设计\n")
+        dirs = [root / "index" / "search.db", root / "MESSAGES", root / "ARCHIVE", root / "PROJECT_SPACE"]
+        index = SearchIndex(*dirs)
+        index.refresh()
+        index.close()
+        # 重新打开已有索引 (分词器从 meta 表读出) 后直接检索
+        index = SearchIndex(*dirs)
+        try:
+            for query in ("登录", "ui", "登录 接口", "用户登录"):
+                hits = index.search(query)
+                assert [hit.task_id for hit in hits] == ["ID001"], f"{query!r}: {hits}"
+            assert not index.search("注册"), "注册"
+        finally:
+            index.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def check_upstream_budget():
+    records = {f"ID{i:03d}": {"id": f"ID{i:03d}", "receiver": "P7_研发", "title": "", "summary": "x" * 300,
+                              "depends_on": [f"ID{i - 1:03d}"] if i > 1 else []} for i in range(1, 201)}
+    context = UpstreamContext(Path(tempfile.gettempdir()) / "nexus_check_archive", Path(tempfile.gettempdir()),
+                              budget_chars=2000, max_depth=0)
+    loaded = []
+    context.get_summary = lambda task_id: (loaded.append(task_id), records.get(task_id))[1]
+    text = context.build({"depends_on": ["ID200"]})
+    assert text.count("### ") == 6 and "至少 1 个" in text, text[-200:]
+    assert len(loaded) == 7, f"读取了 {len(loaded)} 个摘要"
+    loaded.clear()
+    context.budget_chars, context.max_depth = 10 ** 9, 3
+    assert context.build({"depends_on": ["ID200"]}).count("### ") == 3
+    assert len(loaded) == 3, f"读取了 {len(loaded)} 个摘要"
+
+
+def check_worker_stop_in_flight():
+    board = LeaseBoard(lease_seconds=2)
+
+    class Client:
+        """直接调用 LeaseBoard，代替 HTTP 的 NexusClient"""
+        def lease_tasks(self, worker_id, max_jobs, wait=0.0, capacity=None):
+            return board.lease(worker_id, max_jobs, min(wait, 0.5), capacity)
+
+        def heartbeat(self, worker_id, lease_ids, capacity=None):
+            return board.heartbeat(worker_id, lease_ids, capacity)
+
+        def post_result(self, worker_id, lease_id, text=None, usage=None, error=None):
+            return {"accepted": board.complete(worker_id, lease_id, text, usage, error)}
+
+    class SlowProvider:
+        """模型调用耗时超过租约有效期"""
+        @contextmanager
+        def request(self, provider_name, provider_cfg):
+            def create(**kwargs):
+                time.sleep(3.5)
+                return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=None)
+            yield SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+    config = SimpleNamespace(config={"system": {}, "api_providers": {"providers": {"mock": {}}}})
+    events = []
+
+    def on_event(event, **data):
+        events.append(event)
+        if event == "lease.started":
+            # 调用开始后不久即停止执行节点
+            threading.Timer(0.5, worker.stop).start()
+
+    worker = RemoteWorker(Client(), config, concurrency=1, provider_pool=SlowProvider(), on_event=on_event)
+    result = {}
+    threading.Thread(target=lambda: result.update(reply=board.call("check", {"id": "ID001", "receiver": "P7_研发"},
+                                                                   "mock", "mock-model", [])),
+                     daemon=True).start()
+    worker.run()
+    time.sleep(0.2)
+    stats = board.stats()
+    assert events == ["lease.started", "lease.done"], events
+    assert result.get("reply", (None,))[0] == "ok", result
+    assert stats["reassigned"] == 0 and stats["queued"] == 0, stats
+
+
+def check_unknown_dependency():
+    root = Path(tempfile.mkdtemp(prefix="nexus_check_"))
+    try:
+        (root / "MESSAGES").mkdir()
+        (root / "ARCHIVE").mkdir()
+        factory = TaskFactory(root / "MESSAGES", root / "ARCHIVE")
+        factory.create_tasks([{"receiver": "P7_研发", "description": "已有任务"}])
+        specs = [{"receiver": "P7_研发", "description": "前端"},
+                 {"receiver": "P7_研发", "description": "后端", "depends_on": "ID001, ID003"}]
+        try:
+            factory.create_tasks(specs)
+        except TaskSpecError:
+            pass
+        else:
+            raise AssertionError("依赖不存在的 ID003 却创建成功")
+        assert len(list((root / "MESSAGES").glob("*.md"))) == 1
+        # 拆解方案: ID003 按批次内第 3 个任务解析 (此处批次只有 3 个任务)
+        specs.append({"receiver": "P7_研发", "description": "测试"})
+        created = factory.create_tasks(specs, legacy_batch_ids=True)
+        body = (root / "MESSAGES" / created[1][1]).read_text(encoding="utf-8")
+        assert f"DEPENDS_ON: ID001, {created[2][0]}" in body, body
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def check_snapshot_reclaim():
+    root = Path(tempfile.mkdtemp(prefix="nexus_check_"))
+    try:
+        messages, archive = root / "MESSAGES", root / "ARCHIVE"
+        messages.mkdir()
+        archive.mkdir()
+        factory = TaskFactory(messages, archive)
+        milestones = MilestoneManager(archive, messages, every_tasks=2, every_tokens=10 ** 9)
+
+        def archive_tasks(*task_ids):
+            paths = []
+            for task_id in task_ids:
+                path = archive / f"[DONE]P1_TO_P7_研发_{task_id}_任务.md"
+                path.write_text("# 任务目标：x\n", encoding="utf-8")
+                paths.append(path)
+            return milestones.on_archived(paths)
+
+        create = lambda spec: factory.create_tasks([spec])[0]
+        assert archive_tasks("ID101", "ID102")
+        first = milestones.maybe_create_snapshot_task(create, lambda task_id: None)
+        assert first and "_MILESTONE_v0.1_SNAPSHOT" in first, first
+        text = (messages / first).read_text(encoding="utf-8")
+        assert milestones.snapshot_version_of(text) == "v0.1", text[:200]
+        # 快照任务熔断进入死信
+        (archive / "DEAD_LETTER").mkdir()
+        (messages / first).replace(archive / "DEAD_LETTER" / first.replace("[NEW]", "[FAIL]"))
+        assert archive_tasks("ID103")
+        second = milestones.maybe_create_snapshot_task(create, lambda task_id: None)
+        assert second, "没有重新创建快照任务"
+        text = (messages / second).read_text(encoding="utf-8")
+        assert "(共 3 个)" in text, text
+        assert milestones._load_state()["pending"]["covers"] == ["ID101", "ID102", "ID103"]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def check_base_changed():
+    root = Path(tempfile.mkdtemp(prefix="nexus_check_"))
+    try:
+        space = root / "PROJECT_SPACE"
+        (space / "src").mkdir(parents=True)
+        (space / "src" / "app.py").write_text("a = 1\nb = 2\n", encoding="utf-8")
+        writer = ArtifactWriter(space)
+        reply = "```diff\n--- a/src/app.py\n+++ b/src/app.py\n@@ -1,2 +1,2 @@\n a = 1\n-b = 2\n+b = 3\n```\n"
+        context = DiffContext(writer)
+
+        def prompt_bases(task_id):
+            bases = {}
+            context.build(context.targets(task_id, "修改 src/app.py"), bases=bases)
+            assert "src/app.py" in bases, bases
+            return bases
+
+        bases = prompt_bases("ID001")
+        # 生成期间其他任务修改了基准文件 (补丁仍可应用)
+        (space / "src" / "app.py").write_text("a = 1\nb = 2\nc = 3\n", encoding="utf-8")
+        result = writer.materialize("ID001", reply, base_hashes=bases)
+        assert not result.written and result.conflicts, (result.written, result.conflicts)
+        # 基准未变化: 正常写入
+        result = writer.materialize("ID002", reply, base_hashes=prompt_bases("ID002"))
+        assert [rel for rel, _, _ in result.written] == ["src/app.py"], (result.written, result.conflicts)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def check_dead_letter_expiry():
+    root = Path(tempfile.mkdtemp(prefix="nexus_check_"))
+    try:
+        messages, archive = root / "MESSAGES", root / "ARCHIVE"
+        messages.mkdir()
+        queue = DeadLetterQueue(archive, messages, expire_after_hours=48)
+        queue.dir.mkdir(parents=True)
+        old = time.time() - 50 * 3600
+        # ID001 在 50 小时前熔断，ID006 在 1 小时前熔断
+        for name, dead_at in (("[FAIL]P1_TO_P7_研发_ID001_接口.md", old), ("[FAIL]P1_TO_P7_研发_ID006_样式.md", time.time() - 3600)):
+            (queue.dir / name).write_text("# 任务\n", encoding="utf-8")
+            os.utime(queue.dir / name, (dead_at, dead_at))
+        specs = {"ID002": ["ID001"], "ID003": ["ID002"], "ID004": [], "ID005": ["ID006"], "ID007": ["ID004"]}
+        tasks = []
+        for task_id, deps in specs.items():
+            path = messages / f"[NEW]P1_TO_P7_研发_{task_id}_任务.md"
+            path.write_text(f"# 任务\n**DEPENDS_ON: {', '.join(deps) or '无'}**\n", encoding="utf-8")
+            os.utime(path, (old, old))
+            tasks.append({"id": task_id, "status": "NEW", "depends_on": deps, "file": str(path)})
+        expired = queue.sweep_expired(tasks, done_ids=set())
+        assert sorted(path.name for path, _ in expired) == ["[EXPIRED]P1_TO_P7_研发_ID002_任务.md",
+                                                             "[EXPIRED]P1_TO_P7_研发_ID003_任务.md"], expired
+        # 从未执行过的可执行任务 (ID004) 与排队中的下游 (ID007)、宽限期内的下游 (ID005) 留在 MESSAGES
+        assert sorted(p.name for p in messages.glob("*.md")) == [
+            "[NEW]P1_TO_P7_研发_ID004_任务.md", "[NEW]P1_TO_P7_研发_ID005_任务.md", "[NEW]P1_TO_P7_研发_ID007_任务.md"]
+        # 进入死信的时间为移动时间 (而不是文件原来的修改时间)
+        assert time.time() - queue.dead_times()["ID002"] < 60
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def check_environment_error():
+    class RateLimitError(Exception):
+        status_code = 429
+
+    class BadRequestError(Exception):
+        status_code = 400
+
+    class RemoteError(RuntimeError):
+        pass
+
+    assert is_environment_error(RateLimitError()) and is_environment_error(ConnectionResetError())
+    assert is_environment_error(SimpleNamespace(status_code=503))
+    assert not is_environment_error(BadRequestError()) and not is_environment_error(ValueError("bad reply"))
+    assert is_environment_error(RemoteError("APITimeoutError: timed out")) and is_environment_error(RemoteError("执行节点失联"))
+    assert not is_environment_error(RemoteError("BadRequestError: context length exceeded"))
+
+    class Engine:
+        """第一个任务因环境问题失败，之后的任务不应再被执行"""
+        history_file = None
+        def __init__(self):
+            self._busy_ids, self.executed = set(), []
+            self.environment_error, self.last_failure = None, None
+        def execute_task(self, task):
+            self.executed.append(task['id'])
+            self.environment_error = "RateLimitError: 429"
+            return False
+
+    events = []
+    runner = TaskRunner(record_history=False, on_event=lambda event, **data: events.append((event, data)))
+    slot = ProjectSlot("demo", Engine())
+    slot.inflight = 1
+    assert runner._execute(slot, {"id": "ID001", "receiver": "P7_研发"}) is False
+    assert slot.stopped, "环境问题后项目未暂停"
+    paused = [data for event, data in events if event == "project.paused"]
+    assert paused == [{"project": "demo", "task_id": "ID001", "reason": "RateLimitError: 429"}], events
+    # 失败次数未能记录 (last_failure 为 None) 的普通失败同样暂停
+    slot.stopped, slot.inflight, slot.engine.environment_error = False, 1, None
+    slot.engine.execute_task = lambda task: False
+    runner._execute(slot, {"id": "ID002", "receiver": "P7_研发"})
+    assert slot.stopped
+    # 失败已记录时继续调度
+    slot.stopped, slot.inflight, slot.engine.last_failure = False, 1, (1, False)
+    runner._execute(slot, {"id": "ID003", "receiver": "P7_研发"})
+    assert not slot.stopped
+
+
+CHECKS = {
+    "speculative_no_assumes": check_speculative_no_assumes,
+    "search_short_terms": check_search_short_terms,
+    "upstream_budget": check_upstream_budget,
+    "worker_stop_in_flight": check_worker_stop_in_flight,
+    "unknown_dependency": check_unknown_dependency,
+    "snapshot_reclaim": check_snapshot_reclaim,
+    "base_changed": check_base_changed,
+    "dead_letter_expiry": check_dead_letter_expiry,
+    "environment_error": check_environment_error,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="A1_Nexus 回归检查")
+    parser.add_argument("--only", nargs="*", choices=sorted(CHECKS), help="只运行指定的检查")
+    args = parser.parse_args()
+    failed = 0
+    for name in args.only or CHECKS:
+        try:
+            CHECKS[name]()
+            print(f"  通过  {name}")
+        except Exception:
+            failed += 1
+            print(f"  失败  {name}")
+            traceback.print_exc()
+    print(f"{len(args.only or CHECKS) - failed} 项通过，{failed} 项失败")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()